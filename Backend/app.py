@@ -4,6 +4,9 @@ from config.settings import app_config
 from routes.auth_routes import auth_bp
 from routes.todo_routes import todo_bp
 from routes.search_routes import search_bp
+from routes.health_routes import health_bp
+from services.service_registry import registry
+from services.ingest_queue import start_local_workers
 from waitress import serve
 
 def create_app():
@@ -15,6 +18,16 @@ def create_app():
     app.register_blueprint(auth_bp)
     app.register_blueprint(todo_bp)
     app.register_blueprint(search_bp)
+    app.register_blueprint(health_bp)
+    
+    # 模型在后台线程加载并预热，启动不再等待；就绪前 /ready 返回503
+    # 入库走队列时OCR和文档提取在入库worker中完成，Web进程不预热PaddleOCR（进程内消费线程首次处理时才加载）
+    if app_config.model_loading == "background":
+        registry.warm_up(["vector", "rag"] if app_config.ingest_mode == "queue" else None)
+    
+    # 入库任务由进程内消费线程处理；单独运行 scripts.ingest_worker 时 INGEST_LOCAL_WORKERS=0
+    if app_config.ingest_mode == "queue" and app_config.ingest_local_workers > 0:
+        start_local_workers(app_config.ingest_local_workers)
     
     return app
 
@@ -0,0 +1,246 @@
+# 向量索引 ANN 基准：召回率 / 延迟 / 内存
+#
+# 生成分布在多个用户下的合成 1024 维语料（带聚类结构，接近真实嵌入的分布），
+# 通过 VectorService 使用的存储写入路径（RedisVectorStore.save_many）写入 vector:* 分块，
+# 再针对这些分块依次创建 FLAT 与不同 M / EF_CONSTRUCTION 的 HNSW 基准索引（只索引本基准的用户），
+# 每个 HNSW 索引按查询扫描 EF_RUNTIME。对每组设置统计：
+#   构建耗时、索引内存（FT.INFO vector_index_sz_mb）、分块数据内存（MEMORY USAGE 抽样估算）、
+#   查询延迟 p50/p99，以及相对 NumPy 精确检索的 recall@k。
+# 结果以JSON输出（--output 写入文件），便于不同版本之间对比。
+#
+# 用法（在 Backend 目录下，需要本地 redis-stack-server；写入的数据同时会进入 vector 索引，不要对生产实例运行）:
+#     python -m benchmarks.bench_ann [--sizes 1000,10000,100000,1000000] [--users 100] [--queries 200]
+#                                    [--top-k 10] [--m 16,32] [--ef-construction 200] [--ef-runtime 10,50,100,200]
+#                                    [--scope user|global] [--output bench_ann.json]
+import argparse
+import json
+import time
+import numpy as np
+from redis.commands.search.field import TagField, VectorField
+from redis.commands.search.indexDefinition import IndexDefinition, IndexType
+from redis.commands.search.query import Query
+from config.database import cache_client
+from config.settings import db_config
+from services.vector_codec import encode_vector
+from services.vector_store import RedisVectorStore
+
+PREFIX = "bench-ann"
+
+
+def _generate(size: int, users: int, dim: int, seed: int) -> tuple:
+    """生成带聚类结构的单位向量，返回 (向量矩阵, 每条向量的用户编号)"""
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((max(1, size // 50), dim)).astype(np.float32)
+    vectors = np.empty((size, dim), dtype=np.float32)
+    for start in range(0, size, 10000):
+        end = min(size, start + 10000)
+        labels = rng.integers(0, len(centers), end - start)
+        block = centers[labels] + 0.6 * rng.standard_normal((end - start, dim)).astype(np.float32)
+        vectors[start:end] = block / np.linalg.norm(block, axis=1, keepdims=True)
+    owners = rng.integers(0, users, size)
+    return vectors, owners
+
+
+def _load(store: RedisVectorStore, size: int, vectors: np.ndarray, owners: np.ndarray, batch: int = 500) -> float:
+    """通过存储层批量写入，每条向量一个单分块内容，返回写入耗时"""
+    started = time.perf_counter()
+    for start in range(0, len(vectors), batch):
+        writes = []
+        for i in range(start, min(len(vectors), start + batch)):
+            doc_id = f"{PREFIX}-{size}-{i}"
+            text = f"bench {i}"
+            writes.append({
+                "doc_id": doc_id,
+                "user_id": f"{PREFIX}-{size}-u{owners[i]}",
+                "chunks": [{"text": text, "start": 0, "end": len(text)}],
+                "fingerprints": [doc_id],
+                "vectors": [vectors[i]],
+                "raw_json": "{}",
+                "content_fingerprint": doc_id,
+            })
+        store.save_many(writes)
+    return time.perf_counter() - started
+
+
+def _cleanup(redis_client, size: int):
+    """删除本规模写入的全部键"""
+    for pattern in (f"vector:{PREFIX}-{size}-*", f"vector_doc:{PREFIX}-{size}-*", f"vector_fp:{PREFIX}-{size}-*"):
+        keys = []
+        for key in redis_client.scan_iter(match=pattern, count=1000):
+            keys.append(key)
+            if len(keys) >= 1000:
+                redis_client.delete(*keys)
+                keys = []
+        if keys:
+            redis_client.delete(*keys)
+
+
+def _create_index(redis_client, name: str, size: int, algorithm: str, params: dict) -> float:
+    """在已写入的分块上创建基准索引，等待后台索引完成，返回构建耗时"""
+    attributes = {"TYPE": db_config.vector_type, "DIM": db_config.vector_dim, "DISTANCE_METRIC": "COSINE", **params}
+    definition = IndexDefinition(
+        prefix=[f"vector:{PREFIX}-{size}-"],
+        index_type=IndexType.HASH
+    )
+    started = time.perf_counter()
+    redis_client.ft(name).create_index(
+        [TagField("user_id"), VectorField("vector", algorithm, attributes)],
+        definition=definition
+    )
+    while True:
+        info = redis_client.ft(name).info()
+        if str(info.get("indexing", 0)) in ("0", "0.0") and float(info.get("percent_indexed", 1)) >= 1:
+            return time.perf_counter() - started
+        time.sleep(0.05)
+
+
+def _drop_index(redis_client, name: str):
+    try:
+        redis_client.ft(name).dropindex(delete_documents=False)
+    except Exception:
+        pass
+
+
+def _data_memory_mb(redis_client, size: int, total: int, samples: int = 200) -> float:
+    """抽样 MEMORY USAGE 估算分块哈希的总内存"""
+    keys = [f"vector:{PREFIX}-{size}-{i}:0" for i in np.linspace(0, total - 1, min(samples, total)).astype(int)]
+    pipe = redis_client.pipeline(transaction=False)
+    for key in keys:
+        pipe.memory_usage(key, samples=0)
+    usage = [value for value in pipe.execute() if value]
+    return float(np.mean(usage)) * total / 1024 / 1024 if usage else 0.0
+
+
+def _exact_top_k(vectors: np.ndarray, owners: np.ndarray, queries: np.ndarray, query_owners: np.ndarray,
+                 k: int, scope: str) -> list:
+    """NumPy 精确检索的基准答案（向量已归一化，内积即余弦）"""
+    truth = []
+    for query, owner in zip(queries, query_owners):
+        candidates = np.flatnonzero(owners == owner) if scope == "user" else np.arange(len(vectors))
+        scores = vectors[candidates] @ query
+        top = candidates[np.argsort(-scores)[:k]]
+        truth.append(set(top.tolist()))
+    return truth
+
+
+def _vector_index(key) -> int:
+    """键名 vector:{PREFIX}-{size}-{i}:0 → 语料中的下标 i"""
+    key = key.decode("utf-8") if isinstance(key, bytes) else key
+    return int(key.split(":")[1].rsplit("-", 1)[1])
+
+
+def _run_queries(redis_client, name: str, size: int, queries: np.ndarray, query_owners: np.ndarray,
+                 truth: list, k: int, scope: str, ef_runtime: int = None) -> dict:
+    """执行查询，统计延迟和recall@k"""
+    ef = f" EF_RUNTIME {ef_runtime}" if ef_runtime else ""
+    latencies = []
+    recalls = []
+    for query, owner, expected in zip(queries, query_owners, truth):
+        user_filter = f"@user_id:{{{RedisVectorStore._escape_tag(f'{PREFIX}-{size}-u{owner}')}}}" \
+            if scope == "user" else "*"
+        q = (
+            Query(f"{user_filter}=>[KNN {k} @vector $vec{ef} AS score]")
+            .sort_by("score")
+            .paging(0, k)
+            .return_fields("score")
+            .dialect(2)
+        )
+        query_bytes, _ = encode_vector(query, db_config.vector_type)
+        started = time.perf_counter()
+        docs = redis_client.ft(name).search(q, query_params={"vec": query_bytes}).docs
+        latencies.append((time.perf_counter() - started) * 1000)
+        found = {_vector_index(doc.id) for doc in docs}
+        recalls.append(len(found & expected) / max(1, len(expected)))
+    return {
+        "p50_ms": float(np.percentile(latencies, 50)),
+        "p99_ms": float(np.percentile(latencies, 99)),
+        f"recall@{k}": float(np.mean(recalls)),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="向量索引 ANN 基准")
+    parser.add_argument("--sizes", default="1000,10000,100000,1000000", help="语料向量数量，逗号分隔")
+    parser.add_argument("--users", type=int, default=100, help="语料分布的用户数")
+    parser.add_argument("--queries", type=int, default=200, help="查询数量")
+    parser.add_argument("--top-k", type=int, default=10, help="召回计算的k")
+    parser.add_argument("--m", default="16,32", help="HNSW M，逗号分隔")
+    parser.add_argument("--ef-construction", default="200", help="HNSW EF_CONSTRUCTION，逗号分隔")
+    parser.add_argument("--ef-runtime", default="10,50,100,200", help="HNSW EF_RUNTIME，逗号分隔")
+    parser.add_argument("--scope", choices=("user", "global"), default="user",
+                        help="user 为按用户过滤的KNN（与线上一致），global 为全库KNN")
+    parser.add_argument("--seed", type=int, default=42, help="随机种子")
+    parser.add_argument("--output", default=None, help="JSON结果文件")
+    parser.add_argument("--keep", action="store_true", help="结束后保留写入的数据")
+    args = parser.parse_args()
+
+    redis_client = cache_client.client
+    store = RedisVectorStore(redis_client)
+    report = {
+        "vector_type": db_config.vector_type,
+        "dim": db_config.vector_dim,
+        "users": args.users,
+        "scope": args.scope,
+        "top_k": args.top_k,
+        "results": []
+    }
+
+    for size in [int(s) for s in args.sizes.split(",")]:
+        vectors, owners = _generate(size, args.users, db_config.vector_dim, args.seed)
+        load_s = _load(store, size, vectors, owners)
+        print(f"已写入 {size} 条向量，耗时 {load_s:.1f}s")
+
+        # 查询为语料向量加噪声，基准答案由NumPy精确检索得到
+        rng = np.random.default_rng(args.seed + 1)
+        picks = rng.integers(0, size, args.queries)
+        queries = vectors[picks] + 0.05 * rng.standard_normal((args.queries, db_config.vector_dim)).astype(np.float32)
+        queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+        query_owners = owners[picks]
+        truth = _exact_top_k(vectors, owners, queries, query_owners, args.top_k, args.scope)
+        data_mb = _data_memory_mb(redis_client, size, size)
+
+        settings = [("FLAT", {}, [None])]
+        for m in [int(v) for v in args.m.split(",")]:
+            for ef_construction in [int(v) for v in args.ef_construction.split(",")]:
+                settings.append((
+                    "HNSW",
+                    {"M": m, "EF_CONSTRUCTION": ef_construction},
+                    [int(v) for v in args.ef_runtime.split(",")]
+                ))
+
+        for algorithm, params, ef_runtimes in settings:
+            name = f"{PREFIX}-{size}-{algorithm.lower()}-" + "-".join(f"{k}{v}" for k, v in params.items())
+            _drop_index(redis_client, name)
+            try:
+                build_s = _create_index(redis_client, name, size, algorithm, params)
+                index_mb = float(redis_client.ft(name).info().get("vector_index_sz_mb", 0) or 0)
+                for ef_runtime in ef_runtimes:
+                    result = {
+                        "size": size,
+                        "algorithm": algorithm,
+                        **params,
+                        "ef_runtime": ef_runtime,
+                        "build_s": build_s,
+                        "index_mb": index_mb,
+                        "data_mb": data_mb,
+                        "load_s": load_s,
+                        **_run_queries(redis_client, name, size, queries, query_owners, truth,
+                                       args.top_k, args.scope, ef_runtime)
+                    }
+                    report["results"].append(result)
+                    print(json.dumps(result, ensure_ascii=False))
+            finally:
+                _drop_index(redis_client, name)
+
+        if not args.keep:
+            _cleanup(redis_client, size)
+
+    output = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output)
+    print(output)
+
+
+if __name__ == "__main__":
+    main()
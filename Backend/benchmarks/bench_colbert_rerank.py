@@ -0,0 +1,67 @@
+# ColBERT重排的延迟与质量基准
+#
+# 对一组标注查询分别用单向量排序与ColBERT重排检索，输出延迟分位数和 Recall@k / MRR@k，
+# 用来决定是否开启 RERANK。被检索的内容需要在 COLBERT_INDEX=true 时写入，否则重排没有可用的向量。
+#
+# 标注文件为JSON数组，每项 {"user_id": "...", "query": "...", "relevant": ["doc_id", ...]}
+#
+# 用法（在 Backend 目录下，需要 Redis Stack 和模型）:
+#     python -m benchmarks.bench_colbert_rerank --queries eval.json [--top-k 5] [--modes dense,hybrid]
+import argparse
+import json
+import time
+import numpy as np
+from services.vector_service import VectorService
+
+
+def _evaluate(vector_service: VectorService, queries: list, top_k: int, mode: str, rerank: bool) -> dict:
+    """按给定模式跑完全部查询，返回延迟与质量指标"""
+    latencies = []
+    recalls = []
+    reciprocal_ranks = []
+    for item in queries:
+        started = time.perf_counter()
+        results = vector_service.search_chunks(item["query"], item["user_id"], top_k, mode=mode, rerank=rerank)
+        latencies.append((time.perf_counter() - started) * 1000)
+
+        relevant = set(item["relevant"])
+        ranked = [group["doc_id"] for group in results]
+        recalls.append(len(relevant.intersection(ranked)) / len(relevant) if relevant else 0.0)
+        reciprocal_ranks.append(next((1.0 / rank for rank, doc_id in enumerate(ranked, 1) if doc_id in relevant), 0.0))
+
+    return {
+        "mode": mode,
+        "rerank": rerank,
+        "queries": len(queries),
+        "latency_p50_ms": float(np.percentile(latencies, 50)),
+        "latency_p95_ms": float(np.percentile(latencies, 95)),
+        f"recall@{top_k}": float(np.mean(recalls)),
+        f"mrr@{top_k}": float(np.mean(reciprocal_ranks)),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ColBERT重排延迟与质量基准")
+    parser.add_argument("--queries", required=True, help="标注查询JSON文件")
+    parser.add_argument("--top-k", type=int, default=5, help="返回的内容数量")
+    parser.add_argument("--modes", default="dense", help="第一阶段检索模式，逗号分隔")
+    args = parser.parse_args()
+
+    with open(args.queries, "r", encoding="utf-8") as f:
+        queries = json.load(f)
+
+    vector_service = VectorService()
+    # 预热模型，避免首个查询的加载耗时计入延迟
+    vector_service.encode_query(queries[0]["query"], with_lexical=True, with_colbert=True)
+
+    report = []
+    for mode in args.modes.split(","):
+        for rerank in (False, True):
+            report.append(_evaluate(vector_service, queries, args.top_k, mode, rerank))
+            print(json.dumps(report[-1], ensure_ascii=False))
+
+    print(json.dumps({"results": report}, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+# 向量分片基准：分布 / 按用户检索 / 全局并行检索
+#
+# 在 --shards 指定的多个本地 Redis Stack 实例上（例如 redis-stack-server --port 6380 / 6381 / 6382）
+# 通过 ShardedVectorStore 写入分布在多个用户下的合成向量，统计：
+#   各分片的用户数和分块数、按用户检索的延迟（只访问一个分片）、
+#   全局检索并行查询全部分片后合并的延迟和相对 NumPy 精确检索的 recall@k，
+#   以及分片表增加一个节点时需要迁移的用户比例（rendezvous 哈希约为 1/(N+1)）。
+#
+# 用法（在 Backend 目录下）:
+#     python -m benchmarks.bench_shards --shards 127.0.0.1:6380,127.0.0.1:6381,127.0.0.1:6382
+#                                       [--size 20000] [--users 200] [--queries 100] [--top-k 10]
+import argparse
+import json
+import time
+import numpy as np
+from config.database import parse_shard_endpoints, ShardMap
+from config.settings import db_config
+from services.sharded_vector_store import ShardedVectorStore
+
+PREFIX = "bench-shard"
+
+
+def _generate(size: int, users: int, dim: int, seed: int) -> tuple:
+    """生成单位向量，返回 (向量矩阵, 每条向量的用户编号)"""
+    rng = np.random.default_rng(seed)
+    vectors = rng.standard_normal((size, dim)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors, rng.integers(0, users, size)
+
+
+def _load(store: ShardedVectorStore, vectors: np.ndarray, owners: np.ndarray, batch: int = 500):
+    """每条向量一个单分块内容，按批写入（同一批内按用户分片并行）"""
+    for start in range(0, len(vectors), batch):
+        writes = []
+        for i in range(start, min(len(vectors), start + batch)):
+            doc_id = f"{PREFIX}-{i}"
+            text = f"bench {i}"
+            writes.append({
+                "doc_id": doc_id,
+                "user_id": f"{PREFIX}-u{owners[i]}",
+                "chunks": [{"text": text, "start": 0, "end": len(text)}],
+                "fingerprints": [doc_id],
+                "vectors": [vectors[i]],
+                "raw_json": "{}",
+                "content_fingerprint": doc_id,
+            })
+        store.save_many(writes)
+
+
+def _moved_ratio(endpoints: list, users: int) -> float:
+    """分片表增加一个节点后归属分片变化的用户比例"""
+    before = ShardMap(endpoints)
+    after = ShardMap(endpoints + ["127.0.0.1:65535/0"])
+    moved = sum(
+        1 for u in range(users)
+        if before.endpoints[before.shard_for(f"{PREFIX}-u{u}")] != after.endpoints[after.shard_for(f"{PREFIX}-u{u}")]
+    )
+    return moved / max(1, users)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="向量分片基准")
+    parser.add_argument("--shards", required=True, help="逗号分隔的 host:port[/db]，与 VECTOR_SHARDS 格式一致")
+    parser.add_argument("--size", type=int, default=20000, help="向量数量")
+    parser.add_argument("--users", type=int, default=200, help="用户数")
+    parser.add_argument("--queries", type=int, default=100, help="查询数量")
+    parser.add_argument("--top-k", type=int, default=10, help="召回计算的k")
+    parser.add_argument("--seed", type=int, default=42, help="随机种子")
+    parser.add_argument("--keep", action="store_true", help="结束后保留写入的数据")
+    args = parser.parse_args()
+
+    shards = ShardMap(parse_shard_endpoints(args.shards))
+    store = ShardedVectorStore(shards)
+    vectors, owners = _generate(args.size, args.users, db_config.vector_dim, args.seed)
+
+    started = time.perf_counter()
+    _load(store, vectors, owners)
+    load_s = time.perf_counter() - started
+    # 等待各分片后台索引完成
+    time.sleep(1)
+
+    distribution = {endpoint: {"users": 0, "chunks": 0} for endpoint in shards.endpoints}
+    for u in range(args.users):
+        user_id = f"{PREFIX}-u{u}"
+        endpoint = shards.endpoints[shards.shard_for(user_id)]
+        distribution[endpoint]["users"] += 1
+        distribution[endpoint]["chunks"] += store.count(user_id)
+
+    rng = np.random.default_rng(args.seed + 1)
+    picks = rng.integers(0, args.size, args.queries)
+    user_ms = []
+    global_ms = []
+    recalls = []
+    leaked = 0
+    for i in picks:
+        user_id = f"{PREFIX}-u{owners[i]}"
+        t0 = time.perf_counter()
+        hits = store.search(vectors[i], user_id, args.top_k, exact=True)
+        user_ms.append((time.perf_counter() - t0) * 1000)
+        leaked += sum(1 for hit in hits if hit["user_id"] != user_id)
+
+        t0 = time.perf_counter()
+        hits = store.search_global(vectors[i], args.top_k, ef_runtime=max(100, args.top_k))
+        global_ms.append((time.perf_counter() - t0) * 1000)
+        expected = set(np.argsort(-(vectors @ vectors[i]))[:args.top_k].tolist())
+        found = {int(hit["doc_id"].rsplit("-", 1)[1]) for hit in hits}
+        recalls.append(len(found & expected) / args.top_k)
+
+    print(json.dumps({
+        "shards": len(shards),
+        "size": args.size,
+        "users": args.users,
+        "load_s": round(load_s, 2),
+        "distribution": distribution,
+        "user_search_p50_ms": float(np.percentile(user_ms, 50)),
+        "user_search_p99_ms": float(np.percentile(user_ms, 99)),
+        "user_search_foreign_hits": leaked,
+        "global_search_p50_ms": float(np.percentile(global_ms, 50)),
+        "global_search_p99_ms": float(np.percentile(global_ms, 99)),
+        f"global_recall@{args.top_k}": float(np.mean(recalls)),
+        "moved_users_when_adding_shard": _moved_ratio(shards.endpoints, args.users),
+    }, ensure_ascii=False, indent=2))
+
+    if not args.keep:
+        for u in range(args.users):
+            user_id = f"{PREFIX}-u{u}"
+            doc_ids = [f"{PREFIX}-{i}" for i in np.flatnonzero(owners == u)]
+            if doc_ids:
+                store.delete(user_id, doc_ids)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,216 @@
+# vector索引schema内存对比：旧版全文索引（content/raw/text 为TEXT字段） vs 精简schema（只有向量、TAG/NUMERIC和lex）
+#
+# 语料默认取MongoDB中带附件的真实内容（正文 + OCR + 文档提取文本，与入库时的索引文本一致），
+# 不足时用Zipf分布词表生成长文档补齐；按字符窗口切分为分块（近似按token切分的分块长度），
+# 以与 RedisVectorStore 相同的字段写入 bench-schema:* 哈希（随机单位向量、按词频取的lex词项）。
+# 对同一批键先后创建两种schema的索引，等待后台索引完成后记录：
+#   FT.INFO 的倒排索引、词位置、文档表、键表、向量索引大小，以及建索引前后 used_memory 的增量。
+# 结果以JSON输出（--output 写入文件）。
+#
+# 用法（在 Backend 目录下，需要本地 redis-stack-server；不要对生产实例运行）:
+#     python -m benchmarks.bench_vector_schema [--docs 2000] [--source mongo|synthetic]
+#                                              [--chunk-chars 1200] [--overlap 150] [--output bench_vector_schema.json]
+import argparse
+import json
+import re
+import time
+import zlib
+from collections import Counter
+import numpy as np
+from redis.commands.search.indexDefinition import IndexDefinition, IndexType
+from config.database import build_vector_schema, cache_client, db_client
+from config.settings import db_config
+from services.vector_codec import encode_vector
+from services.vector_rehydrator import CONTENT_PROJECTION
+from services.vector_service import build_index_text
+
+PREFIX = "bench-schema:"
+INDEX_NAME = "bench-schema"
+INFO_FIELDS = ("inverted_sz_mb", "offset_vectors_sz_mb", "doc_table_size_mb",
+               "key_table_size_mb", "vector_index_sz_mb")
+# BGE-M3 词表大小，lex 词项形如 t{token_id}
+VOCAB_SIZE = 250002
+
+
+def _mongo_corpus(limit: int) -> list:
+    """MongoDB中带附件内容的索引文本"""
+    query = {"$or": [{"images.0": {"$exists": True}}, {"files.0": {"$exists": True}}]}
+    texts = []
+    for content in db_client.todosContent.find(query, CONTENT_PROJECTION).limit(limit):
+        extracted = content.get("extracted_content") or {}
+        text = build_index_text(
+            content.get("content"), extracted.get("ocr_texts"), extracted.get("file_texts")
+        )
+        if text:
+            texts.append(text)
+    return texts
+
+
+def _synthetic_corpus(count: int, seed: int) -> list:
+    """Zipf分布词表生成的长文档，长度按对数正态分布（多页PDF/扫描件量级）"""
+    rng = np.random.default_rng(seed)
+    vocab = [f"w{i:05d}" for i in range(50000)]
+    texts = []
+    for _ in range(count):
+        words = int(np.clip(rng.lognormal(6.5, 1.0), 50, 20000))
+        ranks = np.minimum(rng.zipf(1.2, words), len(vocab)) - 1
+        texts.append(" ".join(vocab[r] for r in ranks))
+    return texts
+
+
+def _chunk(text: str, size: int, overlap: int) -> list:
+    step = max(1, size - overlap)
+    chunks = []
+    for start in range(0, len(text), step):
+        chunks.append({"text": text[start:start + size], "start": start, "end": min(len(text), start + size)})
+        if start + size >= len(text):
+            break
+    return chunks
+
+
+def _lex_terms(text: str, limit: int = 16) -> str:
+    """取分块中最常见的词映射为 t{token_id}，近似词汇权重最高的token"""
+    counts = Counter(re.findall(r"\w+", text.lower()))
+    return " ".join(f"t{zlib.crc32(word.encode('utf-8')) % VOCAB_SIZE}" for word, _ in counts.most_common(limit))
+
+
+def _load(redis_client, texts: list, args, rng) -> tuple:
+    """按存储层的字段写入分块哈希，返回 (分块数, 分块文本总字符数)"""
+    chunks_total = 0
+    chars = 0
+    pipe = redis_client.pipeline(transaction=False)
+    for n, text in enumerate(texts):
+        doc_id = f"doc{n}"
+        raw_json = json.dumps({"images": [], "files": [f"{doc_id}.pdf"], "has_ocr": False, "has_file_text": True})
+        for i, chunk in enumerate(_chunk(text, args.chunk_chars, args.overlap)):
+            vector = rng.standard_normal(db_config.vector_dim).astype(np.float32)
+            vector_bytes, vector_scale = encode_vector(vector / np.linalg.norm(vector), db_config.vector_type)
+            fields = {
+                "doc_id": doc_id,
+                "user_id": f"u{n % args.users}",
+                "chunk_index": i,
+                "start": chunk["start"],
+                "end": chunk["end"],
+                "fingerprint": f"{doc_id}-{i}",
+                "raw": raw_json,
+                "text": chunk["text"],
+                "lex": _lex_terms(chunk["text"]),
+                "vector": vector_bytes
+            }
+            if vector_scale is not None:
+                fields["vector_scale"] = repr(vector_scale)
+            pipe.hset(f"{PREFIX}{doc_id}:{i}", mapping=fields)
+            chunks_total += 1
+            chars += len(chunk["text"])
+            if chunks_total % 500 == 0:
+                pipe.execute()
+    pipe.execute()
+    return chunks_total, chars
+
+
+def _cleanup(redis_client):
+    keys = []
+    for key in redis_client.scan_iter(match=f"{PREFIX}*", count=1000):
+        keys.append(key)
+        if len(keys) >= 1000:
+            redis_client.delete(*keys)
+            keys = []
+    if keys:
+        redis_client.delete(*keys)
+
+
+def _drop_index(redis_client):
+    try:
+        redis_client.ft(INDEX_NAME).dropindex(delete_documents=False)
+    except Exception:
+        pass
+
+
+def _info_value(info: dict, name: str) -> float:
+    value = info.get(name, 0)
+    if isinstance(value, bytes):
+        value = value.decode("utf-8")
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def _measure(redis_client, full_text: bool) -> dict:
+    """创建一种schema的索引并记录内存"""
+    _drop_index(redis_client)
+    before = redis_client.info("memory")["used_memory"]
+    started = time.perf_counter()
+    redis_client.ft(INDEX_NAME).create_index(
+        build_vector_schema(db_config.vector_type, db_config.vector_dim, full_text=full_text),
+        definition=IndexDefinition(prefix=[PREFIX], index_type=IndexType.HASH),
+        no_term_offsets=not full_text
+    )
+    while True:
+        info = redis_client.ft(INDEX_NAME).info()
+        if _info_value(info, "indexing") == 0 and _info_value(info, "percent_indexed") >= 1:
+            break
+        time.sleep(0.1)
+    elapsed = time.perf_counter() - started
+    result = {field: round(_info_value(info, field), 2) for field in INFO_FIELDS}
+    result["index_total_mb"] = round(sum(result[field] for field in INFO_FIELDS), 2)
+    result["used_memory_delta_mb"] = round((redis_client.info("memory")["used_memory"] - before) / 1024 / 1024, 2)
+    result["num_records"] = int(_info_value(info, "num_records"))
+    result["build_seconds"] = round(elapsed, 2)
+    _drop_index(redis_client)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="vector索引schema内存对比")
+    parser.add_argument("--docs", type=int, default=2000, help="内容数量")
+    parser.add_argument("--source", choices=["mongo", "synthetic"], default="mongo", help="语料来源，mongo不足时用合成文档补齐")
+    parser.add_argument("--users", type=int, default=50, help="内容分布的用户数")
+    parser.add_argument("--chunk-chars", type=int, default=1200, help="分块字符数")
+    parser.add_argument("--overlap", type=int, default=150, help="相邻分块重叠字符数")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--output", default=None, help="结果JSON文件")
+    args = parser.parse_args()
+
+    redis_client = cache_client.client
+    rng = np.random.default_rng(args.seed)
+    texts = _mongo_corpus(args.docs) if args.source == "mongo" else []
+    real = len(texts)
+    texts += _synthetic_corpus(args.docs - real, args.seed)
+
+    _cleanup(redis_client)
+    data_before = redis_client.info("memory")["used_memory"]
+    chunks, chars = _load(redis_client, texts, args, rng)
+    data_mb = (redis_client.info("memory")["used_memory"] - data_before) / 1024 / 1024
+    print(f"写入 {len(texts)} 个内容（真实 {real}），{chunks} 个分块，文本 {chars / 1024 / 1024:.1f}M 字符，数据 {data_mb:.1f}MB")
+
+    try:
+        full = _measure(redis_client, full_text=True)
+        print(f"全文schema: {full}")
+        slim = _measure(redis_client, full_text=False)
+        print(f"精简schema: {slim}")
+    finally:
+        _drop_index(redis_client)
+        _cleanup(redis_client)
+
+    report = {
+        "vector_type": db_config.vector_type,
+        "docs": len(texts),
+        "real_docs": real,
+        "chunks": chunks,
+        "text_chars": chars,
+        "data_mb": round(data_mb, 2),
+        "full_text": full,
+        "slim": slim,
+        "index_saved_mb": round(full["index_total_mb"] - slim["index_total_mb"], 2),
+        "total_ratio": round((data_mb + slim["used_memory_delta_mb"]) / (data_mb + full["used_memory_delta_mb"]), 3)
+        if data_mb + full["used_memory_delta_mb"] > 0 else None
+    }
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+
+
+if __name__ == "__main__":
+    main()
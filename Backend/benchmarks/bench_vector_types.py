@@ -0,0 +1,111 @@
+# 向量存储类型的内存与召回对比
+#
+# 从Redis抽样已存储的分块向量，一部分作为语料、一部分作为查询，
+# 对 FLOAT32 / FLOAT16 / INT8 分别做编码-还原后精确计算余弦 top-k，
+# 以FLOAT32结果为基准输出 Recall@k，并给出每种类型的向量字节数和当前索引的内存占用。
+#
+# 用法（在 Backend 目录下，需要 Redis Stack 中已有向量数据）:
+#     python -m benchmarks.bench_vector_types [--corpus 20000] [--queries 200] [--top-k 10]
+import argparse
+import json
+import numpy as np
+from config.database import cache_client, vector_key_prefixes
+from config.settings import db_config
+from services.vector_codec import VECTOR_TYPES, decode_vector, encode_vector, vector_bytes
+from services.vector_index import VectorIndexManager
+
+
+def _sample_vectors(redis_client, limit: int, batch: int = 500) -> np.ndarray:
+    """抽样当前索引版本已存储的分块向量"""
+    prefix = vector_key_prefixes(VectorIndexManager(redis_client).state()["active"])["chunk"]
+    vectors = []
+    keys = []
+
+    def flush():
+        pipe = redis_client.pipeline(transaction=False)
+        for key in keys:
+            pipe.hmget(key, ["vector", "vector_scale"])
+        for data, scale in pipe.execute():
+            if data:
+                vectors.append(decode_vector(data, db_config.vector_dim, scale))
+
+    for key in redis_client.scan_iter(match=f"{prefix}*", count=batch, _type="HASH"):
+        keys.append(key)
+        if len(keys) >= batch:
+            flush()
+            keys = []
+            if len(vectors) >= limit:
+                break
+    if keys:
+        flush()
+    return np.array(vectors[:limit], dtype=np.float32)
+
+
+def _roundtrip(vector: np.ndarray, vector_type: str) -> np.ndarray:
+    """按存储类型编码后再还原，得到索引实际使用的向量"""
+    data, scale = encode_vector(vector, vector_type)
+    return decode_vector(data, db_config.vector_dim, scale)
+
+
+def _normalize(matrix: np.ndarray) -> np.ndarray:
+    return matrix / np.maximum(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12)
+
+
+def _top_k(corpus: np.ndarray, queries: np.ndarray, k: int) -> np.ndarray:
+    """余弦相似度精确 top-k"""
+    scores = _normalize(queries) @ _normalize(corpus).T
+    return np.argsort(-scores, axis=1)[:, :k]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="向量存储类型的内存与召回对比")
+    parser.add_argument("--corpus", type=int, default=20000, help="语料向量数量")
+    parser.add_argument("--queries", type=int, default=200, help="查询向量数量")
+    parser.add_argument("--top-k", type=int, default=10, help="召回计算的k")
+    args = parser.parse_args()
+
+    redis_client = cache_client.client
+    sample = _sample_vectors(redis_client, args.corpus + args.queries)
+    if len(sample) <= args.queries:
+        print("向量数量不足，无法评估")
+        return
+    queries, corpus = sample[:args.queries], sample[args.queries:]
+    truth = _top_k(corpus, queries, args.top_k)
+
+    report = []
+    for vector_type in VECTOR_TYPES:
+        restored = np.array([_roundtrip(vector, vector_type) for vector in corpus])
+        # 查询向量同样按存储类型编码后参与计算
+        restored_queries = np.array([_roundtrip(vector, vector_type) for vector in queries])
+        found = _top_k(restored, restored_queries, args.top_k)
+        recall = np.mean([len(set(t).intersection(f)) / args.top_k for t, f in zip(truth, found)])
+        per_vector = vector_bytes(db_config.vector_dim, vector_type)
+        report.append({
+            "vector_type": vector_type,
+            "bytes_per_vector": per_vector,
+            "vector_mb_for_corpus": len(corpus) * per_vector / 1024 / 1024,
+            "memory_saved_vs_float32": 1 - per_vector / vector_bytes(db_config.vector_dim, "FLOAT32"),
+            f"recall@{args.top_k}": float(recall),
+        })
+        print(json.dumps(report[-1], ensure_ascii=False))
+
+    try:
+        info = redis_client.ft(db_config.vector_index_alias).info()
+        index_info = {
+            key: info.get(key) for key in ("num_docs", "vector_index_sz_mb", "total_index_memory_sz_mb")
+            if key in info
+        }
+    except Exception as e:
+        index_info = {"error": str(e)}
+
+    print(json.dumps({
+        "configured_vector_type": db_config.vector_type,
+        "corpus": len(corpus),
+        "queries": len(queries),
+        "current_index": index_info,
+        "results": report
+    }, ensure_ascii=False, indent=2, default=str))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+# 向量写入/删除往返延迟基准
+#
+# 用随机向量直接写入（不经过模型编码），对比每个Todo有 1 / 100 / 10000 个内容时
+# 脚本化批量删除与逐条 HGET 校验后删除（旧实现）的延迟。
+#
+# 用法（在 Backend 目录下，需要 Redis Stack 且 VECTOR_STORE=redis）:
+#     python -m benchmarks.bench_vector_writes [--sizes 1,100,10000] [--repeat 3]
+import argparse
+import json
+import time
+import uuid
+import numpy as np
+from services.vector_service import VectorService
+
+
+def _write_todo(vector_service: VectorService, user_id: str, todo_id: str, count: int, dim: int) -> tuple:
+    """为一个Todo写入count个单分块内容，返回doc_id列表和单次写入耗时"""
+    doc_ids = []
+    write_ms = []
+    for _ in range(count):
+        doc_id = uuid.uuid4().hex
+        text = f"bench {doc_id}"
+        vector = np.random.rand(dim).astype(np.float32)
+        started = time.perf_counter()
+        vector_service.store.save(
+            doc_id, user_id,
+            chunks=[{"text": text, "start": 0, "end": len(text)}],
+            fingerprints=[vector_service.fingerprint(text)],
+            vectors=[vector],
+            raw_json="{}",
+            content_fingerprint=vector_service.fingerprint(text),
+            todo_id=todo_id
+        )
+        write_ms.append((time.perf_counter() - started) * 1000)
+        doc_ids.append(doc_id)
+    return doc_ids, write_ms
+
+
+def _legacy_delete(vector_service: VectorService, user_id: str, doc_ids: list) -> int:
+    """旧实现：每个内容一次 HGET 校验归属，最后一次 DEL"""
+    store = vector_service.store.for_user(user_id)
+    redis_client = store.redis_client
+    prefixes = store.active().prefixes
+    keys = []
+    for doc_id in doc_ids:
+        owner = redis_client.hget(f"{prefixes['doc']}{doc_id}", "user_id")
+        if owner and owner.decode("utf-8") == user_id:
+            keys.extend([f"{prefixes['doc']}{doc_id}", f"{prefixes['chunk']}{doc_id}:0", f"{prefixes['chunk']}{doc_id}"])
+    if keys:
+        redis_client.delete(*keys)
+    return len(keys)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="向量写入/删除延迟基准")
+    parser.add_argument("--sizes", default="1,100,10000", help="每个Todo的内容数量，逗号分隔")
+    parser.add_argument("--repeat", type=int, default=3, help="每个规模重复次数")
+    parser.add_argument("--dim", type=int, default=1024, help="向量维度")
+    args = parser.parse_args()
+
+    vector_service = VectorService()
+    user_id = f"bench-{uuid.uuid4()}"
+    report = []
+
+    for size in [int(s) for s in args.sizes.split(",")]:
+        script_ms = []
+        legacy_ms = []
+        write_ms = []
+        for _ in range(args.repeat):
+            todo_id = f"bench-{uuid.uuid4()}"
+            doc_ids, single_write_ms = _write_todo(vector_service, user_id, todo_id, size, args.dim)
+            write_ms.extend(single_write_ms)
+            started = time.perf_counter()
+            vector_service.delete_by_todo_id(todo_id, user_id)
+            script_ms.append((time.perf_counter() - started) * 1000)
+
+            todo_id = f"bench-{uuid.uuid4()}"
+            doc_ids, _ = _write_todo(vector_service, user_id, todo_id, size, args.dim)
+            started = time.perf_counter()
+            _legacy_delete(vector_service, user_id, doc_ids)
+            legacy_ms.append((time.perf_counter() - started) * 1000)
+            store = vector_service.store.for_user(user_id)
+            store.redis_client.delete(f"{store.active().prefixes['todo']}{todo_id}")
+
+        report.append({
+            "contents_per_todo": size,
+            "write_p50_ms": float(np.percentile(write_ms, 50)),
+            "write_p99_ms": float(np.percentile(write_ms, 99)),
+            "delete_by_todo_script_ms": float(np.median(script_ms)),
+            "delete_by_todo_legacy_ms": float(np.median(legacy_ms)),
+        })
+        print(json.dumps(report[-1], ensure_ascii=False))
+
+    print(json.dumps({"results": report}, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
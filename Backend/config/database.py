@@ -1,10 +1,13 @@
 #数据库连接模块
+import hashlib
+import threading
 from pydoc import doc
 from pymongo import MongoClient
 from pymongo.server_api import ServerApi
 #导入redis
 import redis
 from redis import Redis
+from redis.exceptions import ResponseError
 #导入redis的搜索模块
 from redis.commands.search.query import Query
 #导入redis的搜索字段模块
@@ -72,17 +75,16 @@ class MongoDBClient:
 #创建全局数据库实例
 db_client=MongoDBClient()
 
-#Redis客户端
-@singleton
-class RedisClient:
-    _client=None
-
-    #规定vector索引
-    vector_schema=[
-        TextField('content'),
+#vector索引字段，向量存储类型可配置
+#检索只用KNN、user_id/doc_id过滤和lex词汇检索，分块的 text、raw 作为普通哈希字段保存（不建倒排索引），
+#FT.SEARCH 的 RETURN 仍直接从哈希读取；full_text=True 为旧版全文索引的schema，仅供内存对比基准使用
+def build_vector_schema(vector_type: str, dim: int, full_text: bool = False) -> list:
+    text_fields=[TextField('content'), TextField('raw'), TextField('text')] if full_text else []
+    return text_fields + [
         TagField('user_id'),
-        TextField('raw'),
-        TextField('text'),
+        TagField('doc_id'),#分块所属的内容ID
+        NumericField('chunk_index'),
+        TextField('lex', no_stem=True),#BGE-M3词汇权重最高的token，形如 t{token_id}
         VectorField(
                         "vector",                   # 向量字段
                         # "FLAT",                     # 使用FLAT算法适应小中数据
@@ -93,8 +95,8 @@ class RedisClient:
                         # }
                         "HNSW",                     # 使用HNSW算法适应大中数据
                         {
-                            "TYPE": "FLOAT32",
-                            "DIM": 1024,#512是向量维度
+                            "TYPE": vector_type,    # FLOAT32 / FLOAT16 / INT8
+                            "DIM": dim,
                             "DISTANCE_METRIC": "COSINE",
                             "INITIAL_CAP": 1000,
                             "M": 16,  # HNSW 参数：连接数
@@ -104,6 +106,78 @@ class RedisClient:
                     )
     ]
 
+#索引版本0为最初的 vector 索引和 vector:* 键，重建产生的版本n使用 vector_v{n} 索引和 vector_v{n}:* 键
+VECTOR_INDEX_META_KEY = "vector_index:meta"
+
+def vector_index_name(version: int) -> str:
+    return "vector" if version == 0 else f"vector_v{version}"
+
+#某个版本的分块、元数据、指纹索引、Todo集合、内存计量、LRU键前缀
+def vector_key_prefixes(version: int) -> dict:
+    base = vector_index_name(version)
+    return {
+        "chunk": f"{base}:",
+        "doc": f"{base}_doc:",
+        "fp": f"{base}_fp:",
+        "todo": f"{base}_todo:",
+        "usage": f"{base}_usage:",
+        "lru": f"{base}_lru:"
+    }
+
+#在指定Redis上创建vector索引，vector_type为空时使用配置的存储类型，version为索引版本，
+#name为空时使用该版本的索引名（迁移schema时在同一前缀上建临时索引）
+def create_vector_index(client, vector_type=None, version=0, name=None):
+    vector_definition=IndexDefinition(
+        prefix=[
+        vector_key_prefixes(version)["chunk"]
+        ],
+        index_type=IndexType.HASH
+    )
+    schema=build_vector_schema(vector_type or db_config.vector_type, db_config.vector_dim)
+    #lex只做 @lex:(t1|t2) 词项匹配和BM25打分，不需要短语/邻近查询用的词位置
+    client.ft(name or vector_index_name(version)).create_index(schema,vector_definition,no_term_offsets=True)
+
+#索引或别名是否存在，FT.INFO 对不存在的索引返回错误（连接错误等照常抛出）
+def index_exists(client, name: str) -> bool:
+    try:
+        client.ft(name).info()
+        return True
+    except ResponseError as e:
+        if "unknown index" in str(e).lower() or "no such index" in str(e).lower():
+            return False
+        raise
+
+#索引是否仍对分块文本建全文索引（旧版schema创建的索引），需要运行 scripts.migrate_vector_schema 迁移
+def has_full_text_schema(client, name: str) -> bool:
+    info=client.ft(name).info()
+    for attribute in info.get("attributes", []):
+        fields=[item.decode("utf-8") if isinstance(item, bytes) else item for item in attribute]
+        if "identifier" in fields and fields[fields.index("identifier") + 1] in ("text", "raw", "content"):
+            return True
+    return False
+
+#检索通过别名访问当前版本的vector索引，没有时创建（缓存Redis和每个向量分片各自维护）
+def init_vector_index(client):
+    try:
+        if index_exists(client, db_config.vector_index_alias):
+            if has_full_text_schema(client, db_config.vector_index_alias):
+                print('vector索引仍对分块文本建全文索引，运行 python -m scripts.migrate_vector_schema 可释放这部分内存')
+            return
+        version=int(client.hget(VECTOR_INDEX_META_KEY, "active") or 0)
+        if not index_exists(client, vector_index_name(version)):
+            create_vector_index(client, version=version)
+        client.ft(vector_index_name(version)).aliasadd(db_config.vector_index_alias)
+    except Exception as e:
+        print(f'创建索引失败: {e}')
+
+#Redis客户端
+@singleton
+class RedisClient:
+    _client=None
+
+    #规定vector索引
+    vector_schema=build_vector_schema(db_config.vector_type, db_config.vector_dim)
+
     content_schema = [
         TextField('content'),          
         TagField('user_id'),          
@@ -138,17 +212,9 @@ class RedisClient:
     #初始化操作，如果没有就创建索引
     def init_index(self):
         try:
-            self._client.ft('vector').info()
             self._client.ft('content').info()
         except Exception as e:
             try:
-                vector_definition=IndexDefinition(
-                    prefix=[
-                    "vector:"
-                    ],
-                    index_type=IndexType.HASH
-                )
-                self._client.ft('vector').create_index(self.vector_schema,vector_definition)
                 content_definition=IndexDefinition(
                     prefix=[
                     "content:"
@@ -159,8 +225,12 @@ class RedisClient:
             except Exception as e:
                 print(f'创建索引失败: {e}')
 
-    
-    
+        init_vector_index(self._client)
+
+    #创建vector索引，vector_type为空时使用配置的存储类型，version为索引版本
+    def create_vector_index(self, vector_type=None, version=0):
+        create_vector_index(self._client, vector_type, version)
+
     @property
     #返回客户端
     def client(self):
@@ -176,9 +246,64 @@ class RedisClient:
 
 #缓存客户端
 cache_client=RedisClient()
-    
-    
 
+#解析向量分片配置，每项规范化为 host:port/db；为空时只有缓存Redis一个分片
+def parse_shard_endpoints(spec: str) -> list:
+    endpoints=[]
+    for item in (spec or "").split(","):
+        item=item.strip()
+        if not item:
+            continue
+        address, _, db=item.partition("/")
+        host, _, port=address.rpartition(":")
+        if not host:
+            host, port=address, "6379"
+        endpoint=f"{host}:{int(port)}/{int(db or 0)}"
+        if endpoint in endpoints:
+            raise ValueError(f"向量分片重复: {item}")
+        endpoints.append(endpoint)
+    return endpoints or [f"{db_config.redis_host}:{int(db_config.redis_port)}/{int(db_config.redis_db)}"]
 
-    
-    
+#向量分片表：user_id 用最高随机权重（rendezvous）哈希到一个分片，
+#增删分片时只有原本或新归属该分片的用户需要迁移，各进程按同一配置得到相同结果
+class ShardMap:
+    def __init__(self, endpoints: list):
+        self.endpoints=list(endpoints)
+        self._clients={}
+        self._lock=threading.Lock()
+
+    def __len__(self):
+        return len(self.endpoints)
+
+    #用户所在分片的序号
+    def shard_for(self, user_id: str) -> int:
+        if len(self.endpoints) == 1:
+            return 0
+        return max(
+            range(len(self.endpoints)),
+            key=lambda i: hashlib.sha1(f"{self.endpoints[i]}|{user_id}".encode("utf-8")).digest()
+        )
+
+    #分片的Redis客户端，首次使用时连接并初始化vector索引；与缓存Redis相同的分片复用缓存客户端
+    def client(self, shard: int):
+        with self._lock:
+            client=self._clients.get(shard)
+            if client is None:
+                host, _, rest=self.endpoints[shard].rpartition(":")
+                port, _, db=rest.partition("/")
+                if (host, int(port), int(db)) == (db_config.redis_host, int(db_config.redis_port), int(db_config.redis_db)):
+                    client=cache_client.client
+                else:
+                    client=Redis(host=host, port=int(port), db=int(db), decode_responses=False)
+                    client.ping()
+                    init_vector_index(client)
+                    print(f'向量分片 {self.endpoints[shard]} 连接成功')
+                self._clients[shard]=client
+            return client
+
+    #全部分片的客户端，按分片序号排列
+    def clients(self) -> list:
+        return [self.client(shard) for shard in range(len(self.endpoints))]
+
+#向量分片表
+shard_map=ShardMap(parse_shard_endpoints(db_config.vector_shards))
@@ -18,8 +18,51 @@ class DatabaseConfig:
     redis_port: str = os.getenv('REDIS_PORT','6379')
     # redis_password: str = os.getenv('REDIS_PASSWORD')
     redis_vector_ttl: int = os.getenv('REDIS_VECTOR_TTL', 3*24*60*60)#3天
+    #滑动过期：检索命中和读取内容时刷新向量的过期时间
+    vector_sliding_ttl: bool = os.getenv('VECTOR_SLIDING_TTL', 'true').lower() == 'true'
+    #检索时发现用户向量少于内容数量时，在后台从MongoDB重新编码已过期的内容
+    vector_lazy_rehydrate: bool = os.getenv('VECTOR_LAZY_REHYDRATE', 'true').lower() == 'true'
+    #同一用户两次惰性检查的最小间隔（秒）
+    vector_rehydrate_interval: int = int(os.getenv('VECTOR_REHYDRATE_INTERVAL', 600))
+    #重新编码时每批处理的内容数量
+    vector_rehydrate_batch_size: int = int(os.getenv('VECTOR_REHYDRATE_BATCH_SIZE', 64))
+    #向量内存预算（MB，0为不限），按稠密向量和ColBERT向量的字节数计量：用户超出时逐出其最久未被检索的内容，
+    #全局（每个Redis）超出时从用量最大的用户开始逐出；设置任一预算后向量键不再设置过期时间（代替 REDIS_VECTOR_TTL）
+    vector_user_budget_mb: int = int(os.getenv('VECTOR_USER_BUDGET_MB', 0))
+    vector_global_budget_mb: int = int(os.getenv('VECTOR_GLOBAL_BUDGET_MB', 0))
+    #一次检索最多在后台重新编码的已逐出内容数量
+    vector_restore_limit: int = int(os.getenv('VECTOR_RESTORE_LIMIT', 5))
     redis_content_ttl: int = os.getenv('REDIS_CONTENT_TTL', 3600)#一小时
     redis_db: int = os.getenv('REDIS_DB', 0)
+    #用户分块数不超过该值时对其全部分块精确打分，否则走过滤后的HNSW
+    vector_exact_search_threshold: int = int(os.getenv('VECTOR_EXACT_SEARCH_THRESHOLD', 2000))
+    #默认检索精度档位：fast / balanced / exact（exact 始终对用户全部分块精确打分）
+    vector_search_profile: str = os.getenv('VECTOR_SEARCH_PROFILE', 'balanced').lower()
+    #各档位HNSW查询的候选列表大小（EF_RUNTIME），越大召回越高、延迟越高
+    vector_ef_runtime_fast: int = int(os.getenv('VECTOR_EF_RUNTIME_FAST', 10))
+    vector_ef_runtime_balanced: int = int(os.getenv('VECTOR_EF_RUNTIME_BALANCED', 100))
+    #各档位KNN多取的分块倍数（同一内容可能命中多个分块）
+    vector_oversample_fast: int = int(os.getenv('VECTOR_OVERSAMPLE_FAST', 2))
+    vector_oversample_balanced: int = int(os.getenv('VECTOR_OVERSAMPLE_BALANCED', 3))
+    vector_oversample_exact: int = int(os.getenv('VECTOR_OVERSAMPLE_EXACT', 4))
+    redis_query_vector_ttl: int = int(os.getenv('REDIS_QUERY_VECTOR_TTL', 7*24*60*60))#查询向量缓存7天
+    #向量索引的存储类型：FLOAT32 / FLOAT16（需RediSearch 2.10+）/ INT8（需Redis 8+），修改后用 scripts.migrate_vector_type 迁移
+    vector_type: str = os.getenv('VECTOR_TYPE', 'FLOAT32').upper()
+    #向量维度
+    vector_dim: int = int(os.getenv('VECTOR_DIM', 1024))
+    #检索使用的索引别名，指向当前版本的 vector 索引，重建后原子切换
+    vector_index_alias: str = os.getenv('VECTOR_INDEX_ALIAS', 'vector_active')
+    #各进程重新读取索引版本状态的间隔（秒）
+    vector_index_refresh: int = int(os.getenv('VECTOR_INDEX_REFRESH', 5))
+    #别名切换后旧版本保留的时间（秒），之后回收其索引和键
+    vector_index_gc_grace: int = int(os.getenv('VECTOR_INDEX_GC_GRACE', 600))
+    #向量存储：redis（Redis Stack HNSW索引）/ mmap（进程内内存映射矩阵精确检索，单进程，不需要Redis Stack）
+    vector_store: str = os.getenv('VECTOR_STORE', 'redis').lower()
+    #mmap存储的数据目录
+    mmap_store_dir: str = os.getenv('MMAP_STORE_DIR', './vector_store')
+    #向量分片：逗号分隔的 host:port[/db]，按 user_id 哈希到其中一个Redis Stack；为空时向量与缓存共用一个Redis
+    #修改后用 scripts.reindex --old-shards 按新分片表重建并清理旧分片上的数据
+    vector_shards: str = os.getenv('VECTOR_SHARDS', '')
 
     
 #大模型配置
@@ -31,6 +74,42 @@ class AIconfig:
     model_name:str = os.getenv('MODEL_NAME', './bge-m3')
     #HuggingFace镜像地址
     hf_endpoint: str = os.getenv('HF_ENDPOINT', 'https://hf-mirror.com')
+    #编码后端：flag 为FlagEmbedding（torch），onnx 为ONNX Runtime（CPU，可int8量化）
+    encoder_backend: str = os.getenv('ENCODER_BACKEND', 'flag').lower()
+    #ONNX模型目录（scripts.export_onnx 的输出）与模型文件
+    onnx_model_dir: str = os.getenv('ONNX_MODEL_DIR', './bge-m3-onnx')
+    onnx_model_file: str = os.getenv('ONNX_MODEL_FILE', 'model_int8.onnx')
+    #ONNX Runtime单个算子的线程数，0为默认值
+    onnx_intra_op_threads: int = int(os.getenv('ONNX_INTRA_OP_THREADS', 0))
+    #独立编码进程地址：Unix socket路径或 host:port，逗号分隔可连接多个编码进程；为空时在Web进程内加载模型
+    embedding_worker: str = os.getenv('EMBEDDING_WORKER', '')
+    #编码进程连接认证密钥，编码进程和Web进程必须配置相同的随机密钥，没有默认值（连接上的消息会被反序列化）
+    embedding_worker_authkey: str = os.getenv('EMBEDDING_WORKER_AUTHKEY', '')
+    #每个Web进程到编码进程的连接数（同时进行的编码请求数）
+    embedding_worker_connections: int = int(os.getenv('EMBEDDING_WORKER_CONNECTIONS', 4))
+    #编码进程不可用时回退到进程内加载模型
+    embedding_worker_fallback: bool = os.getenv('EMBEDDING_WORKER_FALLBACK', 'true').lower() == 'true'
+    #长文本分块：每块token数与相邻块重叠的token数
+    chunk_tokens: int = int(os.getenv('CHUNK_TOKENS', 512))
+    chunk_overlap: int = int(os.getenv('CHUNK_OVERLAP', 64))
+    #编码微批处理：合并并发请求的编码调用
+    embed_batching: bool = os.getenv('EMBED_BATCHING', 'true').lower() == 'true'
+    embed_batch_max_size: int = int(os.getenv('EMBED_BATCH_MAX_SIZE', 32))
+    embed_batch_max_wait_ms: float = float(os.getenv('EMBED_BATCH_MAX_WAIT_MS', 5))
+    #按字符数分桶的边界
+    embed_batch_buckets: List[int] = field(
+        default_factory=lambda: [int(b) for b in os.getenv('EMBED_BATCH_BUCKETS', '128,512,2048').split(',')]
+    )
+    #查询向量进程内LRU缓存容量
+    query_cache_size: int = int(os.getenv('QUERY_CACHE_SIZE', 2048))
+    #写入时同时存储BGE-M3词汇权重，供hybrid检索使用
+    lexical_index: bool = os.getenv('LEXICAL_INDEX', 'true').lower() == 'true'
+    #每个分块保留的词汇权重token数
+    lexical_max_terms: int = int(os.getenv('LEXICAL_MAX_TERMS', 128))
+    #写入时同时存储ColBERT多向量（float16），供重排使用
+    colbert_index: bool = os.getenv('COLBERT_INDEX', 'false').lower() == 'true'
+    #ColBERT向量池化：相邻多少个token向量取平均，1为不池化
+    colbert_pool_factor: int = int(os.getenv('COLBERT_POOL_FACTOR', 1))
 
 #应用层配置
 @dataclass
@@ -51,6 +130,37 @@ class AppConfig:
     )
     #最大文件数量
     max_file_count: int = int(os.getenv('MAX_FILE_COUNT', 10))
+    #模型加载方式：background（启动后在后台线程加载并预热，完成前 /ready 返回503）/ lazy（首次使用时加载）
+    model_loading: str = os.getenv('MODEL_LOADING', 'background').lower()
+    #就绪检查要求已加载并预热的组件：vector（BGE-M3）/ file（PaddleOCR）/ rag（DeepSeek问答），
+    #入库走队列时Web进程不预热OCR，默认只要求vector
+    ready_components: List[str] = field(
+        default_factory=lambda: [name.strip() for name in os.getenv(
+            'READY_COMPONENTS', 'vector' if os.getenv('INGEST_MODE', 'queue').lower() == 'queue' else 'vector,file'
+        ).split(',') if name.strip()]
+    )
+    #内容入库方式：queue（请求只保存文件和内容，OCR、文本提取和向量化由入库worker经Redis Streams异步完成）/ inline（在请求内完成）
+    ingest_mode: str = os.getenv('INGEST_MODE', 'queue').lower()
+    #Web进程内启动的入库消费线程数，单独运行 scripts.ingest_worker 时设为0
+    ingest_local_workers: int = int(os.getenv('INGEST_LOCAL_WORKERS', 1))
+    #入库任务最多尝试次数，超过后转入死信流并标记失败
+    ingest_max_attempts: int = int(os.getenv('INGEST_MAX_ATTEMPTS', 3))
+    #消费者取走任务后超过该秒数未确认（进程崩溃等），由其他消费者接管
+    ingest_claim_idle: int = int(os.getenv('INGEST_CLAIM_IDLE', 600))
+    #任务流保留的最大条目数（近似裁剪）
+    ingest_stream_maxlen: int = int(os.getenv('INGEST_STREAM_MAXLEN', 100000))
+    #每个用户的入库进度事件保留时间（秒）
+    ingest_event_ttl: int = int(os.getenv('INGEST_EVENT_TTL', 3600))
+    #入库进度SSE连接的最长保持时间（秒），客户端断开后可带 Last-Event-ID 重连续读
+    ingest_events_timeout: int = int(os.getenv('INGEST_EVENTS_TIMEOUT', 300))
+    #相同文件（按内容SHA-256）的OCR/文档提取结果缓存时间（秒），0 表示不缓存
+    extract_cache_ttl: int = int(os.getenv('EXTRACT_CACHE_TTL', 30*24*60*60))
+    #入库时的近重复检测：link（链接到已有内容的向量，不再编码和写入索引）/ flag（照常索引并标记重复）/ off
+    near_dup_mode: str = os.getenv('NEAR_DUP_MODE', 'link').lower()
+    #判定为近重复的MinHash相似度（Jaccard估计）阈值
+    near_dup_threshold: float = float(os.getenv('NEAR_DUP_THRESHOLD', 0.9))
+    #参与近重复检测的最短文本长度（字符），只检测带图片或文件的内容
+    near_dup_min_chars: int = int(os.getenv('NEAR_DUP_MIN_CHARS', 200))
 
 #RAG配置
 @dataclass
@@ -59,6 +169,24 @@ class RAGConfig:
     top_k: int = int(os.getenv('TOP_K', 5))
     #检索结果相似度阈值
     similarity_threshold: float = float(os.getenv('SIMILARITY_THRESHOLD', 0.5))
+    #默认检索模式：dense 仅向量，hybrid 向量+词汇RRF融合
+    search_mode: str = os.getenv('SEARCH_MODE', 'dense')
+    #RRF平滑常数
+    rrf_k: int = int(os.getenv('RRF_K', 60))
+    #词汇检索召回的候选分块数
+    lexical_candidates: int = int(os.getenv('LEXICAL_CANDIDATES', 100))
+    #词汇检索使用的查询token数
+    lexical_query_terms: int = int(os.getenv('LEXICAL_QUERY_TERMS', 32))
+    #默认是否使用ColBERT重排（需开启COLBERT_INDEX写入ColBERT向量）
+    rerank: bool = os.getenv('RERANK', 'false').lower() == 'true'
+    #参与重排的候选分块数
+    rerank_candidates: int = int(os.getenv('RERANK_CANDIDATES', 50))
+    #按用户缓存检索的最终结果，用户向量写入或删除后通过写入纪元失效
+    search_result_cache: bool = os.getenv('SEARCH_RESULT_CACHE', 'true').lower() == 'true'
+    #检索结果缓存过期时间（秒）
+    search_result_cache_ttl: int = int(os.getenv('SEARCH_RESULT_CACHE_TTL', 300))
+    #检索结果中折叠近重复内容，只保留分数最高的一条并在 duplicates 中列出其余内容
+    collapse_duplicates: bool = os.getenv('COLLAPSE_DUPLICATES', 'true').lower() == 'true'
 
 
 #创建全局配置
@@ -130,7 +130,8 @@ class TodoContentModel(BaseModel):
     
     def create_content(self, todo_id: str, user_id: str, content: str, 
                       images: List[str] = None, files: List[str] = None,
-                      ocr_texts: List[str] = None, file_texts: List[str] = None) -> Tuple[bool, str, Optional[Dict]]:
+                      ocr_texts: List[str] = None, file_texts: List[str] = None,
+                      index_status: str = None) -> Tuple[bool, str, Optional[Dict]]:
         """
         创建Todo内容
         
@@ -142,6 +143,7 @@ class TodoContentModel(BaseModel):
             files: 文件列表
             ocr_texts: OCR提取的文本列表（新增）
             file_texts: 从文档提取的文本列表（新增）
+            index_status: 入库状态 pending/processing/indexed/failed，异步入库时传入（不传表示已在请求内完成）
             
         Returns:
             Tuple[bool, str, Optional[Dict]]: (是否成功, 消息, 内容数据)
@@ -179,6 +181,9 @@ class TodoContentModel(BaseModel):
                 "files": files or [],
                 "complete": False
             }
+            if index_status:
+                content_data["index_status"] = index_status
+                content_data["index_error"] = None
             
             result = self.collection.insert_one(content_data)
             content_data["_id"] = str(result.inserted_id)
@@ -287,6 +292,27 @@ class TodoContentModel(BaseModel):
                 content["created_at"] = content["created_at"].isoformat()
         return content
     
+    def find_linked_duplicates(self, user_id: str, content_ids: List[str]) -> List[Dict]:
+        """
+        查找链接到指定内容的近重复内容（不含这些内容本身）
+        
+        Args:
+            user_id: 用户ID
+            content_ids: 规范内容ID列表
+            
+        Returns:
+            List[Dict]: 内容列表，只含 _id 和 todo_id
+        """
+        contents = list(self.collection.find({
+            "user_id": user_id,
+            "duplicate_of": {"$in": content_ids},
+            "duplicate_mode": "link",
+            "_id": {"$nin": [ObjectId(content_id) for content_id in content_ids]}
+        }, {"_id": 1, "todo_id": 1}))
+        for content in contents:
+            content["_id"] = str(content["_id"])
+        return contents
+    
     def delete_contents_by_todo(self, todo_id: str, user_id: str) -> int:
         """删除指定Todo的所有内容"""
         result = self.collection.delete_many({
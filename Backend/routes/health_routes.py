@@ -0,0 +1,51 @@
+# 健康检查路由模块，供负载均衡判断进程存活和模型是否已就绪
+from flask import Blueprint, jsonify
+from config.settings import app_config
+from services.service_registry import registry
+
+# 创建健康检查蓝图
+health_bp = Blueprint('health', __name__)
+
+
+@health_bp.route('/live', methods=['GET'])
+def live():
+    """
+    存活检查，进程能处理请求即返回200
+
+    返回:
+        {"status": "alive"}
+    """
+    return jsonify({"status": "alive"}), 200
+
+
+@health_bp.route('/ready', methods=['GET'])
+def ready():
+    """
+    就绪检查：READY_COMPONENTS 中的组件全部加载并预热完成时返回200，否则503，
+    负载均衡只把流量转发到已就绪的实例。
+    MODEL_LOADING=lazy 时模型在首次使用时加载，只要没有组件加载失败即视为就绪
+
+    返回:
+        {
+            "ready": true/false,
+            "loading": "background/lazy",
+            "required": ["vector", "file"],
+            "components": {
+                "vector": {"state": "ready", "load_ms": 加载耗时, "warmup_ms": 预热耗时, "error": null},
+                ...
+            }
+        }
+    """
+    components = registry.status()
+    if app_config.model_loading == "lazy":
+        is_ready = all(
+            components.get(name, {}).get("state") != "failed" for name in app_config.ready_components
+        )
+    else:
+        is_ready = registry.is_ready()
+    return jsonify({
+        "ready": is_ready,
+        "loading": app_config.model_loading,
+        "required": app_config.ready_components,
+        "components": components
+    }), 200 if is_ready else 503
@@ -2,30 +2,21 @@
 import time
 import jwt
 from flask import Blueprint, request, jsonify, Response
-from services.vector_service import VectorService
+from services.vector_service import SEARCH_MODES, SEARCH_PROFILES
+from services.service_registry import registry
 from services.auth_service import AuthService
-from utils.decorators import handle_exceptions
+from utils.decorators import token_required, handle_exceptions
 from utils.validators import validate_search_query
 from config.settings import app_config
 
 # 创建搜索蓝图
 search_bp = Blueprint('search', __name__)
 
-# 初始化服务
-vector_service = VectorService()
+# 初始化服务，向量模型和RAG服务首次使用时加载（或由启动后的后台预热加载）
+vector_service = registry.lazy("vector")
+rag_service = registry.lazy("rag")
 auth_service = AuthService()
 
-# 导入RAG服务
-from services.rag_service import RAGService
-
-# 初始化RAG服务
-try:
-    rag_service = RAGService()
-    print("RAG服务初始化成功")
-except Exception as e:
-    print(f"RAG服务初始化失败: {e}")
-    rag_service = None
-
 
 def verify_token_for_sse(token):
     """
@@ -62,7 +53,9 @@ def chat():
             "question": "问题",
             "user_id": "用户ID",
             "token": "JWT令牌",
-            "continue": false  # 是否继续对话
+            "continue": false,  # 是否继续对话
+            "mode": "dense",  # 可选，检索模式 dense/hybrid
+            "profile": "balanced"  # 可选，检索精度档位 fast/balanced/exact
         }
     
     GET请求参数:
@@ -70,12 +63,14 @@ def chat():
         user_id: 用户ID
         token: JWT令牌
         continue: 是否继续对话 (true/false)
+        mode: 可选，检索模式 dense/hybrid
+        profile: 可选，检索精度档位 fast/balanced/exact
     
     返回:
         SSE流式响应
     """
     # 检查RAG服务是否可用
-    if not rag_service:
+    if registry.try_get("rag") is None:
         return jsonify({"error": "RAG service is not available"}), 503
     
     # 解析请求参数
@@ -88,11 +83,15 @@ def chat():
         user_id = data.get('user_id', '')
         token = data.get('token', '')
         continue_chat = data.get('continue', False)
+        mode = data.get('mode')
+        profile = data.get('profile')
     else:  # GET方法
         question = request.args.get("question", "").strip()
         user_id = request.args.get('user_id', '')
         token = request.args.get('token', '')
         continue_chat = request.args.get('continue', 'false').lower() == 'true'
+        mode = request.args.get('mode')
+        profile = request.args.get('profile')
     
     # 验证输入参数
     if not validate_search_query(question):
@@ -133,13 +132,33 @@ def chat():
                 yield f"event: error\ndata: {error_msg}\n\n"
             return Response(generate_error(), mimetype="text/event-stream")
     
+    if mode and mode not in SEARCH_MODES:
+        error_msg = "检索模式只能是 dense 或 hybrid"
+        if request.method == "POST":
+            return jsonify({"message": error_msg}), 400
+        else:
+            def generate_error():
+                yield f"event: error\ndata: {error_msg}\n\n"
+            return Response(generate_error(), mimetype="text/event-stream")
+    
+    if profile and profile not in SEARCH_PROFILES:
+        error_msg = "检索精度档位只能是 fast、balanced 或 exact"
+        if request.method == "POST":
+            return jsonify({"message": error_msg}), 400
+        else:
+            def generate_error():
+                yield f"event: error\ndata: {error_msg}\n\n"
+            return Response(generate_error(), mimetype="text/event-stream")
+    
     # 如果是继续对话，添加标记
     if continue_chat:
         print(f"继续之前的对话: {question}")
     
     # 调用RAG服务
     try:
-        result = rag_service.process_question(question, user_id, continue_chat)
+        result = rag_service.process_question(
+            question, user_id, continue_chat, search_mode=mode, search_profile=profile
+        )
         
         # 返回SSE流式响应
         def generate():
@@ -186,7 +205,11 @@ def vector_search():
             "query": "搜索查询",
             "user_id": "用户ID",
             "token": "JWT令牌",
-            "top_k": 5  # 可选，返回结果数量
+            "top_k": 5,  # 可选，返回结果数量
+            "mode": "hybrid",  # 可选，检索模式 dense/hybrid
+            "rerank": false,  # 可选，是否ColBERT重排
+            "profile": "balanced",  # 可选，检索精度档位 fast/balanced/exact
+            "collapse": true  # 可选，是否折叠近重复内容
         }
     
     返回:
@@ -195,7 +218,13 @@ def vector_search():
                 {
                     "score": 0.95,
                     "doc_id": "文档ID",
-                    "content": "文档内容"
+                    "content": "命中的分块内容",
+                    "raw_data": {...},
+                    "chunks": [{"chunk_index": 0, "text": "分块内容", "score": 0.95}],
+                    "dense_score": 0.95,  # hybrid 模式下各路的原始分数
+                    "lexical_score": 0.12,
+                    "first_stage_score": 0.03,  # 重排时第一阶段的分数
+                    "duplicates": ["重复内容ID"]  # 折叠时被合并的近重复内容
                 }
             ]
         }, 200
@@ -209,6 +238,10 @@ def vector_search():
     user_id = data.get("user_id", "")
     token = data.get("token", "")
     top_k = data.get("top_k", 5)
+    mode = data.get("mode")
+    rerank = data.get("rerank")
+    profile = data.get("profile")
+    collapse = data.get("collapse")
     
     # 验证输入
     if not validate_search_query(query):
@@ -230,22 +263,38 @@ def vector_search():
     if not isinstance(top_k, int) or top_k < 1 or top_k > 20:
         top_k = 5
     
+    if mode and mode not in SEARCH_MODES:
+        return jsonify({"message": "检索模式只能是 dense 或 hybrid"}), 400
+    
+    if rerank is not None and not isinstance(rerank, bool):
+        return jsonify({"message": "rerank 必须是布尔值"}), 400
+    
+    if profile and profile not in SEARCH_PROFILES:
+        return jsonify({"message": "检索精度档位只能是 fast、balanced 或 exact"}), 400
+    
+    if collapse is not None and not isinstance(collapse, bool):
+        return jsonify({"message": "collapse 必须是布尔值"}), 400
+    
     try:
-        # 执行向量搜索
-        search_results = vector_service.search_embedding(query, user_id, top_k)
+        # 执行向量搜索，结果直接由FT.SEARCH返回的分块字段组装，不再逐条回查
+        search_results = vector_service.search_chunks(
+            query, user_id, top_k, mode=mode, rerank=rerank, profile=profile, collapse=collapse
+        )
         
         # 格式化结果
         results = []
-        for score, doc_id in search_results:
-            # 获取文档详细信息
-            embedding_doc = vector_service.get_embedding_by_doc_id(doc_id, user_id)
-            if embedding_doc:
-                results.append({
-                    "score": score,
-                    "doc_id": doc_id,
-                    "content": embedding_doc.get("text", ""),
-                    "raw_data": embedding_doc.get("raw", {})
-                })
+        for group in search_results:
+            result = {
+                "score": group["score"],
+                "doc_id": group["doc_id"],
+                "content": "\n...\n".join(chunk["text"] for chunk in group["chunks"]),
+                "raw_data": group["raw"],
+                "chunks": group["chunks"]
+            }
+            for key in ("dense_score", "lexical_score", "first_stage_score", "duplicates"):
+                if key in group:
+                    result[key] = group[key]
+            results.append(result)
         
         return jsonify({"results": results}), 200
         
@@ -263,11 +312,47 @@ def health_check():
         {
             "status": "healthy",
             "rag_available": true/false,
-            "vector_service": "ready"
+            "vector_service": "pending/loading/warming/ready/failed"
         }
     """
+    components = registry.status()
     return jsonify({
         "status": "healthy",
-        "rag_available": rag_service is not None,
-        "vector_service": "ready"
+        "rag_available": components["rag"]["state"] != "failed",
+        "vector_service": components["vector"]["state"]
     }), 200
+
+
+@search_bp.route('/search/metrics', methods=['GET'])
+@token_required
+def metrics(current_user):
+    """
+    向量服务运行指标（编码微批处理、查询向量缓存等），向量服务未加载时不触发加载
+    
+    请求头:
+        Authorization: Bearer <token>
+    
+    返回:
+        {
+            "embedding_batcher": {
+                "batches": 批次数,
+                "avg_batch_size": 平均批大小,
+                "avg_queue_wait_ms": 平均排队等待时间,
+                "batch_size_histogram": {...},
+                ...
+            },
+            "query_cache": {
+                "local_hits": 进程内命中数,
+                "redis_hits": Redis命中数,
+                "misses": 未命中数,
+                "hit_rate": 命中率,
+                ...
+            },
+            "vector_usage": 当前用户的向量内存计量和预算
+        }
+        向量服务未加载时: {"vector_service": "pending/loading/failed"}
+    """
+    service = registry.peek("vector")
+    if service is None:
+        return jsonify({"vector_service": registry.status()["vector"]["state"]}), 200
+    return jsonify(service.metrics(current_user['id'])), 200
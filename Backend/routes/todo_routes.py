@@ -5,10 +5,12 @@ import json
 import traceback
 from flask import Blueprint, request, jsonify, Response, stream_with_context
 from bson import ObjectId
+from config.settings import app_config
 from models.todo import TodoModel, TodoContentModel
-from services.file_service import FileService
-from services.vector_service import VectorService
+from services.service_registry import registry
 from services.cache_service import CacheService
+from services.upload_storage import UploadStorage
+from services.ingest_queue import IngestQueue, index_content, release_duplicates, FINAL_STATUSES
 from utils.decorators import token_required, handle_exceptions
 from utils.helpers import create_sse_response, stream_todo_contents
 from urllib.parse import unquote, quote
@@ -19,9 +21,13 @@ todo_bp = Blueprint('todo', __name__, url_prefix='/api')
 # 初始化模型和服务
 todo_model = TodoModel()
 content_model = TodoContentModel()
-file_service = FileService()
-vector_service = VectorService()
+# OCR和向量模型首次使用时加载（或由启动后的后台预热加载）
+file_service = registry.lazy("file")
+vector_service = registry.lazy("vector")
+# 删除和读取上传文件不需要OCR，不经过 FileService
+upload_storage = UploadStorage()
 cache_service = CacheService()
+ingest_queue = IngestQueue()
 
 
 @todo_bp.route('/todos', methods=['GET'])
@@ -133,22 +139,26 @@ def delete_todo(current_user, todo_id):
                 # 删除图片文件
                 for image_url in content.get('images', []):
                     try:
-                        image_path = file_service.get_file_path(image_url, 'image')
-                        file_service.delete_file(image_path)
+                        image_path = upload_storage.get_file_path(image_url, 'image')
+                        upload_storage.delete_file(image_path)
                     except Exception as e:
                         print(f"删除图片文件失败 {image_url}: {e}")
                 
                 # 删除文档文件
                 for file_url in content.get('files', []):
                     try:
-                        file_path = file_service.get_file_path(file_url, 'file')
-                        file_service.delete_file(file_path)
+                        file_path = upload_storage.get_file_path(file_url, 'file')
+                        upload_storage.delete_file(file_path)
                     except Exception as e:
                         print(f"删除文档文件失败 {file_url}: {e}")
         
         # 删除向量数据
         vector_service.delete_by_todo_id(todo_id, current_user['id'])
         
+        # 其他Todo中链接到这些内容的近重复内容重新入库
+        if success and contents:
+            release_duplicates(current_user['id'], contents, queue=ingest_queue)
+        
         # 删除Todo和内容
         success, message = todo_model.delete_todo(todo_id, current_user['id'])
         
@@ -181,6 +191,7 @@ def add_todos_content(current_user, todo_id):
     
     返回:
         成功: {"message": "内容添加成功", "data": 内容对象}, 201
+        异步入库（INGEST_MODE=queue）: {"message": "内容已保存，正在索引", "data": 内容对象（index_status为pending）}, 202
         失败: {"error": "错误信息"}, 400/500
     """
     try:
@@ -195,6 +206,9 @@ def add_todos_content(current_user, todo_id):
         if not content_text and len(images) == 0 and len(files) == 0:
             return jsonify({"message": "至少需要文字或文件"}), 400
         
+        if app_config.ingest_mode == "queue":
+            return _enqueue_content(current_user['id'], todo_id, content_text, images, files)
+        
         # 处理文件上传
         uploaded_images = []
         uploaded_files = []
@@ -226,21 +240,14 @@ def add_todos_content(current_user, todo_id):
             return jsonify({"message": message}), 400
         
         # 保存向量嵌入（合并所有文本用于搜索）
-        all_text_parts = []
-        if content_text:
-            all_text_parts.append(content_text)
-        if ocr_texts:
-            all_text_parts.extend(ocr_texts)
-        if file_texts:
-            all_text_parts.extend(file_texts)
-        
-        full_text = "\n\n".join(all_text_parts).strip()
+        full_text = vector_service.build_index_text(content_text, ocr_texts, file_texts)
         
         if full_text:
             try:
                 vector_service.save_embedding(
                     doc_id=content_data["_id"],
                     user_id=current_user["id"],
+                    todo_id=todo_id,
                     text=full_text,  # 合并后的完整文本
                     raw_data={
                         "images": uploaded_images, 
@@ -263,6 +270,129 @@ def add_todos_content(current_user, todo_id):
         return jsonify({"error": str(e)}), 500
 
 
+def _enqueue_content(user_id, todo_id, content_text, images, files):
+    """
+    只保存文件和内容并投递入库任务，OCR、文本提取和向量化由入库worker完成
+
+    Args:
+        user_id: 用户ID
+        todo_id: Todo ID
+        content_text: 用户输入的文字
+        images: 上传的图片列表
+        files: 上传的文档列表
+
+    Returns:
+        Flask响应
+    """
+    uploaded_images = []
+    uploaded_files = []
+    if images or files:
+        success, message, uploaded_images, uploaded_files = file_service.save_uploaded_files(images, files)
+        if not success:
+            return jsonify({"error": message}), 400
+    
+    success, message, content_data = content_model.create_content(
+        todo_id,
+        user_id,
+        content_text,
+        uploaded_images,
+        uploaded_files,
+        index_status="pending"
+    )
+    if not success:
+        return jsonify({"message": message}), 400
+    
+    try:
+        ingest_queue.enqueue(content_data["_id"], user_id, todo_id)
+    except Exception as e:
+        # 队列不可用时在请求内完成入库，内容不会停留在pending
+        print(f"入库任务投递失败，改为同步处理: {e}")
+        try:
+            index_content(content_data["_id"], user_id, todo_id)
+            content_data = content_model.find_content_by_id(content_data["_id"], user_id) or content_data
+        except Exception as e:
+            print(f"同步入库失败: {traceback.format_exc()}")
+            content_model.update_content(content_data["_id"], user_id, {"index_status": "failed", "index_error": str(e)})
+            content_data["index_status"] = "failed"
+            content_data["index_error"] = str(e)
+        cache_service.invalidate_todo_cache(todo_id, user_id)
+        return jsonify({"message": "内容添加成功", "data": content_data}), 201
+    
+    # 使缓存失效
+    cache_service.invalidate_todo_cache(todo_id, user_id)
+    
+    return jsonify({"message": "内容已保存，正在索引", "data": content_data}), 202
+
+
+@todo_bp.route('/todos/ingest/events', methods=['GET'])
+@handle_exceptions
+@token_required
+def ingest_events(current_user):
+    """
+    入库进度（SSE），前端据此显示“索引中…”并在完成后刷新内容
+    
+    请求参数:
+        token: JWT令牌（EventSource无法设置请求头时使用）
+        content_ids: 逗号分隔的内容ID，先推送这些内容的当前状态，全部到达终态后结束
+    
+    请求头:
+        Last-Event-ID: 断线重连时从该事件之后继续推送
+    
+    返回:
+        SSE流式数据，每个事件带 id 便于重连
+        event: status - 指定内容的当前状态 {"content_id", "todo_id", "status", "error"}
+        event: index - 进度事件 {"content_id", "todo_id", "status": pending/processing/extracting/embedding/retrying/indexed/failed,
+                                 "done", "total", "attempts", "error"}
+        event: end - 指定内容全部完成，或达到最长保持时间
+    """
+    user_id = current_user['id']
+    content_ids = [cid.strip() for cid in request.args.get('content_ids', '').split(',') if cid.strip()]
+    last_id = request.headers.get('Last-Event-ID') or request.args.get('last_id')
+    
+    def generate():
+        try:
+            waiting = set()
+            cursor = last_id
+            if not cursor:
+                # 先记下事件位置再读取当前状态，两者之间发生的事件不会丢失
+                cursor = ingest_queue.last_event_id(user_id)
+                for content_id in content_ids:
+                    content = content_model.find_content_by_id(content_id, user_id)
+                    if not content:
+                        continue
+                    status = content.get("index_status", "indexed")
+                    if status not in FINAL_STATUSES:
+                        waiting.add(content_id)
+                    yield f"event: status\ndata: {json.dumps({'content_id': content_id, 'todo_id': content.get('todo_id'), 'status': status, 'error': content.get('index_error')}, ensure_ascii=False)}\n\n"
+                if content_ids and not waiting:
+                    yield f"event: end\ndata: {json.dumps({'message': 'DONE'}, ensure_ascii=False)}\n\n"
+                    return
+            else:
+                waiting = set(content_ids)
+            
+            deadline = time.time() + app_config.ingest_events_timeout
+            while time.time() < deadline:
+                events = ingest_queue.read_events(user_id, cursor, block_ms=15000)
+                if not events:
+                    # 心跳，避免代理断开空闲连接
+                    yield ": ping\n\n"
+                    continue
+                for event_id, event in events:
+                    cursor = event_id
+                    yield f"id: {event_id}\nevent: index\ndata: {json.dumps(event, ensure_ascii=False)}\n\n"
+                    if event.get("status") in FINAL_STATUSES:
+                        waiting.discard(event.get("content_id"))
+                if content_ids and not waiting:
+                    break
+            
+            yield f"event: end\ndata: {json.dumps({'message': 'DONE'}, ensure_ascii=False)}\n\n"
+        except Exception as e:
+            print(f"入库进度推送异常: {traceback.format_exc()}")
+            yield f"event: error\ndata: {json.dumps({'message': str(e)}, ensure_ascii=False)}\n\n"
+    
+    return Response(stream_with_context(generate()), mimetype="text/event-stream")
+
+
 @todo_bp.route('/todos/content/<todo_id>', methods=['GET'])
 @handle_exceptions
 @token_required
@@ -372,24 +502,38 @@ def update_todos_content(current_user, content_id):
         return jsonify({"message": "找不到Todo内容"}), 404
     
     todo_id = original_content.get('todo_id')
+    # 仍在异步入库或链接到其他内容（没有自己的向量）的内容，文字变化后重新入库
+    reindex_pending = original_content.get('index_status') in ("pending", "processing") \
+        or original_content.get('duplicate_mode') == "link"
     
     # 更新文字内容
     if 'content' in data:
         update_fields['content'] = data['content']
         
-        # 如果更新了文字内容，需要更新向量
-        try:
-            vector_service.update_embedding(
-                doc_id=content_id,
-                user_id=current_user["id"],
-                text=data['content'],
-                raw_data={
-                    "images": original_content.get("images", []),
-                    "files": original_content.get("files", [])
-                }
-            )
-        except Exception as e:
-            print(f"向量更新失败: {e}")
+        # 文字内容确有变化时才更新向量（合并OCR和文档文本，与新增时保持一致）；
+        # 需要重新入库的内容由worker按最新文字建立向量
+        if data['content'] != original_content.get('content', '') and not reindex_pending:
+            extracted = original_content.get('extracted_content') or {}
+            try:
+                vector_service.update_embedding(
+                    doc_id=content_id,
+                    user_id=current_user["id"],
+                    text=vector_service.build_index_text(
+                        data['content'],
+                        extracted.get('ocr_texts'),
+                        extracted.get('file_texts')
+                    ),
+                    raw_data={
+                        "images": original_content.get("images", []),
+                        "files": original_content.get("files", []),
+                        "has_ocr": len(extracted.get('ocr_texts') or []) > 0,
+                        "has_file_text": len(extracted.get('file_texts') or []) > 0,
+                        **({"duplicate_of": original_content["duplicate_of"]}
+                           if original_content.get('duplicate_mode') == "flag" else {})
+                    }
+                )
+            except Exception as e:
+                print(f"向量更新失败: {e}")
     
     # 更新图片和文件
     if 'images' in data:
@@ -404,6 +548,12 @@ def update_todos_content(current_user, content_id):
     )
     
     if success:
+        # 需要重新入库时投递任务，worker读取到的是更新后的文字
+        if reindex_pending and 'content' in data:
+            try:
+                ingest_queue.enqueue(content_id, current_user['id'], todo_id)
+            except Exception as e:
+                print(f"入库任务投递失败: {e}")
         # 使缓存失效
         if todo_id:
             cache_service.invalidate_todo_cache(todo_id, current_user['id'])
@@ -438,22 +588,25 @@ def delete_todo_content(current_user, content_id):
         # 删除关联的图片文件
         for image_url in content.get('images', []):
             try:
-                image_path = file_service.get_file_path(image_url, 'image')
-                file_service.delete_file(image_path)
+                image_path = upload_storage.get_file_path(image_url, 'image')
+                upload_storage.delete_file(image_path)
             except Exception as e:
                 print(f"删除图片文件失败 {image_url}: {e}")
         
         # 删除关联的文档文件
         for file_url in content.get('files', []):
             try:
-                file_path = file_service.get_file_path(file_url, 'file')
-                file_service.delete_file(file_path)
+                file_path = upload_storage.get_file_path(file_url, 'file')
+                upload_storage.delete_file(file_path)
             except Exception as e:
                 print(f"删除文档文件失败 {file_url}: {e}")
         
         # 删除向量数据
         vector_service.delete_by_doc_id(content_id, current_user['id'])
         
+        # 链接到该内容的近重复内容重新入库
+        release_duplicates(current_user['id'], [content], queue=ingest_queue)
+        
         # 删除内容
         success, message = content_model.delete_content(content_id, current_user['id'])
         
@@ -488,13 +641,13 @@ def serve_image(current_user, imagename):
         decoded_imagename = unquote(imagename)
         
         # 使用规范化的路径
-        file_path = file_service.get_file_path(f"/uploads/images/{decoded_imagename}", 'image')
+        file_path = upload_storage.get_file_path(f"/uploads/images/{decoded_imagename}", 'image')
         
         # 规范化文件路径（解决Windows路径问题）
         file_path = os.path.normpath(file_path)
         
         # 安全检查：确保文件路径在允许的目录内
-        image_folder = os.path.normpath(file_service.image_folder)
+        image_folder = os.path.normpath(upload_storage.image_folder)
         if not os.path.abspath(file_path).startswith(os.path.abspath(image_folder)):
             return jsonify({"message": "非法的文件路径"}), 403
         
@@ -554,13 +707,13 @@ def serve_file(current_user, filename):
         decoded_filename = unquote(filename)
         
         # 使用规范化的路径
-        file_path = file_service.get_file_path(f"/uploads/files/{decoded_filename}", 'file')
+        file_path = upload_storage.get_file_path(f"/uploads/files/{decoded_filename}", 'file')
         
         # 规范化文件路径
         file_path = os.path.normpath(file_path)
         
         # 安全检查
-        file_folder = os.path.normpath(file_service.file_folder)
+        file_folder = os.path.normpath(upload_storage.file_folder)
         if not os.path.abspath(file_path).startswith(os.path.abspath(file_folder)):
             return jsonify({"message": "非法的文件路径"}), 403
         
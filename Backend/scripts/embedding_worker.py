@@ -0,0 +1,35 @@
+# 独立编码进程
+#
+# 加载一份BGE-M3（按 ENCODER_BACKEND），监听本地socket为多个Web进程提供编码，结果通过共享内存返回。
+# Web进程设置 EMBEDDING_WORKER 为相同地址（多个编码进程用逗号分隔）即可使用，
+# 编码进程不可用时按 EMBEDDING_WORKER_FALLBACK 回退到进程内加载模型。
+# 共享内存要求编码进程与Web进程在同一台机器（同一容器或共享 /dev/shm）。
+# 只能监听Unix socket（权限0600）或回环地址，两端都必须设置相同的 EMBEDDING_WORKER_AUTHKEY（如 openssl rand -hex 32）。
+#
+# 用法（在 Backend 目录下）:
+#     python -m scripts.embedding_worker [--address /tmp/flare-embed.sock]
+import argparse
+import os
+import time
+from config.settings import ai_config
+from services.embedding_worker import EmbeddingWorkerServer, load_encoder
+
+
+def main():
+    parser = argparse.ArgumentParser(description="独立编码进程")
+    parser.add_argument("--address", default=ai_config.embedding_worker.split(",")[0].strip() or "/tmp/flare-embed.sock",
+                        help="监听地址，Unix socket路径或回环地址 host:port")
+    args = parser.parse_args()
+
+    os.environ['HF_ENDPOINT'] = ai_config.hf_endpoint
+    started = time.perf_counter()
+    encoder = load_encoder()
+    # 预热一次，第一个请求不承担初始化开销
+    encoder.encode(["预热"], batch_size=1, max_length=32, return_dense=True,
+                   return_sparse=ai_config.lexical_index, return_colbert_vecs=ai_config.colbert_index)
+    print(f"编码模型加载完成，耗时 {time.perf_counter() - started:.1f}s")
+    EmbeddingWorkerServer(encoder, args.address, ai_config.embedding_worker_authkey).serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+# 把BGE-M3导出为ONNX并做int8动态量化，导出后检查与torch输出的一致性
+#
+# 输出目录包含 model.onnx（fp32）、model_int8.onnx（int8动态量化）和分词器文件，
+# 设置 ENCODER_BACKEND=onnx、ONNX_MODEL_DIR=输出目录 后即可使用。
+# 一致性检查对比稠密向量与ColBERT向量的余弦偏差、词汇权重的top token重合度，
+# 稠密向量最小余弦低于 --min-cosine 时以非零状态退出。
+#
+# 用法（在 Backend 目录下）:
+#     python -m scripts.export_onnx [--output ./bge-m3-onnx] [--opset 17] [--min-cosine 0.99]
+import argparse
+import os
+import sys
+import numpy as np
+import torch
+from FlagEmbedding import BGEM3FlagModel
+from config.settings import ai_config
+from services.onnx_encoder import INPUT_NAMES, OUTPUT_NAMES, OnnxBGEM3Encoder
+
+# 一致性检查用的样例文本，覆盖中英文、短句和长段落
+SAMPLE_TEXTS = [
+    "明天下午三点开项目周会",
+    "Remember to renew the SSL certificate before it expires next month.",
+    "向量数据库使用HNSW索引，查询时先按用户过滤再做近邻搜索。",
+    "买牛奶、鸡蛋和面包",
+    "The quarterly report shows revenue growth of 12% compared with last year, mainly driven by "
+    "subscription sales in the Asia-Pacific region. 下一步需要细化各地区的预算。" * 4,
+    "Python 3.10 的 match 语句可以替代一长串 if/elif 判断。",
+]
+
+
+class _BGEM3Heads(torch.nn.Module):
+    """把BGE-M3的编码器和三个输出头包成一个前向，供ONNX导出"""
+
+    def __init__(self, model):
+        super().__init__()
+        self.encoder = model.model
+        self.sparse_linear = model.sparse_linear
+        self.colbert_linear = model.colbert_linear
+
+    def forward(self, input_ids, attention_mask):
+        hidden = self.encoder(input_ids=input_ids, attention_mask=attention_mask, return_dict=True).last_hidden_state
+        dense = torch.nn.functional.normalize(hidden[:, 0], dim=-1)
+        sparse = torch.relu(self.sparse_linear(hidden)).squeeze(-1)
+        # 与FlagEmbedding一致：去掉[CLS]，padding位置置零后归一化
+        colbert = self.colbert_linear(hidden[:, 1:]) * attention_mask[:, 1:][:, :, None].to(hidden.dtype)
+        colbert = torch.nn.functional.normalize(colbert, dim=-1)
+        return dense, sparse, colbert
+
+
+def export(flag_model: BGEM3FlagModel, output_dir: str, opset: int) -> str:
+    """导出fp32 ONNX模型，返回文件路径"""
+    model = _BGEM3Heads(flag_model.model).eval()
+    inputs = flag_model.tokenizer(["导出样例 export sample"], return_tensors="pt")
+    path = os.path.join(output_dir, "model.onnx")
+    dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in INPUT_NAMES}
+    dynamic_axes.update({
+        "dense_vecs": {0: "batch"},
+        "sparse_weights": {0: "batch", 1: "sequence"},
+        "colbert_vecs": {0: "batch", 1: "sequence"},
+    })
+    with torch.no_grad():
+        torch.onnx.export(
+            model,
+            (inputs["input_ids"], inputs["attention_mask"]),
+            path,
+            input_names=INPUT_NAMES,
+            output_names=OUTPUT_NAMES,
+            dynamic_axes=dynamic_axes,
+            opset_version=opset,
+        )
+    return path
+
+
+def quantize(fp32_path: str, output_dir: str) -> str:
+    """int8动态量化，返回文件路径"""
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    path = os.path.join(output_dir, "model_int8.onnx")
+    quantize_dynamic(fp32_path, path, weight_type=QuantType.QInt8)
+    return path
+
+
+def _cosine_rows(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    a = a / np.maximum(np.linalg.norm(a, axis=-1, keepdims=True), 1e-12)
+    b = b / np.maximum(np.linalg.norm(b, axis=-1, keepdims=True), 1e-12)
+    return np.sum(a * b, axis=-1)
+
+
+def _top_tokens(weights: dict, n: int = 20) -> set:
+    return {token for token, _ in sorted(weights.items(), key=lambda item: item[1], reverse=True)[:n]}
+
+
+def check_parity(flag_model: BGEM3FlagModel, encoder: OnnxBGEM3Encoder, max_length: int) -> dict:
+    """
+    对比torch与ONNX输出
+
+    Returns:
+        dict: 稠密向量余弦（最小/平均）、ColBERT逐token余弦（最小/平均）、词汇top20重合度
+    """
+    options = dict(batch_size=len(SAMPLE_TEXTS), max_length=max_length,
+                   return_dense=True, return_sparse=True, return_colbert_vecs=True)
+    expected = flag_model.encode(SAMPLE_TEXTS, **options)
+    actual = encoder.encode(SAMPLE_TEXTS, **options)
+
+    dense = _cosine_rows(np.array(expected["dense_vecs"], dtype=np.float32), actual["dense_vecs"])
+    colbert = np.concatenate([
+        _cosine_rows(np.asarray(e, dtype=np.float32), np.asarray(a, dtype=np.float32))
+        for e, a in zip(expected["colbert_vecs"], actual["colbert_vecs"])
+    ])
+    overlap = [
+        len(_top_tokens(e).intersection(_top_tokens(a))) / max(1, len(_top_tokens(e)))
+        for e, a in zip(expected["lexical_weights"], actual["lexical_weights"])
+    ]
+    return {
+        "dense_cosine_min": float(dense.min()),
+        "dense_cosine_mean": float(dense.mean()),
+        "colbert_cosine_min": float(colbert.min()),
+        "colbert_cosine_mean": float(colbert.mean()),
+        "lexical_top20_overlap_mean": float(np.mean(overlap)),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="导出并量化BGE-M3 ONNX模型")
+    parser.add_argument("--output", default=ai_config.onnx_model_dir, help="输出目录")
+    parser.add_argument("--opset", type=int, default=17, help="ONNX opset版本")
+    parser.add_argument("--max-length", type=int, default=512, help="一致性检查的最大token数")
+    parser.add_argument("--min-cosine", type=float, default=0.99, help="int8模型稠密向量最小余弦阈值")
+    parser.add_argument("--skip-export", action="store_true", help="只做一致性检查")
+    args = parser.parse_args()
+
+    os.makedirs(args.output, exist_ok=True)
+    # 导出和对比都用fp32的torch模型
+    flag_model = BGEM3FlagModel(ai_config.model_name, use_fp16=False, device="cpu")
+
+    if not args.skip_export:
+        fp32_path = export(flag_model, args.output, args.opset)
+        print(f"已导出: {fp32_path}")
+        int8_path = quantize(fp32_path, args.output)
+        print(f"已量化: {int8_path}")
+        flag_model.tokenizer.save_pretrained(args.output)
+
+    failed = False
+    for model_file in ("model.onnx", "model_int8.onnx"):
+        encoder = OnnxBGEM3Encoder(args.output, model_file, ai_config.onnx_intra_op_threads)
+        report = check_parity(flag_model, encoder, args.max_length)
+        print(f"{model_file}: {report}")
+        if model_file == "model_int8.onnx" and report["dense_cosine_min"] < args.min_cosine:
+            print(f"int8模型稠密向量最小余弦 {report['dense_cosine_min']:.4f} 低于阈值 {args.min_cosine}")
+            failed = True
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
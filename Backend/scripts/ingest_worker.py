@@ -0,0 +1,62 @@
+# 独立入库worker
+#
+# 从Redis Streams入库队列消费任务，完成OCR、文本提取、向量化和缓存失效，
+# Web进程设置 INGEST_LOCAL_WORKERS=0 后OCR和编码模型只在worker进程加载，可按负载启动多个worker进程。
+# 同时提供队列状态查看和死信任务重新投递。
+#
+# 用法（在 Backend 目录下）:
+#     python -m scripts.ingest_worker [--threads 2]
+#     python -m scripts.ingest_worker --stats
+#     python -m scripts.ingest_worker --dead [--count 100]
+#     python -m scripts.ingest_worker --requeue-dead [--count 100]
+import argparse
+import json
+import os
+import signal
+import threading
+from config.settings import ai_config
+from services.ingest_queue import IngestQueue, IngestWorker
+from services.service_registry import registry
+
+
+def main():
+    parser = argparse.ArgumentParser(description="入库worker")
+    parser.add_argument("--threads", type=int, default=1, help="消费线程数，OCR和编码在进程内共享同一份模型")
+    parser.add_argument("--stats", action="store_true", help="输出队列状态后退出")
+    parser.add_argument("--dead", action="store_true", help="列出死信任务后退出")
+    parser.add_argument("--requeue-dead", action="store_true", help="死信任务重置尝试次数后重新投递")
+    parser.add_argument("--count", type=int, default=100, help="--dead/--requeue-dead 处理的条数")
+    args = parser.parse_args()
+
+    queue = IngestQueue()
+    if args.stats:
+        print(json.dumps(queue.stats(), ensure_ascii=False, indent=2))
+        return
+    if args.dead:
+        for message_id, job in queue.dead_letters(args.count):
+            print(json.dumps({"id": message_id, **job}, ensure_ascii=False))
+        return
+    if args.requeue_dead:
+        print(f"已重新投递 {queue.requeue_dead(args.count)} 个任务")
+        return
+
+    os.environ['HF_ENDPOINT'] = ai_config.hf_endpoint
+    # 先加载并预热模型，避免第一个任务因加载耗时超过接管时间被其他worker重复处理
+    registry.warm_up(["file", "vector"]).join()
+
+    stop_event = threading.Event()
+    signal.signal(signal.SIGINT, lambda *_: stop_event.set())
+    signal.signal(signal.SIGTERM, lambda *_: stop_event.set())
+    threads = [
+        threading.Thread(target=IngestWorker(queue).run, args=(stop_event,), name=f"ingest-worker-{i}")
+        for i in range(args.threads)
+    ]
+    for thread in threads:
+        thread.start()
+    # 当前任务处理完后退出，未确认的任务由其他worker接管
+    for thread in threads:
+        thread.join()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+# vector索引schema迁移：去掉分块 text / raw / content 的全文索引
+#
+# 旧版索引对分块文本建倒排索引，而检索只用KNN、user_id/doc_id过滤和lex词汇检索。
+# 分块键不需要改写（text、raw 仍作为普通哈希字段保存，RETURN 照常返回），只需在同一前缀上重建索引：
+#   1. 在当前版本的分块前缀上按新schema创建临时索引 {name}_migrate，等待后台索引完成
+#   2. 别名切换到临时索引（检索不中断），删除旧索引（保留数据）
+#   3. 按新schema重建原名索引，等待完成后别名切回并删除临时索引
+# 迁移期间两份索引同时存在，额外占用的是新schema的索引内存（不复制分块数据）。
+# 已经是新schema的分片直接跳过，中途中断后可直接重跑。
+#
+# 用法（在 Backend 目录下）:
+#     python -m scripts.migrate_vector_schema [--dry-run]
+import argparse
+import time
+from config.database import create_vector_index, has_full_text_schema, shard_map, vector_index_name
+from config.settings import db_config
+from services.vector_index import VectorIndexManager
+
+INDEX_SIZE_FIELDS = ("inverted_sz_mb", "offset_vectors_sz_mb", "doc_table_size_mb",
+                     "key_table_size_mb", "vector_index_sz_mb")
+
+
+def _info_value(info: dict, name: str, default: float = 0.0) -> float:
+    value = info.get(name, default)
+    if isinstance(value, bytes):
+        value = value.decode("utf-8")
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return default
+
+
+def _index_size_mb(redis_client, name: str) -> float:
+    """FT.INFO 中索引结构（倒排、词位置、文档表、键表、向量）占用的内存"""
+    info = redis_client.ft(name).info()
+    return sum(_info_value(info, field) for field in INDEX_SIZE_FIELDS)
+
+
+def _wait_indexed(redis_client, name: str, endpoint: str):
+    """等待后台索引完成"""
+    while True:
+        info = redis_client.ft(name).info()
+        if _info_value(info, "indexing") == 0 and _info_value(info, "percent_indexed", 1.0) >= 1:
+            return
+        print(f"[{endpoint}] {name} 已索引 {_info_value(info, 'percent_indexed') * 100:.1f}%")
+        time.sleep(1)
+
+
+def _drop_index(redis_client, name: str):
+    try:
+        redis_client.ft(name).dropindex(delete_documents=False)
+    except Exception:
+        pass
+
+
+def _migrate(redis_client, endpoint: str, args):
+    """迁移一个Redis（缓存Redis或一个向量分片）上当前版本的索引"""
+    manager = VectorIndexManager(redis_client)
+    state = manager.state(fresh=True)
+    if state["building"] is not None:
+        print(f"[{endpoint}] 版本 {state['building']} 正在重建，完成或放弃后再迁移（重建产生的新版本已是新schema）")
+        return
+    version = state["active"]
+    index_name = vector_index_name(version)
+    temp_name = f"{index_name}_migrate"
+    vector_type = manager.vector_type(version)
+
+    try:
+        full_text = has_full_text_schema(redis_client, index_name)
+        before = _index_size_mb(redis_client, index_name)
+    except Exception:
+        # 上次在删除旧索引后中断：原名索引不存在，检索仍通过别名使用临时索引，从第3步继续
+        full_text, before = None, None
+    if full_text is False:
+        _drop_index(redis_client, temp_name)
+        print(f"[{endpoint}] {index_name} 已是新schema，跳过")
+        return
+    if args.dry_run:
+        print(f"[{endpoint}] {index_name} 需要迁移，当前索引 {before or 0:.1f}MB")
+        return
+
+    started = time.perf_counter()
+    if full_text:
+        _drop_index(redis_client, temp_name)
+        create_vector_index(redis_client, vector_type, version, name=temp_name)
+        _wait_indexed(redis_client, temp_name, endpoint)
+        redis_client.ft(temp_name).aliasupdate(db_config.vector_index_alias)
+        print(f"[{endpoint}] 别名已切换到临时索引 {temp_name}")
+        _drop_index(redis_client, index_name)
+    create_vector_index(redis_client, vector_type, version)
+    _wait_indexed(redis_client, index_name, endpoint)
+    redis_client.ft(index_name).aliasupdate(db_config.vector_index_alias)
+    _drop_index(redis_client, temp_name)
+
+    after = _index_size_mb(redis_client, index_name)
+    saved = f"{before:.1f}MB -> {after:.1f}MB" if before is not None else f"{after:.1f}MB"
+    print(f"[{endpoint}] {index_name} 迁移完成，索引内存 {saved}，耗时 {time.perf_counter() - started:.1f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="vector索引schema迁移")
+    parser.add_argument("--dry-run", action="store_true", help="只检查哪些分片需要迁移")
+    args = parser.parse_args()
+
+    # 每个向量分片各自维护索引
+    for shard, endpoint in enumerate(shard_map.endpoints):
+        _migrate(shard_map.client(shard), endpoint, args)
+
+
+if __name__ == "__main__":
+    main()
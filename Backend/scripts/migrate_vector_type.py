@@ -0,0 +1,115 @@
+# 向量存储类型迁移
+#
+# 删除当前版本的 vector 索引（保留数据），把该版本全部分块的向量原地改写为目标类型，再按目标类型重建索引。
+# 迁移期间向量搜索不可用；完成后把 VECTOR_TYPE 设为目标类型并重启服务。
+# 读取时按字节长度判断类型，迁移中途中断后可直接重跑。
+# 需要迁移期间检索不中断时改用 scripts.rebuild_vector_index --type（复制到新版本后切换别名，额外占用一份内存）。
+#
+# 用法（在 Backend 目录下）:
+#     python -m scripts.migrate_vector_type --to FLOAT16 [--batch 500] [--dry-run]
+import argparse
+from config.database import create_vector_index, shard_map, vector_index_name, vector_key_prefixes, VECTOR_INDEX_META_KEY
+from config.settings import db_config
+from services.vector_codec import check_vector_type, decode_vector, encode_vector, vector_bytes
+from services.vector_index import VectorIndexManager
+
+
+def _convert_batch(redis_client, keys: list, vector_type: str, dry_run: bool) -> tuple:
+    """改写一批分块的向量，返回 (改写数量, 改写前字节数, 改写后字节数)"""
+    pipe = redis_client.pipeline(transaction=False)
+    for key in keys:
+        pipe.hmget(key, ["vector", "vector_scale"])
+    rows = pipe.execute()
+
+    converted = 0
+    before = 0
+    after = 0
+    pipe = redis_client.pipeline(transaction=False)
+    for key, (data, scale) in zip(keys, rows):
+        if not data:
+            continue
+        before += len(data)
+        try:
+            vector = decode_vector(data, db_config.vector_dim, scale)
+        except ValueError as e:
+            print(f"跳过 {key}: {e}")
+            continue
+        new_data, new_scale = encode_vector(vector, vector_type)
+        after += len(new_data)
+        if new_data == data:
+            continue
+        converted += 1
+        if dry_run:
+            continue
+        pipe.hset(key, "vector", new_data)
+        if new_scale is None:
+            pipe.hdel(key, "vector_scale")
+        else:
+            pipe.hset(key, "vector_scale", repr(new_scale))
+    if not dry_run:
+        pipe.execute()
+    return converted, before, after
+
+
+def _migrate(redis_client, endpoint: str, vector_type: str, args):
+    """迁移一个Redis（缓存Redis或一个向量分片）上当前版本的分块"""
+    state = VectorIndexManager(redis_client).state(fresh=True)
+    if state["building"] is not None:
+        print(f"[{endpoint}] 版本 {state['building']} 正在重建，完成或放弃后再迁移")
+        return
+    version = state["active"]
+    index_name = vector_index_name(version)
+
+    if not args.dry_run:
+        try:
+            redis_client.ft(index_name).dropindex(delete_documents=False)
+            print(f"[{endpoint}] 已删除 {index_name} 索引（保留数据）")
+        except Exception as e:
+            print(f"删除索引失败（可能不存在）: {e}")
+
+    totals = [0, 0, 0]
+    scanned = 0
+    keys = []
+    for key in redis_client.scan_iter(match=f"{vector_key_prefixes(version)['chunk']}*", count=args.batch, _type="HASH"):
+        keys.append(key)
+        if len(keys) >= args.batch:
+            for i, value in enumerate(_convert_batch(redis_client, keys, vector_type, args.dry_run)):
+                totals[i] += value
+            scanned += len(keys)
+            keys = []
+            print(f"[{endpoint}] 已处理 {scanned} 个键")
+    if keys:
+        for i, value in enumerate(_convert_batch(redis_client, keys, vector_type, args.dry_run)):
+            totals[i] += value
+        scanned += len(keys)
+
+    if not args.dry_run:
+        create_vector_index(redis_client, vector_type, version)
+        # 删除索引时别名一并失效，重新指向重建的索引
+        redis_client.ft(index_name).aliasupdate(db_config.vector_index_alias)
+        redis_client.hset(VECTOR_INDEX_META_KEY, f"type:{version}", vector_type)
+        print(f"[{endpoint}] 已按 {vector_type} 重建 {index_name} 索引，后台索引完成前搜索结果不完整")
+
+    converted, before, after = totals
+    print(
+        f"[{endpoint}] 共扫描 {scanned} 个键，改写 {converted} 个；向量数据 {before / 1024 / 1024:.1f}MB -> "
+        f"{after / 1024 / 1024:.1f}MB（每个向量 {vector_bytes(db_config.vector_dim, vector_type)} 字节）"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="向量存储类型迁移")
+    parser.add_argument("--to", required=True, help="目标类型 FLOAT32/FLOAT16/INT8")
+    parser.add_argument("--batch", type=int, default=500, help="每批处理的键数量")
+    parser.add_argument("--dry-run", action="store_true", help="只统计，不修改数据和索引")
+    args = parser.parse_args()
+
+    vector_type = check_vector_type(args.to)
+    # 每个向量分片各自迁移
+    for shard, endpoint in enumerate(shard_map.endpoints):
+        _migrate(shard_map.client(shard), endpoint, vector_type, args)
+    print(f"请设置 VECTOR_TYPE={vector_type} 后重启服务")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+# 从MongoDB重建近重复索引
+#
+# 近重复关系以内容文档的 duplicate_of / duplicate_mode 为准，Redis中的LSH桶、签名和链接集合可以随时重建：
+# Redis数据丢失后、或开启 NEAR_DUP_MODE 之前已有的内容需要参与检测时运行。
+# 已有内容之间不会重新判定重复，只把规范内容写入LSH、把已链接的重复内容写回链接集合。
+#
+# 用法（在 Backend 目录下）:
+#     python -m scripts.rebuild_near_duplicates [--user USER_ID]
+import argparse
+import time
+from config.database import cache_client, db_client
+from config.settings import app_config
+from services.near_duplicate import NearDuplicateIndex, minhash
+from services.vector_rehydrator import CONTENT_PROJECTION
+from services.vector_service import build_index_text
+
+
+def main():
+    parser = argparse.ArgumentParser(description="重建近重复索引")
+    parser.add_argument("--user", default=None, help="只重建该用户")
+    args = parser.parse_args()
+
+    index = NearDuplicateIndex(cache_client.client)
+    query = {"user_id": args.user} if args.user else {}
+    # 只检测带图片或文件的内容，与入库时一致
+    query["$or"] = [{"images.0": {"$exists": True}}, {"files.0": {"$exists": True}}]
+    stats = {"signatures": 0, "links": 0, "skipped": 0}
+    started = time.perf_counter()
+    for content in db_client.todosContent.find(query, CONTENT_PROJECTION).batch_size(256):
+        user_id = content.get("user_id")
+        content_id = str(content["_id"])
+        if content.get("duplicate_mode") == "link":
+            index.link(user_id, content["duplicate_of"], content_id)
+            stats["links"] += 1
+            continue
+        if content.get("duplicate_mode") == "flag":
+            stats["skipped"] += 1
+            continue
+        extracted = content.get("extracted_content") or {}
+        text = build_index_text(
+            content.get("content"), extracted.get("ocr_texts"), extracted.get("file_texts")
+        )
+        signature = minhash(text) if len(text or "") >= app_config.near_dup_min_chars else None
+        if signature is None:
+            stats["skipped"] += 1
+            continue
+        index.add(user_id, content_id, signature)
+        stats["signatures"] += 1
+    print(f"近重复索引重建完成: {stats}，耗时 {time.perf_counter() - started:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
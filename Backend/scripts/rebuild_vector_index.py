@@ -0,0 +1,176 @@
+# 向量索引零停机重建
+#
+# 创建新版本的空索引（可换向量存储类型），服务进程在下一次刷新版本状态后开始对新旧两个版本双写；
+# 随后把当前版本的全部内容复制到新版本（复制不覆盖双写已写入的新数据，复制后再次确认源内容仍存在），
+# 已按内存预算逐出的内容按逐出状态复制（元数据、分块文本和lex，没有向量，检索命中时照常从MongoDB恢复）；
+# 复制只覆盖有完整元数据和分块的内容，分块前的旧格式（vector:{doc_id} 单向量键）、缺少元数据或分块不完整的内容
+# 不会被复制，切换前再按 _id 顺序扫描MongoDB，把新版本中仍缺失的内容重新编码写入（与 reindex 相同的编码方式，
+# 不覆盖双写已写入的数据；有缺失时才加载模型，--no-backfill 跳过这一步）。
+# 完成后把检索别名原子切换到新版本，旧版本保留 VECTOR_INDEX_GC_GRACE 秒后删除。
+# 整个过程中检索始终可用；中途失败用 --abort 放弃新版本。配置了多个向量分片（VECTOR_SHARDS）时每个分片各自重建。
+#
+# 用法（在 Backend 目录下）:
+#     python -m scripts.rebuild_vector_index [--type FLOAT16] [--batch 200] [--no-gc] [--no-backfill]
+#     python -m scripts.rebuild_vector_index --gc-only [--force]
+#     python -m scripts.rebuild_vector_index --abort
+import argparse
+import time
+from config.database import db_client, shard_map
+from config.settings import db_config
+from services.vector_index import VersionedRedisVectorStore
+from services.vector_rehydrator import CONTENT_PROJECTION
+from services.vector_service import VectorService
+from scripts.reindex import reindex_window
+
+
+def _copy_batch(source, target, doc_ids: list) -> tuple:
+    """复制一批内容，返回 (复制数量, 其中已逐出的数量, 跳过数量)"""
+    documents = source.export_documents(doc_ids)
+    writes = [document for document in documents if document is not None]
+    results = target.save_many(writes, only_if_absent=True) if writes else []
+    copied = sum(1 for written in results if written >= 0)
+    evicted = sum(1 for document, written in zip(writes, results) if written >= 0 and document["evicted"])
+
+    # 导出后源内容可能已被删除：删除双写只作用于新版本中已存在的键，复制可能把它写回，这里补删
+    existing = source.existing([document["doc_id"] for document in writes])
+    for document in writes:
+        if document["doc_id"] not in existing:
+            target.delete(document["user_id"], [document["doc_id"]])
+    return copied, evicted, len(doc_ids) - len(writes)
+
+
+def _doc_ids(redis_client, prefix: str, batch: int):
+    """扫描某个版本的内容元数据键，按批产出内容ID"""
+    doc_ids = []
+    for key in redis_client.scan_iter(match=f"{prefix}*", count=batch):
+        key = key.decode("utf-8") if isinstance(key, bytes) else key
+        doc_ids.append(key[len(prefix):])
+        if len(doc_ids) >= batch:
+            yield doc_ids
+            doc_ids = []
+    if doc_ids:
+        yield doc_ids
+
+
+def _contents(batch: int):
+    """按 _id 顺序流式读取MongoDB内容，按批产出"""
+    contents = []
+    for content in db_client.todosContent.find({}, CONTENT_PROJECTION).sort("_id", 1).batch_size(batch):
+        contents.append(content)
+        if len(contents) >= batch:
+            yield contents
+            contents = []
+    if contents:
+        yield contents
+
+
+def _backfill(builds: list, args) -> dict:
+    """
+    从MongoDB补齐新版本中缺失的内容，每个内容写入其所在分片的新版本
+
+    Returns:
+        dict: 每个分片的统计 {endpoint: {"missing", "docs", "chunks", "failed"}}
+    """
+    targets = [versioned.store(version) for _, versioned, _, version in builds]
+    stats = {endpoint: {"missing": 0, "docs": 0, "chunks": 0, "failed": 0} for endpoint, *_ in builds}
+    vector_service = None
+    for contents in _contents(args.batch):
+        # 链接到其他内容的近重复内容没有自己的向量
+        contents = [content for content in contents
+                    if content.get("user_id") and content.get("duplicate_mode") != "link"]
+        by_shard = {}
+        for content in contents:
+            by_shard.setdefault(shard_map.shard_for(content["user_id"]), []).append(content)
+        for shard, group in by_shard.items():
+            metas = targets[shard].get_metas([str(content["_id"]) for content in group])
+            missing = [content for content, meta in zip(group, metas) if not meta["user_id"]]
+            if not missing:
+                continue
+            if vector_service is None:
+                vector_service = VectorService()
+            shard_stats = stats[builds[shard][0]]
+            shard_stats["missing"] += len(missing)
+            try:
+                window = reindex_window(vector_service, missing, args.batch, target=targets[shard])
+            except Exception as e:
+                print(f"[{builds[shard][0]}] 补齐失败（{len(missing)} 个内容）: {e}")
+                shard_stats["failed"] += len(missing)
+                continue
+            for key in ("docs", "chunks", "failed"):
+                shard_stats[key] += window[key]
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="向量索引零停机重建")
+    parser.add_argument("--type", default=None, help="新版本的向量存储类型 FLOAT32/FLOAT16/INT8，不传时沿用当前类型")
+    parser.add_argument("--batch", type=int, default=200, help="每批复制的内容数量")
+    parser.add_argument("--no-gc", action="store_true", help="切换后不等待回收旧版本（之后用 --gc-only 回收）")
+    parser.add_argument("--gc-only", action="store_true", help="只回收已下线的旧版本")
+    parser.add_argument("--force", action="store_true", help="配合 --gc-only，忽略保留时间立即回收")
+    parser.add_argument("--abort", action="store_true", help="放弃正在构建的版本")
+    parser.add_argument("--no-backfill", action="store_true", help="不从MongoDB补齐复制后仍缺失的内容")
+    args = parser.parse_args()
+
+    # 每个向量分片各自维护索引版本，逐个分片执行
+    shards = [(endpoint, VersionedRedisVectorStore(shard_map.client(i))) for i, endpoint in enumerate(shard_map.endpoints)]
+
+    if args.abort:
+        for endpoint, versioned in shards:
+            versioned.indexes.abort()
+            print(f"[{endpoint}] 已放弃正在构建的版本")
+        return
+    if args.gc_only:
+        for endpoint, versioned in shards:
+            version = versioned.indexes.gc(force=args.force)
+            print(f"[{endpoint}] 已回收版本 {version}" if version is not None else f"[{endpoint}] 没有可回收的版本或未到保留时间")
+        return
+
+    # 上一次切换留下的旧版本先回收（保留时间内不回收，begin_rebuild 会报错提示）
+    builds = []
+    for endpoint, versioned in shards:
+        indexes = versioned.indexes
+        indexes.gc()
+        source_version = indexes.state(fresh=True)["active"]
+        version = indexes.begin_rebuild(args.type)
+        builds.append((endpoint, versioned, source_version, version))
+        print(f"[{endpoint}] 已创建版本 {version}（{indexes.vector_type(version)}）")
+    print("等待服务进程开始双写")
+    time.sleep(db_config.vector_index_refresh + 1)
+
+    for endpoint, versioned, source_version, version in builds:
+        source = versioned.store(source_version)
+        target = versioned.store(version)
+        started = time.perf_counter()
+        copied = 0
+        evicted = 0
+        skipped = 0
+        for doc_ids in _doc_ids(versioned.redis_client, source.prefixes["doc"], args.batch):
+            batch_copied, batch_evicted, batch_skipped = _copy_batch(source, target, doc_ids)
+            copied += batch_copied
+            evicted += batch_evicted
+            skipped += batch_skipped
+            print(f"[{endpoint}] 已复制 {copied} 个内容（其中已逐出 {evicted} 个），跳过 {skipped} 个，"
+                  f"{copied / max(time.perf_counter() - started, 1e-9):.1f} docs/s")
+
+    if not args.no_backfill:
+        started = time.perf_counter()
+        for endpoint, shard_stats in _backfill(builds, args).items():
+            print(f"[{endpoint}] 从MongoDB补齐 {shard_stats['docs']}/{shard_stats['missing']} 个缺失的内容，"
+                  f"{shard_stats['chunks']} 个分块，失败 {shard_stats['failed']} 个，"
+                  f"耗时 {time.perf_counter() - started:.1f}s")
+
+    for endpoint, versioned, source_version, version in builds:
+        versioned.indexes.swap(version)
+        print(f"[{endpoint}] 检索已切换到版本 {version}，旧版本 {source_version} 保留 {db_config.vector_index_gc_grace}s")
+
+    if args.no_gc:
+        return
+    time.sleep(db_config.vector_index_gc_grace)
+    for endpoint, versioned, source_version, _ in builds:
+        versioned.indexes.gc()
+        print(f"[{endpoint}] 已回收版本 {source_version}")
+
+
+if __name__ == "__main__":
+    main()
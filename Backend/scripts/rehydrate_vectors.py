@@ -0,0 +1,32 @@
+# 向量回填清扫
+#
+# 扫描MongoDB中的全部内容（或指定用户），向量已过期的内容重新构建索引文本并批量编码写回。
+# 检索时的惰性回填只覆盖活跃用户；该脚本用于定时兜底，或在Redis数据丢失后整体重建。
+# 只写入缺失的内容，中途中断后可直接重跑。
+#
+# 用法（在 Backend 目录下）:
+#     python -m scripts.rehydrate_vectors [--user USER_ID] [--limit N] [--interval 3600]
+import argparse
+import time
+from services.vector_service import VectorService
+
+
+def main():
+    parser = argparse.ArgumentParser(description="回填已过期的向量")
+    parser.add_argument("--user", default=None, help="只回填该用户")
+    parser.add_argument("--limit", type=int, default=None, help="每轮最多回填的内容数量")
+    parser.add_argument("--interval", type=int, default=0, help="大于0时每隔该秒数循环执行")
+    args = parser.parse_args()
+
+    rehydrator = VectorService().rehydrator
+    while True:
+        started = time.perf_counter()
+        stats = rehydrator.rehydrate(args.user, args.limit)
+        print(f"回填完成: {stats}，耗时 {time.perf_counter() - started:.1f}s")
+        if args.interval <= 0:
+            break
+        time.sleep(args.interval)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,298 @@
+# 从MongoDB全量重建向量
+#
+# 用于Redis数据丢失、更换模型或修改分块/索引字段之后：按 _id 顺序用游标读取 todosContent，
+# 每个窗口内的分块按长度排序后切成大批次编码（减少padding），写入通过流水线一次往返提交。
+# 与 save_embedding 不同，重建不复用已有向量、不因指纹一致而跳过，保证全部来自当前模型。
+# 每完成一个窗口把已连续完成的最大 _id 写入检查点文件，中断后重跑会从检查点继续；
+# 某个窗口失败（编码或写入异常）时记入失败数，其余窗口继续处理，但检查点不再越过失败的窗口，重跑会从它开始。
+# 链接到其他内容的近重复内容没有自己的向量，单独计数，不算作跳过。
+# 调整向量分片（VECTOR_SHARDS）后，用新的分片表运行并通过 --old-shards 传入旧分片表：
+# 内容写入新分片表下的归属分片，归属分片变化的内容随后从旧分片删除。
+#
+# 用法（在 Backend 目录下）:
+#     python -m scripts.reindex [--user USER_ID] [--since 2024-01-01] [--workers 2]
+#                               [--window 512] [--batch-size 64] [--checkpoint .reindex_checkpoint.json] [--restart]
+#                               [--old-shards host1:6379,host2:6379]
+import argparse
+import json
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import datetime
+from bson import ObjectId
+from config.database import db_client, parse_shard_endpoints, shard_map, ShardMap
+from config.settings import ai_config
+from services.sharded_vector_store import ShardedVectorStore
+from services.vector_rehydrator import CONTENT_PROJECTION
+from services.vector_service import VectorService
+
+
+def _load_checkpoint(path: str, scope: dict, restart: bool) -> dict:
+    """读取检查点，范围（--user/--since）不一致时重新开始"""
+    if restart or not os.path.exists(path):
+        return {"scope": scope, "last_id": None, "docs": 0, "chunks": 0, "skipped": 0, "linked": 0}
+    with open(path, "r", encoding="utf-8") as f:
+        checkpoint = json.load(f)
+    if checkpoint.get("scope") != scope:
+        print(f"检查点范围 {checkpoint.get('scope')} 与本次 {scope} 不一致，重新开始")
+        return {"scope": scope, "last_id": None, "docs": 0, "chunks": 0, "skipped": 0, "linked": 0}
+    checkpoint.setdefault("linked", 0)
+    print(f"从检查点继续: last_id={checkpoint['last_id']}，已完成 {checkpoint['docs']} 个内容")
+    return checkpoint
+
+
+def _save_checkpoint(path: str, checkpoint: dict):
+    """先写临时文件再替换，避免中断时留下半个文件"""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(checkpoint, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+def _iter_windows(query: dict, window: int):
+    """按 _id 升序流式读取内容，每 window 个为一组"""
+    cursor = db_client.todosContent.find(query, CONTENT_PROJECTION).sort("_id", 1).batch_size(window)
+    batch = []
+    for content in cursor:
+        batch.append(content)
+        if len(batch) >= window:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _prune_moved(previous: ShardedVectorStore, writes: list, results: list) -> int:
+    """删除旧分片表下归属分片已变化的内容，返回删除数量"""
+    moved = 0
+    for document, written in zip(writes, results):
+        if written < 0:
+            continue
+        user_id = document["user_id"]
+        old_endpoint = previous.shards.endpoints[previous.shards.shard_for(user_id)]
+        if old_endpoint != shard_map.endpoints[shard_map.shard_for(user_id)]:
+            moved += previous.for_user(user_id).delete(user_id, [document["doc_id"]])
+    return moved
+
+
+def reindex_window(vector_service: VectorService, contents: list, batch_size: int,
+                   previous: ShardedVectorStore = None, target=None) -> dict:
+    """
+    重建一个窗口内全部内容的向量
+
+    Args:
+        previous: 旧分片表的存储，传入时写入后从旧分片删除已迁走的内容
+        target: 写入的存储（RedisVectorStore），不传时写入服务的存储；传入时不覆盖已存在的内容，
+            用于索引重建时从MongoDB补齐新版本中缺失的内容
+
+    Returns:
+        dict: docs/chunks/skipped（没有可索引文本或入库尚未完成）/linked（链接到其他内容的近重复内容）/failed/moved
+    """
+    documents = [
+        document for document in map(vector_service.rehydrator.build_document, contents)
+        if document is not None and document["user_id"]
+    ]
+    linked = sum(1 for content in contents if content.get("duplicate_mode") == "link")
+    stats = {"docs": 0, "chunks": 0, "skipped": len(contents) - len(documents) - linked, "linked": linked,
+             "failed": 0, "moved": 0}
+    if not documents:
+        return stats
+
+    # 窗口内全部分块按长度降序排列，相近长度的分块进同一批次
+    doc_chunks = [vector_service.chunk_text(document["text"]) for document in documents]
+    refs = [(d, c) for d, chunks in enumerate(doc_chunks) for c in range(len(chunks))]
+    refs.sort(key=lambda ref: len(doc_chunks[ref[0]][ref[1]]["text"]), reverse=True)
+
+    vectors = [[None] * len(chunks) for chunks in doc_chunks]
+    extras = [[{} for _ in chunks] for chunks in doc_chunks]
+    for start in range(0, len(refs), batch_size):
+        batch = refs[start:start + batch_size]
+        # max_length 与写入路径一致（分块本身不超过 chunk_tokens，再加上首尾特殊token），
+        # 向量与正常写入的完全相同
+        rows = vector_service.encode_multi(
+            [doc_chunks[d][c]["text"] for d, c in batch],
+            sparse=ai_config.lexical_index,
+            colbert=ai_config.colbert_index,
+            batch_size=batch_size
+        )
+        for (d, c), row in zip(batch, rows):
+            vectors[d][c] = row["dense"]
+            extras[d][c] = vector_service.chunk_extras(row)
+
+    store = target if target is not None else vector_service.store
+    metas = store.get_user_metas(
+        [document["doc_id"] for document in documents], [document["user_id"] for document in documents]
+    )
+    writes = []
+    for document, meta, chunks, doc_vectors, doc_extras in zip(documents, metas, doc_chunks, vectors, extras):
+        writes.append({
+            "doc_id": document["doc_id"],
+            "user_id": document["user_id"],
+            "chunks": chunks,
+            "fingerprints": [vector_service.fingerprint(chunk["text"]) for chunk in chunks],
+            "vectors": doc_vectors,
+            "raw_json": json.dumps(document["raw_data"], ensure_ascii=False),
+            "content_fingerprint": vector_service._content_fingerprint(document["text"]),
+            "todo_id": document["todo_id"],
+            "stale_chunk_count": meta["chunks"],
+            "extras": doc_extras
+        })
+    results = store.save_many(writes, only_if_absent=True) if target is not None else store.save_many(writes)
+    # 重新编码后的分数可能变化，使这些用户的检索结果缓存失效
+    vector_service.result_cache.bump(document["user_id"] for document in documents)
+    for written in results:
+        if written == -2:
+            # 双写已经写入了更新的数据
+            continue
+        if written < 0:
+            stats["failed"] += 1
+        else:
+            stats["docs"] += 1
+            stats["chunks"] += written
+    if previous is not None:
+        stats["moved"] = _prune_moved(previous, writes, results)
+    return stats
+
+
+class CheckpointTracker:
+    """
+    汇总各窗口的结果并推进检查点
+
+    窗口可能乱序完成，检查点只推进到已连续完成的窗口；某个窗口失败后检查点停在它之前，
+    其后完成的窗口只计入本次统计，重跑时从失败的窗口开始
+    """
+
+    def __init__(self, checkpoint: dict, path: str = None):
+        """
+        Args:
+            checkpoint: _load_checkpoint 读取的检查点
+            path: 检查点文件，不传时只在内存中推进
+        """
+        self.checkpoint = checkpoint
+        self.path = path
+        self.processed = 0
+        self.failed = 0
+        self.failed_windows = 0
+        self.moved = 0
+        self.started = time.perf_counter()
+        self._done = {}
+        self._next_seq = 0
+
+    def finish(self, seq: int, last_id: str, size: int, stats: dict = None):
+        """
+        记录一个窗口完成
+
+        Args:
+            seq: 窗口序号（从0开始按提交顺序）
+            last_id: 窗口内最大的 _id
+            size: 窗口内容数
+            stats: reindex_window 的结果，窗口失败时为None
+        """
+        self._done[seq] = (last_id, size, stats)
+        while self._next_seq in self._done:
+            last_id, size, stats = self._done.pop(self._next_seq)
+            self._next_seq += 1
+            if stats is None:
+                self.failed += size
+                self.failed_windows += 1
+                continue
+            self.processed += stats["docs"]
+            self.failed += stats["failed"]
+            self.moved += stats["moved"]
+            if self.failed_windows == 0:
+                self.checkpoint["last_id"] = last_id
+                for key in ("docs", "chunks", "skipped", "linked"):
+                    self.checkpoint[key] += stats[key]
+                if self.path:
+                    _save_checkpoint(self.path, self.checkpoint)
+            elapsed = time.perf_counter() - self.started
+            print(f"last_id={last_id} 本次 {self.processed} 个内容，{self.processed / max(elapsed, 1e-9):.1f} docs/s，"
+                  f"累计 {self.checkpoint['docs']} 个内容 {self.checkpoint['chunks']} 个分块"
+                  + (f"（{self.failed_windows} 个窗口失败，检查点停在 {self.checkpoint['last_id']}）"
+                     if self.failed_windows else ""))
+
+
+def reindex_windows(vector_service: VectorService, windows, tracker: CheckpointTracker, batch_size: int,
+                    workers: int = 1, previous: ShardedVectorStore = None):
+    """
+    并行重建各窗口，完成后交给 tracker 推进检查点
+
+    Args:
+        windows: 按 _id 升序的内容窗口
+        workers: 并行处理的窗口数，在途窗口不超过其两倍
+    """
+    pending = {}
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        def drain(block_until: int):
+            while len(pending) > block_until:
+                finished, _ = wait(list(pending), return_when=FIRST_COMPLETED)
+                for future in finished:
+                    seq, last_id, size = pending.pop(future)
+                    try:
+                        stats = future.result()
+                    except Exception as e:
+                        print(f"窗口 last_id={last_id} 重建失败（{size} 个内容）: {e}")
+                        stats = None
+                    tracker.finish(seq, last_id, size, stats)
+
+        for seq, contents in enumerate(windows):
+            future = executor.submit(reindex_window, vector_service, contents, batch_size, previous)
+            pending[future] = (seq, str(contents[-1]["_id"]), len(contents))
+            # 限制在途窗口数量，避免一次读入过多内容
+            drain(workers * 2)
+        drain(0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="从MongoDB全量重建向量")
+    parser.add_argument("--user", default=None, help="只重建该用户")
+    parser.add_argument("--since", default=None, help="只重建该日期（YYYY-MM-DD）之后创建的内容")
+    parser.add_argument("--workers", type=int, default=1, help="并行处理的窗口数")
+    parser.add_argument("--window", type=int, default=512, help="每个窗口的内容数量（长度排序范围）")
+    parser.add_argument("--batch-size", type=int, default=64, help="编码批大小")
+    parser.add_argument("--checkpoint", default=".reindex_checkpoint.json", help="检查点文件")
+    parser.add_argument("--restart", action="store_true", help="忽略检查点从头开始")
+    parser.add_argument("--old-shards", default=None, help="调整分片前的 VECTOR_SHARDS，重建后从旧分片删除已迁走的内容")
+    args = parser.parse_args()
+
+    scope = {"user": args.user, "since": args.since}
+    previous = None
+    if args.old_shards:
+        scope["old_shards"] = args.old_shards
+        previous = ShardedVectorStore(ShardMap(parse_shard_endpoints(args.old_shards)))
+    checkpoint = _load_checkpoint(args.checkpoint, scope, args.restart)
+
+    # ObjectId 内含创建时间，--since 和断点续跑都转为 _id 范围
+    query = {}
+    if args.user:
+        query["user_id"] = args.user
+    id_range = {}
+    if args.since:
+        id_range["$gte"] = ObjectId.from_datetime(datetime.strptime(args.since, "%Y-%m-%d"))
+    if checkpoint["last_id"]:
+        id_range["$gt"] = ObjectId(checkpoint["last_id"])
+    if id_range:
+        query["_id"] = id_range
+
+    vector_service = VectorService()
+    tracker = CheckpointTracker(checkpoint, args.checkpoint)
+    reindex_windows(vector_service, _iter_windows(query, args.window), tracker, args.batch_size,
+                    workers=args.workers, previous=previous)
+
+    elapsed = time.perf_counter() - tracker.started
+    print(json.dumps({
+        "docs": tracker.processed,
+        "failed": tracker.failed,
+        "failed_windows": tracker.failed_windows,
+        "moved_from_old_shards": tracker.moved,
+        "elapsed_s": round(elapsed, 2),
+        "docs_per_s": round(tracker.processed / max(elapsed, 1e-9), 2),
+        "total_docs": checkpoint["docs"],
+        "total_chunks": checkpoint["chunks"],
+        "skipped_without_text": checkpoint["skipped"],
+        "linked_duplicates": checkpoint["linked"],
+    }, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,169 @@
+# 向量内存计量与预算
+#
+# 默认输出每个Redis（缓存Redis或向量分片）当前版本的计量合计和用量最大的用户。
+# 计量只在设置内存预算时随写入和删除更新，未设置预算时的计数不反映当前数据。
+# --rebuild 从现有键重新统计计量（从TTL切换到内存预算前、或计量之前写入的数据使计数偏离时运行）：
+#   逐个内容按分块的向量与ColBERT向量长度计算字节数写回元数据，重写各用户和全局的计量；
+#   设置了内存预算时同时重建LRU，时间按剩余过期时间推算最近一次刷新（没有过期时间的记为当前时间）。
+# --persist 去掉向量键的过期时间，从 REDIS_VECTOR_TTL 切换到内存预算时与 --rebuild 一起运行。
+# --enforce 立即按预算逐出（正常情况下写入后自动执行）。
+# 重建期间的并发写入可能使计数有少量偏差，建议在低峰期运行。
+#
+# 用法（在 Backend 目录下）:
+#     python -m scripts.vector_usage [--user USER_ID] [--top 20] [--rebuild] [--persist] [--enforce] [--batch 500]
+import argparse
+import time
+from config.database import cache_client, shard_map
+from config.settings import db_config
+from services.search_cache import SearchResultCache
+from services.vector_index import VectorIndexManager
+from services.vector_store import RedisVectorStore, decode_value
+
+
+def _scan_delete(redis_client, pattern: str, batch: int):
+    keys = []
+    for key in redis_client.scan_iter(match=pattern, count=batch):
+        keys.append(key)
+        if len(keys) >= batch:
+            redis_client.unlink(*keys)
+            keys = []
+    if keys:
+        redis_client.unlink(*keys)
+
+
+def _rebuild_batch(store: RedisVectorStore, doc_keys: list, usage: dict, lru: dict, persist: bool):
+    """统计一批内容：写回元数据的 bytes 字段，累加到用户计量"""
+    redis_client = store.redis_client
+    pipe = redis_client.pipeline(transaction=False)
+    for key in doc_keys:
+        pipe.hmget(key, ["user_id", "chunks", "evicted", "todo_id"])
+        pipe.pttl(key)
+    rows = pipe.execute()
+    metas = [(rows[i], rows[i + 1]) for i in range(0, len(rows), 2)]
+
+    pipe = redis_client.pipeline(transaction=False)
+    for key, ((owner, chunks, _, _), _) in zip(doc_keys, metas):
+        doc_id = decode_value(key)[len(store.prefixes["doc"]):]
+        for i in range(int(chunks or 0) if owner else 0):
+            pipe.hstrlen(f"{store.prefixes['chunk']}{doc_id}:{i}", "vector")
+            pipe.hstrlen(f"{store.prefixes['chunk']}{doc_id}:{i}", "colbert")
+    lengths = iter(pipe.execute())
+
+    now = time.time()
+    ttl = int(db_config.redis_vector_ttl)
+    pipe = redis_client.pipeline(transaction=False)
+    for key, ((owner, chunks, evicted, todo_id), pttl) in zip(doc_keys, metas):
+        if not owner:
+            continue
+        user_id = decode_value(owner)
+        doc_id = decode_value(key)[len(store.prefixes["doc"]):]
+        n_chunks = int(chunks or 0)
+        n_bytes = sum(next(lengths) + next(lengths) for _ in range(n_chunks))
+        entry = usage.setdefault(user_id, {field: 0 for field in RedisVectorStore.USAGE_FIELDS})
+        if decode_value(evicted) == "1":
+            entry["evicted"] += 1
+        else:
+            entry["docs"] += 1
+            entry["chunks"] += n_chunks
+            entry["bytes"] += n_bytes
+            # 滑动过期下剩余时间越短，最近一次刷新越早
+            lru.setdefault(user_id, {})[doc_id] = now - (ttl - pttl / 1000) if pttl > 0 and ttl > 0 else now
+        pipe.hset(key, "bytes", n_bytes)
+        if persist:
+            pipe.persist(key)
+            for i in range(n_chunks):
+                pipe.persist(f"{store.prefixes['chunk']}{doc_id}:{i}")
+            if todo_id:
+                pipe.persist(f"{store.prefixes['todo']}{decode_value(todo_id)}")
+    pipe.execute()
+
+
+def _rebuild(store: RedisVectorStore, endpoint: str, args):
+    """重新统计一个Redis上当前版本的计量"""
+    redis_client = store.redis_client
+    usage: dict = {}
+    lru: dict = {}
+    started = time.perf_counter()
+    doc_keys = []
+    for key in redis_client.scan_iter(match=f"{store.prefixes['doc']}*", count=args.batch):
+        doc_keys.append(key)
+        if len(doc_keys) >= args.batch:
+            _rebuild_batch(store, doc_keys, usage, lru, args.persist)
+            doc_keys = []
+    if doc_keys:
+        _rebuild_batch(store, doc_keys, usage, lru, args.persist)
+    if args.persist:
+        for key in redis_client.scan_iter(match=f"{store.prefixes['fp']}*", count=args.batch):
+            redis_client.persist(key)
+
+    _scan_delete(redis_client, f"{store.prefixes['usage']}*", args.batch)
+    _scan_delete(redis_client, f"{store.prefixes['lru']}*", args.batch)
+    total = {field: 0 for field in RedisVectorStore.USAGE_FIELDS}
+    pipe = redis_client.pipeline(transaction=False)
+    for user_id, entry in usage.items():
+        pipe.hset(f"{store.prefixes['usage']}{user_id}", mapping=entry)
+        if entry["bytes"] > 0:
+            pipe.zadd(f"{store.prefixes['usage']}_users", {user_id: entry["bytes"]})
+        for field, value in entry.items():
+            total[field] += value
+    pipe.hset(f"{store.prefixes['usage']}_total", mapping=total)
+    if store.budgeted:
+        for user_id, docs in lru.items():
+            pipe.zadd(f"{store.prefixes['lru']}{user_id}", docs)
+    pipe.execute()
+    print(f"[{endpoint}] 计量重建完成: {len(usage)} 个用户 {total}，耗时 {time.perf_counter() - started:.1f}s")
+
+
+def _enforce(store: RedisVectorStore, endpoint: str, args):
+    """对计量中的全部用户按预算逐出"""
+    users = [user_id for user_id, _ in store.top_users(limit=0)] if store.user_budget > 0 else []
+    stats = {"docs": 0, "bytes": 0}
+    evicted_users = set()
+    for start in range(0, max(1, len(users)), args.batch):
+        batch = store.enforce_budget(users[start:start + args.batch])
+        stats["docs"] += batch["docs"]
+        stats["bytes"] += batch["bytes"]
+        evicted_users.update(batch["users"])
+    # 被逐出内容的用户的检索结果缓存失效
+    SearchResultCache(cache_client.client, namespace="search").bump(evicted_users)
+    print(f"[{endpoint}] 逐出 {stats['docs']} 个内容，释放 {stats['bytes'] / 1024 / 1024:.1f}MB")
+
+
+def _report(store: RedisVectorStore, endpoint: str, args):
+    if args.user:
+        print(f"[{endpoint}] 用户 {args.user}: {store.usage(args.user)}")
+        return
+    total = store.usage()
+    print(f"[{endpoint}] 合计: {total}（向量 {total['bytes'] / 1024 / 1024:.1f}MB）")
+    for user_id, n_bytes in store.top_users(args.top):
+        print(f"    {user_id}: {n_bytes / 1024 / 1024:.1f}MB {store.usage(user_id)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="向量内存计量与预算")
+    parser.add_argument("--user", default=None, help="只查看该用户的计量")
+    parser.add_argument("--top", type=int, default=20, help="列出用量最大的用户数量")
+    parser.add_argument("--rebuild", action="store_true", help="从现有键重新统计计量")
+    parser.add_argument("--persist", action="store_true", help="去掉向量键的过期时间（与 --rebuild 一起使用）")
+    parser.add_argument("--enforce", action="store_true", help="立即按预算逐出")
+    parser.add_argument("--batch", type=int, default=500, help="每批处理的键数量")
+    args = parser.parse_args()
+    if args.persist and not args.rebuild:
+        parser.error("--persist 需要与 --rebuild 一起使用")
+
+    print(f"内存预算: 用户 {db_config.vector_user_budget_mb}MB，全局 {db_config.vector_global_budget_mb}MB（0为不限）")
+    # 每个向量分片各自计量和执行预算
+    for shard, endpoint in enumerate(shard_map.endpoints):
+        redis_client = shard_map.client(shard)
+        manager = VectorIndexManager(redis_client)
+        version = manager.state(fresh=True)["active"]
+        store = RedisVectorStore(redis_client, version, manager.vector_type(version))
+        if args.rebuild:
+            _rebuild(store, endpoint, args)
+        if args.enforce:
+            _enforce(store, endpoint, args)
+        _report(store, endpoint, args)
+
+
+if __name__ == "__main__":
+    main()
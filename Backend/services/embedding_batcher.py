@@ -0,0 +1,213 @@
+# 向量编码微批处理层，把并发请求的小批量编码合并为批量前向计算
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable, Dict, List, Sequence, Tuple
+
+
+class _EncodeRequest:
+    """一次排队中的编码请求"""
+    __slots__ = ("texts", "max_length", "options", "future", "enqueued_at")
+
+    def __init__(self, texts: List[str], max_length: int, options: Tuple = ()):
+        self.texts = texts
+        self.max_length = max_length
+        self.options = tuple(options)
+        self.future = Future()
+        self.enqueued_at = time.perf_counter()
+
+
+class EmbeddingBatcher:
+    """
+    编码微批处理器
+
+    各请求线程调用 encode() 后阻塞等待，后台线程在 max_wait_ms 内或攒够
+    max_batch_size 条文本后统一出队，按编码选项和文本长度分桶，每个桶做一次
+    批量编码，再把对应的行分发回各调用方。
+    """
+
+    # 批大小直方图的上界
+    BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64)
+
+    def __init__(self, encode_fn: Callable[[List[str], int, int, Tuple], Sequence],
+                 max_batch_size: int = 32, max_wait_ms: float = 5.0,
+                 length_buckets: Sequence[int] = (128, 512, 2048)):
+        """
+        初始化微批处理器
+
+        Args:
+            encode_fn: 实际的编码函数 (texts, batch_size, max_length, options) -> 逐行结果
+            max_batch_size: 单次出队的最大文本数
+            max_wait_ms: 第一条请求入队后最多等待的毫秒数
+            length_buckets: 按字符数分桶的边界
+        """
+        self._encode_fn = encode_fn
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000
+        self.length_buckets = sorted(int(b) for b in length_buckets)
+
+        self._queue: List[_EncodeRequest] = []
+        self._pending_texts = 0
+        self._cond = threading.Condition()
+
+        # 指标
+        self._stats_lock = threading.Lock()
+        self._stats = {
+            "requests": 0,
+            "texts": 0,
+            "batches": 0,
+            "forward_passes": 0,
+            "max_batch_size": 0,
+            "queue_wait_ms_total": 0.0,
+            "queue_wait_ms_max": 0.0,
+            "encode_ms_total": 0.0,
+            "errors": 0,
+        }
+        self._batch_histogram = {self._histogram_label(b): 0 for b in self.BATCH_SIZE_BUCKETS}
+        self._batch_histogram[f">{self.BATCH_SIZE_BUCKETS[-1]}"] = 0
+
+        self._worker = threading.Thread(target=self._run, name="embedding-batcher", daemon=True)
+        self._worker.start()
+
+    def encode(self, texts: List[str], max_length: int, options: Tuple = ()) -> List:
+        """
+        提交编码请求并等待结果
+
+        Args:
+            texts: 文本列表
+            max_length: 最大文本长度
+            options: 编码选项，选项相同的请求才会合并
+
+        Returns:
+            List: 与texts逐行对应的编码结果
+        """
+        request = _EncodeRequest(list(texts), max_length, options)
+        with self._cond:
+            self._queue.append(request)
+            self._pending_texts += len(request.texts)
+            self._cond.notify()
+        return request.future.result()
+
+    def _take_batch(self) -> List[_EncodeRequest]:
+        """阻塞直到凑满一批或等待超时，取出待处理的请求"""
+        with self._cond:
+            while not self._queue:
+                self._cond.wait()
+
+            deadline = self._queue[0].enqueued_at + self.max_wait
+            while self._pending_texts < self.max_batch_size:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+
+            batch = []
+            taken = 0
+            # 至少取一条请求，单条请求超过批大小时也整条处理
+            while self._queue and (not batch or taken + len(self._queue[0].texts) <= self.max_batch_size):
+                request = self._queue.pop(0)
+                batch.append(request)
+                taken += len(request.texts)
+            self._pending_texts -= taken
+            return batch
+
+    def _bucket_of(self, text: str) -> int:
+        """返回文本所属长度桶的下标"""
+        length = len(text)
+        for i, bound in enumerate(self.length_buckets):
+            if length <= bound:
+                return i
+        return len(self.length_buckets)
+
+    def _run(self):
+        """后台线程：循环出队并批量编码"""
+        while True:
+            batch = self._take_batch()
+            started = time.perf_counter()
+            try:
+                self._process(batch)
+            except Exception as e:
+                for request in batch:
+                    if not request.future.done():
+                        request.future.set_exception(e)
+                with self._stats_lock:
+                    self._stats["errors"] += 1
+            self._record(batch, started)
+
+    def _process(self, batch: List[_EncodeRequest]):
+        """按 max_length、编码选项和长度桶分组编码，再把结果行分发给各请求"""
+        groups: Dict[Tuple[int, Tuple, int], List[Tuple[int, int, str]]] = {}
+        for req_idx, request in enumerate(batch):
+            for text_idx, text in enumerate(request.texts):
+                key = (request.max_length, request.options, self._bucket_of(text))
+                groups.setdefault(key, []).append((req_idx, text_idx, text))
+
+        results: List[List] = [[None] * len(request.texts) for request in batch]
+        passes = 0
+        for (max_length, options, _), items in groups.items():
+            # 桶内再按长度排序，进一步减少padding
+            items.sort(key=lambda item: len(item[2]))
+            rows = self._encode_fn([item[2] for item in items], len(items), max_length, options)
+            passes += 1
+            for (req_idx, text_idx, _), row in zip(items, rows):
+                results[req_idx][text_idx] = row
+
+        with self._stats_lock:
+            self._stats["forward_passes"] += passes
+
+        for request, rows in zip(batch, results):
+            request.future.set_result(rows)
+
+    @staticmethod
+    def _histogram_label(bound: int) -> str:
+        return f"<={bound}"
+
+    def _record(self, batch: List[_EncodeRequest], started: float):
+        """记录批处理指标"""
+        now = time.perf_counter()
+        size = sum(len(request.texts) for request in batch)
+        waits = [(started - request.enqueued_at) * 1000 for request in batch]
+        label = f">{self.BATCH_SIZE_BUCKETS[-1]}"
+        for bound in self.BATCH_SIZE_BUCKETS:
+            if size <= bound:
+                label = self._histogram_label(bound)
+                break
+
+        with self._stats_lock:
+            self._stats["requests"] += len(batch)
+            self._stats["texts"] += size
+            self._stats["batches"] += 1
+            self._stats["max_batch_size"] = max(self._stats["max_batch_size"], size)
+            self._stats["queue_wait_ms_total"] += sum(waits)
+            self._stats["queue_wait_ms_max"] = max(self._stats["queue_wait_ms_max"], max(waits))
+            self._stats["encode_ms_total"] += (now - started) * 1000
+            self._batch_histogram[label] += 1
+
+    def stats(self) -> Dict:
+        """
+        获取批处理指标
+
+        Returns:
+            Dict: 配置、累计计数、平均批大小/等待时间以及批大小直方图
+        """
+        with self._stats_lock:
+            stats = dict(self._stats)
+            histogram = dict(self._batch_histogram)
+        with self._cond:
+            queued = self._pending_texts
+
+        batches = stats["batches"] or 1
+        requests = stats["requests"] or 1
+        stats.update({
+            "config": {
+                "max_batch_size": self.max_batch_size,
+                "max_wait_ms": self.max_wait * 1000,
+                "length_buckets": self.length_buckets,
+            },
+            "queued_texts": queued,
+            "avg_batch_size": stats["texts"] / batches,
+            "avg_queue_wait_ms": stats["queue_wait_ms_total"] / requests,
+            "avg_encode_ms": stats["encode_ms_total"] / batches,
+            "batch_size_histogram": histogram,
+        })
+        return stats
@@ -0,0 +1,187 @@
+# 向量缓存层，缓存文本对应的稠密向量，避免重复编码
+import hashlib
+import json
+import re
+import threading
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+import numpy as np
+
+
+def normalize_query(text: str) -> str:
+    """
+    规范化查询文本：全半角统一、去除首尾空白、合并连续空白
+
+    Args:
+        text: 查询文本
+
+    Returns:
+        str: 规范化后的文本
+    """
+    text = unicodedata.normalize("NFKC", text or "")
+    return re.sub(r"\s+", " ", text).strip()
+
+
+class EmbeddingCache:
+    """
+    两级向量缓存
+
+    第一级为进程内LRU（有容量上限），第二级为Redis（float32字节 + TTL，多进程共享）。
+    缓存键为 模型名 + 文本 的哈希。词汇权重（{token_id: weight}）以JSON存放在同一哈希的 lex: 子键下。
+    """
+
+    def __init__(self, redis_client, namespace: str, model_name: str,
+                 max_entries: int = 2048, ttl: int = 7 * 24 * 60 * 60):
+        """
+        初始化向量缓存
+
+        Args:
+            redis_client: Redis客户端
+            namespace: Redis键前缀
+            model_name: 模型名，参与哈希，换模型后旧缓存自然失效
+            max_entries: 进程内LRU容量
+            ttl: Redis缓存过期时间（秒）
+        """
+        self.redis_client = redis_client
+        self.namespace = namespace
+        self.model_name = model_name
+        self.max_entries = max(0, int(max_entries))
+        self.ttl = int(ttl)
+
+        self._lru: "OrderedDict[str, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"local_hits": 0, "redis_hits": 0, "misses": 0, "errors": 0}
+
+    def digest(self, text: str) -> str:
+        """文本 + 模型名的哈希"""
+        return hashlib.sha256(f"{self.model_name}\x00{text}".encode("utf-8")).hexdigest()
+
+    def _redis_key(self, digest: str) -> str:
+        return f"{self.namespace}:{digest}"
+
+    def _remember(self, digest: str, value):
+        """写入进程内LRU"""
+        if self.max_entries == 0:
+            return
+        with self._lock:
+            self._lru[digest] = value
+            self._lru.move_to_end(digest)
+            while len(self._lru) > self.max_entries:
+                self._lru.popitem(last=False)
+
+    def _lookup(self, digest: str) -> Optional[Any]:
+        """先查进程内LRU再查Redis：LRU命中返回缓存的对象，Redis命中返回原始字节，都未命中返回None"""
+        with self._lock:
+            value = self._lru.get(digest)
+            if value is not None:
+                self._lru.move_to_end(digest)
+                self._stats["local_hits"] += 1
+                return value
+
+        try:
+            cached = self.redis_client.get(self._redis_key(digest))
+        except Exception as e:
+            print(f"获取向量缓存失败: {e}")
+            self._count("errors")
+            cached = None
+
+        if cached:
+            self._count("redis_hits")
+            return cached
+
+        self._count("misses")
+        return None
+
+    def _store(self, digest: str, value, payload: bytes) -> bool:
+        """写入进程内LRU和Redis"""
+        self._remember(digest, value)
+        try:
+            self.redis_client.setex(self._redis_key(digest), self.ttl, payload)
+            return True
+        except Exception as e:
+            print(f"设置向量缓存失败: {e}")
+            self._count("errors")
+            return False
+
+    def _count(self, name: str):
+        with self._lock:
+            self._stats[name] += 1
+
+    def get(self, text: str) -> Optional[np.ndarray]:
+        """
+        查询缓存
+
+        Args:
+            text: 文本
+
+        Returns:
+            Optional[np.ndarray]: 缓存的向量，未命中返回None
+        """
+        digest = self.digest(text)
+        cached = self._lookup(digest)
+        if isinstance(cached, bytes):
+            cached = np.frombuffer(cached, dtype=np.float32)
+            self._remember(digest, cached)
+        return cached
+
+    def set(self, text: str, vector: np.ndarray) -> bool:
+        """
+        写入缓存
+
+        Args:
+            text: 文本
+            vector: 稠密向量
+
+        Returns:
+            bool: Redis写入是否成功
+        """
+        vector = np.asarray(vector, dtype=np.float32)
+        return self._store(self.digest(text), vector, vector.tobytes())
+
+    def get_weights(self, text: str) -> Optional[Dict[str, float]]:
+        """
+        查询词汇权重缓存
+
+        Args:
+            text: 文本
+
+        Returns:
+            Optional[Dict[str, float]]: 缓存的词汇权重 {token_id: weight}，未命中返回None
+        """
+        digest = f"lex:{self.digest(text)}"
+        cached = self._lookup(digest)
+        if isinstance(cached, bytes):
+            cached = json.loads(cached)
+            self._remember(digest, cached)
+        return cached
+
+    def set_weights(self, text: str, weights: Dict) -> bool:
+        """
+        写入词汇权重缓存
+
+        Args:
+            text: 文本
+            weights: 词汇权重 {token_id: weight}
+
+        Returns:
+            bool: Redis写入是否成功
+        """
+        weights = {str(token): float(weight) for token, weight in weights.items()}
+        return self._store(f"lex:{self.digest(text)}", weights, json.dumps(weights).encode("utf-8"))
+
+    def stats(self) -> Dict:
+        """
+        获取缓存命中指标
+
+        Returns:
+            Dict: 命中/未命中计数与命中率
+        """
+        with self._lock:
+            stats = dict(self._stats)
+            stats["local_entries"] = len(self._lru)
+        lookups = stats["local_hits"] + stats["redis_hits"] + stats["misses"]
+        stats["hit_rate"] = (stats["local_hits"] + stats["redis_hits"]) / lookups if lookups else 0.0
+        stats["max_entries"] = self.max_entries
+        stats["ttl"] = self.ttl
+        return stats
@@ -0,0 +1,397 @@
+# 独立编码进程：模型只在编码进程中加载一份，多个Web进程通过本地socket请求编码，
+# 结果向量写入共享内存，socket上只传输形状等少量元数据，不再pickle整批向量
+#
+# multiprocessing.connection 会反序列化收到的每条消息，能连上并通过认证的一方即可在编码进程中执行代码，
+# 因此只允许Unix socket（文件权限0600）或回环地址，并且必须配置 EMBEDDING_WORKER_AUTHKEY
+#
+# 编码进程: python -m scripts.embedding_worker [--address /tmp/flare-embed.sock]
+# Web进程: 设置 EMBEDDING_WORKER 后 VectorService 使用 RemoteEncoder，接口与进程内模型一致
+import ipaddress
+import itertools
+import os
+import queue
+import threading
+import time
+from multiprocessing import resource_tracker
+from multiprocessing.connection import Client, Listener
+from multiprocessing.shared_memory import SharedMemory
+from typing import Dict, List, Optional, Tuple, Union
+import numpy as np
+from config.settings import ai_config
+
+
+def load_encoder():
+    """
+    按配置的后端加载编码模型
+
+    Returns:
+        BGEM3FlagModel 或 OnnxBGEM3Encoder，两者的 encode()/tokenizer 用法一致
+
+    Raises:
+        ValueError: 后端不支持时抛出
+    """
+    if ai_config.encoder_backend == "flag":
+        # torch只在进程内加载模型时需要
+        from FlagEmbedding import BGEM3FlagModel
+        return BGEM3FlagModel(ai_config.model_name, use_fp16=True)
+    if ai_config.encoder_backend == "onnx":
+        # onnxruntime只在使用该后端时需要
+        from services.onnx_encoder import OnnxBGEM3Encoder
+        return OnnxBGEM3Encoder(
+            ai_config.onnx_model_dir,
+            ai_config.onnx_model_file,
+            intra_op_threads=ai_config.onnx_intra_op_threads
+        )
+    raise ValueError(f"不支持的编码后端: {ai_config.encoder_backend}")
+
+
+def _is_loopback(host: str) -> bool:
+    if host == "localhost":
+        return True
+    try:
+        return ipaddress.ip_address(host.strip("[]")).is_loopback
+    except ValueError:
+        return False
+
+
+def parse_address(address: str) -> Union[str, Tuple[str, int]]:
+    """
+    解析编码进程地址，host:port 为TCP地址，其余视为Unix socket路径
+
+    Raises:
+        ValueError: TCP地址不是回环地址时抛出（编码进程只供本机的Web进程使用）
+    """
+    host, sep, port = address.rpartition(":")
+    if sep and host and port.isdigit():
+        if not _is_loopback(host):
+            raise ValueError(f"编码进程只能监听Unix socket或回环地址: {address}")
+        return host.strip("[]"), int(port)
+    return address
+
+
+def require_authkey(authkey: str) -> bytes:
+    """
+    检查认证密钥
+
+    Raises:
+        ValueError: 未配置 EMBEDDING_WORKER_AUTHKEY 时抛出
+    """
+    if not authkey:
+        raise ValueError("未配置 EMBEDDING_WORKER_AUTHKEY，编码进程连接需要随机认证密钥")
+    return authkey.encode("utf-8")
+
+
+class EmbeddingWorkerUnavailable(ConnectionError):
+    """编码进程无法连接或连接中断"""
+
+
+class EmbeddingWorkerServer:
+    """
+    编码进程服务端
+
+    每个连接一个线程，同一连接上的请求串行（请求-响应），结果写入该连接独占的共享内存块，
+    下一次请求前客户端已读完，因此共享内存可以复用，容量不足时换一块更大的；
+    多个连接的编码请求串行调用模型，由模型自身的算子线程占满CPU
+    """
+
+    def __init__(self, encoder, address: str, authkey: str):
+        """
+        Args:
+            encoder: load_encoder() 加载的模型
+            address: 监听地址，Unix socket路径或回环地址 host:port
+            authkey: 连接认证密钥
+
+        Raises:
+            ValueError: 地址不是本地地址或未配置认证密钥时抛出
+        """
+        self.encoder = encoder
+        self.address = parse_address(address)
+        self.authkey = require_authkey(authkey)
+        self._lock = threading.Lock()
+
+    def serve_forever(self):
+        """接受连接直到进程退出"""
+        unix_socket = isinstance(self.address, str)
+        if unix_socket and os.path.exists(self.address):
+            # 上次异常退出留下的socket文件
+            os.remove(self.address)
+        # socket文件创建时即只有本用户可读写，避免chmod之前被其他用户连接
+        umask = os.umask(0o177) if unix_socket else None
+        try:
+            listener = Listener(self.address, authkey=self.authkey)
+        finally:
+            if umask is not None:
+                os.umask(umask)
+        if unix_socket:
+            os.chmod(self.address, 0o600)
+        with listener:
+            print(f"编码进程已启动: {self.address}")
+            while True:
+                try:
+                    conn = listener.accept()
+                except Exception as e:
+                    # 认证失败等只影响该连接
+                    print(f"接受连接失败: {e}")
+                    continue
+                threading.Thread(target=self._serve, args=(conn,), daemon=True).start()
+
+    def _serve(self, conn):
+        """处理一个连接上的请求"""
+        shm = None
+        try:
+            while True:
+                try:
+                    request = conn.recv()
+                except EOFError:
+                    return
+                try:
+                    response, shm = self._encode(request, shm)
+                except Exception as e:
+                    response = {"ok": False, "error": str(e)}
+                conn.send(response)
+        finally:
+            conn.close()
+            if shm is not None:
+                shm.close()
+                shm.unlink()
+
+    def _encode(self, request: Dict, shm: Optional[SharedMemory]) -> Tuple[Dict, Optional[SharedMemory]]:
+        """编码并把稠密向量和ColBERT向量依次写入共享内存"""
+        with self._lock:
+            out = self.encoder.encode(
+                request["texts"],
+                batch_size=request["batch_size"],
+                max_length=request["max_length"],
+                return_dense=True,
+                return_sparse=request["sparse"],
+                return_colbert_vecs=request["colbert"]
+            )
+        dense = np.ascontiguousarray(out["dense_vecs"], dtype=np.float32)
+        colbert = [np.ascontiguousarray(vecs, dtype=np.float32) for vecs in out["colbert_vecs"]] \
+            if request["colbert"] else []
+        size = dense.nbytes + sum(vecs.nbytes for vecs in colbert)
+
+        if shm is None or shm.size < size:
+            if shm is not None:
+                shm.close()
+                shm.unlink()
+            shm = SharedMemory(create=True, size=max(size, 2 * (shm.size if shm is not None else 0), 1 << 20))
+        buffer = np.ndarray((size // 4,), dtype=np.float32, buffer=shm.buf)
+        buffer[:dense.size] = dense.ravel()
+        offset = dense.size
+        for vecs in colbert:
+            buffer[offset:offset + vecs.size] = vecs.ravel()
+            offset += vecs.size
+        del buffer
+
+        response = {
+            "ok": True,
+            "shm": shm.name,
+            "dense": dense.shape,
+            "colbert": [vecs.shape for vecs in colbert] if request["colbert"] else None,
+            # 词汇权重是小字典，直接随消息返回
+            "sparse": [{str(k): float(v) for k, v in weights.items()} for weights in out["lexical_weights"]]
+            if request["sparse"] else None
+        }
+        return response, shm
+
+
+class _Channel:
+    """到编码进程的一条连接及其已映射的共享内存"""
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.shm: Optional[SharedMemory] = None
+
+    def attach(self, name: str) -> SharedMemory:
+        """映射服务端的共享内存块，服务端换了新块时释放旧的映射"""
+        if self.shm is None or self.shm.name != name.lstrip("/"):
+            self.detach()
+            self.shm = SharedMemory(name=name)
+            # 共享内存由编码进程创建和回收，本进程只映射，不交给资源跟踪器（否则退出时会被误删）
+            try:
+                resource_tracker.unregister(self.shm._name, "shared_memory")
+            except Exception:
+                pass
+        return self.shm
+
+    def detach(self):
+        if self.shm is not None:
+            self.shm.close()
+            self.shm = None
+
+    def close(self):
+        self.detach()
+        try:
+            self.conn.close()
+        except Exception:
+            pass
+
+
+class RemoteEncoder:
+    """
+    编码进程客户端，encode()/tokenizer 的用法与 BGEM3FlagModel 一致，可替换进程内模型
+
+    每个Web进程维护一个小连接池，连接数即同时进行的编码请求数；
+    编码进程不可用时重连一次，仍失败且允许回退时在本进程加载模型，之后都在进程内编码
+    """
+
+    def __init__(self, addresses: List[str], authkey: str, connections: int = 4, fallback: bool = True):
+        """
+        Args:
+            addresses: 编码进程地址列表，新连接轮流分配到各地址
+            authkey: 连接认证密钥
+            connections: 连接池大小
+            fallback: 编码进程不可用时是否回退到进程内模型
+        """
+        self.addresses = [parse_address(address) for address in addresses]
+        self.authkey = require_authkey(authkey)
+        self.fallback = fallback
+        self._next_address = itertools.cycle(range(len(self.addresses)))
+        self._idle: "queue.Queue[_Channel]" = queue.Queue()
+        self._slots = threading.BoundedSemaphore(max(1, connections))
+        self._lock = threading.Lock()
+        self._local = None
+        self._tokenizer = None
+        # 统计由多个请求线程同时更新
+        self._stats_lock = threading.Lock()
+        self._stats = {"requests": 0, "texts": 0, "shared_bytes": 0, "reconnects": 0, "wait_ms": 0.0}
+
+    @property
+    def tokenizer(self):
+        """分词只需要分词器，不加载模型权重"""
+        if self._local is not None:
+            return self._local.tokenizer
+        with self._lock:
+            if self._tokenizer is None:
+                from transformers import AutoTokenizer
+                path = ai_config.onnx_model_dir if ai_config.encoder_backend == "onnx" else ai_config.model_name
+                self._tokenizer = AutoTokenizer.from_pretrained(path)
+        return self._tokenizer
+
+    def _connect(self) -> _Channel:
+        """按轮询顺序连接编码进程，全部失败时抛出 EmbeddingWorkerUnavailable"""
+        errors = []
+        for _ in range(len(self.addresses)):
+            with self._lock:
+                address = self.addresses[next(self._next_address)]
+            try:
+                return _Channel(Client(address, authkey=self.authkey))
+            except Exception as e:
+                errors.append(f"{address}: {e}")
+        raise EmbeddingWorkerUnavailable("; ".join(errors))
+
+    def _reset_pool(self):
+        """编码进程重启后空闲连接全部失效"""
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+    def _request(self, request: Dict) -> Dict:
+        """在一条空闲连接上发送请求并读取共享内存中的结果"""
+        self._slots.acquire()
+        channel = None
+        try:
+            try:
+                channel = self._idle.get_nowait()
+            except queue.Empty:
+                channel = self._connect()
+            try:
+                channel.conn.send(request)
+                response = channel.conn.recv()
+            except (EOFError, OSError) as e:
+                channel.close()
+                channel = None
+                raise EmbeddingWorkerUnavailable(str(e))
+            if not response["ok"]:
+                raise RuntimeError(f"编码进程出错: {response['error']}")
+            return self._read(channel, response)
+        finally:
+            if channel is not None:
+                self._idle.put(channel)
+            self._slots.release()
+
+    @staticmethod
+    def _read(channel: _Channel, response: Dict) -> Dict:
+        """从共享内存复制出结果，组装为 BGEM3FlagModel.encode 的返回格式"""
+        shm = channel.attach(response["shm"])
+        n, dim = response["dense"]
+        colbert_shapes = response["colbert"] or []
+        size = n * dim + sum(rows * cols for rows, cols in colbert_shapes)
+        buffer = np.ndarray((size,), dtype=np.float32, buffer=shm.buf)
+        out = {"dense_vecs": buffer[:n * dim].reshape(n, dim).copy()}
+        offset = n * dim
+        if response["colbert"] is not None:
+            out["colbert_vecs"] = []
+            for rows, cols in colbert_shapes:
+                out["colbert_vecs"].append(buffer[offset:offset + rows * cols].reshape(rows, cols).copy())
+                offset += rows * cols
+        if response["sparse"] is not None:
+            out["lexical_weights"] = response["sparse"]
+        del buffer
+        out["shared_bytes"] = size * 4
+        return out
+
+    def _load_local(self):
+        """回退：在本进程加载模型"""
+        with self._lock:
+            if self._local is None:
+                print("编码进程不可用，回退到进程内加载模型")
+                self._local = load_encoder()
+        return self._local
+
+    def encode(self, sentences: List[str], batch_size: int = 12, max_length: int = 8192,
+               return_dense: bool = True, return_sparse: bool = False,
+               return_colbert_vecs: bool = False) -> Dict:
+        """
+        编码文本，参数和返回格式与 BGEM3FlagModel.encode 一致（始终返回稠密向量）
+
+        Raises:
+            EmbeddingWorkerUnavailable: 编码进程不可用且不允许回退时抛出
+            RuntimeError: 编码进程内编码出错时抛出
+        """
+        if self._local is not None:
+            return self._local.encode(sentences, batch_size=batch_size, max_length=max_length,
+                                      return_dense=True, return_sparse=return_sparse,
+                                      return_colbert_vecs=return_colbert_vecs)
+        request = {
+            "texts": list(sentences),
+            "batch_size": batch_size,
+            "max_length": max_length,
+            "sparse": return_sparse,
+            "colbert": return_colbert_vecs
+        }
+        started = time.perf_counter()
+        try:
+            try:
+                out = self._request(request)
+            except EmbeddingWorkerUnavailable:
+                # 编码进程可能刚重启，丢弃旧连接重试一次
+                self._reset_pool()
+                with self._stats_lock:
+                    self._stats["reconnects"] += 1
+                out = self._request(request)
+        except EmbeddingWorkerUnavailable:
+            if not self.fallback:
+                raise
+            return self._load_local().encode(sentences, batch_size=batch_size, max_length=max_length,
+                                             return_dense=True, return_sparse=return_sparse,
+                                             return_colbert_vecs=return_colbert_vecs)
+        shared_bytes = out.pop("shared_bytes")
+        with self._stats_lock:
+            self._stats["requests"] += 1
+            self._stats["texts"] += len(sentences)
+            self._stats["shared_bytes"] += shared_bytes
+            self._stats["wait_ms"] += (time.perf_counter() - started) * 1000
+        return out
+
+    def stats(self) -> Dict:
+        """客户端统计：请求数、共享内存传输字节数、平均往返耗时、是否已回退"""
+        with self._stats_lock:
+            stats = dict(self._stats)
+        stats["avg_round_trip_ms"] = stats.pop("wait_ms") / max(1, stats["requests"])
+        stats["fallback_in_process"] = self._local is not None
+        stats["addresses"] = [str(address) for address in self.addresses]
+        return stats
@@ -1,19 +1,23 @@
 # 文件处理服务层，处理文件上传、OCR识别和文档解析
 import os
 from pydoc import text
+import hashlib
+import threading
 import uuid
-from typing import List, Tuple, Optional
+from typing import Callable, List, Tuple, Optional
 from PIL import Image
 import fitz  # PyMuPDF for PDF OCR识别
 import docx2txt#DOCX文件解析
 from paddleocr import PaddleOCR#图片中英文识别
-from urllib.parse import quote, unquote
+from urllib.parse import quote
+from config.database import cache_client
 from config.settings import ai_config, app_config
+from services.upload_storage import UploadStorage
 import openpyxl#xlsx文件解析
 import xlrd#xls文件解析
 
-class FileService:
-    """文件处理服务类"""
+class FileService(UploadStorage):
+    """文件处理服务类，上传目录和文件路径由 UploadStorage 负责"""
     
     # 允许的文件类型
     ALLOWED_IMAGE_EXTENSIONS = app_config.allowed_image_extensions
@@ -22,22 +26,24 @@ class FileService:
     
     def __init__(self):
         """初始化文件服务"""
-        
-        # 设置上传目录
-        self.upload_folder = app_config.upload_folder
+        super().__init__()
         self.max_file_size = app_config.max_file_size
 
-        #设置PaddleOCR
-        self.ocr = PaddleOCR(
-        use_doc_orientation_classify=False,
-        use_doc_unwarping=False,
-        use_textline_orientation=False)
-        
-        # 创建上传目录
-        self.image_folder = os.path.join(self.upload_folder, 'images')
-        self.file_folder = os.path.join(self.upload_folder, 'files')
-        os.makedirs(self.image_folder, exist_ok=True)
-        os.makedirs(self.file_folder, exist_ok=True)
+        #PaddleOCR首次识别时创建，只保存上传文件的进程（入库走队列时的Web进程）不加载OCR模型
+        self._ocr = None
+        self._ocr_lock = threading.Lock()
+    
+    @property
+    def ocr(self) -> PaddleOCR:
+        """PaddleOCR实例，首次访问时创建"""
+        if self._ocr is None:
+            with self._ocr_lock:
+                if self._ocr is None:
+                    self._ocr = PaddleOCR(
+                    use_doc_orientation_classify=False,
+                    use_doc_unwarping=False,
+                    use_textline_orientation=False)
+        return self._ocr
     
     def allowed_image_file(self, filename: str) -> bool:
         """
@@ -131,9 +137,9 @@ class FileService:
             ocr_text = result[0].get('rec_texts', [])
             ocr_confidence = result[0].get('rec_scores', [])
             
-            for text,confidence in zip(ocr_text,ocr_confidence):
+            for rec_text,confidence in zip(ocr_text,ocr_confidence):
                 if confidence > 0.5:
-                    texts.append(text)
+                    texts.append(rec_text)
             full_text = '\n'.join(texts).strip()
             return full_text
 
@@ -260,102 +266,149 @@ class FileService:
         else:
             return ""
     
-    def process_uploaded_files(self, images, files) -> Tuple[bool, str, List[str], List[str], List[str], List[str]]:
+    def save_uploaded_files(self, images, files) -> Tuple[bool, str, List[str], List[str]]:
         """
-        处理上传的文件（图片和文档）
+        校验并保存上传的文件（图片和文档），不做OCR和文本提取
         
         Args:
             images: 上传的图片列表
             files: 上传的文档列表
             
         Returns:
-            Tuple[bool, str, List[str], List[str], List[str], List[str]]: 
-            (是否成功, 错误消息, 图片URL列表, 文件URL列表, OCR文本列表, 文档文本列表)
+            Tuple[bool, str, List[str], List[str]]: (是否成功, 错误消息, 图片URL列表, 文件URL列表)
         """
         # 验证文件数量
         if len(images) > self.MAX_FILES_COUNT or len(files) > self.MAX_FILES_COUNT:
-            return False, "每种文件类型最多只能上传10个", [], [], [], []
+            return False, "每种文件类型最多只能上传10个", [], []
         
         uploaded_images = []
         uploaded_files = []
-        ocr_texts = []     
-        file_texts = []     
         
         try:
-            # 处理图片文件
+            # 保存图片文件
             for img in images:
                 if img and self.allowed_image_file(img.filename):
                     # 验证文件大小
                     if not self.validate_file_size(img):
-                        return False, f"图片 {img.filename} 超过200MB限制", [], [], [], []
-                    
-                    # 保存文件
-                    file_path, url_path = self.save_uploaded_file(img, 'image')
+                        return False, f"图片 {img.filename} 超过200MB限制", [], []
+                    _, url_path = self.save_uploaded_file(img, 'image')
                     uploaded_images.append(url_path)
-                    
-                    # OCR提取文字
-                    text = self.process_image_ocr(file_path)
-                    if text:
-                        ocr_texts.append(text)
             
-            # 处理文档文件
+            # 保存文档文件
             for file in files:
                 if file and self.allowed_document_file(file.filename):
                     # 验证文件大小
                     if not self.validate_file_size(file):
-                        return False, f"文件 {file.filename} 超过200MB限制", [], [], [], []
-                    
-                    # 保存文件
-                    file_path, url_path = self.save_uploaded_file(file, 'file')
+                        return False, f"文件 {file.filename} 超过200MB限制", [], []
+                    _, url_path = self.save_uploaded_file(file, 'file')
                     uploaded_files.append(url_path)
-                    
-                    # 提取文档文本
-                    ext = file.filename.rsplit('.', 1)[1].lower()
-                    text = self.extract_text_from_file(file_path, ext)
-                    if text:
-                        file_texts.append(text)
             
-            return True, "文件处理成功", uploaded_images, uploaded_files, ocr_texts, file_texts
+            return True, "文件保存成功", uploaded_images, uploaded_files
             
         except Exception as e:
-            return False, f"文件处理失败: {str(e)}", [], [], [], []
+            return False, f"文件保存失败: {str(e)}", [], []
     
-    def get_file_path(self, url_path: str, file_type: str) -> str:
+    def extract_texts(self, image_urls: List[str], file_urls: List[str],
+                      progress: Optional[Callable[[int, int], None]] = None) -> Tuple[List[str], List[str]]:
         """
-        根据URL路径获取实际文件路径
+        对已保存的图片做OCR、从已保存的文档提取文本
         
         Args:
-            url_path: URL路径（可能包含URL编码）
-            file_type: 文件类型 ('image' 或 'file')
+            image_urls: 图片URL列表
+            file_urls: 文件URL列表
+            progress: 每处理完一个文件调用一次，参数为 (已处理数, 总数)
             
         Returns:
-            str: 实际文件路径
+            Tuple[List[str], List[str]]: (OCR文本列表, 文档文本列表)
+            
+        Raises:
+            ValueError: OCR处理失败时抛出
         """
-        if file_type == 'image':
-            folder = self.image_folder
-            prefix = "/uploads/images/"
-        else:
-            folder = self.file_folder
-            prefix = "/uploads/files/"
+        ocr_texts = []
+        file_texts = []
+        total = len(image_urls) + len(file_urls)
+        done = 0
         
-        # 提取文件名并URL解码（因为URL中是编码的，但文件系统中是原始中文名）
-        filename = url_path.replace(prefix, "")
-        decoded_filename = unquote(filename)
-        return os.path.join(folder, decoded_filename)
-
-    def delete_file(self, file_path: str) -> bool:
+        for url in image_urls:
+            file_path = self.get_file_path(url, 'image')
+            text = self._cached_extract(file_path, 'ocr', lambda: self.process_image_ocr(file_path))
+            if text:
+                ocr_texts.append(text)
+            done += 1
+            if progress:
+                progress(done, total)
+        
+        for url in file_urls:
+            file_path = self.get_file_path(url, 'file')
+            ext = file_path.rsplit('.', 1)[1].lower() if '.' in file_path else ''
+            text = self._cached_extract(file_path, ext, lambda: self.extract_text_from_file(file_path, ext))
+            if text:
+                file_texts.append(text)
+            done += 1
+            if progress:
+                progress(done, total)
+        
+        return ocr_texts, file_texts
+    
+    @staticmethod
+    def _cached_extract(file_path: str, kind: str, extract: Callable[[], str]) -> str:
         """
-        删除文件
+        按文件内容哈希缓存提取结果，同一文件重复上传时跳过OCR和文档解析
         
         Args:
             file_path: 文件路径
+            kind: 提取方式（ocr 或文档扩展名），参与缓存键
+            extract: 未命中时调用的提取函数
+            
+        Returns:
+            str: 提取的文本
+        """
+        if app_config.extract_cache_ttl <= 0:
+            return extract()
+        try:
+            digest = hashlib.sha256()
+            with open(file_path, 'rb') as f:
+                for block in iter(lambda: f.read(1024 * 1024), b''):
+                    digest.update(block)
+        except OSError as e:
+            # 文件无法读取时交给提取函数处理（与不缓存时的行为一致）
+            print(f"计算文件哈希失败: {e}")
+            return extract()
+        key = f"extract:{kind}:{digest.hexdigest()}"
+        try:
+            cached = cache_client.client.get(key)
+            if cached is not None:
+                return cached.decode('utf-8')
+        except Exception as e:
+            print(f"提取缓存读取失败: {e}")
+        
+        extracted = extract() or ""
+        # 文档解析失败时提取函数返回空字符串，空结果不缓存，重试或重新上传时重新提取
+        if extracted:
+            try:
+                cache_client.client.setex(key, app_config.extract_cache_ttl, extracted.encode('utf-8'))
+            except Exception as e:
+                print(f"提取缓存写入失败: {e}")
+        return extracted
+    
+    def process_uploaded_files(self, images, files) -> Tuple[bool, str, List[str], List[str], List[str], List[str]]:
+        """
+        处理上传的文件（图片和文档）：保存后在当前线程完成OCR和文本提取
+        
+        Args:
+            images: 上传的图片列表
+            files: 上传的文档列表
             
         Returns:
-            bool: 是否成功
+            Tuple[bool, str, List[str], List[str], List[str], List[str]]: 
+            (是否成功, 错误消息, 图片URL列表, 文件URL列表, OCR文本列表, 文档文本列表)
         """
+        success, message, uploaded_images, uploaded_files = self.save_uploaded_files(images, files)
+        if not success:
+            return False, message, [], [], [], []
+        
         try:
-            os.remove(file_path)
-            return True
+            ocr_texts, file_texts = self.extract_texts(uploaded_images, uploaded_files)
+            return True, "文件处理成功", uploaded_images, uploaded_files, ocr_texts, file_texts
         except Exception as e:
-            print(f"删除文件失败: {e}")
-            return False
\ No newline at end of file
+            return False, f"文件处理失败: {str(e)}", [], [], [], []
@@ -0,0 +1,544 @@
+# 异步入库队列：上传请求只保存文件和内容并投递任务，OCR、文本提取、向量化和缓存失效由入库worker完成
+#
+# 任务流 ingest:jobs 使用消费者组 ingest，多个worker（Web进程内线程或 scripts.ingest_worker 进程）共同消费：
+#   处理成功后 XACK；失败时在同一事务中重新投递（attempts+1）并确认原任务，
+#   尝试次数达到 ingest_max_attempts 后转入死信流 ingest:dead 并把内容标记为 failed；
+#   消费者崩溃留下的未确认任务超过 ingest_claim_idle 秒后由其他消费者通过 XAUTOCLAIM 接管，崩溃次数计入尝试次数。
+# 内容文档的 index_status 字段记录入库状态（pending/processing/indexed/failed），
+# 每个用户的进度事件写入流 ingest:events:{user_id}，由SSE路由推送给前端显示“索引中…”
+import os
+import socket
+import threading
+import time
+import traceback
+from typing import Callable, Dict, List, Optional, Tuple
+import numpy as np
+import redis
+from config.database import cache_client
+from config.settings import app_config
+from models.todo import TodoContentModel
+from services.near_duplicate import NearDuplicateIndex, minhash
+from services.search_cache import SearchResultCache
+
+INGEST_STREAM = "ingest:jobs"
+INGEST_GROUP = "ingest"
+INGEST_DEAD_STREAM = "ingest:dead"
+INGEST_EVENTS_PREFIX = "ingest:events:"
+
+# 入库状态：pending 已投递等待处理，processing 处理中，indexed 已完成，failed 超过重试次数
+INDEX_STATUSES = ("pending", "processing", "indexed", "failed")
+# 终态，进度推送到终态后不再变化
+FINAL_STATUSES = ("indexed", "failed")
+# 每个用户保留的进度事件条数
+EVENTS_MAXLEN = 500
+
+
+def _decode(fields: Dict) -> Dict[str, str]:
+    """流条目字段解码为字符串"""
+    return {
+        (k.decode() if isinstance(k, bytes) else k): (v.decode() if isinstance(v, bytes) else v)
+        for k, v in fields.items()
+    }
+
+
+def _id(message_id) -> str:
+    return message_id.decode() if isinstance(message_id, bytes) else message_id
+
+
+class IngestQueue:
+    """基于Redis Streams消费者组的入库任务队列"""
+
+    def __init__(self, redis_client=None):
+        """
+        初始化入库队列
+
+        Args:
+            redis_client: Redis客户端，不传时使用全局缓存客户端
+        """
+        self.redis_client = redis_client or cache_client.client
+        self._group_ready = False
+
+    def ensure_group(self):
+        """创建任务流和消费者组（已存在时忽略）"""
+        if self._group_ready:
+            return
+        try:
+            self.redis_client.xgroup_create(INGEST_STREAM, INGEST_GROUP, id="0", mkstream=True)
+        except redis.ResponseError as e:
+            if "BUSYGROUP" not in str(e):
+                raise
+        self._group_ready = True
+
+    def enqueue(self, content_id: str, user_id: str, todo_id: str, attempts: int = 0) -> str:
+        """
+        投递入库任务
+
+        Args:
+            content_id: 内容ID
+            user_id: 用户ID
+            todo_id: Todo ID
+            attempts: 已失败的尝试次数
+
+        Returns:
+            str: 任务条目ID
+
+        Raises:
+            redis.RedisError: Redis不可用时抛出
+        """
+        self.ensure_group()
+        message_id = self.redis_client.xadd(
+            INGEST_STREAM,
+            self._job(content_id, user_id, todo_id, attempts),
+            maxlen=app_config.ingest_stream_maxlen,
+            approximate=True
+        )
+        self.publish(user_id, content_id, todo_id, "pending")
+        return _id(message_id)
+
+    @staticmethod
+    def _job(content_id: str, user_id: str, todo_id: str, attempts: int, error: str = "") -> Dict[str, str]:
+        return {
+            "content_id": content_id,
+            "user_id": user_id,
+            "todo_id": todo_id or "",
+            "attempts": str(attempts),
+            "error": error[:1000],
+            "enqueued_at": str(int(time.time())),
+        }
+
+    def read(self, consumer: str, count: int = 1, block_ms: int = 5000) -> List[Tuple[str, Dict]]:
+        """
+        以消费者身份读取新任务
+
+        Args:
+            consumer: 消费者名
+            count: 最多读取条数
+            block_ms: 没有任务时阻塞等待的毫秒数
+
+        Returns:
+            List[Tuple[str, Dict]]: [(条目ID, 任务字段)]
+        """
+        self.ensure_group()
+        response = self.redis_client.xreadgroup(
+            INGEST_GROUP, consumer, {INGEST_STREAM: ">"}, count=count, block=block_ms
+        )
+        return [
+            (_id(message_id), _decode(fields))
+            for _, messages in response or []
+            for message_id, fields in messages
+        ]
+
+    def claim_stale(self, consumer: str, count: int = 10) -> List[Tuple[str, Dict, int]]:
+        """
+        接管其他消费者超时未确认的任务
+
+        Args:
+            consumer: 接管的消费者名
+            count: 最多接管条数
+
+        Returns:
+            List[Tuple[str, Dict, int]]: [(条目ID, 任务字段, 累计投递次数)]
+        """
+        self.ensure_group()
+        idle_ms = app_config.ingest_claim_idle * 1000
+        response = self.redis_client.xautoclaim(
+            INGEST_STREAM, INGEST_GROUP, consumer, idle_ms, start_id="0-0", count=count
+        )
+        messages = [(message_id, fields) for message_id, fields in response[1] if fields]
+        if not messages:
+            return []
+        # 接管后的投递次数包含此前崩溃未确认的次数
+        pending = self.redis_client.xpending_range(
+            INGEST_STREAM, INGEST_GROUP, min=messages[0][0], max=messages[-1][0],
+            count=len(messages) * 2, consumername=consumer
+        )
+        deliveries = {_id(entry["message_id"]): entry["times_delivered"] for entry in pending}
+        return [
+            (_id(message_id), _decode(fields), deliveries.get(_id(message_id), 1))
+            for message_id, fields in messages
+        ]
+
+    def ack(self, message_id: str):
+        """确认任务完成"""
+        pipe = self.redis_client.pipeline(transaction=True)
+        pipe.xack(INGEST_STREAM, INGEST_GROUP, message_id)
+        pipe.xdel(INGEST_STREAM, message_id)
+        pipe.execute()
+
+    def retry(self, message_id: str, job: Dict, attempts: int, error: str) -> bool:
+        """
+        失败任务重新投递，达到最大尝试次数时转入死信流；新条目写入和原条目确认在同一事务中完成
+
+        Args:
+            message_id: 原条目ID
+            job: 任务字段
+            attempts: 含本次在内的已失败尝试次数
+            error: 失败原因
+
+        Returns:
+            bool: 是否已重新投递（False 表示已转入死信流）
+        """
+        requeue = attempts < app_config.ingest_max_attempts
+        pipe = self.redis_client.pipeline(transaction=True)
+        pipe.xadd(
+            INGEST_STREAM if requeue else INGEST_DEAD_STREAM,
+            self._job(job["content_id"], job["user_id"], job.get("todo_id"), attempts, error),
+            maxlen=app_config.ingest_stream_maxlen,
+            approximate=True
+        )
+        pipe.xack(INGEST_STREAM, INGEST_GROUP, message_id)
+        pipe.xdel(INGEST_STREAM, message_id)
+        pipe.execute()
+        return requeue
+
+    def dead_letters(self, count: int = 100) -> List[Tuple[str, Dict]]:
+        """死信流中最早的任务"""
+        return [
+            (_id(message_id), _decode(fields))
+            for message_id, fields in self.redis_client.xrange(INGEST_DEAD_STREAM, count=count)
+        ]
+
+    def requeue_dead(self, count: int = 100) -> int:
+        """
+        死信任务重置尝试次数后重新投递
+
+        Args:
+            count: 最多重新投递条数
+
+        Returns:
+            int: 重新投递的任务数
+        """
+        requeued = 0
+        for message_id, job in self.dead_letters(count):
+            TodoContentModel().update_content(job["content_id"], job["user_id"], {"index_status": "pending"})
+            self.enqueue(job["content_id"], job["user_id"], job.get("todo_id"))
+            self.redis_client.xdel(INGEST_DEAD_STREAM, message_id)
+            requeued += 1
+        return requeued
+
+    def stats(self) -> Dict:
+        """
+        队列状态
+
+        Returns:
+            Dict: {"queued": 流中条目数, "pending": 已取走未确认数, "consumers": 消费者数, "dead": 死信数}
+        """
+        self.ensure_group()
+        groups = {_decode(group)["name"]: group for group in self.redis_client.xinfo_groups(INGEST_STREAM)}
+        group = groups.get(INGEST_GROUP, {})
+        return {
+            "queued": self.redis_client.xlen(INGEST_STREAM),
+            "pending": group.get("pending", 0),
+            "consumers": group.get("consumers", 0),
+            "dead": self.redis_client.xlen(INGEST_DEAD_STREAM),
+        }
+
+    def publish(self, user_id: str, content_id: str, todo_id: str, status: str, **extra) -> Optional[str]:
+        """
+        写入一条进度事件，失败只记录日志
+
+        Args:
+            user_id: 用户ID
+            content_id: 内容ID
+            todo_id: Todo ID
+            status: 入库状态，或过程中的 extracting/embedding/retrying
+            **extra: 附加字段（done/total/error/attempts）
+
+        Returns:
+            Optional[str]: 事件ID
+        """
+        key = f"{INGEST_EVENTS_PREFIX}{user_id}"
+        fields = {"content_id": content_id, "todo_id": todo_id or "", "status": status, "ts": str(int(time.time()))}
+        fields.update({k: str(v) for k, v in extra.items() if v is not None})
+        try:
+            pipe = self.redis_client.pipeline(transaction=False)
+            pipe.xadd(key, fields, maxlen=EVENTS_MAXLEN, approximate=True)
+            pipe.expire(key, app_config.ingest_event_ttl)
+            return _id(pipe.execute()[0])
+        except Exception as e:
+            print(f"入库进度事件写入失败: {e}")
+            return None
+
+    def last_event_id(self, user_id: str) -> str:
+        """用户最新进度事件的ID，没有事件时返回 0-0"""
+        latest = self.redis_client.xrevrange(f"{INGEST_EVENTS_PREFIX}{user_id}", count=1)
+        return _id(latest[0][0]) if latest else "0-0"
+
+    def read_events(self, user_id: str, last_id: str, block_ms: int = 15000) -> List[Tuple[str, Dict]]:
+        """
+        读取 last_id 之后的进度事件
+
+        Args:
+            user_id: 用户ID
+            last_id: 上次读到的事件ID
+            block_ms: 没有新事件时阻塞等待的毫秒数
+
+        Returns:
+            List[Tuple[str, Dict]]: [(事件ID, 事件字段)]
+        """
+        response = self.redis_client.xread({f"{INGEST_EVENTS_PREFIX}{user_id}": last_id}, block=block_ms)
+        return [
+            (_id(message_id), _decode(fields))
+            for _, messages in response or []
+            for message_id, fields in messages
+        ]
+
+
+def index_content(content_id: str, user_id: str, todo_id: str,
+                  publish: Optional[Callable[..., None]] = None, queue: "IngestQueue" = None) -> bool:
+    """
+    完成一条内容的入库：OCR和文本提取（相同文件复用缓存的提取结果）、写回提取结果、
+    近重复检测、保存向量（链接模式下重复内容不写向量）、使缓存失效，并更新入库状态
+
+    Args:
+        content_id: 内容ID
+        user_id: 用户ID
+        todo_id: Todo ID
+        publish: 进度回调，参数为 (状态, **附加字段)
+        queue: 重复内容失去规范内容时重新投递用的入库队列
+
+    Returns:
+        bool: 是否已入库（内容已被删除时返回False）
+
+    Raises:
+        Exception: 提取或向量保存失败时抛出原异常，由调用方决定重试
+    """
+    from services.cache_service import CacheService
+    from services.service_registry import registry
+
+    publish = publish or (lambda status, **extra: None)
+    content_model = TodoContentModel()
+    content = content_model.find_content_by_id(content_id, user_id)
+    if not content:
+        return False
+
+    content_model.update_content(content_id, user_id, {"index_status": "processing"})
+    publish("processing")
+
+    images = content.get("images") or []
+    files = content.get("files") or []
+    ocr_texts, file_texts = [], []
+    if images or files:
+        file_service = registry.get("file")
+        ocr_texts, file_texts = file_service.extract_texts(
+            images, files, progress=lambda done, total: publish("extracting", done=done, total=total)
+        )
+    extracted_content = {"ocr_texts": ocr_texts, "file_texts": file_texts} if ocr_texts or file_texts else None
+    content_model.update_content(content_id, user_id, {"extracted_content": extracted_content})
+
+    vector_service = registry.get("vector")
+    full_text = vector_service.build_index_text(content.get("content", ""), ocr_texts, file_texts)
+
+    # 重新入库时先解除原有的重复关系，链接到本内容的重复内容随后重新入库
+    release_duplicates(user_id, [content], queue=queue)
+    signature, duplicate = _find_duplicate(vector_service.near_duplicates, user_id, content_id,
+                                           full_text, bool(images or files))
+    duplicate_fields = {"duplicate_of": None, "duplicate_mode": None, "duplicate_score": None}
+    if duplicate is not None:
+        duplicate_fields = {"duplicate_of": duplicate[0], "duplicate_mode": app_config.near_dup_mode,
+                            "duplicate_score": round(duplicate[1], 4)}
+
+    if duplicate is not None and app_config.near_dup_mode == "link":
+        # 链接到已有内容的向量，不再编码和写入索引
+        vector_service.delete_by_doc_id(content_id, user_id)
+        vector_service.near_duplicates.link(user_id, duplicate[0], content_id)
+        # 删除向量时已更新纪元，链接写入后再更新一次，期间缓存的结果不含新的链接
+        vector_service.result_cache.bump([user_id])
+    elif full_text:
+        publish("embedding")
+        raw_data = {
+            "images": images,
+            "files": files,
+            "has_ocr": len(ocr_texts) > 0,
+            "has_file_text": len(file_texts) > 0
+        }
+        if duplicate is not None:
+            raw_data["duplicate_of"] = duplicate[0]
+        vector_service.save_embedding(
+            doc_id=content_id,
+            user_id=user_id,
+            todo_id=todo_id,
+            text=full_text,
+            raw_data=raw_data
+        )
+        # 只有规范内容写入LSH，重复内容不形成链
+        if signature is not None and duplicate is None:
+            vector_service.near_duplicates.add(user_id, content_id, signature)
+
+    # 处理期间内容被删除时清理刚写入的向量和重复关系
+    success, _, _ = content_model.update_content(
+        content_id, user_id, {"index_status": "indexed", "index_error": None, **duplicate_fields}
+    )
+    if not success:
+        vector_service.delete_by_doc_id(content_id, user_id)
+        release_duplicates(user_id, [{"_id": content_id, **duplicate_fields}], queue=queue)
+        return False
+    CacheService().invalidate_todo_cache(todo_id, user_id)
+    publish("indexed", duplicate_of=duplicate_fields["duplicate_of"])
+    return True
+
+
+def _find_duplicate(near_duplicates: NearDuplicateIndex, user_id: str, content_id: str,
+                    text: str, has_attachments: bool) -> Tuple[Optional[np.ndarray], Optional[Tuple[str, float]]]:
+    """
+    计算签名并查找近重复的已索引内容；只检测带图片或文件、文本不短于 near_dup_min_chars 的内容
+
+    Returns:
+        Tuple: (签名，不参与检测时为None；(规范内容ID, 相似度)，没有重复时为None)
+    """
+    if app_config.near_dup_mode not in ("link", "flag") or not has_attachments \
+            or len(text or "") < app_config.near_dup_min_chars:
+        return None, None
+    signature = minhash(text)
+    if signature is None:
+        return None, None
+    return signature, near_duplicates.find(user_id, signature, app_config.near_dup_threshold, exclude=content_id)
+
+
+def release_duplicates(user_id: str, contents: List[Dict], queue: "IngestQueue" = None) -> int:
+    """
+    内容被删除或重新入库前解除其重复关系：从LSH删除，解除它自身的链接，
+    链接到它的重复内容失去规范内容，清除标记后重新入库
+
+    Args:
+        user_id: 用户ID
+        contents: 内容文档（至少含 _id，可含 duplicate_of）
+        queue: 重新投递用的入库队列，不传时新建
+
+    Returns:
+        int: 重新入库的重复内容数量
+    """
+    if not contents:
+        return 0
+    near_duplicates = NearDuplicateIndex(cache_client.client)
+    content_ids = [str(content["_id"]) for content in contents]
+    near_duplicates.remove(user_id, content_ids)
+    unlinked = False
+    for content in contents:
+        if content.get("duplicate_of"):
+            near_duplicates.unlink(user_id, content["duplicate_of"], str(content["_id"]))
+            unlinked = True
+    if unlinked:
+        # 检索折叠时列出的链接已变化
+        SearchResultCache(cache_client.client, namespace="search").bump([user_id])
+
+    content_model = TodoContentModel()
+    orphans = content_model.find_linked_duplicates(user_id, content_ids)
+    queue = queue or IngestQueue()
+    for orphan in orphans:
+        content_model.update_content(orphan["_id"], user_id, {
+            "index_status": "pending", "duplicate_of": None, "duplicate_mode": None, "duplicate_score": None
+        })
+        try:
+            queue.enqueue(orphan["_id"], user_id, orphan.get("todo_id"))
+        except Exception as e:
+            # 投递失败的内容保持pending，由惰性回填或 scripts.rehydrate_vectors 补齐向量
+            print(f"重复内容重新入库投递失败 {orphan['_id']}: {e}")
+    return len(orphans)
+
+
+class IngestWorker:
+    """入库任务消费者"""
+
+    # 检查超时未确认任务的间隔（秒）
+    CLAIM_INTERVAL = 30
+
+    _counter = 0
+    _counter_lock = threading.Lock()
+
+    def __init__(self, queue: IngestQueue = None, consumer: str = None):
+        """
+        初始化消费者
+
+        Args:
+            queue: 入库队列，不传时新建
+            consumer: 消费者名，同一消费者组内唯一，不传时按主机名、进程号和序号生成
+        """
+        self.queue = queue or IngestQueue()
+        if consumer is None:
+            with IngestWorker._counter_lock:
+                IngestWorker._counter += 1
+                consumer = f"{socket.gethostname()}-{os.getpid()}-{IngestWorker._counter}"
+        self.consumer = consumer
+
+    def run(self, stop_event: threading.Event = None):
+        """
+        循环消费任务直到 stop_event 被设置；Redis暂时不可用时等待后重试
+
+        Args:
+            stop_event: 停止信号
+        """
+        stop_event = stop_event or threading.Event()
+        last_claim = 0.0
+        print(f"入库worker {self.consumer} 已启动")
+        while not stop_event.is_set():
+            try:
+                if time.time() - last_claim >= self.CLAIM_INTERVAL:
+                    last_claim = time.time()
+                    for message_id, job, deliveries in self.queue.claim_stale(self.consumer):
+                        self.handle(message_id, job, deliveries)
+                for message_id, job in self.queue.read(self.consumer):
+                    self.handle(message_id, job)
+            except redis.RedisError as e:
+                print(f"入库队列读取失败: {e}")
+                stop_event.wait(1)
+
+    def handle(self, message_id: str, job: Dict, deliveries: int = 1):
+        """
+        处理一个任务：成功确认，失败重新投递或转入死信流
+
+        Args:
+            message_id: 条目ID
+            job: 任务字段
+            deliveries: 累计投递次数，大于1表示此前的消费者未确认（崩溃）
+        """
+        content_id, user_id, todo_id = job["content_id"], job["user_id"], job.get("todo_id")
+        attempts = int(job.get("attempts") or 0) + deliveries - 1
+
+        def publish(status, **extra):
+            self.queue.publish(user_id, content_id, todo_id, status, **extra)
+
+        if attempts >= app_config.ingest_max_attempts:
+            self._fail(message_id, job, attempts, "处理过程中消费者多次中断", publish)
+            return
+        try:
+            index_content(content_id, user_id, todo_id, publish, queue=self.queue)
+        except Exception as e:
+            print(f"入库任务失败 {content_id}（第{attempts + 1}次）: {traceback.format_exc()}")
+            if attempts + 1 < app_config.ingest_max_attempts:
+                self.queue.retry(message_id, job, attempts + 1, str(e))
+                TodoContentModel().update_content(content_id, user_id, {"index_status": "pending", "index_error": str(e)})
+                publish("retrying", attempts=attempts + 1, error=str(e))
+            else:
+                self._fail(message_id, job, attempts + 1, str(e), publish)
+            return
+        self.queue.ack(message_id)
+
+    def _fail(self, message_id: str, job: Dict, attempts: int, error: str, publish: Callable[..., None]):
+        """转入死信流并把内容标记为失败"""
+        from services.cache_service import CacheService
+        self.queue.retry(message_id, job, attempts, error)
+        TodoContentModel().update_content(job["content_id"], job["user_id"], {"index_status": "failed", "index_error": error})
+        if job.get("todo_id"):
+            CacheService().invalidate_todo_cache(job["todo_id"], job["user_id"])
+        publish("failed", attempts=attempts, error=error)
+
+
+def start_local_workers(count: int) -> List[threading.Thread]:
+    """
+    在当前进程中启动入库消费线程
+
+    Args:
+        count: 线程数
+
+    Returns:
+        List[threading.Thread]: 已启动的线程
+    """
+    threads = []
+    queue = IngestQueue()
+    for i in range(count):
+        worker = IngestWorker(queue)
+        thread = threading.Thread(target=worker.run, name=f"ingest-worker-{i}", daemon=True)
+        thread.start()
+        threads.append(thread)
+    return threads
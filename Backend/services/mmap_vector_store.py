@@ -0,0 +1,415 @@
+# 进程内向量存储：每个用户一个内存映射的float32矩阵，NumPy精确top-k，元数据写追加日志
+#
+# 目录结构:
+#     {root}/log.jsonl             追加日志，put/touch/del 三种记录，启动时重放
+#     {root}/users/{sha1}.f32      用户的向量矩阵，行号记录在日志的分块里
+#
+# 不依赖Redis Stack，适合小规模部署和测试环境，也可作为HNSW召回的精确基线。
+# 只支持单进程访问；数据不过期。
+import base64
+import hashlib
+import json
+import os
+import threading
+from typing import Dict, List, Optional, Sequence, Tuple
+import numpy as np
+from services.vector_store import VectorStore
+
+LOG_FILE = "log.jsonl"
+
+
+def _pack(value):
+    """附加字段写日志：字节转base64"""
+    if isinstance(value, bytes):
+        return {"b64": base64.b64encode(value).decode("ascii")}
+    return value
+
+
+def _unpack(value):
+    if isinstance(value, dict) and "b64" in value:
+        return base64.b64decode(value["b64"])
+    return value
+
+
+class _UserMatrix:
+    """单个用户的内存映射向量矩阵，空闲行复用，容量不足时翻倍扩容"""
+
+    def __init__(self, path: str, dim: int, initial_rows: int):
+        self.path = path
+        self.dim = dim
+        row_bytes = dim * 4
+        if not os.path.exists(path) or os.path.getsize(path) < row_bytes:
+            with open(path, "wb") as f:
+                f.truncate(initial_rows * row_bytes)
+        rows = os.path.getsize(path) // row_bytes
+        self.matrix = np.memmap(path, dtype=np.float32, mode="r+", shape=(rows, dim))
+        self.alive = np.zeros(rows, dtype=bool)
+        self.owners: List[Optional[Tuple[str, int]]] = [None] * rows
+        self.free: List[int] = []
+        self.rebuild_free()
+
+    def rebuild_free(self):
+        """重放日志后重建空闲行"""
+        self.free = [row for row in range(len(self.alive) - 1, -1, -1) if not self.alive[row]]
+
+    def _grow(self):
+        rows = len(self.alive)
+        new_rows = rows * 2
+        self.matrix.flush()
+        del self.matrix
+        with open(self.path, "r+b") as f:
+            f.truncate(new_rows * self.dim * 4)
+        self.matrix = np.memmap(self.path, dtype=np.float32, mode="r+", shape=(new_rows, self.dim))
+        self.alive = np.concatenate([self.alive, np.zeros(new_rows - rows, dtype=bool)])
+        self.owners.extend([None] * (new_rows - rows))
+        self.free.extend(range(new_rows - 1, rows - 1, -1))
+
+    def allocate(self, vector: np.ndarray) -> int:
+        """写入一行向量（归一化后），返回行号"""
+        if not self.free:
+            self._grow()
+        row = self.free.pop()
+        vector = np.asarray(vector, dtype=np.float32)
+        self.matrix[row] = vector / max(float(np.linalg.norm(vector)), 1e-12)
+        return row
+
+    def claim(self, row: int, owner: Tuple[str, int]):
+        while row >= len(self.alive):
+            self._grow()
+        self.alive[row] = True
+        self.owners[row] = owner
+
+    def release(self, row: int):
+        if row < len(self.alive) and self.alive[row]:
+            self.alive[row] = False
+            self.owners[row] = None
+            self.free.append(row)
+
+
+class MmapVectorStore(VectorStore):
+    """
+    嵌入式内存映射向量存储
+
+    写入顺序为 先写向量行并flush → 再追加日志，日志是唯一的事实来源：
+    崩溃时未登记的行在重放后视为空闲；覆盖写入时先分配新行、日志落盘后才释放旧行。
+    日志记录数超过存活内容数的 compact_ratio 倍时重写为快照。
+    """
+
+    def __init__(self, root: str, dim: int, initial_rows: int = 1024, compact_ratio: float = 4.0):
+        """
+        打开（或创建）存储目录并重放日志
+
+        Args:
+            root: 存储目录
+            dim: 向量维度
+            initial_rows: 新用户矩阵的初始行数
+            compact_ratio: 日志压缩阈值
+        """
+        self.root = root
+        self.dim = dim
+        self.initial_rows = initial_rows
+        self.compact_ratio = compact_ratio
+        os.makedirs(os.path.join(root, "users"), exist_ok=True)
+
+        self._lock = threading.RLock()
+        self._docs: Dict[str, Dict] = {}
+        self._users: Dict[str, _UserMatrix] = {}
+        self._user_docs: Dict[str, set] = {}
+        self._todos: Dict[str, set] = {}
+        self._fingerprints: Dict[str, Tuple[str, int]] = {}
+        self._log_records = 0
+
+        self._replay()
+        self._log = open(os.path.join(root, LOG_FILE), "a", encoding="utf-8")
+
+    # ---------- 日志 ----------
+
+    def _matrix(self, user_id: str) -> _UserMatrix:
+        matrix = self._users.get(user_id)
+        if matrix is None:
+            name = hashlib.sha1(user_id.encode("utf-8")).hexdigest()
+            matrix = self._users[user_id] = _UserMatrix(
+                os.path.join(self.root, "users", f"{name}.f32"), self.dim, self.initial_rows
+            )
+        return matrix
+
+    def _replay(self):
+        path = os.path.join(self.root, LOG_FILE)
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        # 崩溃时写了一半的末行
+                        continue
+                    self._apply(record)
+                    self._log_records += 1
+        for matrix in self._users.values():
+            matrix.rebuild_free()
+
+    def _append(self, record: Dict):
+        self._log.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self._log.flush()
+        self._log_records += 1
+        if self._log_records > max(1000, self.compact_ratio * len(self._docs)):
+            self.compact()
+
+    def _apply(self, record: Dict):
+        """把一条日志记录应用到内存状态"""
+        op = record["op"]
+        doc_id = record["doc_id"]
+        if op == "put":
+            self._drop(doc_id)
+            matrix = self._matrix(record["user_id"])
+            chunks = record["chunks"]
+            for i, chunk in enumerate(chunks):
+                matrix.claim(chunk["row"], (doc_id, i))
+                self._fingerprints[chunk["fingerprint"]] = (doc_id, i)
+            self._docs[doc_id] = {key: record.get(key) for key in ("user_id", "fingerprint", "raw", "todo_id")}
+            self._docs[doc_id]["chunks"] = chunks
+            self._user_docs.setdefault(record["user_id"], set()).add(doc_id)
+            if record.get("todo_id"):
+                self._todos.setdefault(record["todo_id"], set()).add(doc_id)
+        elif op == "touch":
+            if doc_id in self._docs:
+                self._docs[doc_id]["raw"] = record["raw"]
+        elif op == "del":
+            self._drop(doc_id)
+
+    def _drop(self, doc_id: str):
+        """从内存状态移除内容并释放其向量行"""
+        doc = self._docs.pop(doc_id, None)
+        if doc is None:
+            return
+        matrix = self._matrix(doc["user_id"])
+        for i, chunk in enumerate(doc["chunks"]):
+            if matrix.owners[chunk["row"]] == (doc_id, i):
+                matrix.release(chunk["row"])
+            if self._fingerprints.get(chunk["fingerprint"]) == (doc_id, i):
+                del self._fingerprints[chunk["fingerprint"]]
+        self._user_docs.get(doc["user_id"], set()).discard(doc_id)
+        if doc.get("todo_id"):
+            self._todos.get(doc["todo_id"], set()).discard(doc_id)
+
+    def compact(self):
+        """把日志重写为只包含存活内容的快照"""
+        with self._lock:
+            for matrix in self._users.values():
+                matrix.matrix.flush()
+            path = os.path.join(self.root, LOG_FILE)
+            tmp_path = path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                for doc_id, doc in self._docs.items():
+                    f.write(json.dumps({"op": "put", "doc_id": doc_id, **doc}, ensure_ascii=False) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            self._log.close()
+            os.replace(tmp_path, path)
+            self._log = open(path, "a", encoding="utf-8")
+            self._log_records = len(self._docs)
+
+    # ---------- 接口实现 ----------
+
+    def get_meta(self, doc_id: str) -> Dict:
+        with self._lock:
+            doc = self._docs.get(doc_id)
+            if doc is None:
+                return {"user_id": None, "chunks": 0, "fingerprint": "", "raw": "", "todo_id": None}
+            return {
+                "user_id": doc["user_id"],
+                "chunks": len(doc["chunks"]),
+                "fingerprint": doc["fingerprint"],
+                "raw": doc["raw"],
+                "todo_id": doc["todo_id"]
+            }
+
+    def find_reusable(self, fingerprints: List[str], extra_fields: List[str]) -> List[Optional[Tuple[np.ndarray, Dict]]]:
+        results = []
+        with self._lock:
+            for fingerprint in fingerprints:
+                ref = self._fingerprints.get(fingerprint)
+                if ref is None:
+                    results.append(None)
+                    continue
+                doc = self._docs[ref[0]]
+                chunk = doc["chunks"][ref[1]]
+                extras = chunk.get("extras", {})
+                if any(field not in extras for field in extra_fields):
+                    results.append(None)
+                    continue
+                vector = np.array(self._matrix(doc["user_id"]).matrix[chunk["row"]])
+                results.append((vector, {field: _unpack(extras[field]) for field in extra_fields}))
+        return results
+
+    def save(self, doc_id: str, user_id: str, chunks: List[Dict], fingerprints: List[str],
+             vectors: List[np.ndarray], raw_json: str, content_fingerprint: str,
+             todo_id: str = None, stale_chunk_count: int = 0, extras: List[Dict] = None) -> int:
+        extras = extras or [{} for _ in chunks]
+        with self._lock:
+            existing = self._docs.get(doc_id)
+            if existing is not None and existing["user_id"] != user_id:
+                return -1
+
+            # 先写新行，日志落盘后再释放旧行（由 _apply 中的 _drop 完成）
+            matrix = self._matrix(user_id)
+            rows = [matrix.allocate(vector) for vector in vectors]
+            for row in rows:
+                # 分配出去但尚未登记的行，避免同一批次重复分配
+                matrix.alive[row] = True
+            matrix.matrix.flush()
+
+            record = {
+                "op": "put",
+                "doc_id": doc_id,
+                "user_id": user_id,
+                "fingerprint": content_fingerprint,
+                "raw": raw_json,
+                "todo_id": todo_id or (existing or {}).get("todo_id"),
+                "chunks": [
+                    {
+                        "text": chunk["text"],
+                        "start": chunk["start"],
+                        "end": chunk["end"],
+                        "fingerprint": fingerprint,
+                        "row": row,
+                        "extras": {key: _pack(value) for key, value in extra.items()}
+                    }
+                    for chunk, fingerprint, row, extra in zip(chunks, fingerprints, rows, extras)
+                ]
+            }
+            self._apply(record)
+            self._append(record)
+            return len(chunks)
+
+    def touch(self, doc_id: str, chunk_count: int, raw_json: Optional[str] = None):
+        if raw_json is None:
+            return
+        with self._lock:
+            if doc_id in self._docs:
+                record = {"op": "touch", "doc_id": doc_id, "raw": raw_json}
+                self._apply(record)
+                self._append(record)
+
+    def refresh(self, doc_ids: Sequence[str]):
+        # 不设过期时间，无需刷新
+        return
+
+    def existing(self, doc_ids: Sequence[str]) -> set:
+        with self._lock:
+            return {doc_id for doc_id in doc_ids if doc_id in self._docs}
+
+    def delete(self, user_id: str, doc_ids: Sequence[str] = (), todo_id: str = None) -> int:
+        with self._lock:
+            targets = list(doc_ids)
+            if todo_id:
+                targets.extend(self._todos.get(todo_id, ()))
+            deleted = 0
+            for doc_id in dict.fromkeys(targets):
+                doc = self._docs.get(doc_id)
+                if doc is None or doc["user_id"] != user_id:
+                    continue
+                record = {"op": "del", "doc_id": doc_id}
+                self._apply(record)
+                self._append(record)
+                deleted += 1
+            return deleted
+
+    def count(self, user_id: str) -> int:
+        with self._lock:
+            matrix = self._users.get(user_id)
+            return int(matrix.alive.sum()) if matrix is not None else 0
+
+    def _hit(self, doc_id: str, chunk_index: int, score: float = None) -> Dict:
+        doc = self._docs[doc_id]
+        chunk = doc["chunks"][chunk_index]
+        hit = {
+            "doc_id": doc_id,
+            "user_id": doc["user_id"],
+            "chunk_index": chunk_index,
+            "text": chunk["text"],
+            "raw": doc["raw"] or "{}",
+        }
+        if score is not None:
+            hit["score"] = score
+        if "lex_w" in chunk.get("extras", {}):
+            hit["lex_w"] = _unpack(chunk["extras"]["lex_w"])
+        return hit
+
+    def search(self, query_vec: np.ndarray, user_id: str, knn: int, total: int = None,
+               ef_runtime: int = None, exact: bool = False) -> List[Dict]:
+        # 始终精确检索，ef_runtime/exact 无需处理
+        query_vec = np.asarray(query_vec, dtype=np.float32)
+        query_vec = query_vec / max(float(np.linalg.norm(query_vec)), 1e-12)
+        with self._lock:
+            matrix = self._users.get(user_id)
+            if matrix is None:
+                return []
+            rows = np.flatnonzero(matrix.alive)
+            if len(rows) == 0 or knn <= 0:
+                return []
+            # 向量已归一化，内积即余弦相似度
+            scores = matrix.matrix[rows] @ query_vec
+            k = min(knn, len(rows))
+            top = np.argpartition(-scores, k - 1)[:k]
+            top = top[np.argsort(-scores[top])]
+            hits = []
+            for i in top:
+                owner = matrix.owners[rows[i]]
+                if owner is not None:
+                    hits.append(self._hit(owner[0], owner[1], float(scores[i])))
+            return hits
+
+    def search_global(self, query_vec: np.ndarray, knn: int, ef_runtime: int = None) -> List[Dict]:
+        # 逐用户精确打分后合并
+        hits = []
+        with self._lock:
+            user_ids = list(self._users)
+        for user_id in user_ids:
+            hits.extend(self.search(query_vec, user_id, knn))
+        hits.sort(key=lambda hit: hit["score"], reverse=True)
+        return hits[:knn]
+
+    def search_lexical(self, terms: List[str], user_id: str, limit: int) -> List[Dict]:
+        wanted = set(terms)
+        scored = []
+        with self._lock:
+            for doc_id in self._user_docs.get(user_id, ()):
+                for i, chunk in enumerate(self._docs[doc_id]["chunks"]):
+                    lex = _unpack(chunk.get("extras", {}).get("lex"))
+                    if not lex:
+                        continue
+                    if isinstance(lex, bytes):
+                        lex = lex.decode("utf-8")
+                    matched = len(wanted.intersection(lex.split()))
+                    if matched:
+                        scored.append((matched, doc_id, i))
+            scored.sort(key=lambda item: item[0], reverse=True)
+            return [self._hit(doc_id, i) for _, doc_id, i in scored[:limit]]
+
+    def get_chunk_values(self, chunk_refs: List[Tuple[str, int]], field: str) -> List:
+        values = []
+        with self._lock:
+            for doc_id, chunk_index in chunk_refs:
+                doc = self._docs.get(doc_id)
+                if doc is None or chunk_index >= len(doc["chunks"]):
+                    values.append(None)
+                    continue
+                chunk = doc["chunks"][chunk_index]
+                value = chunk.get("extras", {}).get(field, chunk.get(field))
+                values.append(_unpack(value) if value is not None else None)
+        return values
+
+    def get_chunks(self, doc_id: str, chunk_count: int, with_vector: bool = False) -> List[Dict]:
+        with self._lock:
+            doc = self._docs.get(doc_id)
+            if doc is None:
+                return []
+            matrix = self._matrix(doc["user_id"])
+            chunks = []
+            for chunk in doc["chunks"]:
+                item = {"text": chunk["text"], "start": chunk["start"], "end": chunk["end"]}
+                if with_vector:
+                    item["vector"] = np.array(matrix.matrix[chunk["row"]])
+                chunks.append(item)
+            return chunks
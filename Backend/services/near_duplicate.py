@@ -0,0 +1,177 @@
+# 近重复检测：入库时对提取后的文本计算MinHash签名，在每个用户的Redis LSH索引中查找相似内容
+#
+# 签名为128个32位最小哈希（文本规范化后的字符5-gram），分成16个band×8行写入LSH桶，
+# 任一band完全相同的内容成为候选（Jaccard约0.7以上大概率命中），再用完整签名估计相似度与阈值比较。
+# 只有被索引（拥有向量）的内容写入LSH；被链接的重复内容记录在规范内容的链接集合中（检索折叠时列出），
+# 重复关系以MongoDB内容文档的 duplicate_of / duplicate_mode 为准。
+#
+# Redis键（均在主Redis，不随向量分片）：
+#   neardup:{user_id}:sig            Hash  doc_id -> 签名（128×uint32）
+#   neardup:{user_id}:{band}:{hash}  Set   落在该桶的doc_id
+#   neardup:{user_id}:links:{doc_id} Set   链接到该规范内容的重复内容ID
+import hashlib
+import zlib
+from typing import Dict, Iterable, List, Optional, Tuple
+import numpy as np
+from services.embedding_cache import normalize_query
+
+NUM_PERM = 128
+BANDS = 16
+ROWS = NUM_PERM // BANDS
+SHINGLE_SIZE = 5
+# 梅森素数 2^61-1；a、b、分片哈希均小于2^32，a*x+b 不会溢出uint64
+_PRIME = np.uint64((1 << 61) - 1)
+_rng = np.random.default_rng(20240601)
+_A = _rng.integers(1, 1 << 32, NUM_PERM, dtype=np.uint64)
+_B = _rng.integers(0, 1 << 32, NUM_PERM, dtype=np.uint64)
+# 分块计算最小哈希，限制 分片数×NUM_PERM 的临时矩阵大小
+_BLOCK = 4096
+
+
+def minhash(text: str) -> Optional[np.ndarray]:
+    """
+    计算文本的MinHash签名
+
+    Args:
+        text: 文本
+
+    Returns:
+        Optional[np.ndarray]: uint32签名，文本短于一个分片时返回None
+    """
+    text = normalize_query(text).lower()
+    if len(text) < SHINGLE_SIZE:
+        return None
+    shingles = {text[i:i + SHINGLE_SIZE] for i in range(len(text) - SHINGLE_SIZE + 1)}
+    hashes = np.fromiter((zlib.crc32(s.encode("utf-8")) for s in shingles), dtype=np.uint64, count=len(shingles))
+    signature = np.full(NUM_PERM, np.iinfo(np.uint64).max, dtype=np.uint64)
+    for start in range(0, len(hashes), _BLOCK):
+        block = hashes[start:start + _BLOCK, None]
+        np.minimum(signature, ((block * _A + _B) % _PRIME).min(axis=0), out=signature)
+    return (signature & np.uint64(0xFFFFFFFF)).astype(np.uint32)
+
+
+def similarity(a: np.ndarray, b: np.ndarray) -> float:
+    """两个签名相同位置相等的比例，即Jaccard相似度的估计"""
+    return float(np.count_nonzero(a == b)) / NUM_PERM
+
+
+class NearDuplicateIndex:
+    """按用户划分的MinHash LSH索引"""
+
+    def __init__(self, redis_client, namespace: str = "neardup"):
+        """
+        初始化近重复索引
+
+        Args:
+            redis_client: Redis客户端
+            namespace: Redis键前缀
+        """
+        self.redis_client = redis_client
+        self.namespace = namespace
+
+    def _sig_key(self, user_id: str) -> str:
+        return f"{self.namespace}:{user_id}:sig"
+
+    def _links_key(self, user_id: str, doc_id: str) -> str:
+        return f"{self.namespace}:{user_id}:links:{doc_id}"
+
+    def _band_keys(self, user_id: str, signature: np.ndarray) -> List[str]:
+        raw = signature.astype("<u4").tobytes()
+        size = ROWS * 4
+        return [
+            f"{self.namespace}:{user_id}:{band}:{hashlib.sha1(raw[band * size:(band + 1) * size]).hexdigest()[:16]}"
+            for band in range(BANDS)
+        ]
+
+    def find(self, user_id: str, signature: np.ndarray, threshold: float,
+             exclude: str = None) -> Optional[Tuple[str, float]]:
+        """
+        查找最相似的已索引内容
+
+        Args:
+            user_id: 用户ID
+            signature: 待查内容的签名
+            threshold: 相似度阈值
+            exclude: 排除的内容ID（重新入库的内容本身）
+
+        Returns:
+            Optional[Tuple[str, float]]: (内容ID, 估计相似度)，没有达到阈值的内容时返回None
+        """
+        pipe = self.redis_client.pipeline(transaction=False)
+        for key in self._band_keys(user_id, signature):
+            pipe.smembers(key)
+        candidates = set()
+        for members in pipe.execute():
+            candidates.update(m.decode() if isinstance(m, bytes) else m for m in members)
+        candidates.discard(exclude)
+        if not candidates:
+            return None
+
+        candidates = sorted(candidates)
+        best = None
+        for doc_id, raw in zip(candidates, self.redis_client.hmget(self._sig_key(user_id), candidates)):
+            if raw is None:
+                continue
+            score = similarity(signature, np.frombuffer(raw, dtype="<u4"))
+            if score >= threshold and (best is None or score > best[1]):
+                best = (doc_id, score)
+        return best
+
+    def add(self, user_id: str, doc_id: str, signature: np.ndarray):
+        """把已索引的内容写入LSH"""
+        pipe = self.redis_client.pipeline(transaction=True)
+        pipe.hset(self._sig_key(user_id), doc_id, signature.astype("<u4").tobytes())
+        for key in self._band_keys(user_id, signature):
+            pipe.sadd(key, doc_id)
+        pipe.execute()
+
+    def link(self, user_id: str, canonical_id: str, duplicate_id: str):
+        """记录重复内容链接到规范内容"""
+        self.redis_client.sadd(self._links_key(user_id, canonical_id), duplicate_id)
+
+    def unlink(self, user_id: str, canonical_id: str, duplicate_id: str):
+        """解除重复内容的链接"""
+        self.redis_client.srem(self._links_key(user_id, canonical_id), duplicate_id)
+
+    def linked(self, user_id: str, doc_ids: List[str]) -> Dict[str, List[str]]:
+        """
+        批量读取链接到各内容的重复内容
+
+        Args:
+            user_id: 用户ID
+            doc_ids: 规范内容ID
+
+        Returns:
+            Dict[str, List[str]]: {规范内容ID: [重复内容ID]}，没有重复内容的不出现
+        """
+        if not doc_ids:
+            return {}
+        pipe = self.redis_client.pipeline(transaction=False)
+        for doc_id in doc_ids:
+            pipe.smembers(self._links_key(user_id, doc_id))
+        return {
+            doc_id: sorted(m.decode() if isinstance(m, bytes) else m for m in members)
+            for doc_id, members in zip(doc_ids, pipe.execute())
+            if members
+        }
+
+    def remove(self, user_id: str, doc_ids: Iterable[str]):
+        """
+        从LSH删除内容，同时删除其链接集合
+
+        Args:
+            user_id: 用户ID
+            doc_ids: 内容ID
+        """
+        doc_ids = list(doc_ids)
+        if not doc_ids:
+            return
+        signatures = self.redis_client.hmget(self._sig_key(user_id), doc_ids)
+        pipe = self.redis_client.pipeline(transaction=True)
+        for doc_id, raw in zip(doc_ids, signatures):
+            if raw is not None:
+                for key in self._band_keys(user_id, np.frombuffer(raw, dtype="<u4")):
+                    pipe.srem(key, doc_id)
+            pipe.delete(self._links_key(user_id, doc_id))
+        pipe.hdel(self._sig_key(user_id), *doc_ids)
+        pipe.execute()
@@ -0,0 +1,118 @@
+# ONNX Runtime 编码后端，在CPU上运行导出（可int8动态量化）的BGE-M3，
+# encode() 的参数与返回格式与 BGEM3FlagModel 一致，可直接替换
+import os
+from typing import Dict, List
+import numpy as np
+
+# 导出图的输入输出名，导出脚本与推理两侧共用
+INPUT_NAMES = ["input_ids", "attention_mask"]
+OUTPUT_NAMES = ["dense_vecs", "sparse_weights", "colbert_vecs"]
+
+
+class OnnxBGEM3Encoder:
+    """
+    ONNX Runtime 上的BGE-M3编码器
+
+    一次推理同时输出稠密向量、逐token词汇权重和ColBERT向量，
+    后处理与FlagEmbedding保持一致：词汇权重同一token取最大值并去掉特殊token，
+    ColBERT向量去掉[CLS]并按实际长度截断
+    """
+
+    def __init__(self, model_dir: str, model_file: str = "model_int8.onnx", intra_op_threads: int = 0):
+        """
+        加载ONNX模型与分词器
+
+        Args:
+            model_dir: 导出目录，包含onnx模型和分词器文件
+            model_file: 目录下的模型文件名
+            intra_op_threads: 单个算子的线程数，0为ONNX Runtime默认值
+
+        Raises:
+            ImportError: 未安装onnxruntime时抛出
+            FileNotFoundError: 模型文件不存在时抛出
+        """
+        import onnxruntime as ort
+        from transformers import AutoTokenizer
+
+        model_path = os.path.join(model_dir, model_file)
+        if not os.path.exists(model_path):
+            raise FileNotFoundError(f"ONNX模型不存在: {model_path}，请先运行 python -m scripts.export_onnx")
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if intra_op_threads > 0:
+            options.intra_op_num_threads = intra_op_threads
+        self.session = ort.InferenceSession(model_path, sess_options=options, providers=["CPUExecutionProvider"])
+        self.tokenizer = AutoTokenizer.from_pretrained(model_dir)
+        self.unused_tokens = {
+            token_id for token_id in (
+                self.tokenizer.cls_token_id,
+                self.tokenizer.eos_token_id,
+                self.tokenizer.pad_token_id,
+                self.tokenizer.unk_token_id,
+            ) if token_id is not None
+        }
+
+    def _lexical_weights(self, input_ids: np.ndarray, weights: np.ndarray) -> Dict[str, float]:
+        """逐token权重转为 {token_id: weight}，同一token取最大值"""
+        result: Dict[str, float] = {}
+        for token_id, weight in zip(input_ids.tolist(), weights.tolist()):
+            if token_id in self.unused_tokens or weight <= 0:
+                continue
+            key = str(token_id)
+            if weight > result.get(key, 0.0):
+                result[key] = weight
+        return result
+
+    def encode(self, sentences: List[str], batch_size: int = 12, max_length: int = 8192,
+               return_dense: bool = True, return_sparse: bool = False,
+               return_colbert_vecs: bool = False) -> Dict:
+        """
+        编码文本
+
+        Args:
+            sentences: 文本列表
+            batch_size: 批处理大小
+            max_length: 最大token数
+            return_dense: 是否返回稠密向量
+            return_sparse: 是否返回词汇权重
+            return_colbert_vecs: 是否返回ColBERT向量
+
+        Returns:
+            Dict: {"dense_vecs", "lexical_weights", "colbert_vecs"}，未请求的项为None
+        """
+        if isinstance(sentences, str):
+            sentences = [sentences]
+        dense_vecs = [None] * len(sentences)
+        lexical_weights = [None] * len(sentences)
+        colbert_vecs = [None] * len(sentences)
+
+        # 按长度排序分批，减少padding
+        order = sorted(range(len(sentences)), key=lambda i: len(sentences[i]), reverse=True)
+        for begin in range(0, len(order), max(1, batch_size)):
+            indexes = order[begin:begin + batch_size]
+            inputs = self.tokenizer(
+                [sentences[i] for i in indexes],
+                padding=True,
+                truncation=True,
+                max_length=max_length,
+                return_tensors="np"
+            )
+            input_ids = inputs["input_ids"].astype(np.int64)
+            attention_mask = inputs["attention_mask"].astype(np.int64)
+            dense, sparse, colbert = self.session.run(
+                OUTPUT_NAMES, {"input_ids": input_ids, "attention_mask": attention_mask}
+            )
+            for row, i in enumerate(indexes):
+                dense_vecs[i] = dense[row]
+                if return_sparse:
+                    lexical_weights[i] = self._lexical_weights(input_ids[row], sparse[row])
+                if return_colbert_vecs:
+                    tokens_num = int(attention_mask[row].sum())
+                    colbert_vecs[i] = colbert[row][:tokens_num - 1]
+
+        return {
+            "dense_vecs": np.array(dense_vecs) if return_dense else None,
+            "lexical_weights": lexical_weights if return_sparse else None,
+            "colbert_vecs": colbert_vecs if return_colbert_vecs else None,
+        }
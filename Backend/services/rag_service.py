@@ -1,5 +1,5 @@
 # RAG服务层，处理检索增强生成相关的业务逻辑
-from typing import List, TypedDict, Generator
+from typing import List, Optional, TypedDict, Generator
 from langchain.schema import Document
 from langchain.prompts import PromptTemplate
 from langchain_deepseek import ChatDeepSeek
@@ -88,6 +88,9 @@ class RAGService:
             question: str
             user_id: str 
             continue_chat: bool
+            search_mode: Optional[str]
+            rerank: Optional[bool]
+            search_profile: Optional[str]
             context: List[Document]
             answer: str
         
@@ -96,46 +99,26 @@ class RAGService:
             query = state['question']
             user_id = state.get('user_id')
             
-            # 获取向量搜索结果
-            results = self.vector_service.search_embedding(query, user_id, top_k=5)
+            # 获取向量搜索结果（按内容聚合的命中分块），检索模式为空时使用配置的默认模式
+            results = self.vector_service.search_chunks(
+                query, user_id, top_k=5, mode=state.get('search_mode'), rerank=state.get('rerank'),
+                profile=state.get('search_profile')
+            )
             
             docs = []
-            for score, doc_id in results:
-                # 从todosContent集合获取完整内容
-                content = db_client.todosContent.find_one({"_id": ObjectId(doc_id)})
-                if content and content['user_id'] == user_id:
-                    # 合并用户内容和提取内容
-                    full_content_parts = []
-                    
-                    # 用户输入的内容
-                    if content.get("content"):
-                        full_content_parts.append(content["content"])
-                    
-                    # 提取的内容
-                    if content.get("extracted_content"):
-                        extracted = content["extracted_content"]
-                        
-                        # OCR文本
-                        if extracted.get("ocr_texts") and len(extracted["ocr_texts"]) > 0:
-                            ocr_section = "【图片识别内容】\n" + "\n".join(extracted["ocr_texts"])
-                            full_content_parts.append(ocr_section)
-                        
-                        # 文档文本
-                        if extracted.get("file_texts") and len(extracted["file_texts"]) > 0:
-                            file_section = "【文档提取内容】\n" + "\n".join(extracted["file_texts"])
-                            full_content_parts.append(file_section)
-                    
-                    # 合并所有内容传给LLM
-                    full_content = "\n\n".join(full_content_parts)
-                    
-                    docs.append(Document(
-                        page_content=full_content,
-                        metadata={
-                            "doc_id": doc_id,
-                            "score": score,
-                            "user_id": user_id
-                        }
-                    ))
+            for group in results:
+                # 只把命中的分块传给LLM，而不是整篇内容
+                page_content = "\n...\n".join(chunk["text"] for chunk in group["chunks"])
+                
+                docs.append(Document(
+                    page_content=page_content,
+                    metadata={
+                        "doc_id": group["doc_id"],
+                        "score": group["score"],
+                        "user_id": user_id,
+                        "chunk_indexes": [chunk["chunk_index"] for chunk in group["chunks"]]
+                    }
+                ))
             
             return {"context": docs}
         
@@ -181,7 +164,9 @@ class RAGService:
         
         return graph_builder.compile()
     
-    def process_question(self, question: str, user_id: str, continue_chat: bool = False) -> dict:
+    def process_question(self, question: str, user_id: str, continue_chat: bool = False,
+                         search_mode: Optional[str] = None, rerank: Optional[bool] = None,
+                         search_profile: Optional[str] = None) -> dict:
         """
         处理用户问题，返回RAG结果
         
@@ -189,6 +174,9 @@ class RAGService:
             question: 用户问题
             user_id: 用户ID
             continue_chat: 是否继续对话
+            search_mode: 检索模式 dense/hybrid
+            rerank: 是否ColBERT重排
+            search_profile: 检索精度档位 fast/balanced/exact
             
         Returns:
             dict: 包含answer生成器的结果
@@ -196,12 +184,18 @@ class RAGService:
         state = {
             "question": question,
             "user_id": user_id,
-            "continue_chat": continue_chat
+            "continue_chat": continue_chat,
+            "search_mode": search_mode,
+            "rerank": rerank,
+            "search_profile": search_profile
         }
         
         return self.rag_chain.invoke(state)
     
-    def get_relevant_documents(self, query: str, user_id: str, top_k: int = 5) -> List[Document]:
+    def get_relevant_documents(self, query: str, user_id: str, top_k: int = 5,
+                               search_mode: Optional[str] = None,
+                               rerank: Optional[bool] = None,
+                               search_profile: Optional[str] = None) -> List[Document]:
         """
         获取相关文档（不生成回答）
         
@@ -209,11 +203,16 @@ class RAGService:
             query: 查询文本
             user_id: 用户ID
             top_k: 返回文档数量
+            search_mode: 检索模式 dense/hybrid
+            rerank: 是否ColBERT重排
+            search_profile: 检索精度档位 fast/balanced/exact
             
         Returns:
             List[Document]: 相关文档列表
         """
-        results = self.vector_service.search_embedding(query, user_id, top_k)
+        results = self.vector_service.search_embedding(
+            query, user_id, top_k, mode=search_mode, rerank=rerank, profile=search_profile
+        )
         
         docs = []
         for score, doc_id in results:
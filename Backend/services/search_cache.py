@@ -0,0 +1,121 @@
+# 检索结果缓存层，缓存按用户检索的最终排序结果
+import hashlib
+import json
+import threading
+from typing import Dict, Iterable, List, Optional, Tuple
+from services.embedding_cache import normalize_query
+
+
+class SearchResultCache:
+    """
+    按用户写入纪元失效的检索结果缓存
+
+    每个用户有一个单调递增的写入纪元（Redis计数器，不设过期，避免归零后旧结果重新可见），
+    用户的向量发生写入或删除时加一；缓存键包含纪元，语料变化后旧结果不再被读到，
+    无需扫描删除，旧条目按TTL自然过期。
+    """
+
+    def __init__(self, redis_client, namespace: str = "search", ttl: int = 300):
+        """
+        初始化检索结果缓存
+
+        Args:
+            redis_client: Redis客户端
+            namespace: Redis键前缀
+            ttl: 结果缓存过期时间（秒）
+        """
+        self.redis_client = redis_client
+        self.namespace = namespace
+        self.ttl = int(ttl)
+
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "bumps": 0, "errors": 0}
+
+    def _epoch_key(self, user_id: str) -> str:
+        return f"{self.namespace}:epoch:{user_id}"
+
+    def _count(self, name: str, n: int = 1):
+        with self._lock:
+            self._stats[name] += n
+
+    def bump(self, user_ids: Iterable[str]):
+        """
+        用户语料发生变化，写入纪元加一
+
+        Args:
+            user_ids: 用户ID，可重复
+        """
+        user_ids = {user_id for user_id in user_ids if user_id}
+        if not user_ids:
+            return
+        try:
+            pipe = self.redis_client.pipeline(transaction=False)
+            for user_id in user_ids:
+                pipe.incr(self._epoch_key(user_id))
+            pipe.execute()
+            self._count("bumps", len(user_ids))
+        except Exception as e:
+            # 纪元未更新时旧结果最多在TTL内继续可见
+            self._count("errors")
+            print(f"检索缓存纪元更新失败: {e}")
+
+    def get(self, user_id: str, query: str, params: Dict) -> Tuple[Optional[List[Dict]], Optional[str]]:
+        """
+        查询缓存
+
+        纪元在检索前读取，检索期间发生的写入使本次结果写入旧纪元的键，不会被后续查询读到
+
+        Args:
+            user_id: 用户ID
+            query: 查询文本（规范化后参与哈希）
+            params: 影响结果的检索参数（top_k、模式、重排、精度档位等）
+
+        Returns:
+            Tuple[Optional[List[Dict]], Optional[str]]: (缓存的结果，未命中为None；回填用的缓存键，Redis不可用时为None)
+        """
+        try:
+            epoch = self.redis_client.get(self._epoch_key(user_id))
+            epoch = int(epoch) if epoch else 0
+            digest = hashlib.sha256(
+                json.dumps([normalize_query(query), params], sort_keys=True, ensure_ascii=False).encode("utf-8")
+            ).hexdigest()
+            key = f"{self.namespace}:result:{user_id}:{epoch}:{digest}"
+            cached = self.redis_client.get(key)
+        except Exception as e:
+            self._count("errors")
+            print(f"检索缓存读取失败: {e}")
+            return None, None
+        if cached is None:
+            self._count("misses")
+            return None, key
+        self._count("hits")
+        return json.loads(cached), key
+
+    def set(self, key: Optional[str], results: List[Dict]):
+        """
+        回填缓存
+
+        Args:
+            key: get() 返回的缓存键
+            results: 检索结果
+        """
+        if key is None:
+            return
+        try:
+            self.redis_client.setex(key, self.ttl, json.dumps(results, ensure_ascii=False, default=float))
+        except Exception as e:
+            self._count("errors")
+            print(f"检索缓存写入失败: {e}")
+
+    def stats(self) -> Dict:
+        """
+        缓存统计
+
+        Returns:
+            Dict: 命中、未命中、纪元更新、错误次数以及命中率
+        """
+        with self._lock:
+            stats = dict(self._stats)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = round(stats["hits"] / lookups, 4) if lookups else 0.0
+        return stats
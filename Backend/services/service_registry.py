@@ -0,0 +1,223 @@
+# 服务注册表：重量级服务（BGE-M3、PaddleOCR、RAG）延迟构造，
+# 可在启动后由后台线程加载并预热，记录每个组件的加载状态和耗时供就绪检查使用
+import os
+import tempfile
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+from config.settings import ai_config, app_config
+
+# 组件状态：pending 未加载，loading 加载中，warming 预热中，ready 可用，failed 加载或预热失败
+COMPONENT_STATES = ("pending", "loading", "warming", "ready", "failed")
+
+
+class _Component:
+    """一个已注册的服务"""
+
+    def __init__(self, factory: Callable[[], object], warmup: Optional[Callable[[object], None]]):
+        self.factory = factory
+        self.warmup = warmup
+        self.instance = None
+        self.state = "pending"
+        self.error = None
+        self.load_ms = None
+        self.warmup_ms = None
+        # 每个组件单独加锁，加载向量模型时不阻塞其他组件
+        self.lock = threading.Lock()
+
+
+class LazyService:
+    """服务代理：首次访问属性时从注册表取得（必要时构造）实例，模块级变量可以在导入时创建"""
+
+    def __init__(self, registry: "ServiceRegistry", name: str):
+        object.__setattr__(self, "_registry", registry)
+        object.__setattr__(self, "_name", name)
+
+    def __getattr__(self, attr: str):
+        return getattr(self._registry.get(self._name), attr)
+
+
+class ServiceRegistry:
+    """线程安全的服务注册表"""
+
+    def __init__(self):
+        self._components: Dict[str, _Component] = {}
+        self._warmup_thread = None
+        self._lock = threading.Lock()
+
+    def register(self, name: str, factory: Callable[[], object],
+                 warmup: Optional[Callable[[object], None]] = None):
+        """
+        注册服务
+
+        Args:
+            name: 组件名
+            factory: 构造实例的函数，首次使用时调用一次
+            warmup: 预热函数，参数为实例，后台预热时调用
+        """
+        self._components[name] = _Component(factory, warmup)
+
+    def get(self, name: str):
+        """
+        获取服务实例，未加载时在当前线程加载；多个线程同时首次使用时只加载一次
+
+        Args:
+            name: 组件名
+
+        Returns:
+            服务实例
+
+        Raises:
+            KeyError: 组件未注册时抛出
+            Exception: 构造失败时抛出原异常，下次调用会重试
+        """
+        component = self._components[name]
+        if component.instance is not None:
+            return component.instance
+        with component.lock:
+            if component.instance is None:
+                self._load(name, component)
+        return component.instance
+
+    def try_get(self, name: str):
+        """获取服务实例，加载失败时返回None"""
+        try:
+            return self.get(name)
+        except Exception:
+            return None
+
+    def peek(self, name: str):
+        """获取已加载的服务实例，未加载时返回None（不触发加载）"""
+        component = self._components.get(name)
+        return component.instance if component is not None else None
+
+    def lazy(self, name: str) -> LazyService:
+        """返回延迟加载的服务代理"""
+        if name not in self._components:
+            raise KeyError(name)
+        return LazyService(self, name)
+
+    @staticmethod
+    def _load(name: str, component: _Component):
+        """构造实例并记录耗时，调用方持有组件锁"""
+        component.state = "loading"
+        component.error = None
+        started = time.perf_counter()
+        try:
+            instance = component.factory()
+        except Exception as e:
+            component.state = "failed"
+            component.error = str(e)
+            print(f"{name} 加载失败: {e}")
+            raise
+        component.load_ms = (time.perf_counter() - started) * 1000
+        component.instance = instance
+        component.state = "ready"
+        print(f"{name} 加载完成，耗时 {component.load_ms:.0f}ms")
+
+    def _warm(self, name: str):
+        """加载并预热一个组件，失败只记录状态"""
+        component = self._components[name]
+        with component.lock:
+            if component.instance is None:
+                try:
+                    self._load(name, component)
+                except Exception:
+                    return
+            if component.warmup is None or component.warmup_ms is not None:
+                return
+            # 预热期间实例已可用，就绪检查仍等待预热完成
+            component.state = "warming"
+            started = time.perf_counter()
+            try:
+                component.warmup(component.instance)
+            except Exception as e:
+                component.state = "failed"
+                component.error = f"预热失败: {e}"
+                print(f"{name} 预热失败: {e}")
+                return
+            component.warmup_ms = (time.perf_counter() - started) * 1000
+            component.state = "ready"
+            print(f"{name} 预热完成，耗时 {component.warmup_ms:.0f}ms")
+
+    def warm_up(self, names: List[str] = None) -> threading.Thread:
+        """
+        在后台线程中依次加载并预热组件，重复调用只启动一次
+
+        Args:
+            names: 组件名，不传时为全部已注册组件（按注册顺序）
+
+        Returns:
+            threading.Thread: 预热线程
+        """
+        with self._lock:
+            if self._warmup_thread is None:
+                names = list(names or self._components)
+                self._warmup_thread = threading.Thread(
+                    target=lambda: [self._warm(name) for name in names],
+                    name="service-warmup",
+                    daemon=True
+                )
+                self._warmup_thread.start()
+            return self._warmup_thread
+
+    def status(self) -> Dict[str, Dict]:
+        """
+        各组件的加载状态
+
+        Returns:
+            Dict[str, Dict]: {组件名: {state, load_ms, warmup_ms, error}}
+        """
+        return {
+            name: {
+                "state": component.state,
+                "load_ms": round(component.load_ms, 1) if component.load_ms is not None else None,
+                "warmup_ms": round(component.warmup_ms, 1) if component.warmup_ms is not None else None,
+                "error": component.error
+            }
+            for name, component in self._components.items()
+        }
+
+    def is_ready(self, names: List[str] = None) -> bool:
+        """组件是否都已就绪，不传时检查 app_config.ready_components"""
+        names = app_config.ready_components if names is None else names
+        return all(name in self._components and self._components[name].state == "ready" for name in names)
+
+
+def _vector_service():
+    from services.vector_service import VectorService
+    return VectorService()
+
+
+def _warm_vector(vector_service):
+    """一次编码，触发模型权重加载到内存和计算图初始化"""
+    vector_service.encode_multi(["预热"], sparse=ai_config.lexical_index, colbert=ai_config.colbert_index)
+
+
+def _file_service():
+    from services.file_service import FileService
+    return FileService()
+
+
+def _warm_file(file_service):
+    """对一张空白图片做一次OCR，触发检测和识别模型初始化"""
+    from PIL import Image
+    fd, path = tempfile.mkstemp(suffix=".png")
+    os.close(fd)
+    try:
+        Image.new("RGB", (64, 32), "white").save(path)
+        file_service.process_image_ocr(path)
+    finally:
+        os.remove(path)
+
+
+def _rag_service():
+    from services.rag_service import RAGService
+    return RAGService()
+
+
+# 全局服务注册表，预热按注册顺序进行
+registry = ServiceRegistry()
+registry.register("vector", _vector_service, _warm_vector)
+registry.register("file", _file_service, _warm_file)
+registry.register("rag", _rag_service)
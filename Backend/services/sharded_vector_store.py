@@ -0,0 +1,144 @@
+# 分片向量存储：按 user_id 把内容路由到多个 Redis Stack 节点，跨分片的读取和全局检索并行查询后合并
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+import numpy as np
+from config.database import ShardMap
+from services.vector_index import VersionedRedisVectorStore
+from services.vector_store import VectorStore
+
+
+class ShardedVectorStore(VectorStore):
+    """
+    分片向量存储
+
+    一个用户的全部内容在同一个分片上，按用户的写入、删除和检索只访问该分片；
+    只有内容ID的读取（调用方不知道归属用户时）并行查询全部分片，取存在的一份；
+    全局检索在每个分片上各取 knn 个分块，合并后按相似度取前 knn 个。
+    每个分片各自维护索引版本和别名
+    """
+
+    def __init__(self, shards: ShardMap, on_evict: Callable[[List[str]], None] = None):
+        """
+        Args:
+            shards: 分片表
+            on_evict: 按预算逐出内容后的回调，参数为被逐出内容的用户
+        """
+        self.shards = shards
+        self.stores = [VersionedRedisVectorStore(client, on_evict) for client in shards.clients()]
+        self._executor = ThreadPoolExecutor(max_workers=len(self.stores), thread_name_prefix="vector-shard")
+
+    def for_user(self, user_id: str) -> VectorStore:
+        return self.stores[self.shards.shard_for(user_id)]
+
+    def _fan_out(self, call: Callable[[VectorStore], object]) -> List:
+        """在全部分片上并行执行，结果按分片序号排列"""
+        return list(self._executor.map(call, self.stores))
+
+    def _group_by_shard(self, user_ids: Sequence[str]) -> Dict[int, List[int]]:
+        """按用户所在分片把下标分组"""
+        groups: Dict[int, List[int]] = {}
+        for i, user_id in enumerate(user_ids):
+            groups.setdefault(self.shards.shard_for(user_id), []).append(i)
+        return groups
+
+    def _by_shard(self, user_ids: Sequence[str], call: Callable[[VectorStore, List[int]], List]) -> List:
+        """按用户所在分片分组，各分片并行执行 call(分片存储, 下标)，结果按原下标合并"""
+        results: List = [None] * len(user_ids)
+        groups = self._group_by_shard(user_ids)
+        futures = {
+            shard: self._executor.submit(call, self.stores[shard], indexes)
+            for shard, indexes in groups.items()
+        }
+        for shard, future in futures.items():
+            for i, value in zip(groups[shard], future.result()):
+                results[i] = value
+        return results
+
+    def get_meta(self, doc_id: str) -> Dict:
+        return self.get_metas([doc_id])[0]
+
+    def get_metas(self, doc_ids: Sequence[str]) -> List[Dict]:
+        results = self._fan_out(lambda store: store.get_metas(doc_ids))
+        metas = list(results[0])
+        for shard_metas in results[1:]:
+            for i, meta in enumerate(shard_metas):
+                if metas[i]["user_id"] is None and meta["user_id"] is not None:
+                    metas[i] = meta
+        return metas
+
+    def get_user_metas(self, doc_ids: Sequence[str], user_ids: Sequence[str]) -> List[Dict]:
+        return self._by_shard(user_ids, lambda store, indexes: store.get_metas([doc_ids[i] for i in indexes]))
+
+    def find_reusable(self, fingerprints: List[str], extra_fields: List[str]) -> List[Optional[Tuple[np.ndarray, Dict]]]:
+        # 向量与用户无关，任一分片命中即可复用
+        results = self._fan_out(lambda store: store.find_reusable(fingerprints, extra_fields))
+        return [next((hit for hit in hits if hit is not None), None) for hits in zip(*results)]
+
+    def find_user_reusable(self, fingerprints: List[str], user_ids: Sequence[str],
+                           extra_fields: List[str]) -> List[Optional[Tuple[np.ndarray, Dict]]]:
+        # 只在写入用户所在的分片复用，新写入的分块也在该分片
+        return self._by_shard(user_ids, lambda store, indexes: store.find_reusable(
+            [fingerprints[i] for i in indexes], extra_fields
+        ))
+
+    def save(self, doc_id: str, user_id: str, chunks: List[Dict], fingerprints: List[str],
+             vectors: List[np.ndarray], raw_json: str, content_fingerprint: str,
+             todo_id: str = None, stale_chunk_count: int = 0, extras: List[Dict] = None) -> int:
+        return self.for_user(user_id).save(doc_id, user_id, chunks, fingerprints, vectors, raw_json,
+                                           content_fingerprint, todo_id, stale_chunk_count, extras)
+
+    def save_many(self, documents: List[Dict]) -> List[int]:
+        return self._by_shard([document["user_id"] for document in documents],
+                              lambda store, indexes: store.save_many([documents[i] for i in indexes]))
+
+    def touch(self, doc_id: str, chunk_count: int, raw_json: Optional[str] = None):
+        # 不知道归属用户，各分片并行检查（VectorService 通过 for_user 直接刷新所在分片）
+        def touch_shard(store: VectorStore):
+            if doc_id in store.existing([doc_id]):
+                store.touch(doc_id, chunk_count, raw_json)
+        self._fan_out(touch_shard)
+
+    def refresh(self, doc_ids: Sequence[str]):
+        self._fan_out(lambda store: store.refresh(doc_ids))
+
+    def existing(self, doc_ids: Sequence[str]) -> set:
+        return set().union(*self._fan_out(lambda store: store.existing(doc_ids)))
+
+    def delete(self, user_id: str, doc_ids: Sequence[str] = (), todo_id: str = None) -> int:
+        return self.for_user(user_id).delete(user_id, doc_ids, todo_id)
+
+    def count(self, user_id: str) -> int:
+        return self.for_user(user_id).count(user_id)
+
+    def usage(self, user_id: str = None) -> Dict:
+        if user_id:
+            return self.for_user(user_id).usage(user_id)
+        # 全部用户的合计为各分片之和（预算按分片各自执行）
+        totals: Dict[str, int] = {}
+        for shard_usage in self._fan_out(lambda store: store.usage()):
+            for field, value in shard_usage.items():
+                totals[field] = totals.get(field, 0) + value
+        return totals
+
+    def search(self, query_vec: np.ndarray, user_id: str, knn: int, total: int = None,
+               ef_runtime: int = None, exact: bool = False) -> List[Dict]:
+        return self.for_user(user_id).search(query_vec, user_id, knn, total, ef_runtime, exact)
+
+    def search_global(self, query_vec: np.ndarray, knn: int, ef_runtime: int = None) -> List[Dict]:
+        hits = [hit for shard_hits in self._fan_out(lambda store: store.search_global(query_vec, knn, ef_runtime))
+                for hit in shard_hits]
+        hits.sort(key=lambda hit: hit["score"], reverse=True)
+        return hits[:knn]
+
+    def search_lexical(self, terms: List[str], user_id: str, limit: int) -> List[Dict]:
+        return self.for_user(user_id).search_lexical(terms, user_id, limit)
+
+    def get_chunk_values(self, chunk_refs: List[Tuple[str, int]], field: str) -> List:
+        results = self._fan_out(lambda store: store.get_chunk_values(chunk_refs, field))
+        return [next((value for value in values if value is not None), None) for values in zip(*results)]
+
+    def get_chunks(self, doc_id: str, chunk_count: int, with_vector: bool = False) -> List[Dict]:
+        for chunks in self._fan_out(lambda store: store.get_chunks(doc_id, chunk_count, with_vector)):
+            if chunks:
+                return chunks
+        return []
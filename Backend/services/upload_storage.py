@@ -0,0 +1,61 @@
+# 上传文件存储，负责上传目录、URL与文件路径的对应和文件删除，
+# 不依赖OCR和文档解析，删除内容、读取文件时不需要构造 FileService
+import os
+from urllib.parse import unquote
+from config.settings import app_config
+
+
+class UploadStorage:
+    """上传文件存储类"""
+    
+    def __init__(self):
+        """初始化上传目录"""
+        
+        # 设置上传目录
+        self.upload_folder = app_config.upload_folder
+        
+        # 创建上传目录
+        self.image_folder = os.path.join(self.upload_folder, 'images')
+        self.file_folder = os.path.join(self.upload_folder, 'files')
+        os.makedirs(self.image_folder, exist_ok=True)
+        os.makedirs(self.file_folder, exist_ok=True)
+    
+    def get_file_path(self, url_path: str, file_type: str) -> str:
+        """
+        根据URL路径获取实际文件路径
+        
+        Args:
+            url_path: URL路径（可能包含URL编码）
+            file_type: 文件类型 ('image' 或 'file')
+            
+        Returns:
+            str: 实际文件路径
+        """
+        if file_type == 'image':
+            folder = self.image_folder
+            prefix = "/uploads/images/"
+        else:
+            folder = self.file_folder
+            prefix = "/uploads/files/"
+        
+        # 提取文件名并URL解码（因为URL中是编码的，但文件系统中是原始中文名）
+        filename = url_path.replace(prefix, "")
+        decoded_filename = unquote(filename)
+        return os.path.join(folder, decoded_filename)
+
+    def delete_file(self, file_path: str) -> bool:
+        """
+        删除文件
+        
+        Args:
+            file_path: 文件路径
+            
+        Returns:
+            bool: 是否成功
+        """
+        try:
+            os.remove(file_path)
+            return True
+        except Exception as e:
+            print(f"删除文件失败: {e}")
+            return False
\ No newline at end of file
@@ -0,0 +1,83 @@
+# 向量存储编码，按索引的向量类型在float32向量与 FLOAT32/FLOAT16/INT8 字节之间转换
+from typing import Optional, Tuple
+import numpy as np
+
+# 支持的存储类型及每个分量的字节数
+VECTOR_TYPES = {"FLOAT32": 4, "FLOAT16": 2, "INT8": 1}
+_DTYPES = {4: np.float32, 2: np.float16, 1: np.int8}
+
+
+def check_vector_type(vector_type: str) -> str:
+    """
+    校验存储类型
+
+    Args:
+        vector_type: 存储类型
+
+    Returns:
+        str: 大写的存储类型
+
+    Raises:
+        ValueError: 存储类型不支持时抛出
+    """
+    vector_type = (vector_type or "").upper()
+    if vector_type not in VECTOR_TYPES:
+        raise ValueError(f"不支持的向量存储类型: {vector_type}，可选 {', '.join(VECTOR_TYPES)}")
+    return vector_type
+
+
+def encode_vector(vector: np.ndarray, vector_type: str) -> Tuple[bytes, Optional[float]]:
+    """
+    把向量编码为存储字节
+
+    INT8 为对称量化：scale = max|v| / 127，存储 round(v / scale)，
+    余弦距离与缩放无关，索引直接用量化值计算，scale 只用于还原向量
+
+    Args:
+        vector: 向量
+        vector_type: 存储类型
+
+    Returns:
+        Tuple[bytes, Optional[float]]: (向量字节, INT8的缩放系数，其他类型为None)
+    """
+    vector = np.asarray(vector, dtype=np.float32)
+    vector_type = check_vector_type(vector_type)
+    if vector_type == "INT8":
+        scale = float(np.abs(vector).max()) / 127 or 1.0
+        quantized = np.clip(np.round(vector / scale), -127, 127).astype(np.int8)
+        return quantized.tobytes(), scale
+    return vector.astype(_DTYPES[VECTOR_TYPES[vector_type]]).tobytes(), None
+
+
+def decode_vector(data: bytes, dim: int, scale=None) -> np.ndarray:
+    """
+    把存储字节还原为float32向量
+
+    按字节长度判断存储类型，迁移过程中新旧类型的键可以同时读取
+
+    Args:
+        data: 向量字节
+        dim: 向量维度
+        scale: INT8的缩放系数，缺失时还原为单位向量
+
+    Returns:
+        np.ndarray: float32向量
+
+    Raises:
+        ValueError: 字节长度与维度不匹配时抛出
+    """
+    itemsize, remainder = divmod(len(data), dim)
+    if remainder or itemsize not in _DTYPES:
+        raise ValueError(f"向量字节长度 {len(data)} 与维度 {dim} 不匹配")
+    vector = np.frombuffer(data, dtype=_DTYPES[itemsize]).astype(np.float32)
+    if itemsize == 1:
+        if scale:
+            vector *= float(scale)
+        else:
+            vector /= max(float(np.linalg.norm(vector)), 1e-12)
+    return vector
+
+
+def vector_bytes(dim: int, vector_type: str) -> int:
+    """单个向量在给定存储类型下的字节数"""
+    return dim * VECTOR_TYPES[check_vector_type(vector_type)]
@@ -0,0 +1,265 @@
+# 向量索引版本管理：检索通过别名访问当前版本，重建时新版本在后台填充，完成后原子切换别名并回收旧版本
+#
+# 版本状态存于哈希 vector_index:meta：
+#   active 当前版本，building 正在构建的版本，previous/retired_at 已切换下线、等待回收的版本，
+#   type:{n} 版本n索引的向量存储类型
+# 构建期间写入和删除同时作用于 active 和 building 两个版本（双写），各进程每 vector_index_refresh 秒重新读取状态
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+import numpy as np
+from config.database import create_vector_index, vector_index_name, vector_key_prefixes, VECTOR_INDEX_META_KEY
+from config.settings import db_config
+from services.vector_codec import check_vector_type
+from services.vector_store import RedisVectorStore, VectorStore
+
+
+class VectorIndexManager:
+    """向量索引版本管理"""
+
+    def __init__(self, redis_client):
+        """
+        初始化索引版本管理
+
+        Args:
+            redis_client: Redis客户端
+        """
+        self.redis_client = redis_client
+        self._state = None
+        self._loaded_at = 0.0
+        self._lock = threading.Lock()
+
+    def state(self, fresh: bool = False) -> Dict:
+        """
+        读取版本状态，进程内缓存 vector_index_refresh 秒
+
+        Args:
+            fresh: 是否跳过缓存直接读取
+
+        Returns:
+            Dict: active/building/previous/retired_at/types
+        """
+        with self._lock:
+            if fresh or self._state is None or time.monotonic() - self._loaded_at >= db_config.vector_index_refresh:
+                raw = {
+                    (k.decode("utf-8") if isinstance(k, bytes) else k): (v.decode("utf-8") if isinstance(v, bytes) else v)
+                    for k, v in self.redis_client.hgetall(VECTOR_INDEX_META_KEY).items()
+                }
+                self._state = {
+                    "active": int(raw.get("active") or 0),
+                    "building": int(raw["building"]) if raw.get("building") else None,
+                    "previous": int(raw["previous"]) if raw.get("previous") else None,
+                    "retired_at": float(raw["retired_at"]) if raw.get("retired_at") else None,
+                    "types": {int(k[5:]): v for k, v in raw.items() if k.startswith("type:")}
+                }
+                self._loaded_at = time.monotonic()
+            return self._state
+
+    def vector_type(self, version: int) -> str:
+        """版本的向量存储类型，未记录时（版本0）使用配置"""
+        return self.state()["types"].get(version) or db_config.vector_type
+
+    def begin_rebuild(self, vector_type: str = None) -> int:
+        """
+        创建新版本的空索引并开始双写
+
+        Args:
+            vector_type: 新版本的向量存储类型，不传时沿用当前版本
+
+        Returns:
+            int: 新版本号
+
+        Raises:
+            ValueError: 已有正在构建的版本或上一个版本尚未回收时抛出
+        """
+        state = self.state(fresh=True)
+        if state["building"] is not None:
+            raise ValueError(f"版本 {state['building']} 正在构建，先完成或放弃")
+        if state["previous"] is not None:
+            raise ValueError(f"旧版本 {state['previous']} 尚未回收")
+        version = state["active"] + 1
+        vector_type = check_vector_type(vector_type or self.vector_type(state["active"]))
+        # 残留的同名索引和键（例如上次放弃后未清理）先回收
+        self.drop_version(version)
+        create_vector_index(self.redis_client, vector_type, version)
+        self.redis_client.hset(VECTOR_INDEX_META_KEY, mapping={"building": version, f"type:{version}": vector_type})
+        self.state(fresh=True)
+        return version
+
+    def swap(self, version: int):
+        """
+        把检索别名原子切换到新版本，旧版本转为待回收
+
+        Args:
+            version: 构建完成的版本
+
+        Raises:
+            ValueError: 版本不是正在构建的版本时抛出
+        """
+        state = self.state(fresh=True)
+        if state["building"] != version:
+            raise ValueError(f"版本 {version} 不是正在构建的版本")
+        # FT.ALIASUPDATE 原子地把别名指向新索引，检索不中断
+        self.redis_client.ft(vector_index_name(version)).aliasupdate(db_config.vector_index_alias)
+        pipe = self.redis_client.pipeline(transaction=True)
+        pipe.hset(VECTOR_INDEX_META_KEY, mapping={
+            "active": version,
+            "previous": state["active"],
+            "retired_at": time.time()
+        })
+        pipe.hdel(VECTOR_INDEX_META_KEY, "building")
+        pipe.execute()
+        self.state(fresh=True)
+
+    def abort(self):
+        """放弃正在构建的版本，删除其索引和键"""
+        state = self.state(fresh=True)
+        if state["building"] is None:
+            return
+        self.redis_client.hdel(VECTOR_INDEX_META_KEY, "building")
+        self.drop_version(state["building"])
+        self.state(fresh=True)
+
+    def gc(self, force: bool = False) -> Optional[int]:
+        """
+        回收已下线的旧版本
+
+        Args:
+            force: 是否忽略保留时间立即回收
+
+        Returns:
+            Optional[int]: 回收的版本号，没有可回收的版本或未到保留时间时返回None
+        """
+        state = self.state(fresh=True)
+        version = state["previous"]
+        if version is None:
+            return None
+        if not force and time.time() - (state["retired_at"] or 0) < db_config.vector_index_gc_grace:
+            return None
+        self.drop_version(version)
+        self.redis_client.hdel(VECTOR_INDEX_META_KEY, "previous", "retired_at")
+        self.state(fresh=True)
+        return version
+
+    def drop_version(self, version: int, batch: int = 1000) -> int:
+        """
+        删除某个版本的索引（保留文档由下面逐批删除，避免一次阻塞Redis）和全部键
+
+        Returns:
+            int: 删除的键数量
+        """
+        try:
+            self.redis_client.ft(vector_index_name(version)).dropindex(delete_documents=False)
+        except Exception:
+            pass
+        deleted = 0
+        for prefix in vector_key_prefixes(version).values():
+            keys = []
+            for key in self.redis_client.scan_iter(match=f"{prefix}*", count=batch):
+                keys.append(key)
+                if len(keys) >= batch:
+                    deleted += self.redis_client.unlink(*keys)
+                    keys = []
+            if keys:
+                deleted += self.redis_client.unlink(*keys)
+        self.redis_client.hdel(VECTOR_INDEX_META_KEY, f"type:{version}")
+        return deleted
+
+
+class VersionedRedisVectorStore(VectorStore):
+    """
+    按索引版本路由的Redis向量存储
+
+    读取和检索走当前版本（检索通过别名），写入、刷新过期时间和删除同时作用于当前版本和正在构建的版本
+    """
+
+    def __init__(self, redis_client, on_evict: Callable[[List[str]], None] = None):
+        """
+        Args:
+            redis_client: Redis客户端
+            on_evict: 按预算逐出内容后的回调，参数为被逐出内容的用户
+        """
+        self.redis_client = redis_client
+        self.on_evict = on_evict
+        self.indexes = VectorIndexManager(redis_client)
+        self._stores: Dict[Tuple[int, str], RedisVectorStore] = {}
+
+    def store(self, version: int) -> RedisVectorStore:
+        """某个版本的存储实例"""
+        vector_type = self.indexes.vector_type(version)
+        key = (version, vector_type)
+        if key not in self._stores:
+            self._stores[key] = RedisVectorStore(
+                self.redis_client, version, vector_type, search_index=db_config.vector_index_alias,
+                on_evict=self.on_evict
+            )
+        return self._stores[key]
+
+    def active(self) -> RedisVectorStore:
+        """当前版本的存储实例"""
+        return self.store(self.indexes.state()["active"])
+
+    def _writers(self) -> List[RedisVectorStore]:
+        state = self.indexes.state()
+        versions = [state["active"]] + ([state["building"]] if state["building"] is not None else [])
+        return [self.store(version) for version in versions]
+
+    def get_meta(self, doc_id: str) -> Dict:
+        return self.active().get_meta(doc_id)
+
+    def get_metas(self, doc_ids: Sequence[str]) -> List[Dict]:
+        return self.active().get_metas(doc_ids)
+
+    def find_reusable(self, fingerprints: List[str], extra_fields: List[str]) -> List[Optional[Tuple[np.ndarray, Dict]]]:
+        return self.active().find_reusable(fingerprints, extra_fields)
+
+    def save(self, doc_id: str, user_id: str, chunks: List[Dict], fingerprints: List[str],
+             vectors: List[np.ndarray], raw_json: str, content_fingerprint: str,
+             todo_id: str = None, stale_chunk_count: int = 0, extras: List[Dict] = None) -> int:
+        results = [
+            store.save(doc_id, user_id, chunks, fingerprints, vectors, raw_json, content_fingerprint,
+                       todo_id, stale_chunk_count, extras)
+            for store in self._writers()
+        ]
+        return results[0]
+
+    def save_many(self, documents: List[Dict]) -> List[int]:
+        results = [store.save_many(documents) for store in self._writers()]
+        return results[0]
+
+    def touch(self, doc_id: str, chunk_count: int, raw_json: Optional[str] = None):
+        for store in self._writers():
+            store.touch(doc_id, chunk_count, raw_json)
+
+    def refresh(self, doc_ids: Sequence[str]):
+        for store in self._writers():
+            store.refresh(doc_ids)
+
+    def existing(self, doc_ids: Sequence[str]) -> set:
+        return self.active().existing(doc_ids)
+
+    def delete(self, user_id: str, doc_ids: Sequence[str] = (), todo_id: str = None) -> int:
+        results = [store.delete(user_id, doc_ids, todo_id) for store in self._writers()]
+        return results[0]
+
+    def count(self, user_id: str) -> int:
+        return self.active().count(user_id)
+
+    def usage(self, user_id: str = None) -> Dict:
+        return self.active().usage(user_id)
+
+    def search(self, query_vec: np.ndarray, user_id: str, knn: int, total: int = None,
+               ef_runtime: int = None, exact: bool = False) -> List[Dict]:
+        return self.active().search(query_vec, user_id, knn, total, ef_runtime, exact)
+
+    def search_global(self, query_vec: np.ndarray, knn: int, ef_runtime: int = None) -> List[Dict]:
+        return self.active().search_global(query_vec, knn, ef_runtime)
+
+    def search_lexical(self, terms: List[str], user_id: str, limit: int) -> List[Dict]:
+        return self.active().search_lexical(terms, user_id, limit)
+
+    def get_chunk_values(self, chunk_refs: List[Tuple[str, int]], field: str) -> List:
+        return self.active().get_chunk_values(chunk_refs, field)
+
+    def get_chunks(self, doc_id: str, chunk_count: int, with_vector: bool = False) -> List[Dict]:
+        return self.active().get_chunks(doc_id, chunk_count, with_vector)
@@ -0,0 +1,252 @@
+# 向量回填模块：MongoDB中的内容永久保存，Redis中的向量会过期或被内存预算逐出，
+# 找出向量已过期的内容、或重新被检索到的已逐出内容，从MongoDB重新构建索引文本并批量编码写回
+import threading
+from typing import Dict, Iterator, List, Optional
+from bson import ObjectId
+from config.database import db_client
+from config.settings import db_config
+
+# 构建索引文本只需要的字段
+CONTENT_PROJECTION = {
+    "_id": 1,
+    "user_id": 1,
+    "todo_id": 1,
+    "content": 1,
+    "extracted_content": 1,
+    "images": 1,
+    "files": 1,
+    "duplicate_of": 1,
+    "duplicate_mode": 1,
+    "index_status": 1
+}
+
+
+class VectorRehydrator:
+    """
+    向量回填
+
+    两种触发方式：检索时发现用户分块数少于内容数，按用户节流后在后台线程回填（惰性）；
+    或由 scripts.rehydrate_vectors 定时扫描全部内容（后台清扫）。
+    被内存预算逐出的内容保留元数据，不算缺失，只在重新被检索到时由 restore_async 恢复
+    """
+
+    def __init__(self, vector_service):
+        """
+        初始化向量回填
+
+        Args:
+            vector_service: 向量服务实例，负责编码和写入
+        """
+        self.vector_service = vector_service
+        self.redis_client = vector_service.redis_client
+        # 正在后台回填的用户，避免同一进程重复启动
+        self._running = set()
+        # 正在后台恢复的已逐出内容
+        self._restoring = set()
+        self._lock = threading.Lock()
+
+    def build_document(self, content: Dict) -> Optional[Dict]:
+        """
+        把MongoDB中的内容转成 index_documents 的输入，与新增内容时的索引文本和原始数据一致
+
+        Args:
+            content: todosContent 文档
+
+        Returns:
+            Optional[Dict]: doc_id/user_id/todo_id/text/raw_data，没有可索引的文本、异步入库尚未完成
+                或是链接到其他内容的近重复内容时返回None
+        """
+        if content.get("duplicate_mode") == "link":
+            return None
+        # 入库中的内容提取文本还不完整，由入库worker写入向量；入库失败的等待重试或重新入库
+        if content.get("index_status") not in (None, "indexed"):
+            return None
+        extracted = content.get("extracted_content") or {}
+        ocr_texts = extracted.get("ocr_texts") or []
+        file_texts = extracted.get("file_texts") or []
+        text = self.vector_service.build_index_text(content.get("content"), ocr_texts, file_texts)
+        if not text:
+            return None
+        raw_data = {
+            "images": content.get("images", []),
+            "files": content.get("files", []),
+            "has_ocr": len(ocr_texts) > 0,
+            "has_file_text": len(file_texts) > 0
+        }
+        if content.get("duplicate_mode") == "flag":
+            raw_data["duplicate_of"] = content.get("duplicate_of")
+        return {
+            "doc_id": str(content["_id"]),
+            "user_id": content.get("user_id"),
+            "todo_id": content.get("todo_id"),
+            "text": text,
+            "raw_data": raw_data
+        }
+
+    def iter_missing(self, user_id: str = None, batch_size: int = None) -> Iterator[List[Dict]]:
+        """
+        按批扫描MongoDB内容，产出向量已不存在的内容
+
+        Args:
+            user_id: 只扫描该用户，不传时扫描全部内容
+            batch_size: 每批检查的内容数量
+
+        Yields:
+            List[Dict]: 一批待回填的内容（build_document 的结果）
+        """
+        batch_size = batch_size or db_config.vector_rehydrate_batch_size
+        query = {"user_id": user_id} if user_id else {}
+        cursor = db_client.todosContent.find(query, CONTENT_PROJECTION).batch_size(batch_size)
+
+        batch = []
+        for content in cursor:
+            document = self.build_document(content)
+            if document is not None and document["user_id"]:
+                batch.append(document)
+            if len(batch) >= batch_size:
+                missing = self._filter_missing(batch)
+                if missing:
+                    yield missing
+                batch = []
+        missing = self._filter_missing(batch)
+        if missing:
+            yield missing
+
+    def _filter_missing(self, documents: List[Dict]) -> List[Dict]:
+        """一次批量查询过滤掉仍有向量的内容"""
+        if not documents:
+            return []
+        existing = self.vector_service.store.existing([document["doc_id"] for document in documents])
+        return [document for document in documents if document["doc_id"] not in existing]
+
+    def rehydrate(self, user_id: str = None, limit: int = None) -> Dict:
+        """
+        回填向量已过期的内容，每批的全部分块合并编码
+
+        Args:
+            user_id: 只回填该用户，不传时回填全部用户
+            limit: 最多回填的内容数量
+
+        Returns:
+            Dict: 统计信息 missing/rehydrated/chunks/failed
+        """
+        stats = {"missing": 0, "rehydrated": 0, "chunks": 0, "failed": 0}
+        for batch in self.iter_missing(user_id):
+            if limit is not None:
+                batch = batch[:max(0, limit - stats["missing"])]
+                if not batch:
+                    break
+            stats["missing"] += len(batch)
+            try:
+                counts = self.vector_service.index_documents(batch)
+            except Exception as e:
+                # 单批失败不影响后续批次
+                print(f"向量回填失败: {e}")
+                stats["failed"] += len(batch)
+                continue
+            for count in counts:
+                if count >= 0:
+                    stats["rehydrated"] += 1
+                    stats["chunks"] += count
+                else:
+                    stats["failed"] += 1
+        return stats
+
+    @staticmethod
+    def count_contents(user_id: str) -> int:
+        """用户在MongoDB中应有向量的内容数量（链接到其他内容的近重复内容没有自己的向量）"""
+        return db_client.todosContent.count_documents({"user_id": user_id, "duplicate_mode": {"$ne": "link"}})
+
+    def maybe_rehydrate(self, user_id: str, chunk_count: int) -> bool:
+        """
+        惰性回填：用户分块数少于内容数时在后台线程回填
+
+        同一用户在 vector_rehydrate_interval 内只检查一次（Redis SET NX 节流，多进程共享），
+        不阻塞当前检索
+
+        Args:
+            user_id: 用户ID
+            chunk_count: 用户当前的分块数量
+
+        Returns:
+            bool: 是否启动了回填
+        """
+        if not db_config.vector_lazy_rehydrate or not user_id:
+            return False
+        throttle_key = f"vector_rehydrate:{user_id}"
+        if not self.redis_client.set(throttle_key, 1, nx=True, ex=db_config.vector_rehydrate_interval):
+            return False
+
+        # 有文本的内容至少一个分块，分块数不少于内容数时认为没有过期；
+        # 纯图片内容没有向量会使检查偏保守，由节流限制重复扫描
+        if chunk_count >= self.count_contents(user_id):
+            return False
+
+        with self._lock:
+            if user_id in self._running:
+                return False
+            self._running.add(user_id)
+        threading.Thread(target=self._run, args=(user_id,), daemon=True).start()
+        return True
+
+    def _run(self, user_id: str):
+        """后台线程入口"""
+        try:
+            stats = self.rehydrate(user_id)
+            print(f"用户 {user_id} 向量回填完成: {stats}")
+        except Exception as e:
+            print(f"用户 {user_id} 向量回填异常: {e}")
+        finally:
+            with self._lock:
+                self._running.discard(user_id)
+
+    def restore(self, user_id: str, doc_ids: List[str]) -> int:
+        """
+        从MongoDB重新编码向量已被逐出的内容
+
+        Args:
+            user_id: 用户ID
+            doc_ids: 内容ID
+
+        Returns:
+            int: 恢复的内容数量
+        """
+        ids = [ObjectId(doc_id) for doc_id in doc_ids if ObjectId.is_valid(doc_id)]
+        if not ids:
+            return 0
+        contents = db_client.todosContent.find({"_id": {"$in": ids}, "user_id": user_id}, CONTENT_PROJECTION)
+        documents = [document for document in map(self.build_document, contents) if document is not None]
+        if not documents:
+            return 0
+        # 已被其他进程恢复的内容元数据不再带逐出标记，index_documents 只刷新不重新编码
+        return sum(1 for count in self.vector_service.index_documents(documents) if count >= 0)
+
+    def restore_async(self, user_id: str, doc_ids: List[str]) -> bool:
+        """
+        在后台线程恢复已逐出的内容，不阻塞当前检索
+
+        Args:
+            user_id: 用户ID
+            doc_ids: 内容ID
+
+        Returns:
+            bool: 是否启动了恢复
+        """
+        with self._lock:
+            doc_ids = [doc_id for doc_id in doc_ids if doc_id not in self._restoring]
+            if not doc_ids:
+                return False
+            self._restoring.update(doc_ids)
+        threading.Thread(target=self._run_restore, args=(user_id, doc_ids), daemon=True).start()
+        return True
+
+    def _run_restore(self, user_id: str, doc_ids: List[str]):
+        """后台恢复线程入口"""
+        try:
+            restored = self.restore(user_id, doc_ids)
+            print(f"用户 {user_id} 恢复已逐出的向量 {restored} 个内容")
+        except Exception as e:
+            print(f"用户 {user_id} 恢复已逐出的向量异常: {e}")
+        finally:
+            with self._lock:
+                self._restoring.difference_update(doc_ids)
@@ -0,0 +1,339 @@
+# 向量存储的Redis Lua脚本，把多步读写合并为一次往返的原子操作
+#
+# 分块键、元数据键等由调用方通过KEYS传入；按doc_id批量删除时键名需要在脚本内拼接，
+# 前缀通过ARGV传入，只适用于单实例Redis（非Cluster）
+#
+# 设置内存预算时，内存计量随写入、删除、逐出在脚本内原子更新（未设置预算时不维护：TTL过期删除的键无法扣除，
+# 计数只会增长；从TTL切换到预算前用 scripts.vector_usage --rebuild 按现有键重建）：
+#   {用量前缀}{user_id} / {用量前缀}_total  Hash  docs/chunks/bytes 为驻留向量的内容数、分块数、向量字节数，evicted 为已逐出的内容数
+#   {用量前缀}_users                       ZSet  user_id -> 驻留向量字节数
+#   {LRU前缀}{user_id}                     ZSet  驻留内容 doc_id -> 最近写入或被检索的时间（仅在设置内存预算时记录）
+# 内容元数据的 bytes 字段记录该内容计入的字节数，计量之前或未设置预算时写入的内容没有该字段，删除时不扣除
+
+# 原子写入内容：校验归属后重写元数据与全部分块，删除多余旧分块，登记指纹索引和Todo集合，更新内存计量
+# KEYS: [元数据键, 分块键..., 待删除键..., 指纹索引键..., 用户用量键, 全局用量键, 用户用量排行键, 用户LRU键, (Todo集合键)]
+# ARGV: [user_id, ttl, 哈希数量(元数据+分块), 待删除键数量, 指纹索引数量, 是否有Todo集合, doc_id,
+#        仅在不存在时写入, 向量字节数, LRU时间戳(0为未设置内存预算，不计量也不记录LRU), 是否已逐出, (字段值个数, 字段, 值, ...) * 哈希数量, 指纹索引值...]
+# 已逐出的内容（索引重建时复制的无向量内容）只计入 evicted，不计入驻留用量和LRU
+# 返回: 写入的分块数量，归属其他用户时返回-1，要求不存在但元数据已存在时返回-2（索引重建复制时不覆盖双写的新数据）
+WRITE_DOC = """
+local owner = redis.call('HGET', KEYS[1], 'user_id')
+if owner and owner ~= ARGV[1] then
+    return -1
+end
+if owner and ARGV[8] == '1' then
+    return -2
+end
+local old = redis.call('HMGET', KEYS[1], 'chunks', 'bytes', 'evicted')
+local ttl = tonumber(ARGV[2])
+local n_hashes = tonumber(ARGV[3])
+local n_stale = tonumber(ARGV[4])
+local n_pointers = tonumber(ARGV[5])
+local has_todo = tonumber(ARGV[6])
+local n_bytes = tonumber(ARGV[9])
+local now = tonumber(ARGV[10])
+local evicted = ARGV[11] == '1'
+local pos = 12
+local k = 1
+for i = 1, n_hashes do
+    local n_items = tonumber(ARGV[pos])
+    redis.call('DEL', KEYS[k])
+    redis.call('HSET', KEYS[k], unpack(ARGV, pos + 1, pos + n_items))
+    if ttl > 0 then
+        redis.call('EXPIRE', KEYS[k], ttl)
+    end
+    pos = pos + n_items + 1
+    k = k + 1
+end
+for i = 1, n_stale do
+    redis.call('DEL', KEYS[k])
+    k = k + 1
+end
+for i = 1, n_pointers do
+    if ttl > 0 then
+        redis.call('SET', KEYS[k], ARGV[pos], 'EX', ttl)
+    else
+        redis.call('SET', KEYS[k], ARGV[pos])
+    end
+    pos = pos + 1
+    k = k + 1
+end
+local usage_keys = {KEYS[k], KEYS[k + 1]}
+local users_key = KEYS[k + 2]
+local lru_key = KEYS[k + 3]
+k = k + 4
+if now > 0 then
+    -- 覆盖写入时先扣除旧内容计入的用量
+    if owner and old[2] then
+        if old[3] == '1' then
+            for _, key in ipairs(usage_keys) do
+                redis.call('HINCRBY', key, 'evicted', -1)
+            end
+        else
+            for _, key in ipairs(usage_keys) do
+                redis.call('HINCRBY', key, 'docs', -1)
+                redis.call('HINCRBY', key, 'chunks', -(tonumber(old[1]) or 0))
+                redis.call('HINCRBY', key, 'bytes', -tonumber(old[2]))
+            end
+            redis.call('ZINCRBY', users_key, -tonumber(old[2]), ARGV[1])
+        end
+    end
+    if evicted then
+        for _, key in ipairs(usage_keys) do
+            redis.call('HINCRBY', key, 'evicted', 1)
+        end
+    else
+        for _, key in ipairs(usage_keys) do
+            redis.call('HINCRBY', key, 'docs', 1)
+            redis.call('HINCRBY', key, 'chunks', n_hashes - 1)
+            redis.call('HINCRBY', key, 'bytes', n_bytes)
+        end
+        redis.call('ZINCRBY', users_key, n_bytes, ARGV[1])
+        redis.call('ZADD', lru_key, now, ARGV[7])
+    end
+end
+if has_todo == 1 then
+    redis.call('SADD', KEYS[k], ARGV[7])
+    if ttl > 0 then
+        redis.call('EXPIRE', KEYS[k], ttl)
+    end
+end
+return n_hashes - 1
+"""
+
+# 批量删除内容：逐个校验归属后删除元数据、全部分块、指向这些分块的指纹索引、旧版单向量键，
+# 移出Todo集合和LRU，设置内存预算时扣除计入的用量
+# KEYS: [(Todo集合键)]，传入时集合内的全部doc_id一并删除
+# ARGV: [user_id, 分块键前缀, 元数据键前缀, Todo集合键前缀, 指纹索引键前缀, 用量键前缀, LRU键前缀, 是否计量, doc_id...]
+# 返回: 删除的内容数量
+DELETE_DOCS = """
+local user_id = ARGV[1]
+local chunk_prefix = ARGV[2]
+local doc_prefix = ARGV[3]
+local todo_prefix = ARGV[4]
+local fp_prefix = ARGV[5]
+local usage_prefix = ARGV[6]
+local lru_key = ARGV[7] .. user_id
+local metered = ARGV[8] == '1'
+local usage_keys = {usage_prefix .. user_id, usage_prefix .. '_total'}
+local doc_ids = {}
+for i = 9, #ARGV do
+    doc_ids[#doc_ids + 1] = ARGV[i]
+end
+if KEYS[1] then
+    for _, doc_id in ipairs(redis.call('SMEMBERS', KEYS[1])) do
+        doc_ids[#doc_ids + 1] = doc_id
+    end
+end
+local deleted = 0
+local seen = {}
+for _, doc_id in ipairs(doc_ids) do
+    if not seen[doc_id] then
+        seen[doc_id] = true
+        local doc_key = doc_prefix .. doc_id
+        local legacy_key = chunk_prefix .. doc_id
+        local meta = redis.call('HMGET', doc_key, 'user_id', 'chunks', 'todo_id', 'bytes', 'evicted')
+        local owner = meta[1]
+        if not owner then
+            owner = redis.call('HGET', legacy_key, 'user_id')
+        end
+        if owner == user_id then
+            local n_chunks = tonumber(meta[2]) or 0
+            for i = 0, n_chunks - 1 do
+                local chunk_key = chunk_prefix .. doc_id .. ':' .. i
+                local fingerprint = redis.call('HGET', chunk_key, 'fingerprint')
+                if fingerprint and redis.call('GET', fp_prefix .. fingerprint) == chunk_key then
+                    redis.call('DEL', fp_prefix .. fingerprint)
+                end
+                redis.call('DEL', chunk_key)
+            end
+            redis.call('DEL', doc_key, legacy_key)
+            if meta[3] then
+                redis.call('SREM', todo_prefix .. meta[3], doc_id)
+            end
+            if metered and meta[4] then
+                if meta[5] == '1' then
+                    for _, key in ipairs(usage_keys) do
+                        redis.call('HINCRBY', key, 'evicted', -1)
+                    end
+                else
+                    for _, key in ipairs(usage_keys) do
+                        redis.call('HINCRBY', key, 'docs', -1)
+                        redis.call('HINCRBY', key, 'chunks', -n_chunks)
+                        redis.call('HINCRBY', key, 'bytes', -tonumber(meta[4]))
+                    end
+                    if tonumber(redis.call('ZINCRBY', usage_prefix .. '_users', -tonumber(meta[4]), user_id)) <= 0 then
+                        redis.call('ZREM', usage_prefix .. '_users', user_id)
+                    end
+                end
+            end
+            redis.call('ZREM', lru_key, doc_id)
+            deleted = deleted + 1
+        end
+    end
+end
+return deleted
+"""
+
+# 按指纹读取可复用的向量：指纹索引指向的分块指纹一致时返回其向量及附加字段（词汇权重等）
+# KEYS: [指纹索引键...]
+# ARGV: [附加字段数量, 附加字段名..., 指纹...]
+# 返回: 与KEYS逐项对应的 [向量字节, 附加字段值...]，未命中为空
+REUSE_VECTORS = """
+local n_extra = tonumber(ARGV[1])
+local fields = {'fingerprint', 'vector'}
+for i = 1, n_extra do
+    fields[#fields + 1] = ARGV[1 + i]
+end
+local result = {}
+for i, pointer_key in ipairs(KEYS) do
+    local row = false
+    local chunk_key = redis.call('GET', pointer_key)
+    if chunk_key then
+        local stored = redis.call('HMGET', chunk_key, unpack(fields))
+        if stored[1] == ARGV[1 + n_extra + i] and stored[2] then
+            row = {}
+            for j = 2, #fields do
+                row[#row + 1] = stored[j]
+            end
+        end
+    end
+    result[i] = row
+end
+return result
+"""
+
+# 滑动过期与LRU：刷新内容元数据、全部分块、旧版单向量键、所属Todo集合和分块指纹索引的过期时间，
+# 并更新驻留内容在所属用户LRU中的时间（已逐出的内容不在LRU中，不会被加回）
+# KEYS: []
+# ARGV: [ttl(0为不刷新过期时间), 分块键前缀, 元数据键前缀, Todo集合键前缀, 指纹索引键前缀,
+#        LRU键前缀, LRU时间戳(0为不记录), doc_id...]
+# 返回: 刷新的内容数量
+REFRESH_DOCS = """
+local ttl = tonumber(ARGV[1])
+local chunk_prefix = ARGV[2]
+local doc_prefix = ARGV[3]
+local todo_prefix = ARGV[4]
+local fp_prefix = ARGV[5]
+local lru_prefix = ARGV[6]
+local now = tonumber(ARGV[7])
+local refreshed = 0
+for i = 8, #ARGV do
+    local doc_id = ARGV[i]
+    local meta = redis.call('HMGET', doc_prefix .. doc_id, 'chunks', 'todo_id', 'user_id')
+    if meta[3] then
+        refreshed = refreshed + 1
+        if now > 0 then
+            redis.call('ZADD', lru_prefix .. meta[3], 'XX', now, doc_id)
+        end
+        if ttl > 0 then
+            redis.call('EXPIRE', doc_prefix .. doc_id, ttl)
+            for j = 0, (tonumber(meta[1]) or 0) - 1 do
+                local chunk_key = chunk_prefix .. doc_id .. ':' .. j
+                local fingerprint = redis.call('HGET', chunk_key, 'fingerprint')
+                redis.call('EXPIRE', chunk_key, ttl)
+                if fingerprint then
+                    redis.call('EXPIRE', fp_prefix .. fingerprint, ttl)
+                end
+            end
+            if meta[2] then
+                redis.call('EXPIRE', todo_prefix .. meta[2], ttl)
+            end
+        end
+    elseif ttl > 0 and redis.call('EXPIRE', chunk_prefix .. doc_id, ttl) == 1 then
+        refreshed = refreshed + 1
+    end
+end
+return refreshed
+"""
+
+# 按内存预算逐出向量：用户超出预算时逐出其最久未被检索的内容，全局超出预算时从用量最大的用户开始逐出。
+# 逐出只删除分块的向量、缩放系数和ColBERT向量（RediSearch随之把分块移出向量索引）以及指向它们的指纹索引，
+# 文本和词汇字段保留，词汇检索仍能命中；元数据标记 evicted=1，重新相关时从MongoDB重新编码
+# KEYS: []
+# ARGV: [用户预算字节(0为不限), 全局预算字节(0为不限), 本次最多逐出的内容数量,
+#        分块键前缀, 元数据键前缀, 指纹索引键前缀, 用量键前缀, LRU键前缀, user_id...]
+# 返回: [逐出的内容数量, 释放的字节数, 达到数量上限时为1（调用方继续调用）, 被逐出内容的user_id列表]
+EVICT_DOCS = """
+local user_budget = tonumber(ARGV[1])
+local global_budget = tonumber(ARGV[2])
+local limit = tonumber(ARGV[3])
+local chunk_prefix = ARGV[4]
+local doc_prefix = ARGV[5]
+local fp_prefix = ARGV[6]
+local usage_prefix = ARGV[7]
+local lru_prefix = ARGV[8]
+local total_key = usage_prefix .. '_total'
+local users_key = usage_prefix .. '_users'
+local evicted = 0
+local freed = 0
+local users = {}
+local evicted_users = {}
+
+-- 逐出用户LRU中最早的内容，LRU为空时返回false；已删除或已逐出的内容只移出LRU
+local function evict_oldest(user_id)
+    local lru_key = lru_prefix .. user_id
+    local oldest = redis.call('ZRANGE', lru_key, 0, 0)
+    if not oldest[1] then
+        return false
+    end
+    local doc_id = oldest[1]
+    redis.call('ZREM', lru_key, doc_id)
+    local doc_key = doc_prefix .. doc_id
+    local meta = redis.call('HMGET', doc_key, 'user_id', 'chunks', 'bytes', 'evicted')
+    if meta[1] ~= user_id or not meta[3] or meta[4] == '1' then
+        return true
+    end
+    local n_chunks = tonumber(meta[2]) or 0
+    local n_bytes = tonumber(meta[3])
+    for j = 0, n_chunks - 1 do
+        local chunk_key = chunk_prefix .. doc_id .. ':' .. j
+        local fingerprint = redis.call('HGET', chunk_key, 'fingerprint')
+        if fingerprint and redis.call('GET', fp_prefix .. fingerprint) == chunk_key then
+            redis.call('DEL', fp_prefix .. fingerprint)
+        end
+        redis.call('HDEL', chunk_key, 'vector', 'vector_scale', 'colbert')
+    end
+    redis.call('HSET', doc_key, 'evicted', 1)
+    for _, key in ipairs({usage_prefix .. user_id, total_key}) do
+        redis.call('HINCRBY', key, 'docs', -1)
+        redis.call('HINCRBY', key, 'chunks', -n_chunks)
+        redis.call('HINCRBY', key, 'bytes', -n_bytes)
+        redis.call('HINCRBY', key, 'evicted', 1)
+    end
+    if tonumber(redis.call('ZINCRBY', users_key, -n_bytes, user_id)) <= 0 then
+        redis.call('ZREM', users_key, user_id)
+    end
+    evicted = evicted + 1
+    freed = freed + n_bytes
+    if not users[user_id] then
+        users[user_id] = true
+        table.insert(evicted_users, user_id)
+    end
+    return true
+end
+
+if user_budget > 0 then
+    for i = 9, #ARGV do
+        local usage_key = usage_prefix .. ARGV[i]
+        while evicted < limit and (tonumber(redis.call('HGET', usage_key, 'bytes')) or 0) > user_budget do
+            if not evict_oldest(ARGV[i]) then
+                break
+            end
+        end
+    end
+end
+if global_budget > 0 then
+    while evicted < limit and (tonumber(redis.call('HGET', total_key, 'bytes')) or 0) > global_budget do
+        local top = redis.call('ZREVRANGE', users_key, 0, 0)
+        if not top[1] then
+            break
+        end
+        if not evict_oldest(top[1]) then
+            -- 没有可逐出内容的用户（计量之前写入的数据）移出排行，避免反复选中
+            redis.call('ZREM', users_key, top[1])
+        end
+    end
+end
+return {evicted, freed, evicted >= limit and 1 or 0, evicted_users}
+"""
@@ -1,14 +1,55 @@
 # 向量服务层，处理向量嵌入和搜索相关的业务逻辑
 import os
+import base64
+import hashlib
 import numpy as np
 from typing import List, Tuple, Dict, Optional
-from FlagEmbedding import BGEM3FlagModel
 from models.base import BaseModel
-from config.database import cache_client, db_client
-from config.settings import ai_config,db_config
+from config.database import cache_client, db_client, shard_map
+from config.settings import ai_config,db_config,rag_config
 import json
+from services.embedding_batcher import EmbeddingBatcher
+from services.embedding_cache import EmbeddingCache, normalize_query
+from services.embedding_worker import RemoteEncoder, load_encoder
+from services.search_cache import SearchResultCache
+from services.near_duplicate import NearDuplicateIndex
+from services.vector_store import VectorStore
+from services.vector_index import VersionedRedisVectorStore
+from services.sharded_vector_store import ShardedVectorStore
+from services.mmap_vector_store import MmapVectorStore
+from services.vector_rehydrator import VectorRehydrator
 from utils.decorators import singleton
 
+# 压缩存储的词汇权重：token_id + 半精度权重
+LEXICAL_DTYPE = np.dtype([("id", "<u4"), ("w", "<f2")])
+# 支持的检索模式
+SEARCH_MODES = ("dense", "hybrid")
+# 检索精度档位
+SEARCH_PROFILES = ("fast", "balanced", "exact")
+
+
+def build_index_text(content: str, ocr_texts: List[str] = None, file_texts: List[str] = None) -> str:
+    """
+    合并用户输入、OCR文本和文档文本，作为向量化的完整文本
+    
+    Args:
+        content: 用户输入的内容
+        ocr_texts: OCR文本列表
+        file_texts: 文档文本列表
+        
+    Returns:
+        str: 合并后的文本
+    """
+    parts = []
+    if content:
+        parts.append(content)
+    if ocr_texts:
+        parts.extend(ocr_texts)
+    if file_texts:
+        parts.extend(file_texts)
+    return "\n\n".join(parts).strip()
+
+
 @singleton
 class VectorService(BaseModel):
     """向量服务类"""
@@ -20,75 +61,278 @@ class VectorService(BaseModel):
             # super().__init__(db_client.vector)
             #导入实例
             self.redis_client = cache_client.client
-            self.vector_ttl = db_config.redis_vector_ttl
+            # 分块向量的存储与检索
+            self.store = self._load_store()
+            # 向量过期后从MongoDB回填
+            self.rehydrator = VectorRehydrator(self)
+            # 设置向量内存预算时，超出预算的内容只保留文本和词汇字段，重新被检索到时在后台重新编码
+            self.memory_budget = db_config.vector_user_budget_mb > 0 or db_config.vector_global_budget_mb > 0
 
             # 设置HuggingFace镜像
             os.environ['HF_ENDPOINT'] = ai_config.hf_endpoint
             
             # 加载向量模型
-            self._model = BGEM3FlagModel(ai_config.model_name, use_fp16=True)
+            self._model = self._load_model()
             print('向量模型加载成功')
+            
+            # 并发的小批量编码请求通过微批处理器合并
+            self._batcher = None
+            if ai_config.embed_batching:
+                self._batcher = EmbeddingBatcher(
+                    self._encode_direct,
+                    max_batch_size=ai_config.embed_batch_max_size,
+                    max_wait_ms=ai_config.embed_batch_max_wait_ms,
+                    length_buckets=ai_config.embed_batch_buckets
+                )
+            
+            # 查询向量两级缓存
+            self.query_cache = EmbeddingCache(
+                self.redis_client,
+                namespace="qvec",
+                model_name=ai_config.model_name,
+                max_entries=ai_config.query_cache_size,
+                ttl=db_config.redis_query_vector_ttl
+            )
+            
+            # 检索结果缓存，按用户写入纪元失效
+            self.result_cache = SearchResultCache(
+                self.redis_client,
+                namespace="search",
+                ttl=rag_config.search_result_cache_ttl
+            )
+            
+            # 入库时的近重复检测索引（MinHash LSH，按用户划分）
+            self.near_duplicates = NearDuplicateIndex(self.redis_client)
     
-    def encode_dense(self, texts: List[str], batch_size: int = 8, max_length: int = 2048) -> np.ndarray:
+    def _load_store(self) -> VectorStore:
         """
-        稠密向量编码，用于语义搜索
+        按配置加载向量存储
+        
+        Returns:
+            VectorStore: redis 为Redis Stack（HNSW索引，按索引版本路由，多分片时按用户路由），mmap 为进程内内存映射矩阵（精确检索）
+            
+        Raises:
+            ValueError: 存储类型不支持时抛出
+        """
+        if db_config.vector_store == "redis":
+            # 配置了多个向量分片时按用户路由；预算逐出后使被逐出用户的检索结果缓存失效
+            if len(shard_map) > 1:
+                return ShardedVectorStore(shard_map, on_evict=self._on_evict)
+            return VersionedRedisVectorStore(self.redis_client, on_evict=self._on_evict)
+        if db_config.vector_store == "mmap":
+            return MmapVectorStore(db_config.mmap_store_dir, db_config.vector_dim)
+        raise ValueError(f"不支持的向量存储: {db_config.vector_store}")
+    
+    def _on_evict(self, user_ids: List[str]):
+        """预算逐出了内容，使这些用户的检索结果缓存失效"""
+        self.result_cache.bump(user_ids)
+    
+    @staticmethod
+    def _load_model():
+        """
+        按配置加载编码模型
+        
+        配置了 EMBEDDING_WORKER 时连接独立编码进程，本进程只加载分词器；
+        否则在本进程按后端加载模型
+        
+        Returns:
+            BGEM3FlagModel / OnnxBGEM3Encoder / RemoteEncoder，三者的 encode()/tokenizer 用法一致
+            
+        Raises:
+            ValueError: 后端不支持时抛出
+        """
+        if ai_config.embedding_worker:
+            return RemoteEncoder(
+                [address.strip() for address in ai_config.embedding_worker.split(",") if address.strip()],
+                ai_config.embedding_worker_authkey,
+                connections=ai_config.embedding_worker_connections,
+                fallback=ai_config.embedding_worker_fallback
+            )
+        return load_encoder()
+    
+    def _encode(self, texts: List[str], batch_size: int = 8, max_length: int = 2048, options: Tuple = ()) -> List:
+        """
+        编码入口：小批量请求交给微批处理器与其他线程的请求合并编码，大批量请求直接编码
         
         Args:
             texts: 文本列表
             batch_size: 批处理大小
             max_length: 最大文本长度
+            options: 编码选项，可包含"sparse"（词汇权重）和"colbert"（ColBERT多向量）
             
         Returns:
-            np.ndarray: 稠密向量数组
+            List: 逐行编码结果，无选项时为稠密向量，有选项时为 {"dense", "sparse", "colbert"} 字典
         """
-        if not texts:
-            return np.zeros((0, 1))
-        
+        if self._batcher is not None and len(texts) <= self._batcher.max_batch_size:
+            return self._batcher.encode(texts, max_length, options)
+        return self._encode_direct(texts, batch_size, max_length, options)
+    
+    def _encode_direct(self, texts: List[str], batch_size: int = 8, max_length: int = 2048,
+                       options: Tuple = ()) -> List:
+        """直接调用模型编码，稠密向量、词汇权重和ColBERT向量在同一次前向计算中得到"""
+        return_sparse = "sparse" in options
+        return_colbert = "colbert" in options
         out = self._model.encode(
             texts,
             batch_size=batch_size,
             max_length=max_length,
             return_dense=True,
-            return_sparse=False,
-            return_colbert_vecs=False
+            return_sparse=return_sparse,
+            return_colbert_vecs=return_colbert
         )
-        return np.array(out["dense_vecs"])
-    
-    # def encode_sparse(self, texts: List[str]) -> List[Dict]:
-    #     """
-    #     稀疏向量编码，输出字典格式
-        
-    #     Args:
-    #         texts: 文本列表
-            
-    #     Returns:
-    #         List[Dict]: 稀疏向量字典列表
-    #     """
-    #     out = self._model.encode(
-    #         texts,
-    #         return_dense=False,
-    #         return_sparse=True,
-    #         return_colbert_vecs=False
-    #     )
-    #     return out["lexical_weights"]
-    
-    # def encode_colbert(self, texts: List[str]) -> List[np.ndarray]:
-    #     """
-    #     ColBERT多向量编码，用于精细匹配
-        
-    #     Args:
-    #         texts: 文本列表
-            
-    #     Returns:
-    #         List[np.ndarray]: ColBERT向量列表
-    #     """
-    #     out = self._model.encode(
-    #         texts,
-    #         return_dense=False,
-    #         return_sparse=False,
-    #         return_colbert_vecs=True
-    #     )
-    #     return out["colbert_vecs"]
+        dense_vecs = list(np.array(out["dense_vecs"]))
+        if not options:
+            return dense_vecs
+        rows = [{"dense": vector} for vector in dense_vecs]
+        if return_sparse:
+            for row, weights in zip(rows, out["lexical_weights"]):
+                row["sparse"] = weights
+        if return_colbert:
+            for row, vecs in zip(rows, out["colbert_vecs"]):
+                row["colbert"] = np.asarray(vecs, dtype=np.float32)
+        return rows
+    
+    def encode_dense(self, texts: List[str], batch_size: int = 8, max_length: int = 2048) -> np.ndarray:
+        """
+        稠密向量编码，用于语义搜索
+        
+        Args:
+            texts: 文本列表
+            batch_size: 批处理大小
+            max_length: 最大文本长度
+            
+        Returns:
+            np.ndarray: 稠密向量数组
+        """
+        if not texts:
+            return np.zeros((0, 1))
+        return np.array(self._encode(texts, batch_size, max_length))
+    
+    def encode_multi(self, texts: List[str], sparse: bool = False, colbert: bool = False,
+                     batch_size: int = 8, max_length: int = 2048) -> List[Dict]:
+        """
+        一次前向计算得到稠密向量以及可选的词汇权重、ColBERT向量
+        
+        Args:
+            texts: 文本列表
+            sparse: 是否返回词汇权重
+            colbert: 是否返回ColBERT多向量
+            batch_size: 批处理大小
+            max_length: 最大文本长度
+            
+        Returns:
+            List[Dict]: 逐行 {"dense": 向量, "sparse": {token_id: weight}, "colbert": (token数, 维度)数组}
+        """
+        if not texts:
+            return []
+        options = tuple(name for name, enabled in (("sparse", sparse), ("colbert", colbert)) if enabled)
+        if not options:
+            return [{"dense": vector} for vector in self._encode(texts, batch_size, max_length)]
+        return self._encode(texts, batch_size, max_length, options)
+    
+    def encode_hybrid(self, texts: List[str], batch_size: int = 8,
+                      max_length: int = 2048) -> Tuple[np.ndarray, List[Dict]]:
+        """
+        稠密向量 + 词汇权重编码，两者来自同一次前向计算
+        
+        Args:
+            texts: 文本列表
+            batch_size: 批处理大小
+            max_length: 最大文本长度
+            
+        Returns:
+            Tuple[np.ndarray, List[Dict]]: (稠密向量数组, 词汇权重字典列表 {token_id: weight})
+        """
+        if not texts:
+            return np.zeros((0, 1)), []
+        rows = self.encode_multi(texts, sparse=True, batch_size=batch_size, max_length=max_length)
+        return np.array([row["dense"] for row in rows]), [row["sparse"] for row in rows]
+    
+    def encode_sparse(self, texts: List[str]) -> List[Dict]:
+        """
+        稀疏向量编码，输出字典格式
+        
+        Args:
+            texts: 文本列表
+            
+        Returns:
+            List[Dict]: 稀疏向量字典列表
+        """
+        return self.encode_hybrid(texts)[1]
+    
+    def encode_colbert(self, texts: List[str]) -> List[np.ndarray]:
+        """
+        ColBERT多向量编码，用于精细匹配
+        
+        Args:
+            texts: 文本列表
+            
+        Returns:
+            List[np.ndarray]: ColBERT向量列表
+        """
+        return [row["colbert"] for row in self.encode_multi(texts, colbert=True)]
+    
+    def encode_query(self, query: str, with_lexical: bool = False, with_colbert: bool = False) -> Dict:
+        """
+        查询向量编码，先查缓存，未命中再编码并回填
+        
+        稠密向量和词汇权重都有缓存，需要词汇权重时两者都命中才跳过编码；
+        ColBERT向量不缓存，需要时与稠密向量、词汇权重一次编码得到
+        
+        Args:
+            query: 查询文本
+            with_lexical: 是否同时返回词汇权重
+            with_colbert: 是否同时返回ColBERT向量
+            
+        Returns:
+            Dict: {"dense": 查询向量, "sparse": 词汇权重, "colbert": ColBERT向量}，未请求的项为None
+        """
+        query = normalize_query(query)
+        if not with_colbert:
+            sparse = None
+            vector = self.query_cache.get(query)
+            if vector is not None and with_lexical:
+                sparse = self.query_cache.get_weights(query)
+            if vector is not None and (sparse is not None or not with_lexical):
+                return {"dense": vector, "sparse": sparse, "colbert": None}
+        
+        if not with_lexical and not with_colbert:
+            vector = self.encode_dense([query])[0].astype(np.float32)
+            self.query_cache.set(query, vector)
+            return {"dense": vector, "sparse": None, "colbert": None}
+        
+        row = self.encode_multi([query], sparse=with_lexical, colbert=with_colbert)[0]
+        vector = np.asarray(row["dense"], dtype=np.float32)
+        self.query_cache.set(query, vector)
+        if with_lexical:
+            self.query_cache.set_weights(query, row["sparse"])
+        return {"dense": vector, "sparse": row.get("sparse"), "colbert": row.get("colbert")}
+    
+    def metrics(self, user_id: str) -> Dict:
+        """
+        获取向量服务指标，只读取已有的统计，不会加载模型
+        
+        Args:
+            user_id: 请求的用户ID，向量内存计量只返回该用户的
+            
+        Returns:
+            Dict: 各组件的运行指标
+        """
+        worker = {"enabled": False}
+        if isinstance(self._model, RemoteEncoder):
+            # 工作进程地址不对外暴露
+            worker = {key: value for key, value in self._model.stats().items() if key != "addresses"}
+        return {
+            "embedding_batcher": self._batcher.stats() if self._batcher is not None else {"enabled": False},
+            "embedding_worker": worker,
+            "query_cache": self.query_cache.stats(),
+            "result_cache": self.result_cache.stats() if rag_config.search_result_cache else {"enabled": False},
+            "vector_usage": {
+                **self.store.usage(user_id),
+                "user_budget_mb": db_config.vector_user_budget_mb,
+                "global_budget_mb": db_config.vector_global_budget_mb
+            }
+        }
     
     @staticmethod
     def cosine_similarity(a: np.ndarray, b: np.ndarray) -> float:
@@ -107,176 +351,827 @@ class VectorService(BaseModel):
             return 0.0
         return float(np.dot(a, b) / (np.linalg.norm(a) * np.linalg.norm(b)))
     
-    def save_embedding(self, doc_id: str, user_id: str, text: str, raw_data: Dict = None) -> Dict:
+    def chunk_text(self, text: str) -> List[Dict]:
         """
-        保存向量嵌入到数据库
+        按token切分长文本，相邻分块之间保留重叠，避免超长文本被截断
+        
+        Args:
+            text: 原始文本
+            
+        Returns:
+            List[Dict]: 分块列表，每块包含 text/start/end（start/end为原文字符偏移）
+        """
+        if not text:
+            return []
+        
+        chunk_tokens = ai_config.chunk_tokens
+        overlap = min(ai_config.chunk_overlap, chunk_tokens - 1)
+        
+        # 借助快速分词器的offset_mapping把token窗口映射回原文字符区间
+        encoded = self._model.tokenizer(
+            text,
+            add_special_tokens=False,
+            return_offsets_mapping=True,
+            verbose=False
+        )
+        offsets = encoded["offset_mapping"]
+        if len(offsets) <= chunk_tokens:
+            return [{"text": text, "start": 0, "end": len(text)}]
+        
+        chunks = []
+        step = chunk_tokens - overlap
+        for i in range(0, len(offsets), step):
+            window = offsets[i:i + chunk_tokens]
+            is_last = i + chunk_tokens >= len(offsets)
+            # 首块从0开始、末块到文本结尾，保证分块覆盖全文
+            start = 0 if i == 0 else window[0][0]
+            end = len(text) if is_last else window[-1][1]
+            chunks.append({"text": text[start:end], "start": start, "end": end})
+            if is_last:
+                break
+        return chunks
+    
+    def _get_doc_meta(self, doc_id: str, user_id: str = None) -> Dict:
+        """
+        获取内容级元数据
+        
+        Args:
+            doc_id: 文档ID
+            user_id: 归属用户，传入时只查该用户所在的分片
+            
+        Returns:
+            Dict: user_id/chunks/fingerprint/raw/todo_id，不存在时user_id为None
+        """
+        store = self.store.for_user(user_id) if user_id else self.store
+        return store.get_meta(doc_id)
+    
+    def _get_doc_owner(self, doc_id: str) -> Tuple[Optional[str], int]:
+        """
+        获取内容的归属用户和分块数量
+        
+        Args:
+            doc_id: 文档ID
+            
+        Returns:
+            Tuple[Optional[str], int]: (用户ID, 分块数量)，不存在时返回 (None, 0)
+        """
+        meta = self._get_doc_meta(doc_id)
+        return meta["user_id"], meta["chunks"]
+    
+    def fingerprint(self, text: str) -> str:
+        """
+        文本指纹：模型名 + 文本的sha256
+        
+        Args:
+            text: 文本
+            
+        Returns:
+            str: 十六进制指纹
+        """
+        return hashlib.sha256(f"{ai_config.model_name}\x00{text}".encode("utf-8")).hexdigest()
+    
+    def _content_fingerprint(self, text: str) -> str:
+        """内容级指纹，分块参数变化后需要重新分块，因此一并参与计算"""
+        return self.fingerprint(f"{ai_config.chunk_tokens}:{ai_config.chunk_overlap}\x00{text}")
+    
+    # 模块级函数供不构造服务实例的脚本使用，这里保留实例上的调用方式
+    build_index_text = staticmethod(build_index_text)
+    
+    def _compact_lexical(self, weights: Dict) -> Dict:
+        """
+        把词汇权重压缩为可存储的字段
+        
+        只保留权重最高的若干token：lex 为 "t{token_id}" 空格分隔的词项，
+        供RediSearch按词项召回；lex_w 为 (token_id uint32, weight float16) 数组的base64
+        
+        Args:
+            weights: 词汇权重 {token_id: weight}
+            
+        Returns:
+            Dict: {"lex": 词项, "lex_w": 权重}
+        """
+        items = sorted(
+            ((int(token), float(weight)) for token, weight in weights.items() if float(weight) > 0),
+            key=lambda item: item[1],
+            reverse=True
+        )[:ai_config.lexical_max_terms]
+        packed = np.array(items, dtype=LEXICAL_DTYPE)
+        return {
+            "lex": " ".join(f"t{token}" for token, _ in items),
+            "lex_w": base64.b64encode(packed.tobytes()).decode("ascii")
+        }
+    
+    @staticmethod
+    def _lexical_score(query_weights: Dict, lex_w: str) -> float:
+        """
+        BGE-M3词汇匹配分数：共同token的权重乘积之和
+        
+        Args:
+            query_weights: 查询词汇权重 {token_id: weight}
+            lex_w: 分块存储的压缩权重
+            
+        Returns:
+            float: 词汇匹配分数
+        """
+        if not lex_w:
+            return 0.0
+        packed = np.frombuffer(base64.b64decode(lex_w), dtype=LEXICAL_DTYPE)
+        return float(sum(
+            float(query_weights.get(str(token), 0.0)) * float(weight)
+            for token, weight in zip(packed["id"], packed["w"])
+        ))
+    
+    @staticmethod
+    def _compact_colbert(vecs: np.ndarray) -> bytes:
+        """
+        把ColBERT向量压缩为可存储的字节
+        
+        相邻 colbert_pool_factor 个token向量取平均后重新归一化，再以float16存储
+        
+        Args:
+            vecs: (token数, 维度) 的ColBERT向量
+            
+        Returns:
+            bytes: float16字节
+        """
+        vecs = np.asarray(vecs, dtype=np.float32)
+        factor = max(1, ai_config.colbert_pool_factor)
+        if factor > 1 and len(vecs) > 1:
+            pad = (-len(vecs)) % factor
+            padded = np.concatenate([vecs, np.repeat(vecs[-1:], pad, axis=0)]) if pad else vecs
+            vecs = padded.reshape(-1, factor, vecs.shape[1]).mean(axis=1)
+            vecs /= np.maximum(np.linalg.norm(vecs, axis=1, keepdims=True), 1e-12)
+        return vecs.astype(np.float16).tobytes()
+    
+    @staticmethod
+    def _colbert_score(query_vecs: np.ndarray, stored: bytes) -> float:
+        """
+        ColBERT MaxSim分数：每个查询token取与文档token的最大内积，再对查询token求平均
+        
+        Args:
+            query_vecs: (查询token数, 维度) 的查询ColBERT向量
+            stored: 分块存储的float16字节
+            
+        Returns:
+            float: MaxSim分数
+        """
+        doc_vecs = np.frombuffer(stored, dtype=np.float16).reshape(-1, query_vecs.shape[1]).astype(np.float32)
+        return float((query_vecs @ doc_vecs.T).max(axis=1).mean())
+    
+    def chunk_extras(self, row: Dict) -> Dict:
+        """
+        把编码结果中的词汇权重和ColBERT向量转为分块的附加存储字段
+        
+        Args:
+            row: encode_multi 的单行结果
+            
+        Returns:
+            Dict: lex/lex_w/colbert 字段
+        """
+        extra = {}
+        if row.get("sparse") is not None:
+            extra.update(self._compact_lexical(row["sparse"]))
+        if row.get("colbert") is not None:
+            extra["colbert"] = self._compact_colbert(row["colbert"])
+        return extra
+    
+    def _encode_chunks(self, texts: List[str], fingerprints: List[str],
+                       user_ids: List[str]) -> Tuple[List[np.ndarray], List[Dict]]:
+        """
+        分块编码，指纹相同的文本直接复用已有向量
+        
+        存储按指纹查找最近写入该文本的分块，命中且该分块指纹未变时复用其向量，
+        只有未命中的文本才调用模型；
+        开启词汇索引/ColBERT索引时词汇权重、ColBERT向量与稠密向量同一次前向计算得到
+        
+        Args:
+            texts: 分块文本列表
+            fingerprints: 对应的文本指纹
+            user_ids: 对应的写入用户，分片存储只在用户所在分片查找
+            
+        Returns:
+            Tuple[List[np.ndarray], List[Dict]]: (与texts逐项对应的向量, 附加存储字段)
+        """
+        if not texts:
+            return [], []
+        vectors: List[Optional[np.ndarray]] = [None] * len(texts)
+        extras: List[Dict] = [{} for _ in texts]
+        extra_fields = (["lex", "lex_w"] if ai_config.lexical_index else []) + \
+                       (["colbert"] if ai_config.colbert_index else [])
+        
+        # 需要的附加字段缺失时（如旧数据没有词汇权重）视为未命中，字段值原样写回
+        for i, reused in enumerate(self.store.find_user_reusable(fingerprints, user_ids, extra_fields)):
+            if reused is not None:
+                vectors[i], extras[i] = reused
+        
+        # 同一批次内重复的文本只编码一次
+        missing: Dict[str, List[int]] = {}
+        for i, vector in enumerate(vectors):
+            if vector is None:
+                missing.setdefault(fingerprints[i], []).append(i)
+        if missing:
+            indexes = list(missing.values())
+            missing_texts = [texts[group[0]] for group in indexes]
+            rows = self.encode_multi(
+                missing_texts, sparse=ai_config.lexical_index, colbert=ai_config.colbert_index
+            )
+            for group, row in zip(indexes, rows):
+                extra = self.chunk_extras(row)
+                for i in group:
+                    vectors[i] = np.asarray(row["dense"], dtype=np.float32)
+                    extras[i] = extra
+        return vectors, extras
+    
+    def index_documents(self, documents: List[Dict]) -> List[int]:
+        """
+        批量写入多个内容的向量
+        
+        元数据一次批量读取；内容指纹与已存储的一致且向量未被逐出时只刷新原始数据和过期时间；
+        其余内容的全部分块合并成一批编码，重复文本复用已有向量，再批量写入存储
+        
+        Args:
+            documents: 内容列表，每项包含 doc_id/user_id/text，可选 raw_data/todo_id
+            
+        Returns:
+            List[int]: 与documents逐项对应的分块数量，内容归属其他用户时为-1
+            
+        Raises:
+            ValueError: 当user_id为空时抛出
+        """
+        counts: List[int] = [0] * len(documents)
+        pending = []
+        if any(not document.get("user_id") for document in documents):
+            raise ValueError("User ID is required")
+        metas = self.store.get_user_metas(
+            [document["doc_id"] for document in documents], [document["user_id"] for document in documents]
+        )
+        for i, (document, meta) in enumerate(zip(documents, metas)):
+            raw_json = json.dumps(document.get("raw_data") or {}, ensure_ascii=False)
+            if meta["user_id"] == document["user_id"] and not meta.get("evicted") and \
+                    meta["fingerprint"] == self._content_fingerprint(document["text"]):
+                self.store.for_user(document["user_id"]).touch(document["doc_id"], meta["chunks"], raw_json)
+                counts[i] = meta["chunks"]
+                continue
+            chunks = self.chunk_text(document["text"])
+            pending.append((i, document, meta, chunks, raw_json))
+        
+        # 所有内容的分块一次批量编码
+        texts = [chunk["text"] for *_, chunks, _ in pending for chunk in chunks]
+        fingerprints = [self.fingerprint(text) for text in texts]
+        user_ids = [document["user_id"] for _, document, _, chunks, _ in pending for _ in chunks]
+        vectors, extras = self._encode_chunks(texts, fingerprints, user_ids)
+        
+        writes = []
+        offset = 0
+        for i, document, meta, chunks, raw_json in pending:
+            end = offset + len(chunks)
+            writes.append({
+                "doc_id": document["doc_id"],
+                "user_id": document["user_id"],
+                "chunks": chunks,
+                "fingerprints": fingerprints[offset:end],
+                "vectors": vectors[offset:end],
+                "raw_json": raw_json,
+                "content_fingerprint": self._content_fingerprint(document["text"]),
+                "todo_id": document.get("todo_id") or meta["todo_id"],
+                "stale_chunk_count": meta["chunks"],
+                "extras": extras[offset:end]
+            })
+            offset = end
+        for (i, *_), written in zip(pending, self.store.save_many(writes)):
+            counts[i] = written
+        # 指纹未变的内容也可能更新了原始数据，同样使检索结果缓存失效
+        self.result_cache.bump(document["user_id"] for document in documents)
+        return counts
+    
+    def save_embedding(self, doc_id: str, user_id: str, text: str, raw_data: Dict = None,
+                       todo_id: str = None) -> Dict:
+        """
+        保存向量嵌入到数据库，长文本按token分块，每块一条向量记录
+        
+        内容指纹与已存储的一致时跳过编码
         
         Args:
             doc_id: 文档ID
             user_id: 用户ID
             text: 文本内容
             raw_data: 原始数据（如图片、文件路径等）
+            todo_id: 所属Todo ID，用于按Todo批量删除
             
         Returns:
             Dict: 保存的文档数据
             
         Raises:
-            ValueError: 当user_id为空时抛出
+            ValueError: 当user_id为空或内容归属其他用户时抛出
         """
         if not user_id:
             raise ValueError("User ID is required")
         
-        # 生成向量嵌入
-        vector = self.encode_dense([text])[0]
-
-        #Redis索引
-        redis_key = f'vector:{doc_id}'
-        
-        # # 构建文档数据 for MongoDB
-        # doc = {
-        #     "doc_id": doc_id,
-        #     "user_id": user_id,
-        #     "raw": raw_data or {},
-        #     "text": text,
-        #     "vector": vector.tolist()
-        # }
-        
-        # # 保存到数据库
-        # result = self.collection.insert_one(doc)
-        # doc['_id'] = str(result.inserted_id)
-        # return doc
-
-        #构建vector for Redis
-        doc = {
+        chunk_count = self.index_documents([{
             "doc_id": doc_id,
             "user_id": user_id,
-            "raw": json.dumps(raw_data or {}, ensure_ascii=False),
             "text": text,
-            "vector": vector.astype(np.float32).tobytes()
-        }
-
-        self.redis_client.hset(redis_key,mapping=doc)
-        self.redis_client.expire(redis_key,self.vector_ttl)
+            "raw_data": raw_data,
+            "todo_id": todo_id
+        }])[0]
+        if chunk_count < 0:
+            raise ValueError("Vector record belongs to another user")
         return {
             "doc_id": doc_id,
             "user_id": user_id,
             "text": text,
-            "raw": raw_data or {}
+            "raw": raw_data or {},
+            "chunks": chunk_count
         }
     
-    def search_embedding(self, query: str, user_id: str, top_k: int = 5) -> List[Tuple[float, str]]:
+    def count_user_chunks(self, user_id: str) -> int:
         """
-        向量搜索
+        统计用户的分块数量
+        
+        Args:
+            user_id: 用户ID
+            
+        Returns:
+            int: 分块数量
+        """
+        return self.store.count(user_id)
+    
+    @staticmethod
+    def _group_chunk_hits(hits: List[Dict], user_id: Optional[str], top_k: int) -> List[Dict]:
+        """
+        把分块命中按所属内容聚合，内容分数取最高的分块分数
+        
+        Args:
+            hits: 按分数降序的分块命中
+            user_id: 用户ID，为None时不过滤用户（全局检索），内容附带所属 user_id
+            top_k: 最多保留的内容数量
+            
+        Returns:
+            List[Dict]: 按分数降序的内容列表
+        """
+        grouped: Dict[str, Dict] = {}
+        for hit in hits:
+            # 只保留当前用户的结果
+            if user_id is not None and hit["user_id"] != user_id:
+                continue
+            
+            group = grouped.get(hit["doc_id"])
+            if group is None:
+                if len(grouped) >= top_k:
+                    continue
+                group = grouped[hit["doc_id"]] = {
+                    "doc_id": hit["doc_id"],
+                    "score": hit["score"],
+                    "raw": json.loads(hit["raw"] or "{}"),
+                    "chunks": []
+                }
+                if user_id is None:
+                    group["user_id"] = hit["user_id"]
+            group["chunks"].append({
+                "chunk_index": hit["chunk_index"],
+                "text": hit["text"],
+                "score": hit["score"]
+            })
+        
+        # 分块按原文顺序排列，方便拼接上下文
+        for group in grouped.values():
+            group["chunks"].sort(key=lambda c: c["chunk_index"])
+        return list(grouped.values())
+    
+    @staticmethod
+    def search_profile_params(profile: str = None) -> Dict:
+        """
+        检索精度档位对应的参数
+        
+        fast 使用较小的EF_RUNTIME和多取倍数；balanced 提高EF_RUNTIME；
+        exact 不经过HNSW，对用户的全部分块精确打分，适合小语料或评估召回
+        
+        Args:
+            profile: fast/balanced/exact，不传时使用配置的默认档位
+            
+        Returns:
+            Dict: ef_runtime/oversample/exact
+            
+        Raises:
+            ValueError: 档位不支持时抛出
+        """
+        profile = profile or db_config.vector_search_profile
+        if profile == "fast":
+            return {"ef_runtime": db_config.vector_ef_runtime_fast,
+                    "oversample": db_config.vector_oversample_fast, "exact": False}
+        if profile == "balanced":
+            return {"ef_runtime": db_config.vector_ef_runtime_balanced,
+                    "oversample": db_config.vector_oversample_balanced, "exact": False}
+        if profile == "exact":
+            return {"ef_runtime": None, "oversample": db_config.vector_oversample_exact, "exact": True}
+        raise ValueError(f"不支持的检索档位: {profile}")
+    
+    def _search_dense(self, query_vec: np.ndarray, user_id: str, top_k: int, total: int,
+                      params: Dict = None) -> List[Dict]:
+        """
+        稠密向量检索
+        
+        同一内容可能命中多个分块，KNN按档位的倍数多取分块，不足top_k个内容时扩大KNN重查
+        
+        Args:
+            query_vec: 查询向量
+            user_id: 用户ID
+            top_k: 返回前k个内容
+            total: 用户的分块数量
+            params: search_profile_params 的结果，不传时使用默认档位
+            
+        Returns:
+            List[Dict]: 按相似度降序的内容列表
+        """
+        params = params or self.search_profile_params()
+        knn = min(total, top_k * params["oversample"])
+        while True:
+            hits = self.store.search(
+                query_vec, user_id, knn, total, ef_runtime=params["ef_runtime"], exact=params["exact"]
+            )
+            grouped = self._group_chunk_hits(hits, user_id, top_k)
+            if len(grouped) >= top_k or knn >= total:
+                return grouped
+            knn = min(total, knn * 2)
+    
+    def _search_lexical(self, query_weights: Dict, user_id: str, top_k: int) -> List[Dict]:
+        """
+        词汇检索：按查询权重最高的token在 lex 字段召回候选分块，
+        再用BGE-M3词汇匹配分数（共同token权重乘积之和）重新排序
+        
+        Args:
+            query_weights: 查询词汇权重 {token_id: weight}
+            user_id: 用户ID
+            top_k: 返回前k个内容
+            
+        Returns:
+            List[Dict]: 按词汇分数降序的内容列表
+        """
+        terms = sorted(query_weights.items(), key=lambda item: float(item[1]), reverse=True)
+        terms = [f"t{int(token)}" for token, weight in terms[:rag_config.lexical_query_terms] if float(weight) > 0]
+        if not terms:
+            return []
+        
+        hits = self.store.search_lexical(terms, user_id, rag_config.lexical_candidates)
+        for hit in hits:
+            hit["score"] = self._lexical_score(query_weights, hit.get("lex_w"))
+        hits.sort(key=lambda hit: hit["score"], reverse=True)
+        return self._group_chunk_hits(hits, user_id, top_k)
+    
+    @staticmethod
+    def _rrf_merge(rankings: Dict[str, List[Dict]], top_k: int, k: int = 60) -> List[Dict]:
+        """
+        倒数排名融合（RRF）：内容分数为其在各路排名中 1/(k+rank) 之和
+        
+        Args:
+            rankings: {检索方式: 按相关度降序的内容列表}
+            top_k: 返回前k个内容
+            k: RRF平滑常数
+            
+        Returns:
+            List[Dict]: 按融合分数降序的内容列表，附带各路原始分数 {方式}_score，
+                chunks 为各路命中分块的并集
+        """
+        merged: Dict[str, Dict] = {}
+        for name, groups in rankings.items():
+            for rank, group in enumerate(groups, start=1):
+                entry = merged.get(group["doc_id"])
+                if entry is None:
+                    entry = merged[group["doc_id"]] = {
+                        "doc_id": group["doc_id"],
+                        "score": 0.0,
+                        "raw": group["raw"],
+                        "chunks": {}
+                    }
+                entry["score"] += 1.0 / (k + rank)
+                entry[f"{name}_score"] = group["score"]
+                for chunk in group["chunks"]:
+                    kept = entry["chunks"].get(chunk["chunk_index"])
+                    if kept is None or chunk["score"] > kept["score"]:
+                        entry["chunks"][chunk["chunk_index"]] = chunk
+        
+        results = sorted(merged.values(), key=lambda entry: entry["score"], reverse=True)[:top_k]
+        for entry in results:
+            entry["chunks"] = [entry["chunks"][index] for index in sorted(entry["chunks"])]
+        return results
+    
+    def _rerank_groups(self, groups: List[Dict], query_colbert: np.ndarray, top_k: int,
+                       user_id: str) -> List[Dict]:
+        """
+        ColBERT late-interaction 重排
+        
+        候选分块按第一阶段的内容顺序、内容内分块分数展开，取前 rerank_candidates 个，
+        批量读取其ColBERT向量计算MaxSim；内容分数取最高的分块分数。
+        没有ColBERT向量的分块（旧数据或未开启ColBERT索引）保持第一阶段顺序排在后面
+        
+        Args:
+            groups: 第一阶段按相关度降序的内容列表
+            query_colbert: 查询ColBERT向量
+            top_k: 返回前k个内容
+            user_id: 用户ID
+            
+        Returns:
+            List[Dict]: 按MaxSim分数降序的内容列表，附带第一阶段分数 first_stage_score
+        """
+        candidates = []
+        for group in groups:
+            for chunk in sorted(group["chunks"], key=lambda c: c["score"], reverse=True):
+                candidates.append((group, chunk))
+        candidates = candidates[:rag_config.rerank_candidates]
+        if not candidates:
+            return []
+        
+        stored = self.store.for_user(user_id).get_chunk_values(
+            [(group["doc_id"], chunk["chunk_index"]) for group, chunk in candidates], "colbert"
+        )
+        
+        reranked: Dict[str, Dict] = {}
+        unscored: Dict[str, Dict] = {}
+        for (group, chunk), colbert in zip(candidates, stored):
+            target = reranked if colbert else unscored
+            entry = target.get(group["doc_id"])
+            if entry is None:
+                entry = target[group["doc_id"]] = {
+                    **{key: value for key, value in group.items() if key != "chunks"},
+                    "first_stage_score": group["score"],
+                    "score": float("-inf") if colbert else group["score"],
+                    "chunks": []
+                }
+            if colbert:
+                chunk = {**chunk, "score": self._colbert_score(query_colbert, colbert)}
+                entry["score"] = max(entry["score"], chunk["score"])
+            entry["chunks"].append(chunk)
+        
+        results = sorted(reranked.values(), key=lambda entry: entry["score"], reverse=True)
+        results += [entry for doc_id, entry in unscored.items() if doc_id not in reranked]
+        results = results[:top_k]
+        for entry in results:
+            entry["chunks"].sort(key=lambda c: c["chunk_index"])
+        return results
+    
+    def _refresh_ttl(self, doc_ids: List[str], user_id: str):
+        """
+        滑动过期：刷新被命中或读取的内容的过期时间，设置内存预算时更新其LRU时间，失败不影响检索
+        
+        Args:
+            doc_ids: 内容ID列表
+            user_id: 内容所属用户
+        """
+        if not (db_config.vector_sliding_ttl or self.memory_budget) or not doc_ids:
+            return
+        try:
+            self.store.for_user(user_id).refresh(doc_ids)
+        except Exception as e:
+            print(f"刷新向量过期时间失败: {e}")
+    
+    def _maybe_rehydrate(self, user_id: str, total: int):
+        """
+        惰性回填检查，失败不影响检索
+        
+        Args:
+            user_id: 用户ID
+            total: 用户当前的分块数量
+        """
+        try:
+            self.rehydrator.maybe_rehydrate(user_id, total)
+        except Exception as e:
+            print(f"向量回填检查失败: {e}")
+    
+    def _has_evicted(self, user_id: str) -> bool:
+        """用户是否有向量已被逐出的内容，失败时视为没有"""
+        if not self.memory_budget:
+            return False
+        try:
+            return self.store.for_user(user_id).usage(user_id).get("evicted", 0) > 0
+        except Exception as e:
+            print(f"读取向量计量失败: {e}")
+            return False
+    
+    def _restore_evicted(self, user_id: str, groups: List[Dict], metas: List[Dict] = None):
+        """
+        词汇检索命中了向量已被逐出的内容时，在后台从MongoDB重新编码，失败不影响检索
+        
+        Args:
+            user_id: 用户ID
+            groups: 词汇检索的内容列表
+            metas: 与groups逐项对应的元数据，已读取时传入
+        """
+        if not self.memory_budget or not groups:
+            return
+        try:
+            doc_ids = [group["doc_id"] for group in groups]
+            metas = metas or self.store.for_user(user_id).get_metas(doc_ids)
+            evicted = [doc_id for doc_id, meta in zip(doc_ids, metas) if meta.get("evicted")]
+            if evicted:
+                self.rehydrator.restore_async(user_id, evicted[:db_config.vector_restore_limit])
+        except Exception as e:
+            print(f"恢复已逐出的向量失败: {e}")
+    
+    def _cached_results_alive(self, user_id: str, groups: List[Dict]) -> bool:
+        """
+        缓存的结果是否仍可直接返回：向量已过期的内容没有元数据，按未命中重新检索（并触发回填）；
+        已被逐出的内容仍可被词汇检索命中，照常返回并在后台恢复
+        
+        Args:
+            user_id: 用户ID
+            groups: 缓存的内容列表
+            
+        Returns:
+            bool: 是否可直接返回，读取失败时按不可用处理
+        """
+        if not groups:
+            # 用户没有向量时重新检索一次，由实时检索决定是否回填
+            return False
+        try:
+            metas = self.store.for_user(user_id).get_metas([group["doc_id"] for group in groups])
+        except Exception as e:
+            print(f"检查缓存结果失败: {e}")
+            return False
+        if any(meta["user_id"] != user_id for meta in metas):
+            return False
+        self._restore_evicted(user_id, groups, metas)
+        return True
+    
+    def search_chunks(self, query: str, user_id: str, top_k: int = 5, mode: str = None,
+                      rerank: Optional[bool] = None, profile: str = None,
+                      collapse: Optional[bool] = None) -> List[Dict]:
+        """
+        分块搜索，命中的分块按所属内容聚合
+        
+        dense 模式只做用户预过滤的向量KNN；hybrid 模式在同一次前向计算中得到查询的
+        稠密向量和词汇权重，向量KNN与词汇检索的结果用RRF融合；
+        开启重排时第一阶段多取候选，再用入库时存储的ColBERT向量做MaxSim重排；
+        精度档位决定向量KNN的EF_RUNTIME、多取倍数以及是否精确检索；
+        折叠近重复时多取一倍候选，同一规范内容的多条结果只保留分数最高的一条；
+        返回的内容刷新过期时间，用户分块数少于内容数时触发后台回填；
+        向量被内存预算逐出的内容仍保留词汇字段，被词汇检索命中（dense 模式下用户有逐出内容时额外做一次词汇检索）
+        时在后台重新编码
         
         Args:
             query: 查询文本
             user_id: 用户ID
-            top_k: 返回前k个结果
+            top_k: 返回前k个内容
+            mode: 检索模式 dense/hybrid，不传时使用配置的默认模式
+            rerank: 是否ColBERT重排，不传时使用配置
+            profile: 精度档位 fast/balanced/exact，不传时使用配置的默认档位
+            collapse: 是否折叠近重复内容，不传时使用配置
             
         Returns:
-            List[Tuple[float, str]]: (相似度分数, 文档ID) 列表
+            List[Dict]: 按分数降序的内容列表，每项包含
+                doc_id/score/raw 以及命中的分块 chunks（chunk_index/text/score），
+                hybrid 模式的 score 为RRF分数，另附 dense_score/lexical_score，
+                重排后 score 为MaxSim分数，另附 first_stage_score，
+                折叠时有重复内容的结果另附 duplicates（重复内容ID列表）
             
         Raises:
-            ValueError: 当user_id为空时抛出
+            ValueError: 当user_id为空或检索模式、精度档位不支持时抛出
         """
         if not user_id:
             raise ValueError("User ID is required")
+        mode = mode or rag_config.search_mode
+        if mode not in SEARCH_MODES:
+            raise ValueError(f"不支持的检索模式: {mode}")
+        params = self.search_profile_params(profile)
+        rerank = rag_config.rerank if rerank is None else rerank
+        collapse = rag_config.collapse_duplicates if collapse is None else collapse
 
+        # 相同查询和参数在用户语料未变化时直接返回缓存的结果，只刷新命中内容的过期时间；
+        # 向量过期不会更新写入纪元，缓存的内容已过期时重新检索
+        cache_key = None
+        if rag_config.search_result_cache:
+            cached, cache_key = self.result_cache.get(user_id, query, {
+                "top_k": top_k, "mode": mode, "rerank": rerank, "params": params,
+                "collapse": collapse, "model": ai_config.model_name
+            })
+            if cached is not None and self._cached_results_alive(user_id, cached):
+                self._refresh_ttl([group["doc_id"] for group in cached], user_id)
+                return cached
 
-        # 生成查询向量
-        query_vec = self.encode_dense([query])[0]
+        # 生成查询向量（带缓存），hybrid 模式同时得到词汇权重，重排时同时得到ColBERT向量；
+        # dense 模式下用户有向量被逐出的内容时也取词汇权重，用于发现重新相关的内容
+        probe = mode == "dense" and self._has_evicted(user_id)
+        query_reps = self.encode_query(query, with_lexical=(mode == "hybrid" or probe), with_colbert=rerank)
+        query_vec = query_reps["dense"]
 
         try:
-            #查询向量转为字节向量
-            query_vec_bytes = query_vec.astype(np.float32).tobytes()
-
-            #报错向量搜索异常: 向量搜索异常: Syntax error at offset 28 near -4339
-            #原因是UUID中有-符号,所以需要转义
-
-            #构建RedisSearch查询
-            # query_str = f"@user_id:{{{user_id}}} => [KNN {top_k} @vector $vec AS score]"
-            query_str = f"* => [KNN {top_k * 3} @vector $vec AS score]"
-
-            from redis.commands.search.query import Query
-            q=(
-                Query(query_str).sort_by("score").paging(0,top_k).return_fields("user_id","doc_id","score").dialect(2)
-            )
-            # 执行搜索，返回结果 包含doc_id和score
-            results = self.redis_client.ft("vector").search(
-            q,
-            query_params={"vec": query_vec_bytes}
-            )
-             # 格式化结果
-            scores = []
-            for doc in results.docs:
-                # 获取 user_id
-                doc_user_id = getattr(doc, 'user_id', None)
-                if isinstance(doc_user_id, bytes):
-                    doc_user_id = doc_user_id.decode('utf-8')
-                
-                # 只保留当前用户的结果
-                if doc_user_id != user_id:
-                    continue
-                
-                # 提取 doc_id
-                doc_id = doc.id.replace("vector:", "") if hasattr(doc, 'id') else ""
-                
-                # 计算相似度
-                distance = float(getattr(doc, 'score', 0.0))
-                similarity = 1 - (distance / 2)
-                
-                scores.append((similarity, doc_id))
-                
-                # 获取足够结果后停止
-                if len(scores) >= top_k:
-                    break
-            return scores[:top_k]
+            total = self.count_user_chunks(user_id)
+            self._maybe_rehydrate(user_id, total)
+            if total == 0:
+                return []
+            
+            # 折叠重复内容后仍需要top_k个结果
+            result_k = top_k * 2 if collapse else top_k
+            # 重排时第一阶段取足够的候选内容
+            first_k = max(result_k, rag_config.rerank_candidates) if rerank else result_k
+            if mode == "dense":
+                groups = self._search_dense(query_vec, user_id, first_k, total, params)
+                lexical = self._search_lexical(query_reps["sparse"] or {}, user_id, first_k) if probe else []
+            else:
+                # 两路各取更多候选，融合后再截断
+                candidates = max(result_k * 2, first_k)
+                dense = self._search_dense(query_vec, user_id, candidates, total, params)
+                lexical = self._search_lexical(query_reps["sparse"] or {}, user_id, candidates)
+                groups = self._rrf_merge({"dense": dense, "lexical": lexical}, first_k, k=rag_config.rrf_k)
+            self._restore_evicted(user_id, lexical)
+            
+            if rerank:
+                groups = self._rerank_groups(groups, query_reps["colbert"], result_k, user_id)
+            if collapse:
+                groups = self._collapse_duplicates(groups, user_id)[:top_k]
+            self._refresh_ttl([group["doc_id"] for group in groups], user_id)
+            self.result_cache.set(cache_key, groups)
+            return groups
 
         except Exception as e:
             raise ValueError(f"向量搜索异常: {e}")
+    
+    def search_embedding(self, query: str, user_id: str, top_k: int = 5,
+                         mode: str = None, rerank: Optional[bool] = None,
+                         profile: str = None, collapse: Optional[bool] = None) -> List[Tuple[float, str]]:
+        """
+        向量搜索
+        
+        Args:
+            query: 查询文本
+            user_id: 用户ID
+            top_k: 返回前k个结果
+            mode: 检索模式 dense/hybrid
+            rerank: 是否ColBERT重排
+            profile: 精度档位 fast/balanced/exact
+            collapse: 是否折叠近重复内容
+            
+        Returns:
+            List[Tuple[float, str]]: (分数, 文档ID) 列表，分数取命中分块的最高分
+            
+        Raises:
+            ValueError: 当user_id为空时抛出
+        """
+        return [
+            (group["score"], group["doc_id"])
+            for group in self.search_chunks(query, user_id, top_k, mode, rerank, profile, collapse)
+        ]
 
+    def _collapse_duplicates(self, groups: List[Dict], user_id: str) -> List[Dict]:
+        """
+        折叠近重复内容
+        
+        标记模式下重复内容有自己的向量，原始数据中的 duplicate_of 指向规范内容，
+        同一规范内容的结果只保留分数最高的一条；链接模式下重复内容没有向量，
+        从近重复索引读取链接到各结果的内容一并列出
+        
+        Args:
+            groups: 按分数降序的内容列表
+            user_id: 用户ID
+            
+        Returns:
+            List[Dict]: 折叠后的内容列表，有重复内容的项附 duplicates
+        """
+        kept: Dict[str, Dict] = {}
+        for group in groups:
+            key = group["raw"].get("duplicate_of") or group["doc_id"]
+            if key in kept:
+                kept[key].setdefault("duplicates", []).append(group["doc_id"])
+            else:
+                kept[key] = group
+        try:
+            linked = self.near_duplicates.linked(user_id, [group["doc_id"] for group in kept.values()])
+        except Exception as e:
+            print(f"读取重复内容链接失败: {e}")
+            linked = {}
+        for group in kept.values():
+            if group["doc_id"] in linked:
+                group["duplicates"] = group.get("duplicates", []) + linked[group["doc_id"]]
+        return list(kept.values())
 
-
-
-        # scores=[]
-        # cursor = 0 
-
-        # while True:
-        #     cursor,keys = self.redis_client.scan(cursor,match="vector:*",count=100)
-        #     for key in keys:
-        #         if isinstance(key,bytes):
-        #             #解码key
-        #             key = key.decode("utf-8")
-                
-        #         #得到向量数据
-        #         doc_user_id = self.redis_client.hget(key,"user_id")
-        #         if isinstance(doc_user_id,bytes):
-        #             doc_user_id = doc_user_id.decode("utf-8")
-        #             #当不是用户id时跳出循环
-        #         if doc_user_id!=user_id:
-        #             continue
-                
-        #         #获取向量
-        #         vector_bytes = self.redis_client.hget(key,"vector")
-        #         if not vector_bytes:
-        #             continue
-        #         doc_vector = np.frombuffer(vector_bytes,dtype=np.float32)
-
-        #         #计算相似度
-        #         score= self.cosine_similarity(query_vec,doc_vector)
-
-        #         # 提取 doc_id (移除 "vector:" 前缀)
-        #         doc_id = key.replace("vector:", "")
-        #         scores.append((score, doc_id))
-        #     if cursor==0:
-        #         break
-        # #排序损失
-        # scores.sort(key=lambda x:x[0],reverse=True)
-        # return scores[:top_k]
+    def search_global(self, query: str, top_k: int = 5, profile: str = None) -> List[Dict]:
+        """
+        不按用户过滤的全局稠密检索，用于管理和跨用户检索
+        
+        分片存储时并行查询全部分片，各取候选后按相似度合并；
+        全局检索始终走HNSW，exact 档位使用索引默认的EF_RUNTIME
+        
+        Args:
+            query: 查询文本
+            top_k: 返回前k个内容
+            profile: 精度档位 fast/balanced/exact
+            
+        Returns:
+            List[Dict]: 按相似度降序的内容列表，每项包含 doc_id/user_id/score/raw/chunks
+            
+        Raises:
+            ValueError: 精度档位不支持或检索失败时抛出
+        """
+        params = self.search_profile_params(profile)
+        query_vec = self.encode_query(query)["dense"]
+        try:
+            hits = self.store.search_global(query_vec, top_k * params["oversample"], params["ef_runtime"])
+        except Exception as e:
+            raise ValueError(f"向量搜索异常: {e}")
+        return self._group_chunk_hits(hits, None, top_k)
 
     def delete_by_doc_id(self, doc_id: str, user_id: str) -> bool:
         """
-        根据文档ID删除向量
+        根据文档ID删除向量（包括全部分块）
         
         Args:
             doc_id: 文档ID
@@ -285,28 +1180,18 @@ class VectorService(BaseModel):
         Returns:
             bool: 是否删除成功
         """
-        # result = self.collection.delete_one({
-        #     "doc_id": doc_id,
-        #     "user_id": user_id
-        # })
-        # return result.deleted_count > 0
-
-        redis_key = f"vector:{doc_id}"
-
-        #验证是不是属于该用户
-        doc_user_id=self.redis_client.hget(redis_key,"user_id")
-        if doc_user_id:
-            if isinstance(doc_user_id,bytes):
-                doc_user_id=doc_user_id.decode("utf-8")
-            if doc_user_id == user_id:
-                result = self.redis_client.delete(redis_key)
-                return result > 0
-        return False
+        deleted = self.store.delete(user_id, [doc_id])
+        if deleted > 0:
+            self.result_cache.bump([user_id])
+        return deleted > 0
     
     def delete_by_todo_id(self, todo_id: str, user_id: str) -> int:
         """
         删除指定Todo的所有向量
         
+        写入时按Todo登记的内容一次全部删除；
+        没有登记时（登记前写入的旧数据）再从MongoDB取内容ID删除
+        
         Args:
             todo_id: Todo ID
             user_id: 用户ID
@@ -314,33 +1199,26 @@ class VectorService(BaseModel):
         Returns:
             int: 删除的文档数量
         """
-        # 从 MongoDB 中查找该 Todo 的所有内容
-        contents = db_client.todosContent.find({"todo_id": todo_id, "user_id": user_id})
+        deleted = self.store.delete(user_id, todo_id=todo_id)
+        if deleted > 0:
+            self.result_cache.bump([user_id])
+            return deleted
         
-        # 收集需要删除的 Redis key
-        keys_to_delete = []
-        for content in contents:
-            content_id = str(content["_id"])
-            redis_key = f"vector:{content_id}"
-            
-            # 验证是否属于该用户
-            doc_user_id = self.redis_client.hget(redis_key, "user_id")
-            if doc_user_id:
-                if isinstance(doc_user_id, bytes):
-                    doc_user_id = doc_user_id.decode("utf-8")
-                if doc_user_id == user_id:
-                    keys_to_delete.append(redis_key)
-        
-        # 批量删除
-        if keys_to_delete:
-            deleted_count = self.redis_client.delete(*keys_to_delete)
-            return deleted_count
-        
-        return 0
+        # 从 MongoDB 中查找该 Todo 的所有内容ID
+        content_ids = [
+            str(content["_id"])
+            for content in db_client.todosContent.find({"todo_id": todo_id, "user_id": user_id}, {"_id": 1})
+        ]
+        if not content_ids:
+            return 0
+        deleted = self.store.delete(user_id, content_ids)
+        if deleted > 0:
+            self.result_cache.bump([user_id])
+        return deleted
     
     def update_embedding(self, doc_id: str, user_id: str, text: str, raw_data: Dict = None) -> bool:
         """
-        更新向量嵌入
+        更新向量嵌入，重新分块编码并清理多余的旧分块
         
         Args:
             doc_id: 文档ID
@@ -353,88 +1231,75 @@ class VectorService(BaseModel):
         """
         if not user_id:
             raise ValueError("User ID is required")
-        #设置索引
-        redis_key = f"vector:{doc_id}"
 
         # 验证是否属于该用户
-        doc_user_id = self.redis_client.hget(redis_key, "user_id")
-        if not doc_user_id:
+        meta = self._get_doc_meta(doc_id, user_id)
+        if not meta["user_id"] or meta["user_id"] != user_id:
             return False
         
-        if isinstance(doc_user_id, bytes):
-            doc_user_id = doc_user_id.decode('utf-8')
+        if raw_data is None:
+            # 未传入新的原始数据时沿用旧值
+            raw_data = json.loads(meta["raw"] or "{}")
         
-        if doc_user_id != user_id:
-            return False
-        
-        # 生成新的向量嵌入
-        vector = self.encode_dense([text])[0]
-        
-        # 更新数据
-        update_data = {
+        # 文本未变化时不重新编码
+        written = self.index_documents([{
+            "doc_id": doc_id,
+            "user_id": user_id,
             "text": text,
-            # "vector": vector.tolist()
-            "vector":vector.astype(np.float32).tobytes()
-        }
-
-        if raw_data is not None:
-            # update_data["raw"] = raw_data
-            update_data["raw"] = json.dumps(raw_data, ensure_ascii=False)
-
-        
-        # result = self.collection.update_one(
-        #     {"doc_id": doc_id, "user_id": user_id},
-        #     {"$set": update_data}
-        # )
-        #更新哈希
-        self.redis_client.hset(redis_key, mapping=update_data)
-
-        #重置过期时间
-        self.redis_client.expire(redis_key,self.vector_ttl)
-
-        return True
-
-
-        # return result.modified_count > 0
+            "raw_data": raw_data
+        }])[0]
+        return written >= 0
     
-    def get_embedding_by_doc_id(self, doc_id: str, user_id: str) -> Optional[Dict]:
+    def get_embedding_by_doc_id(self, doc_id: str, user_id: str, with_vector: bool = False) -> Optional[Dict]:
         """
         根据文档ID获取向量嵌入
         
+        向量仅在with_vector为True时读取和反序列化
+        
         Args:
             doc_id: 文档ID
             user_id: 用户ID
+            with_vector: 是否返回向量
             
         Returns:
-            Optional[Dict]: 向量文档数据
+            Optional[Dict]: 向量文档数据，text为按分块偏移还原的全文；
+                with_vector时vector为各分块向量的归一化均值
         """
-        # doc = self.collection.find_one({
-        #     "doc_id": doc_id,
-        #     "user_id": user_id
-        # })
-        # return self.convert_objectid(doc) if doc else None
-        redis_key = f"vector:{doc_id}"
-        
-        # 获取所有字段
-        doc_data = self.redis_client.hgetall(redis_key)
-        
-        if not doc_data:
+        meta = self._get_doc_meta(doc_id, user_id)
+        if meta["user_id"] != user_id:
             return None
         
-        # 解码数据
-        doc_user_id = doc_data.get(b"user_id", b"").decode('utf-8')
-        
-        if doc_user_id != user_id:
+        chunks = self.store.for_user(user_id).get_chunks(doc_id, meta["chunks"], with_vector)
+        if not chunks:
             return None
+        self._refresh_ttl([doc_id], user_id)
         
-        # 反序列化向量
-        vector_bytes = doc_data.get(b"vector")
-        vector = np.frombuffer(vector_bytes, dtype=np.float32).tolist() if vector_bytes else []
+        # 去掉相邻分块的重叠部分，还原全文
+        text_parts = []
+        covered = 0
+        vectors = []
+        for chunk in chunks:
+            chunk_text = chunk["text"]
+            if chunk["start"] < covered:
+                chunk_text = chunk_text[covered - chunk["start"]:]
+            text_parts.append(chunk_text)
+            covered = max(covered, chunk["end"])
+            
+            if with_vector and chunk.get("vector") is not None:
+                vectors.append(chunk["vector"])
         
-        return {
-            "doc_id": doc_data.get(b"doc_id", b"").decode('utf-8'),
-            "user_id": doc_user_id,
-            "text": doc_data.get(b"text", b"").decode('utf-8'),
-            "raw": json.loads(doc_data.get(b"raw", b"{}").decode('utf-8')),
-            "vector": vector
-        }
\ No newline at end of file
+        doc = {
+            "doc_id": doc_id,
+            "user_id": meta["user_id"],
+            "text": "".join(text_parts),
+            "raw": json.loads(meta["raw"] or "{}"),
+            "chunks": len(chunks)
+        }
+        if with_vector:
+            vector = []
+            if vectors:
+                mean = np.mean(vectors, axis=0)
+                norm = np.linalg.norm(mean)
+                vector = (mean / norm if norm else mean).tolist()
+            doc["vector"] = vector
+        return doc
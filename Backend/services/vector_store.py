@@ -0,0 +1,688 @@
+# 向量存储接口层，定义分块向量的写入、删除、检索和读取，VectorService 只负责编码和排序
+from abc import ABC, abstractmethod
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+import re
+import time
+import numpy as np
+from redis.commands.search.query import Query
+from config.database import vector_index_name, vector_key_prefixes
+from config.settings import db_config
+from services import vector_scripts
+from services.vector_codec import check_vector_type, decode_vector, encode_vector
+
+
+def decode_value(value, default: str = "") -> str:
+    """存储返回值解码"""
+    if value is None:
+        return default
+    if isinstance(value, bytes):
+        return value.decode("utf-8")
+    return value
+
+
+class VectorStore(ABC):
+    """
+    分块向量存储接口
+
+    内容（doc）由若干分块组成，每个分块有文本、字符偏移、指纹、向量和附加字段（词汇权重等）。
+    检索返回的分块命中统一为字典：doc_id/user_id/chunk_index/text/raw/score，
+    score 为余弦相似度（稠密检索）或由调用方重新计算（词汇检索）。
+    """
+
+    def for_user(self, user_id: str) -> "VectorStore":
+        """用户数据所在的存储：分片存储返回该用户的分片，其余返回自身"""
+        return self
+
+    @abstractmethod
+    def get_meta(self, doc_id: str) -> Dict:
+        """
+        获取内容级元数据
+
+        Returns:
+            Dict: user_id/chunks/fingerprint/raw/todo_id，不存在时user_id为None
+        """
+
+    def get_metas(self, doc_ids: Sequence[str]) -> List[Dict]:
+        """批量获取内容级元数据，与doc_ids逐项对应"""
+        return [self.get_meta(doc_id) for doc_id in doc_ids]
+
+    def get_user_metas(self, doc_ids: Sequence[str], user_ids: Sequence[str]) -> List[Dict]:
+        """
+        写入路径上已知归属用户时批量获取元数据，分片存储只查询各用户所在的分片
+
+        Args:
+            doc_ids: 内容ID
+            user_ids: 与doc_ids逐项对应的用户ID
+
+        Returns:
+            List[Dict]: 与doc_ids逐项对应的元数据
+        """
+        return self.get_metas(doc_ids)
+
+    @abstractmethod
+    def find_reusable(self, fingerprints: List[str], extra_fields: List[str]) -> List[Optional[Tuple[np.ndarray, Dict]]]:
+        """
+        按指纹查找可复用的向量
+
+        Args:
+            fingerprints: 分块文本指纹
+            extra_fields: 需要一并返回的附加字段，任一缺失视为未命中
+
+        Returns:
+            List[Optional[Tuple[np.ndarray, Dict]]]: 逐项 (向量, 附加字段) 或None
+        """
+
+    def find_user_reusable(self, fingerprints: List[str], user_ids: Sequence[str],
+                           extra_fields: List[str]) -> List[Optional[Tuple[np.ndarray, Dict]]]:
+        """
+        按指纹查找可复用的向量，分片存储只查询写入用户所在的分片
+
+        Args:
+            fingerprints: 分块文本指纹
+            user_ids: 与fingerprints逐项对应的写入用户
+            extra_fields: 需要一并返回的附加字段，任一缺失视为未命中
+
+        Returns:
+            List[Optional[Tuple[np.ndarray, Dict]]]: 逐项 (向量, 附加字段) 或None
+        """
+        return self.find_reusable(fingerprints, extra_fields)
+
+    @abstractmethod
+    def save(self, doc_id: str, user_id: str, chunks: List[Dict], fingerprints: List[str],
+             vectors: List[np.ndarray], raw_json: str, content_fingerprint: str,
+             todo_id: str = None, stale_chunk_count: int = 0, extras: List[Dict] = None) -> int:
+        """
+        原子写入（或覆盖）内容元数据与全部分块，删除多余的旧分块
+
+        Returns:
+            int: 写入的分块数量，内容归属其他用户时返回-1
+        """
+
+    def save_many(self, documents: List[Dict]) -> List[int]:
+        """
+        批量写入多个内容
+
+        Args:
+            documents: 每项为 save 的关键字参数
+
+        Returns:
+            List[int]: 与documents逐项对应的 save 返回值
+        """
+        return [self.save(**document) for document in documents]
+
+    @abstractmethod
+    def touch(self, doc_id: str, chunk_count: int, raw_json: Optional[str] = None):
+        """内容未变化时只刷新原始数据和过期时间"""
+
+    @abstractmethod
+    def refresh(self, doc_ids: Sequence[str]):
+        """滑动过期：内容被检索命中或读取时刷新其全部键的过期时间"""
+
+    @abstractmethod
+    def existing(self, doc_ids: Sequence[str]) -> set:
+        """
+        批量检查内容是否有向量
+
+        Args:
+            doc_ids: 内容ID
+
+        Returns:
+            set: 仍有向量的内容ID
+        """
+
+    @abstractmethod
+    def delete(self, user_id: str, doc_ids: Sequence[str] = (), todo_id: str = None) -> int:
+        """
+        删除内容及其全部分块，只删除属于user_id的内容
+
+        Args:
+            user_id: 用户ID
+            doc_ids: 内容ID
+            todo_id: 传入时该Todo登记的全部内容一并删除
+
+        Returns:
+            int: 删除的内容数量
+        """
+
+    @abstractmethod
+    def count(self, user_id: str) -> int:
+        """用户的分块数量"""
+
+    def usage(self, user_id: str = None) -> Dict:
+        """
+        向量内存计量
+
+        Args:
+            user_id: 用户ID，不传时返回全部用户的合计
+
+        Returns:
+            Dict: docs/chunks/bytes（驻留向量的内容数、分块数、向量字节数）/evicted（已逐出的内容数），
+                存储不支持计量时为空字典
+        """
+        return {}
+
+    @abstractmethod
+    def search(self, query_vec: np.ndarray, user_id: str, knn: int, total: int = None,
+               ef_runtime: int = None, exact: bool = False) -> List[Dict]:
+        """
+        用户范围内的稠密向量KNN
+
+        Args:
+            query_vec: 查询向量
+            user_id: 用户ID
+            knn: 返回的分块数量
+            total: 用户的分块数量，用于选择精确/近似检索
+            ef_runtime: 近似检索的候选列表大小，不传时使用索引默认值
+            exact: 是否强制精确检索
+
+        Returns:
+            List[Dict]: 按相似度降序的分块命中
+        """
+
+    @abstractmethod
+    def search_global(self, query_vec: np.ndarray, knn: int, ef_runtime: int = None) -> List[Dict]:
+        """
+        不按用户过滤的全库稠密向量KNN，用于管理和全局检索
+
+        Args:
+            query_vec: 查询向量
+            knn: 返回的分块数量
+            ef_runtime: 近似检索的候选列表大小，不传时使用索引默认值
+
+        Returns:
+            List[Dict]: 按相似度降序的分块命中
+        """
+
+    @abstractmethod
+    def search_lexical(self, terms: List[str], user_id: str, limit: int) -> List[Dict]:
+        """
+        按词项召回候选分块，命中附带压缩词汇权重 lex_w
+
+        Args:
+            terms: 词项（t{token_id}）
+            user_id: 用户ID
+            limit: 最多返回的分块数量
+
+        Returns:
+            List[Dict]: 候选分块命中
+        """
+
+    @abstractmethod
+    def get_chunk_values(self, chunk_refs: List[Tuple[str, int]], field: str) -> List:
+        """
+        批量读取分块的单个字段
+
+        Args:
+            chunk_refs: (doc_id, chunk_index) 列表
+            field: 字段名
+
+        Returns:
+            List: 逐项字段值，不存在为None
+        """
+
+    @abstractmethod
+    def get_chunks(self, doc_id: str, chunk_count: int, with_vector: bool = False) -> List[Dict]:
+        """
+        按顺序读取内容的全部分块
+
+        Returns:
+            List[Dict]: text/start/end，with_vector时附带float32向量 vector
+        """
+
+
+class RedisVectorStore(VectorStore):
+    """
+    基于Redis Stack的向量存储
+
+    分块存为哈希 vector:{doc_id}:{i} 并由RediSearch HNSW索引，内容元数据为 vector_doc:{doc_id}，
+    写入/删除通过Lua脚本一次往返完成。一个实例对应一个索引版本，版本n的键和索引名带 _v{n}。
+    设置内存预算时写入后按预算逐出最久未被检索的内容的向量，键不再设置过期时间
+    """
+
+    # 计量字段
+    USAGE_FIELDS = ("docs", "chunks", "bytes", "evicted")
+    # 一次逐出脚本调用最多逐出的内容数量，限制单次脚本阻塞Redis的时间
+    EVICT_BATCH = 200
+
+    def __init__(self, redis_client, version: int = 0, vector_type: str = None, search_index: str = None,
+                 on_evict: Callable[[List[str]], None] = None):
+        """
+        Args:
+            redis_client: Redis客户端
+            version: 索引版本，决定键前缀和索引名
+            vector_type: 该版本索引的向量存储类型，不传时使用配置
+            search_index: 检索使用的索引名或别名，不传时为该版本的索引
+            on_evict: 写入后按预算逐出了内容时调用，参数为被逐出内容的用户（用于使检索结果缓存失效）
+        """
+        self.redis_client = redis_client
+        self.on_evict = on_evict
+        self.version = version
+        self.prefixes = vector_key_prefixes(version)
+        self.search_index = search_index or vector_index_name(version)
+        # 内存预算（字节，0为不限），设置后由预算逐出代替过期时间
+        self.user_budget = db_config.vector_user_budget_mb * 1024 * 1024
+        self.global_budget = db_config.vector_global_budget_mb * 1024 * 1024
+        self.budgeted = self.user_budget > 0 or self.global_budget > 0
+        self.vector_ttl = 0 if self.budgeted else db_config.redis_vector_ttl
+        # 向量按索引配置的类型存储
+        self.vector_type = check_vector_type(vector_type or db_config.vector_type)
+
+        # 注册Lua脚本，写入/删除都在一次往返内原子完成
+        self._write_doc_script = self.redis_client.register_script(vector_scripts.WRITE_DOC)
+        self._delete_docs_script = self.redis_client.register_script(vector_scripts.DELETE_DOCS)
+        self._reuse_vectors_script = self.redis_client.register_script(vector_scripts.REUSE_VECTORS)
+        self._refresh_docs_script = self.redis_client.register_script(vector_scripts.REFRESH_DOCS)
+        self._evict_docs_script = self.redis_client.register_script(vector_scripts.EVICT_DOCS)
+
+    def _doc_key(self, doc_id: str) -> str:
+        """内容级元数据的Redis键（记录归属用户与分块数量）"""
+        return f"{self.prefixes['doc']}{doc_id}"
+
+    def _chunk_key(self, doc_id: str, chunk_index: int) -> str:
+        """分块向量的Redis键"""
+        return f"{self.prefixes['chunk']}{doc_id}:{chunk_index}"
+
+    def _legacy_key(self, doc_id: str) -> str:
+        """分块前写入的单向量键"""
+        return f"{self.prefixes['chunk']}{doc_id}"
+
+    def _usage_key(self, user_id: str = None) -> str:
+        """用户的内存计量键，不传用户时为全局合计"""
+        return f"{self.prefixes['usage']}{user_id or '_total'}"
+
+    def _lru_now(self) -> float:
+        """写入LRU的时间戳，未设置内存预算时不记录LRU"""
+        return time.time() if self.budgeted else 0
+
+    @staticmethod
+    def _escape_tag(value: str) -> str:
+        """
+        转义TAG查询值，UUID中的 - 等标点在RediSearch查询语法中有特殊含义
+
+        Args:
+            value: 原始TAG值
+
+        Returns:
+            str: 转义后的TAG值
+        """
+        return re.sub(r"([^\w])", r"\\\1", value)
+
+    @staticmethod
+    def _hit(doc, score: float = None) -> Dict:
+        """RediSearch返回的分块文档转为命中字典"""
+        doc_id = decode_value(getattr(doc, 'doc_id', None))
+        if not doc_id:
+            # 旧版单向量键 {前缀}{doc_id}
+            doc_id = doc.id.split(":", 1)[-1]
+        hit = {
+            "doc_id": doc_id,
+            "user_id": decode_value(getattr(doc, 'user_id', None)),
+            "chunk_index": int(getattr(doc, 'chunk_index', 0) or 0),
+            "text": decode_value(getattr(doc, 'text', None)),
+            "raw": decode_value(getattr(doc, 'raw', None), "{}") or "{}",
+        }
+        if score is not None:
+            hit["score"] = score
+        if getattr(doc, 'lex_w', None) is not None:
+            hit["lex_w"] = decode_value(doc.lex_w)
+        return hit
+
+    def get_meta(self, doc_id: str) -> Dict:
+        return self.get_metas([doc_id])[0]
+
+    def get_metas(self, doc_ids: Sequence[str]) -> List[Dict]:
+        # 元数据和旧版单向量键一次往返读取
+        pipe = self.redis_client.pipeline(transaction=False)
+        for doc_id in doc_ids:
+            pipe.hmget(self._doc_key(doc_id), ["user_id", "chunks", "fingerprint", "raw", "todo_id", "evicted"])
+            pipe.hmget(self._legacy_key(doc_id), ["user_id", "raw"])
+        rows = pipe.execute()
+        return [self._meta(rows[i], rows[i + 1]) for i in range(0, len(rows), 2)]
+
+    @staticmethod
+    def _meta(row: List, legacy_row: List) -> Dict:
+        owner, chunk_count, fingerprint, raw, todo_id, evicted = row
+        legacy_owner, legacy_raw = legacy_row
+        if owner:
+            return {
+                "user_id": decode_value(owner),
+                "chunks": int(chunk_count or 0),
+                "fingerprint": decode_value(fingerprint),
+                "raw": decode_value(raw),
+                "todo_id": decode_value(todo_id) or None,
+                "evicted": decode_value(evicted) == "1"
+            }
+
+        # 兼容分块前写入的单向量键 vector:{doc_id}
+        return {
+            "user_id": decode_value(legacy_owner) if legacy_owner else None,
+            "chunks": 0,
+            "fingerprint": "",
+            "raw": decode_value(legacy_raw),
+            "todo_id": None,
+            "evicted": False
+        }
+
+    def find_reusable(self, fingerprints: List[str], extra_fields: List[str]) -> List[Optional[Tuple[np.ndarray, Dict]]]:
+        # 指纹索引的查找与校验在一次脚本调用内完成，INT8向量同时读取缩放系数
+        fields = list(extra_fields) + ["vector_scale"]
+        reused = self._reuse_vectors_script(
+            keys=[f"{self.prefixes['fp']}{fp}" for fp in fingerprints],
+            args=[len(fields)] + fields + list(fingerprints)
+        )
+        results = []
+        for row in reused:
+            # 需要的附加字段缺失时（如旧数据没有词汇权重）视为未命中，字段值原样写回
+            if row and row[0] and all(value is not None for value in row[1:-1]):
+                results.append((decode_vector(row[0], db_config.vector_dim, row[-1]), dict(zip(extra_fields, row[1:-1]))))
+            else:
+                results.append(None)
+        return results
+
+    def save(self, doc_id: str, user_id: str, chunks: List[Dict], fingerprints: List[str],
+             vectors: List[np.ndarray], raw_json: str, content_fingerprint: str,
+             todo_id: str = None, stale_chunk_count: int = 0, extras: List[Dict] = None) -> int:
+        keys, args = self._write_doc_args(doc_id, user_id, chunks, fingerprints, vectors, raw_json,
+                                          content_fingerprint, todo_id, stale_chunk_count, extras)
+        written = int(self._write_doc_script(keys=keys, args=args))
+        self._enforce_after_write([user_id])
+        return written
+
+    def save_many(self, documents: List[Dict], only_if_absent: bool = False) -> List[int]:
+        # 每个内容仍由脚本原子写入，多个脚本调用通过流水线一次往返发送
+        # only_if_absent 时已存在的内容不覆盖（返回-2），用于索引重建时复制旧版本数据
+        pipe = self.redis_client.pipeline(transaction=False)
+        for document in documents:
+            keys, args = self._write_doc_args(**document, only_if_absent=only_if_absent)
+            self._write_doc_script(keys=keys, args=args, client=pipe)
+        results = [int(result) for result in pipe.execute()]
+        self._enforce_after_write(document["user_id"] for document in documents)
+        return results
+
+    def _write_doc_args(self, doc_id: str, user_id: str, chunks: List[Dict], fingerprints: List[str],
+                        vectors: List[np.ndarray], raw_json: str, content_fingerprint: str,
+                        todo_id: str = None, stale_chunk_count: int = 0,
+                        extras: List[Dict] = None, only_if_absent: bool = False,
+                        evicted: bool = False) -> Tuple[List, List]:
+        """组装 WRITE_DOC 脚本的 KEYS 和 ARGV，evicted 时按已逐出的内容写入（分块没有向量，不登记指纹索引）"""
+        doc_fields = {
+            "user_id": user_id,
+            "chunks": len(chunks),
+            "fingerprint": content_fingerprint,
+            "raw": raw_json
+        }
+        if todo_id:
+            doc_fields["todo_id"] = todo_id
+        if evicted:
+            doc_fields["evicted"] = 1
+        hashes = [(self._doc_key(doc_id), doc_fields)]
+        extras = extras or [{} for _ in chunks]
+        vectors = vectors or [None for _ in chunks]
+        # 计量的是逐出时释放的部分：稠密向量和ColBERT向量
+        n_bytes = 0
+        for i, (chunk, fingerprint, vector, extra) in enumerate(zip(chunks, fingerprints, vectors, extras)):
+            if evicted:
+                extra = {field: value for field, value in extra.items() if field != "colbert"}
+            else:
+                vector_bytes, vector_scale = encode_vector(vector, self.vector_type)
+                n_bytes += len(vector_bytes) + len(extra.get("colbert") or b"")
+                extra = {**extra, "vector": vector_bytes}
+                if vector_scale is not None:
+                    extra["vector_scale"] = repr(vector_scale)
+            hashes.append((self._chunk_key(doc_id, i), {
+                **extra,
+                "doc_id": doc_id,
+                "user_id": user_id,
+                "chunk_index": i,
+                "start": chunk["start"],
+                "end": chunk["end"],
+                "fingerprint": fingerprint,
+                "raw": raw_json,
+                "text": chunk["text"]
+            }))
+
+        # 多余的旧分块和旧版单向量键
+        stale_keys = [self._chunk_key(doc_id, i) for i in range(len(chunks), stale_chunk_count)]
+        stale_keys.append(self._legacy_key(doc_id))
+        pointer_keys = [] if evicted else [f"{self.prefixes['fp']}{fp}" for fp in fingerprints]
+
+        # 只在设置内存预算时计量，未计量的内容没有 bytes 字段，删除和覆盖时不扣除
+        if self.budgeted:
+            doc_fields["bytes"] = n_bytes
+
+        usage_keys = [self._usage_key(user_id), self._usage_key(), f"{self.prefixes['usage']}_users",
+                      f"{self.prefixes['lru']}{user_id}"]
+        keys = [key for key, _ in hashes] + stale_keys + pointer_keys + usage_keys
+        args = [user_id, self.vector_ttl, len(hashes), len(stale_keys), len(pointer_keys),
+                1 if todo_id else 0, doc_id, 1 if only_if_absent else 0, n_bytes, self._lru_now(),
+                1 if evicted else 0]
+        for _, fields in hashes:
+            args.append(len(fields) * 2)
+            for field_name, value in fields.items():
+                args.extend([field_name, value])
+        if pointer_keys:
+            args.extend(key for key, _ in hashes[1:])
+        if todo_id:
+            keys.append(f"{self.prefixes['todo']}{todo_id}")
+        return keys, args
+
+    def export_documents(self, doc_ids: Sequence[str]) -> List[Optional[Dict]]:
+        """
+        读出内容的完整数据，格式与 save 的参数一致，用于在索引版本之间复制
+
+        Args:
+            doc_ids: 内容ID
+
+        Returns:
+            List[Optional[Dict]]: 逐项 save 参数，不存在、分块前的旧数据或分块不完整时为None；
+                已逐出的内容没有向量（vectors 为None），带 evicted 标记，按逐出状态复制文本和lex
+        """
+        metas = self.get_metas(doc_ids)
+        pipe = self.redis_client.pipeline(transaction=False)
+        for doc_id, meta in zip(doc_ids, metas):
+            for i in range(meta["chunks"]):
+                pipe.hgetall(self._chunk_key(doc_id, i))
+        rows = iter(pipe.execute())
+
+        documents = []
+        for doc_id, meta in zip(doc_ids, metas):
+            chunk_rows = [{decode_value(k): v for k, v in next(rows).items()} for _ in range(meta["chunks"])]
+            evicted = meta["evicted"]
+            if not meta["user_id"] or not chunk_rows or \
+                    not (evicted or all(row.get("vector") for row in chunk_rows)):
+                documents.append(None)
+                continue
+            documents.append({
+                "doc_id": doc_id,
+                "user_id": meta["user_id"],
+                "chunks": [
+                    {"text": decode_value(row.get("text")), "start": int(row.get("start") or 0),
+                     "end": int(row.get("end") or 0)}
+                    for row in chunk_rows
+                ],
+                "fingerprints": [decode_value(row.get("fingerprint")) for row in chunk_rows],
+                "vectors": None if evicted else [
+                    decode_vector(row["vector"], db_config.vector_dim, row.get("vector_scale")) for row in chunk_rows
+                ],
+                "raw_json": meta["raw"] or "{}",
+                "content_fingerprint": meta["fingerprint"],
+                "todo_id": meta["todo_id"],
+                # 词汇权重、ColBERT向量等附加字段原样复制
+                "extras": [
+                    {field: row[field] for field in ("lex", "lex_w", "colbert") if row.get(field) is not None}
+                    for row in chunk_rows
+                ],
+                "evicted": evicted
+            })
+        return documents
+
+    def touch(self, doc_id: str, chunk_count: int, raw_json: Optional[str] = None):
+        pipe = self.redis_client.pipeline(transaction=False)
+        for key in [self._doc_key(doc_id)] + [self._chunk_key(doc_id, i) for i in range(chunk_count)]:
+            if raw_json is not None:
+                pipe.hset(key, "raw", raw_json)
+            if int(self.vector_ttl) > 0:
+                pipe.expire(key, self.vector_ttl)
+        pipe.execute()
+
+    def refresh(self, doc_ids: Sequence[str]):
+        if not doc_ids or (int(self.vector_ttl) <= 0 and not self.budgeted):
+            return
+        self._refresh_docs_script(
+            keys=[],
+            args=[self.vector_ttl, self.prefixes["chunk"], self.prefixes["doc"], self.prefixes["todo"],
+                  self.prefixes["fp"], self.prefixes["lru"], self._lru_now()] + list(doc_ids)
+        )
+
+    def existing(self, doc_ids: Sequence[str]) -> set:
+        # 元数据键或旧版单向量键任一存在即视为有向量
+        pipe = self.redis_client.pipeline(transaction=False)
+        for doc_id in doc_ids:
+            pipe.exists(self._doc_key(doc_id), self._legacy_key(doc_id))
+        return {doc_id for doc_id, found in zip(doc_ids, pipe.execute()) if found}
+
+    def delete(self, user_id: str, doc_ids: Sequence[str] = (), todo_id: str = None) -> int:
+        keys = [f"{self.prefixes['todo']}{todo_id}"] if todo_id else []
+        return int(self._delete_docs_script(
+            keys=keys,
+            args=[user_id, self.prefixes["chunk"], self.prefixes["doc"], self.prefixes["todo"], self.prefixes["fp"],
+                  self.prefixes["usage"], self.prefixes["lru"], 1 if self.budgeted else 0] + list(doc_ids)
+        ))
+
+    def usage(self, user_id: str = None) -> Dict:
+        raw = self.redis_client.hgetall(self._usage_key(user_id))
+        values = {decode_value(field): int(value) for field, value in raw.items()}
+        return {field: values.get(field, 0) for field in self.USAGE_FIELDS}
+
+    def top_users(self, limit: int = 20) -> List[Tuple[str, int]]:
+        """
+        驻留向量字节数最多的用户
+
+        Args:
+            limit: 返回的用户数量，不大于0时返回全部
+
+        Returns:
+            List[Tuple[str, int]]: (user_id, 字节数)，按字节数降序
+        """
+        end = limit - 1 if limit > 0 else -1
+        rows = self.redis_client.zrevrange(f"{self.prefixes['usage']}_users", 0, end, withscores=True)
+        return [(decode_value(user_id), int(score)) for user_id, score in rows]
+
+    def enforce_budget(self, user_ids: Iterable[str] = ()) -> Dict:
+        """
+        按内存预算逐出向量，超出预算时分批调用逐出脚本直到满足预算
+
+        Args:
+            user_ids: 检查用户预算的用户，全局预算总是检查
+
+        Returns:
+            Dict: 逐出的内容数量 docs、释放的字节数 bytes 和被逐出内容的用户 users
+        """
+        stats = {"docs": 0, "bytes": 0, "users": []}
+        if not self.budgeted:
+            return stats
+        args = [self.user_budget, self.global_budget, self.EVICT_BATCH, self.prefixes["chunk"], self.prefixes["doc"],
+                self.prefixes["fp"], self.prefixes["usage"], self.prefixes["lru"]] + sorted(set(user_ids))
+        users = set()
+        while True:
+            evicted, freed, more, evicted_users = self._evict_docs_script(keys=[], args=args)
+            stats["docs"] += int(evicted)
+            stats["bytes"] += int(freed)
+            users.update(decode_value(user_id) for user_id in evicted_users)
+            if not int(more):
+                stats["users"] = sorted(users)
+                return stats
+
+    def _enforce_after_write(self, user_ids: Iterable[str]):
+        """写入后检查预算，逐出失败不影响写入结果"""
+        if not self.budgeted:
+            return
+        try:
+            stats = self.enforce_budget(user_ids)
+            if stats["docs"]:
+                print(f"向量内存超出预算，逐出 {stats['docs']} 个内容（{stats['bytes'] / 1024 / 1024:.1f}MB）")
+                # 逐出的内容只能被词汇检索命中，缓存的检索结果随之过时
+                if self.on_evict is not None:
+                    self.on_evict(stats["users"])
+        except Exception as e:
+            print(f"向量预算逐出失败: {e}")
+
+    def count(self, user_id: str) -> int:
+        q = Query(f"@user_id:{{{self._escape_tag(user_id)}}}").paging(0, 0).no_content().dialect(2)
+        return int(self.redis_client.ft(self.search_index).search(q).total)
+
+    def search(self, query_vec: np.ndarray, user_id: str, knn: int, total: int = None,
+               ef_runtime: int = None, exact: bool = False) -> List[Dict]:
+        #查询向量按索引的存储类型转为字节向量
+        query_vec_bytes, _ = encode_vector(query_vec, self.vector_type)
+        if not exact:
+            total = self.count(user_id) if total is None else total
+            exact = total <= db_config.vector_exact_search_threshold
+        # 精确打分（ADHOC_BF）不经过HNSW，近似检索为过滤后的HNSW（BATCHES），可按查询指定EF_RUNTIME
+        if exact:
+            attributes = "HYBRID_POLICY ADHOC_BF"
+        else:
+            attributes = "HYBRID_POLICY BATCHES" + (f" EF_RUNTIME {int(ef_runtime)}" if ef_runtime else "")
+        query_str = (
+            f"@user_id:{{{self._escape_tag(user_id)}}}"
+            f"=>[KNN {knn} @vector $vec {attributes} AS score]"
+        )
+        q = (
+            Query(query_str)
+            .sort_by("score")
+            .paging(0, knn)
+            .return_fields("user_id", "doc_id", "chunk_index", "text", "raw", "score")
+            .dialect(2)
+        )
+        docs = self.redis_client.ft(self.search_index).search(q, query_params={"vec": query_vec_bytes}).docs
+        # 余弦距离换算为相似度
+        return [self._hit(doc, 1 - float(getattr(doc, 'score', 0.0)) / 2) for doc in docs]
+
+    def search_global(self, query_vec: np.ndarray, knn: int, ef_runtime: int = None) -> List[Dict]:
+        query_vec_bytes, _ = encode_vector(query_vec, self.vector_type)
+        attributes = f" EF_RUNTIME {int(ef_runtime)}" if ef_runtime else ""
+        q = (
+            Query(f"*=>[KNN {knn} @vector $vec{attributes} AS score]")
+            .sort_by("score")
+            .paging(0, knn)
+            .return_fields("user_id", "doc_id", "chunk_index", "text", "raw", "score")
+            .dialect(2)
+        )
+        docs = self.redis_client.ft(self.search_index).search(q, query_params={"vec": query_vec_bytes}).docs
+        return [self._hit(doc, 1 - float(getattr(doc, 'score', 0.0)) / 2) for doc in docs]
+
+    def search_lexical(self, terms: List[str], user_id: str, limit: int) -> List[Dict]:
+        q = (
+            Query(f"@user_id:{{{self._escape_tag(user_id)}}} @lex:({'|'.join(terms)})")
+            .scorer("BM25")
+            .paging(0, limit)
+            .return_fields("user_id", "doc_id", "chunk_index", "text", "raw", "lex_w")
+            .dialect(2)
+        )
+        return [self._hit(doc) for doc in self.redis_client.ft(self.search_index).search(q).docs]
+
+    def get_chunk_values(self, chunk_refs: List[Tuple[str, int]], field: str) -> List:
+        pipe = self.redis_client.pipeline(transaction=False)
+        for doc_id, chunk_index in chunk_refs:
+            pipe.hget(self._chunk_key(doc_id, chunk_index), field)
+        return pipe.execute()
+
+    def get_chunks(self, doc_id: str, chunk_count: int, with_vector: bool = False) -> List[Dict]:
+        # 旧版单向量键直接读取
+        keys = [self._chunk_key(doc_id, i) for i in range(chunk_count)] or [self._legacy_key(doc_id)]
+        fields = ["text", "start", "end"] + (["vector", "vector_scale"] if with_vector else [])
+        pipe = self.redis_client.pipeline(transaction=False)
+        for key in keys:
+            pipe.hmget(key, fields)
+
+        chunks = []
+        for row in pipe.execute():
+            if row[0] is None:
+                continue
+            text = decode_value(row[0])
+            start = int(row[1] or 0)
+            chunk = {"text": text, "start": start, "end": int(row[2] or start + len(text))}
+            if with_vector and row[3]:
+                chunk["vector"] = decode_vector(row[3], db_config.vector_dim, row[4])
+            chunks.append(chunk)
+        return chunks
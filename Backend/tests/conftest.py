@@ -0,0 +1,7 @@
+# 测试公共配置：config.database 在导入时连接MongoDB和Redis并初始化索引，
+# 这里先用替身客户端导入它，单元测试不需要数据库服务；需要Redis行为的测试使用各自的进程内替身
+import importlib
+from unittest import mock
+
+with mock.patch("pymongo.MongoClient"), mock.patch("redis.Redis"):
+    importlib.import_module("config.database")
@@ -0,0 +1,118 @@
+# 编码微批处理测试：并发请求合并、等待超时出队、按选项分组与异常分发（编码函数用替身，不加载模型）
+#
+# 用法（在 Backend 目录下）:
+#     python -m pytest tests/test_embedding_batcher.py
+import threading
+import time
+import pytest
+from services.embedding_batcher import EmbeddingBatcher
+
+
+class _Encoder:
+    """编码函数替身，记录每次前向计算的输入，逐行返回 文本|max_length|选项"""
+
+    def __init__(self, error: Exception = None):
+        self.error = error
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def __call__(self, texts, batch_size, max_length, options):
+        with self._lock:
+            self.calls.append((list(texts), max_length, options))
+        if self.error is not None:
+            raise self.error
+        return [f"{text}|{max_length}|{','.join(options)}" for text in texts]
+
+
+def _concurrent(batcher: EmbeddingBatcher, requests: list) -> list:
+    """每个请求一个线程同时提交，按请求顺序返回结果"""
+    results = [None] * len(requests)
+
+    def run(i, texts, options):
+        results[i] = batcher.encode(texts, 512, options)
+
+    threads = [threading.Thread(target=run, args=(i, texts, options)) for i, (texts, options) in enumerate(requests)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=5)
+    return results
+
+
+def test_concurrent_requests_are_coalesced_into_one_forward_pass():
+    encoder = _Encoder()
+    # 等待时间足够长，只有攒够批大小才会出队
+    batcher = EmbeddingBatcher(encoder, max_batch_size=4, max_wait_ms=5000)
+    results = _concurrent(batcher, [([f"t{i}"], ()) for i in range(4)])
+
+    assert len(encoder.calls) == 1
+    assert sorted(encoder.calls[0][0]) == ["t0", "t1", "t2", "t3"]
+    # 结果行分发回各自的调用方
+    assert results == [[f"t{i}|512|"] for i in range(4)]
+    stats = batcher.stats()
+    assert stats["requests"] == 4
+    assert stats["batches"] == 1
+    assert stats["max_batch_size"] == 4
+
+
+def test_partial_batch_is_flushed_after_max_wait():
+    encoder = _Encoder()
+    batcher = EmbeddingBatcher(encoder, max_batch_size=32, max_wait_ms=50)
+    started = time.perf_counter()
+    assert batcher.encode(["a", "b"], 256) == ["a|256|", "b|256|"]
+    elapsed = time.perf_counter() - started
+
+    # 没有攒够批大小时等到超时才出队
+    assert elapsed >= 0.04
+    assert elapsed < 2
+    assert encoder.calls == [(["a", "b"], 256, ())]
+
+
+def test_requests_with_different_options_are_encoded_separately():
+    encoder = _Encoder()
+    batcher = EmbeddingBatcher(encoder, max_batch_size=3, max_wait_ms=5000)
+    results = _concurrent(batcher, [(["d1"], ()), (["s1"], ("sparse",)), (["d2"], ())])
+
+    assert results == [["d1|512|"], ["s1|512|sparse"], ["d2|512|"]]
+    passes = sorted((sorted(texts), options) for texts, _, options in encoder.calls)
+    assert passes == [(["d1", "d2"], ()), (["s1"], ("sparse",))]
+    assert batcher.stats()["forward_passes"] == 2
+
+
+def test_texts_are_bucketed_by_length():
+    encoder = _Encoder()
+    batcher = EmbeddingBatcher(encoder, max_batch_size=2, max_wait_ms=5000, length_buckets=(8,))
+    results = _concurrent(batcher, [(["short"], ()), (["x" * 100], ())])
+
+    assert results == [["short|512|"], ["x" * 100 + "|512|"]]
+    assert sorted(texts for texts, _, _ in encoder.calls) == [["short"], ["x" * 100]]
+
+
+def test_encode_error_is_raised_to_every_caller():
+    batcher = EmbeddingBatcher(_Encoder(error=RuntimeError("oom")), max_batch_size=2, max_wait_ms=5000)
+    errors = []
+
+    def run(text):
+        try:
+            batcher.encode([text], 512)
+        except RuntimeError as e:
+            errors.append(str(e))
+
+    threads = [threading.Thread(target=run, args=(text,)) for text in ("a", "b")]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=5)
+    assert errors == ["oom", "oom"]
+    assert batcher.stats()["errors"] == 1
+
+
+
+def test_worker_keeps_serving_after_an_error():
+    encoder = _Encoder(error=RuntimeError("oom"))
+    batcher = EmbeddingBatcher(encoder, max_batch_size=1, max_wait_ms=0)
+    with pytest.raises(RuntimeError):
+        batcher.encode(["a"], 512)
+
+    encoder.error = None
+    assert batcher.encode(["b"], 512) == ["b|512|"]
@@ -0,0 +1,109 @@
+# 查询向量缓存测试：进程内LRU与Redis两级命中、容量淘汰、Redis不可用时降级（进程内的Redis替身，不需要Redis）
+#
+# 用法（在 Backend 目录下）:
+#     python -m pytest tests/test_embedding_cache.py
+import numpy as np
+from services.embedding_cache import EmbeddingCache, normalize_query
+
+
+class _MemoryRedis:
+    """EmbeddingCache 用到的 Redis 命令的进程内实现"""
+
+    def __init__(self):
+        self.values = {}
+        self.ttls = {}
+        self.down = False
+
+    def _check(self):
+        if self.down:
+            raise ConnectionError("redis down")
+
+    def get(self, key):
+        self._check()
+        return self.values.get(key)
+
+    def setex(self, key, ttl, value):
+        self._check()
+        self.values[key] = value
+        self.ttls[key] = ttl
+
+
+def _cache(redis_client: _MemoryRedis, max_entries: int = 8, model_name: str = "bge-m3") -> EmbeddingCache:
+    return EmbeddingCache(redis_client, namespace="qvec", model_name=model_name, max_entries=max_entries, ttl=60)
+
+
+def _vector(seed: int) -> np.ndarray:
+    return np.random.default_rng(seed).standard_normal(8).astype(np.float32)
+
+
+def test_set_writes_both_tiers_and_local_hit_skips_redis():
+    redis_client = _MemoryRedis()
+    cache = _cache(redis_client)
+    vector = _vector(1)
+    assert cache.set("query", vector)
+
+    key = f"qvec:{cache.digest('query')}"
+    assert redis_client.ttls[key] == 60
+    assert np.frombuffer(redis_client.values[key], dtype=np.float32).tolist() == vector.tolist()
+
+    # 进程内LRU命中时不访问Redis
+    redis_client.down = True
+    assert np.array_equal(cache.get("query"), vector)
+    assert cache.stats()["local_hits"] == 1
+
+
+def test_redis_hit_is_shared_across_processes_and_promoted_to_lru():
+    redis_client = _MemoryRedis()
+    vector = _vector(2)
+    _cache(redis_client).set("query", vector)
+
+    # 另一个进程的缓存实例：本地LRU为空，从Redis读取
+    other = _cache(redis_client)
+    assert np.array_equal(other.get("query"), vector)
+    assert other.stats()["redis_hits"] == 1
+
+    redis_client.down = True
+    assert np.array_equal(other.get("query"), vector)
+    assert other.stats()["local_hits"] == 1
+
+
+def test_miss_and_model_name_isolation():
+    redis_client = _MemoryRedis()
+    _cache(redis_client, model_name="bge-m3").set("query", _vector(3))
+    other_model = _cache(redis_client, model_name="other-model")
+    assert other_model.get("query") is None
+    stats = other_model.stats()
+    assert stats["misses"] == 1
+    assert stats["hit_rate"] == 0.0
+
+
+def test_lru_evicts_least_recently_used_entry():
+    redis_client = _MemoryRedis()
+    cache = _cache(redis_client, max_entries=2)
+    cache.set("a", _vector(1))
+    cache.set("b", _vector(2))
+    cache.get("a")
+    cache.set("c", _vector(3))
+    assert cache.stats()["local_entries"] == 2
+
+    # b 最久未使用，被淘汰后只能从Redis读取
+    redis_client.down = True
+    assert cache.get("a") is not None
+    assert cache.get("c") is not None
+    assert cache.get("b") is None
+
+
+def test_redis_failure_degrades_to_local_cache():
+    redis_client = _MemoryRedis()
+    redis_client.down = True
+    cache = _cache(redis_client)
+    vector = _vector(4)
+    assert not cache.set("query", vector)
+    assert np.array_equal(cache.get("query"), vector)
+    assert cache.get("missing") is None
+    assert cache.stats()["errors"] == 2
+
+
+def test_normalize_query():
+    assert normalize_query("  ＡＢＣ\t\n１２３  ") == "ABC 123"
+    assert normalize_query(None) == ""
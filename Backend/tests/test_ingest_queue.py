@@ -0,0 +1,198 @@
+# 入库队列测试：失败重试、超过尝试次数转入死信流、崩溃接管计入尝试次数、死信重新投递（进程内的Redis替身，不需要Redis）
+#
+# 用法（在 Backend 目录下）:
+#     python -m pytest tests/test_ingest_queue.py
+import pytest
+from config.settings import app_config
+from services import ingest_queue
+from services.ingest_queue import INGEST_STREAM, IngestQueue, IngestWorker
+
+
+class _MemoryRedis:
+    """IngestQueue 用到的 Redis Streams 命令的进程内实现（单个消费者组）"""
+
+    def __init__(self):
+        self.streams = {}
+        self.delivered = set()
+        self.pending = {}
+        self._seq = 0
+
+    def pipeline(self, transaction: bool = True):
+        return _MemoryPipeline(self)
+
+    def xgroup_create(self, name, groupname, id="0", mkstream=False):
+        self.streams.setdefault(name, [])
+
+    def xadd(self, name, fields, maxlen=None, approximate=True):
+        self._seq += 1
+        message_id = f"{self._seq}-0".encode()
+        self.streams.setdefault(name, []).append((message_id, {k.encode(): v.encode() for k, v in fields.items()}))
+        return message_id
+
+    def xreadgroup(self, groupname, consumername, streams, count=None, block=None):
+        response = []
+        for name in streams:
+            messages = [(message_id, fields) for message_id, fields in self.streams.get(name, [])
+                        if message_id not in self.delivered][:count]
+            for message_id, _ in messages:
+                self.delivered.add(message_id)
+                self.pending[message_id] = self.pending.get(message_id, 0) + 1
+            if messages:
+                response.append([name.encode(), messages])
+        return response
+
+    def xack(self, name, groupname, *ids):
+        for message_id in ids:
+            self.pending.pop(message_id.encode() if isinstance(message_id, str) else message_id, None)
+
+    def xdel(self, name, *ids):
+        ids = {message_id.encode() if isinstance(message_id, str) else message_id for message_id in ids}
+        self.streams[name] = [(message_id, fields) for message_id, fields in self.streams.get(name, [])
+                              if message_id not in ids]
+
+    def xrange(self, name, count=None):
+        return self.streams.get(name, [])[:count]
+
+    def xlen(self, name):
+        return len(self.streams.get(name, []))
+
+    def expire(self, name, seconds):
+        pass
+
+
+class _MemoryPipeline:
+    def __init__(self, redis_client: _MemoryRedis):
+        self.redis_client = redis_client
+        self.calls = []
+
+    def __getattr__(self, name):
+        def queue(*args, **kwargs):
+            self.calls.append((getattr(self.redis_client, name), args, kwargs))
+        return queue
+
+    def execute(self):
+        results = [call(*args, **kwargs) for call, args, kwargs in self.calls]
+        self.calls = []
+        return results
+
+
+class _Contents:
+    """TodoContentModel 替身，记录写回的入库状态"""
+
+    updates = []
+
+    def update_content(self, content_id, user_id, fields):
+        self.updates.append((content_id, fields.get("index_status")))
+        return True, None, None
+
+
+class _Cache:
+    """CacheService 替身，记录失效的Todo缓存"""
+
+    invalidated = []
+
+    def invalidate_todo_cache(self, todo_id, user_id):
+        self.invalidated.append(todo_id)
+
+
+@pytest.fixture
+def queue(monkeypatch):
+    monkeypatch.setattr(ingest_queue, "TodoContentModel", _Contents)
+    monkeypatch.setattr("services.cache_service.CacheService", _Cache)
+    monkeypatch.setattr(app_config, "ingest_max_attempts", 3)
+    _Contents.updates = []
+    _Cache.invalidated = []
+    return IngestQueue(_MemoryRedis())
+
+
+def _failing(monkeypatch, error: str = "ocr failed"):
+    calls = []
+
+    def index_content(content_id, user_id, todo_id, *args, **kwargs):
+        calls.append(content_id)
+        raise RuntimeError(error)
+
+    monkeypatch.setattr(ingest_queue, "index_content", index_content)
+    return calls
+
+
+def _events(queue: IngestQueue, user_id: str = "u1") -> list:
+    """用户进度事件的状态序列"""
+    return [fields[b"status"].decode() for _, fields in queue.redis_client.xrange(f"ingest:events:{user_id}")]
+
+
+def _drain(queue: IngestQueue, worker: IngestWorker) -> int:
+    """处理队列中的全部任务，返回处理次数"""
+    handled = 0
+    while True:
+        messages = queue.read(worker.consumer, count=10, block_ms=0)
+        if not messages:
+            return handled
+        for message_id, job in messages:
+            worker.handle(message_id, job)
+            handled += 1
+
+
+def test_success_acks_and_removes_the_job(queue, monkeypatch):
+    monkeypatch.setattr(ingest_queue, "index_content", lambda *args, **kwargs: True)
+    queue.enqueue("c1", "u1", "t1")
+    assert _drain(queue, IngestWorker(queue, consumer="w1")) == 1
+    assert queue.redis_client.xlen(INGEST_STREAM) == 0
+    assert queue.redis_client.pending == {}
+    assert queue.dead_letters() == []
+
+
+def test_failed_job_is_retried_then_dead_lettered(queue, monkeypatch):
+    calls = _failing(monkeypatch)
+    queue.enqueue("c1", "u1", "t1")
+    assert _drain(queue, IngestWorker(queue, consumer="w1")) == 3
+
+    assert calls == ["c1", "c1", "c1"]
+    # 每次失败都确认原任务，任务流中不留下未确认或重复的条目
+    assert queue.redis_client.xlen(INGEST_STREAM) == 0
+    assert queue.redis_client.pending == {}
+    dead = queue.dead_letters()
+    assert len(dead) == 1
+    assert dead[0][1]["content_id"] == "c1"
+    assert dead[0][1]["attempts"] == "3"
+    assert dead[0][1]["error"] == "ocr failed"
+    assert _Contents.updates == [("c1", "pending"), ("c1", "pending"), ("c1", "failed")]
+    assert _Cache.invalidated == ["t1"]
+    assert _events(queue) == ["pending", "retrying", "retrying", "failed"]
+
+
+def test_crashed_deliveries_count_as_attempts(queue, monkeypatch):
+    calls = _failing(monkeypatch)
+    queue.enqueue("c1", "u1", "t1")
+    message_id, job = queue.read("w1", block_ms=0)[0]
+
+    # 前两次投递的消费者崩溃，接管后的第三次投递是最后一次尝试，失败后转入死信流
+    IngestWorker(queue, consumer="w2").handle(message_id, job, deliveries=3)
+    assert calls == ["c1"]
+    assert queue.dead_letters()[0][1]["attempts"] == "3"
+
+
+def test_job_crashing_every_consumer_is_dead_lettered_without_running(queue, monkeypatch):
+    calls = _failing(monkeypatch)
+    queue.enqueue("c1", "u1", "t1")
+    message_id, job = queue.read("w1", block_ms=0)[0]
+
+    # 三次投递都在处理中崩溃，不再执行入库
+    IngestWorker(queue, consumer="w2").handle(message_id, job, deliveries=4)
+    assert calls == []
+    assert queue.dead_letters()[0][1]["attempts"] == "3"
+    assert _Contents.updates == [("c1", "failed")]
+
+
+def test_requeue_dead_resets_attempts(queue, monkeypatch):
+    _failing(monkeypatch)
+    queue.enqueue("c1", "u1", "t1")
+    worker = IngestWorker(queue, consumer="w1")
+    _drain(queue, worker)
+
+    assert queue.requeue_dead() == 1
+    assert queue.dead_letters() == []
+    message_id, job = queue.read(worker.consumer, block_ms=0)[0]
+    assert job["content_id"] == "c1"
+    assert job["attempts"] == "0"
+    assert _Contents.updates[-1] == ("c1", "pending")
@@ -0,0 +1,195 @@
+# MmapVectorStore 测试：日志重放与压缩、崩溃顺序、向量行复用、删除时的归属检查
+#
+# 用法（在 Backend 目录下）:
+#     python -m pytest tests/test_mmap_vector_store.py
+import json
+import os
+import numpy as np
+import pytest
+from services.mmap_vector_store import LOG_FILE, MmapVectorStore
+
+DIM = 8
+
+
+def _vector(seed: int) -> np.ndarray:
+    return np.random.default_rng(seed).standard_normal(DIM).astype(np.float32)
+
+
+def _save(store: MmapVectorStore, doc_id: str, user_id: str = "u1", n_chunks: int = 2, seed: int = 0, **kwargs) -> int:
+    chunks = [{"text": f"{doc_id} 分块{i}", "start": i * 10, "end": i * 10 + 10} for i in range(n_chunks)]
+    return store.save(
+        doc_id=doc_id,
+        user_id=user_id,
+        chunks=chunks,
+        fingerprints=[f"{doc_id}-{seed}-{i}" for i in range(n_chunks)],
+        vectors=[_vector(seed * 100 + i) for i in range(n_chunks)],
+        raw_json=json.dumps({"doc_id": doc_id}),
+        content_fingerprint=f"{doc_id}-{seed}",
+        **kwargs
+    )
+
+
+def _rows(store: MmapVectorStore, doc_id: str) -> list:
+    return [chunk["row"] for chunk in store._docs[doc_id]["chunks"]]
+
+
+def _log_lines(root) -> list:
+    with open(os.path.join(root, LOG_FILE), "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f]
+
+
+@pytest.fixture
+def store(tmp_path):
+    return MmapVectorStore(str(tmp_path), DIM, initial_rows=4)
+
+
+def test_replay_restores_documents_and_vectors(tmp_path, store):
+    _save(store, "d1", todo_id="t1")
+    _save(store, "d2", user_id="u2", n_chunks=1, seed=1)
+    store.touch("d1", 2, json.dumps({"doc_id": "d1", "v": 2}))
+    store.delete("u2", ["d2"])
+    vectors = [chunk["vector"] for chunk in store.get_chunks("d1", 2, with_vector=True)]
+
+    reopened = MmapVectorStore(str(tmp_path), DIM, initial_rows=4)
+    assert reopened.existing(["d1", "d2"]) == {"d1"}
+    meta = reopened.get_meta("d1")
+    assert meta["user_id"] == "u1"
+    assert meta["chunks"] == 2
+    assert meta["todo_id"] == "t1"
+    assert json.loads(meta["raw"])["v"] == 2
+    for before, after in zip(vectors, reopened.get_chunks("d1", 2, with_vector=True)):
+        np.testing.assert_allclose(after["vector"], before)
+    assert reopened.count("u1") == 2
+    assert reopened.count("u2") == 0
+
+
+def test_search_returns_normalized_cosine(store):
+    _save(store, "d1")
+    query = _vector(0)
+    hits = store.search(query, "u1", knn=1)
+    assert [(hit["doc_id"], hit["chunk_index"]) for hit in hits] == [("d1", 0)]
+    assert hits[0]["score"] == pytest.approx(1.0, abs=1e-5)
+    assert store.search(query, "u2", knn=1) == []
+
+
+def test_compact_rewrites_log_as_snapshot(tmp_path, store):
+    for seed in range(5):
+        _save(store, "d1", seed=seed)
+    _save(store, "d2", seed=9)
+    store.delete("u1", ["d2"])
+    assert len(_log_lines(tmp_path)) == 7
+
+    store.compact()
+    records = _log_lines(tmp_path)
+    assert [(record["op"], record["doc_id"]) for record in records] == [("put", "d1")]
+    assert store._log_records == 1
+
+    # 压缩后继续追加，重放结果与压缩前一致
+    _save(store, "d3", seed=10)
+    reopened = MmapVectorStore(str(tmp_path), DIM, initial_rows=4)
+    assert reopened.existing(["d1", "d2", "d3"]) == {"d1", "d3"}
+    assert reopened.get_meta("d1")["fingerprint"] == "d1-4"
+    assert _rows(reopened, "d1") == _rows(store, "d1")
+
+
+def test_compact_runs_when_log_exceeds_ratio(tmp_path):
+    store = MmapVectorStore(str(tmp_path), DIM, initial_rows=4, compact_ratio=2.0)
+    for seed in range(1001):
+        _save(store, "d1", n_chunks=1, seed=seed)
+    assert len(_log_lines(tmp_path)) < 1001
+
+
+def test_rows_written_without_log_record_are_free_after_restart(tmp_path, store):
+    _save(store, "d1")
+    used = set(_rows(store, "d1"))
+
+    # 模拟崩溃：向量行已写入并flush，日志记录未落盘
+    matrix = store._matrix("u1")
+    orphan = matrix.allocate(_vector(42))
+    matrix.alive[orphan] = True
+    matrix.matrix.flush()
+
+    reopened = MmapVectorStore(str(tmp_path), DIM, initial_rows=4)
+    reused = reopened._matrix("u1")
+    assert not reused.alive[orphan]
+    assert orphan in reused.free
+    assert reopened.count("u1") == len(used)
+    _save(reopened, "d2", n_chunks=1, seed=1)
+    assert _rows(reopened, "d2") == [orphan]
+
+
+def test_partial_last_log_line_is_ignored(tmp_path, store):
+    _save(store, "d1")
+    with open(os.path.join(tmp_path, LOG_FILE), "a", encoding="utf-8") as f:
+        f.write('{"op": "del", "doc_id": "d1"')
+
+    reopened = MmapVectorStore(str(tmp_path), DIM, initial_rows=4)
+    assert reopened.existing(["d1"]) == {"d1"}
+
+
+def test_overwrite_allocates_new_rows_before_releasing_old(store):
+    _save(store, "d1", seed=0)
+    old_rows = _rows(store, "d1")
+    _save(store, "d1", seed=1)
+    new_rows = _rows(store, "d1")
+
+    # 新行在旧行释放前分配，覆盖写入不会原地改写旧向量
+    assert not set(old_rows) & set(new_rows)
+    matrix = store._matrix("u1")
+    assert all(not matrix.alive[row] for row in old_rows)
+    assert set(old_rows) <= set(matrix.free)
+    assert store.count("u1") == 2
+
+
+def test_deleted_rows_are_reused(store):
+    _save(store, "d1")
+    rows = _rows(store, "d1")
+    assert store.delete("u1", ["d1"]) == 1
+    _save(store, "d2", seed=1)
+    assert sorted(_rows(store, "d2")) == sorted(rows)
+
+
+def test_matrix_grows_when_rows_run_out(tmp_path, store):
+    _save(store, "d1", n_chunks=3)
+    _save(store, "d2", n_chunks=3, seed=1)
+    matrix = store._matrix("u1")
+    assert len(matrix.alive) == 8
+    assert store.count("u1") == 6
+
+    reopened = MmapVectorStore(str(tmp_path), DIM, initial_rows=4)
+    assert reopened.count("u1") == 6
+    hits = reopened.search(_vector(102), "u1", knn=1)
+    assert (hits[0]["doc_id"], hits[0]["chunk_index"]) == ("d2", 2)
+
+
+def test_fingerprint_reuse_returns_vector_and_extras(store):
+    _save(store, "d1", extras=[{"lex": "t1 t2", "lex_w": b"\x01\x02"}, {"lex": "t3"}])
+    found = store.find_reusable(["d1-0-0", "d1-0-1", "unknown"], ["lex", "lex_w"])
+    vector, extras = found[0]
+    np.testing.assert_allclose(vector, _vector(0) / np.linalg.norm(_vector(0)), rtol=1e-5)
+    assert extras == {"lex": "t1 t2", "lex_w": b"\x01\x02"}
+    # 缺少附加字段视为未命中
+    assert found[1] is None
+    assert found[2] is None
+
+
+def test_save_refuses_document_owned_by_other_user(store):
+    _save(store, "d1", user_id="u1")
+    assert _save(store, "d1", user_id="u2", seed=1) == -1
+    assert store.get_meta("d1")["fingerprint"] == "d1-0"
+    assert store.count("u2") == 0
+
+
+def test_delete_checks_owner(tmp_path, store):
+    _save(store, "d1", user_id="u1", todo_id="t1")
+    _save(store, "d2", user_id="u1", seed=1, todo_id="t1")
+
+    assert store.delete("u2", ["d1"]) == 0
+    assert store.delete("u2", todo_id="t1") == 0
+    assert store.existing(["d1", "d2"]) == {"d1", "d2"}
+
+    assert store.delete("u1", todo_id="t1") == 2
+    assert store.existing(["d1", "d2"]) == set()
+    reopened = MmapVectorStore(str(tmp_path), DIM, initial_rows=4)
+    assert reopened.existing(["d1", "d2"]) == set()
+    assert reopened.count("u1") == 0
@@ -0,0 +1,167 @@
+# 近重复检测测试：MinHash签名相似度、LSH候选与阈值（进程内的Redis替身，不需要Redis）
+#
+# 用法（在 Backend 目录下）:
+#     python -m pytest tests/test_near_duplicate.py
+import random
+import numpy as np
+import pytest
+from services.near_duplicate import NUM_PERM, NearDuplicateIndex, minhash, similarity
+
+THRESHOLD = 0.9
+
+
+class _MemoryRedis:
+    """NearDuplicateIndex 用到的 Redis 命令的进程内实现"""
+
+    def __init__(self):
+        self.sets = {}
+        self.hashes = {}
+
+    def pipeline(self, transaction: bool = True):
+        return _MemoryPipeline(self)
+
+    def sadd(self, key, *members):
+        self.sets.setdefault(key, set()).update(members)
+
+    def srem(self, key, *members):
+        self.sets.get(key, set()).difference_update(members)
+
+    def smembers(self, key):
+        return set(self.sets.get(key, set()))
+
+    def delete(self, *keys):
+        for key in keys:
+            self.sets.pop(key, None)
+            self.hashes.pop(key, None)
+
+    def hset(self, key, field, value):
+        self.hashes.setdefault(key, {})[field] = value
+
+    def hmget(self, key, fields):
+        return [self.hashes.get(key, {}).get(field) for field in fields]
+
+    def hdel(self, key, *fields):
+        for field in fields:
+            self.hashes.get(key, {}).pop(field, None)
+
+
+class _MemoryPipeline:
+    def __init__(self, redis_client: _MemoryRedis):
+        self.redis_client = redis_client
+        self.calls = []
+
+    def __getattr__(self, name):
+        def queue(*args, **kwargs):
+            self.calls.append((getattr(self.redis_client, name), args, kwargs))
+        return queue
+
+    def execute(self):
+        results = [call(*args, **kwargs) for call, args, kwargs in self.calls]
+        self.calls = []
+        return results
+
+
+def _text(seed: int, length: int = 3000) -> str:
+    """随机汉字组成的长文本（扫描件OCR文本量级），空格约占15%"""
+    rng = random.Random(seed)
+    return "".join(chr(0x4e00 + rng.randrange(3000)) if rng.random() > 0.15 else " " for _ in range(length))
+
+
+def _edit(text: str, n: int, seed: int = 0) -> str:
+    """随机替换 n 个字符（模拟同一文件重新扫描时的OCR差异）"""
+    rng = random.Random(seed)
+    chars = list(text)
+    for i in rng.sample(range(len(chars)), n):
+        chars[i] = "#"
+    return "".join(chars)
+
+
+def test_minhash_signature_shape_and_determinism():
+    signature = minhash(_text(1))
+    assert signature.dtype == np.uint32
+    assert signature.shape == (NUM_PERM,)
+    np.testing.assert_array_equal(signature, minhash(_text(1)))
+
+
+def test_minhash_short_text_has_no_signature():
+    assert minhash("abcd") is None
+    assert minhash("   ") is None
+
+
+def test_minhash_normalizes_whitespace_width_and_case():
+    text = _text(2)
+    variant = "\t" + text.replace(" ", "  \n") + " ｉｎｖｏｉｃｅ　ＮＯ.１２ "
+    assert similarity(minhash(text + " Invoice No.12"), minhash(variant)) == 1.0
+
+
+def test_similarity_identical_near_duplicate_unrelated():
+    text = _text(3)
+    signature = minhash(text)
+    assert similarity(signature, minhash(text)) == 1.0
+    assert similarity(signature, minhash(_edit(text, 10))) >= THRESHOLD
+    assert similarity(signature, minhash(_text(4))) < 0.1
+
+
+def test_similarity_decreases_with_more_edits():
+    text = _text(5)
+    signature = minhash(text)
+    scores = [similarity(signature, minhash(_edit(text, n))) for n in (5, 50, 300)]
+    assert scores == sorted(scores, reverse=True)
+    assert scores[-1] < THRESHOLD
+
+
+@pytest.fixture
+def index():
+    return NearDuplicateIndex(_MemoryRedis())
+
+
+def test_find_returns_near_duplicate_above_threshold(index):
+    text = _text(6)
+    index.add("u1", "canonical", minhash(text))
+    index.add("u1", "other", minhash(_text(7)))
+
+    found = index.find("u1", minhash(_edit(text, 10)), THRESHOLD)
+    assert found is not None
+    assert found[0] == "canonical"
+    assert found[1] >= THRESHOLD
+
+
+def test_find_ignores_unrelated_and_below_threshold(index):
+    text = _text(8)
+    index.add("u1", "canonical", minhash(text))
+    assert index.find("u1", minhash(_text(9)), THRESHOLD) is None
+    # 有band完全相同而成为候选，但完整签名估计的相似度达不到阈值
+    edited = minhash(_edit(text, 120))
+    candidate = index.find("u1", edited, 0.0)
+    assert candidate is not None and candidate[1] < THRESHOLD
+    assert index.find("u1", edited, THRESHOLD) is None
+
+
+def test_find_is_scoped_to_user_and_excludes_self(index):
+    signature = minhash(_text(10))
+    index.add("u1", "d1", signature)
+    assert index.find("u2", signature, THRESHOLD) is None
+    assert index.find("u1", signature, THRESHOLD, exclude="d1") is None
+    assert index.find("u1", signature, THRESHOLD) == ("d1", 1.0)
+
+
+def test_find_prefers_most_similar(index):
+    text = _text(11)
+    index.add("u1", "far", minhash(_edit(text, 20, seed=1)))
+    index.add("u1", "near", minhash(_edit(text, 2, seed=2)))
+    assert index.find("u1", minhash(text), THRESHOLD)[0] == "near"
+
+
+def test_link_unlink_and_remove(index):
+    signature = minhash(_text(12))
+    index.add("u1", "d1", signature)
+    index.link("u1", "d1", "dup1")
+    index.link("u1", "d1", "dup2")
+    assert index.linked("u1", ["d1", "d2"]) == {"d1": ["dup1", "dup2"]}
+
+    index.unlink("u1", "d1", "dup1")
+    assert index.linked("u1", ["d1"]) == {"d1": ["dup2"]}
+
+    index.remove("u1", ["d1"])
+    assert index.linked("u1", ["d1"]) == {}
+    assert index.find("u1", signature, THRESHOLD) is None
@@ -0,0 +1,76 @@
+# 全量重建测试：窗口乱序完成时的检查点推进、中间窗口失败后的续跑位置（窗口重建用替身，不需要Redis和MongoDB）
+#
+# 用法（在 Backend 目录下）:
+#     python -m pytest tests/test_reindex.py
+import threading
+import pytest
+from scripts import reindex
+
+
+def _stats(docs: int) -> dict:
+    return {"docs": docs, "chunks": docs * 2, "skipped": 0, "linked": 0, "failed": 0, "moved": 0}
+
+
+def _windows(count: int, size: int = 3) -> list:
+    """按 _id 升序的内容窗口，_id 为递增的十六进制字符串"""
+    return [[{"_id": f"{w * size + i:024x}"} for i in range(size)] for w in range(count)]
+
+
+@pytest.fixture
+def checkpoint_path(tmp_path):
+    return str(tmp_path / "checkpoint.json")
+
+
+def test_checkpoint_advances_only_over_contiguous_windows(checkpoint_path):
+    checkpoint = reindex._load_checkpoint(checkpoint_path, {"user": None}, restart=False)
+    tracker = reindex.CheckpointTracker(checkpoint, checkpoint_path)
+
+    tracker.finish(1, "b", 3, _stats(3))
+    assert checkpoint["last_id"] is None
+    tracker.finish(0, "a", 3, _stats(2))
+    assert checkpoint["last_id"] == "b"
+    assert checkpoint["docs"] == 5
+    assert checkpoint["chunks"] == 10
+    assert reindex._load_checkpoint(checkpoint_path, {"user": None}, restart=False)["last_id"] == "b"
+
+
+def test_failed_middle_window_pins_the_resume_point(checkpoint_path, monkeypatch):
+    windows = _windows(4)
+    failing = windows[1][-1]["_id"]
+    release = threading.Event()
+
+    def reindex_window(vector_service, contents, batch_size, previous=None):
+        if contents[-1]["_id"] == failing:
+            raise RuntimeError("encode failed")
+        if contents is windows[2]:
+            # 失败窗口之后的窗口先完成
+            release.set()
+        elif contents is windows[0]:
+            release.wait(5)
+        return _stats(len(contents))
+
+    monkeypatch.setattr(reindex, "reindex_window", reindex_window)
+    checkpoint = reindex._load_checkpoint(checkpoint_path, {"user": None}, restart=False)
+    tracker = reindex.CheckpointTracker(checkpoint, checkpoint_path)
+    reindex.reindex_windows(None, iter(windows), tracker, batch_size=8, workers=2)
+
+    # 失败窗口之后的窗口已经写入，但检查点停在失败窗口之前
+    assert tracker.processed == 9
+    assert tracker.failed == 3
+    assert tracker.failed_windows == 1
+    resumed = reindex._load_checkpoint(checkpoint_path, {"user": None}, restart=False)
+    assert resumed["last_id"] == windows[0][-1]["_id"]
+    assert resumed["docs"] == 3
+
+    # 重跑从失败的窗口开始
+    rerun = [window for window in windows if window[0]["_id"] > resumed["last_id"]]
+    assert rerun[0] is windows[1]
+
+
+def test_checkpoint_with_other_scope_restarts(checkpoint_path):
+    checkpoint = reindex._load_checkpoint(checkpoint_path, {"user": "u1"}, restart=False)
+    reindex.CheckpointTracker(checkpoint, checkpoint_path).finish(0, "a", 1, _stats(1))
+
+    assert reindex._load_checkpoint(checkpoint_path, {"user": "u2"}, restart=False)["last_id"] is None
+    assert reindex._load_checkpoint(checkpoint_path, {"user": "u1"}, restart=True)["last_id"] is None
+    assert reindex._load_checkpoint(checkpoint_path, {"user": "u1"}, restart=False)["last_id"] == "a"
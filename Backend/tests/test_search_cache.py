@@ -0,0 +1,112 @@
+# 检索结果缓存测试：按用户写入纪元失效、查询规范化、Redis不可用时降级（进程内的Redis替身，不需要Redis）
+#
+# 用法（在 Backend 目录下）:
+#     python -m pytest tests/test_search_cache.py
+from services.search_cache import SearchResultCache
+
+PARAMS = {"top_k": 5, "mode": "dense"}
+RESULTS = [{"doc_id": "c1", "score": 0.9}]
+
+
+class _MemoryRedis:
+    """SearchResultCache 用到的 Redis 命令的进程内实现"""
+
+    def __init__(self):
+        self.values = {}
+        self.ttls = {}
+        self.down = False
+
+    def _check(self):
+        if self.down:
+            raise ConnectionError("redis down")
+
+    def pipeline(self, transaction: bool = True):
+        return _MemoryPipeline(self)
+
+    def get(self, key):
+        self._check()
+        return self.values.get(key)
+
+    def setex(self, key, ttl, value):
+        self._check()
+        self.values[key] = value.encode("utf-8") if isinstance(value, str) else value
+        self.ttls[key] = ttl
+
+    def incr(self, key):
+        self._check()
+        self.values[key] = str(int(self.values.get(key) or 0) + 1).encode()
+        return int(self.values[key])
+
+
+class _MemoryPipeline:
+    def __init__(self, redis_client: _MemoryRedis):
+        self.redis_client = redis_client
+        self.calls = []
+
+    def __getattr__(self, name):
+        def queue(*args, **kwargs):
+            self.calls.append((getattr(self.redis_client, name), args, kwargs))
+        return queue
+
+    def execute(self):
+        results = [call(*args, **kwargs) for call, args, kwargs in self.calls]
+        self.calls = []
+        return results
+
+
+def _cache(redis_client: _MemoryRedis) -> SearchResultCache:
+    return SearchResultCache(redis_client, namespace="search", ttl=300)
+
+
+def test_miss_then_hit_after_set():
+    redis_client = _MemoryRedis()
+    cache = _cache(redis_client)
+    cached, key = cache.get("u1", "invoice", PARAMS)
+    assert cached is None
+    cache.set(key, RESULTS)
+    assert redis_client.ttls[key] == 300
+
+    assert cache.get("u1", "invoice", PARAMS) == (RESULTS, key)
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"]) == (1, 1)
+
+
+def test_bump_invalidates_only_that_user():
+    cache = _cache(_MemoryRedis())
+    for user_id in ("u1", "u2"):
+        _, key = cache.get(user_id, "invoice", PARAMS)
+        cache.set(key, RESULTS)
+
+    cache.bump(["u1", "u1", None])
+    assert cache.get("u1", "invoice", PARAMS)[0] is None
+    assert cache.get("u2", "invoice", PARAMS)[0] == RESULTS
+    assert cache.stats()["bumps"] == 1
+
+
+def test_results_computed_before_a_bump_are_not_served_after_it():
+    cache = _cache(_MemoryRedis())
+    # 纪元在检索前读取：检索期间发生写入，回填的结果落在旧纪元的键上
+    _, key = cache.get("u1", "invoice", PARAMS)
+    cache.bump(["u1"])
+    cache.set(key, RESULTS)
+    cached, new_key = cache.get("u1", "invoice", PARAMS)
+    assert cached is None
+    assert new_key != key
+
+
+def test_key_depends_on_normalized_query_and_params():
+    cache = _cache(_MemoryRedis())
+    _, key = cache.get("u1", "  发票\t2024 ", PARAMS)
+    cache.set(key, RESULTS)
+    assert cache.get("u1", "发票 2024", dict(reversed(list(PARAMS.items()))))[0] == RESULTS
+    assert cache.get("u1", "发票 2024", {**PARAMS, "top_k": 10})[0] is None
+
+
+def test_redis_failure_disables_caching():
+    redis_client = _MemoryRedis()
+    cache = _cache(redis_client)
+    redis_client.down = True
+    assert cache.get("u1", "invoice", PARAMS) == (None, None)
+    cache.set(None, RESULTS)
+    cache.bump(["u1"])
+    assert cache.stats()["errors"] == 2
@@ -0,0 +1,51 @@
+# 向量分片路由测试：分片地址解析、按用户的rendezvous哈希路由与扩容时的迁移量（不连接分片，不需要Redis）
+#
+# 用法（在 Backend 目录下）:
+#     python -m pytest tests/test_shard_map.py
+import pytest
+from config.database import ShardMap, parse_shard_endpoints
+
+ENDPOINTS = ["10.0.0.1:6379/0", "10.0.0.2:6379/0", "10.0.0.3:6380/1"]
+USERS = [f"user{i}" for i in range(3000)]
+
+
+def test_parse_shard_endpoints_normalizes_addresses():
+    assert parse_shard_endpoints("10.0.0.1, 10.0.0.2:6380/2 ,,") == ["10.0.0.1:6379/0", "10.0.0.2:6380/2"]
+    with pytest.raises(ValueError):
+        parse_shard_endpoints("10.0.0.1,10.0.0.1:6379/0")
+
+
+def test_single_shard_routes_every_user_to_it():
+    shard_map = ShardMap(ENDPOINTS[:1])
+    assert len(shard_map) == 1
+    assert {shard_map.shard_for(user_id) for user_id in USERS[:100]} == {0}
+
+
+def test_routing_is_deterministic_and_balanced():
+    shard_map = ShardMap(ENDPOINTS)
+    routes = [shard_map.shard_for(user_id) for user_id in USERS]
+    # 其他进程用同一分片表得到相同的路由
+    assert routes == [ShardMap(ENDPOINTS).shard_for(user_id) for user_id in USERS]
+    for shard in range(len(ENDPOINTS)):
+        assert abs(routes.count(shard) / len(USERS) - 1 / 3) < 0.05
+
+
+def test_routing_does_not_depend_on_endpoint_order():
+    shard_map = ShardMap(ENDPOINTS)
+    reordered = ShardMap(list(reversed(ENDPOINTS)))
+    for user_id in USERS[:200]:
+        assert shard_map.endpoints[shard_map.shard_for(user_id)] == reordered.endpoints[reordered.shard_for(user_id)]
+
+
+def test_adding_a_shard_only_moves_users_to_the_new_shard():
+    before = ShardMap(ENDPOINTS)
+    after = ShardMap(ENDPOINTS + ["10.0.0.4:6379/0"])
+    moved = 0
+    for user_id in USERS:
+        old = before.endpoints[before.shard_for(user_id)]
+        new = after.endpoints[after.shard_for(user_id)]
+        if old != new:
+            assert new == "10.0.0.4:6379/0"
+            moved += 1
+    # 约 1/4 的用户迁移到新分片
+    assert abs(moved / len(USERS) - 1 / 4) < 0.05
@@ -0,0 +1,54 @@
+# 向量存储编码测试：FLOAT32/FLOAT16/INT8 往返与字节长度校验
+#
+# 用法（在 Backend 目录下）:
+#     python -m pytest tests/test_vector_codec.py
+import numpy as np
+import pytest
+from services.vector_codec import check_vector_type, decode_vector, encode_vector, vector_bytes
+
+DIM = 16
+
+
+def _vector() -> np.ndarray:
+    vector = np.random.default_rng(3).standard_normal(DIM).astype(np.float32)
+    return vector / np.linalg.norm(vector)
+
+
+@pytest.mark.parametrize("vector_type, atol", [("FLOAT32", 0.0), ("FLOAT16", 1e-3), ("INT8", 1e-2)])
+def test_round_trip(vector_type, atol):
+    vector = _vector()
+    data, scale = encode_vector(vector, vector_type)
+    assert len(data) == vector_bytes(DIM, vector_type)
+    assert (scale is not None) == (vector_type == "INT8")
+    decoded = decode_vector(data, DIM, scale)
+    assert decoded.dtype == np.float32
+    np.testing.assert_allclose(decoded, vector, atol=atol)
+
+
+def test_int8_without_scale_decodes_to_unit_vector():
+    vector = _vector() * 5
+    data, _ = encode_vector(vector, "INT8")
+    decoded = decode_vector(data, DIM)
+    assert float(np.linalg.norm(decoded)) == pytest.approx(1.0, abs=1e-5)
+    assert float(decoded @ (vector / np.linalg.norm(vector))) > 0.999
+
+
+def test_int8_zero_vector():
+    data, scale = encode_vector(np.zeros(DIM, dtype=np.float32), "INT8")
+    assert scale == 1.0
+    np.testing.assert_array_equal(decode_vector(data, DIM, scale), np.zeros(DIM, dtype=np.float32))
+
+
+def test_decode_rejects_mismatched_length():
+    with pytest.raises(ValueError):
+        decode_vector(b"\x00" * (DIM * 3), DIM)
+    with pytest.raises(ValueError):
+        decode_vector(b"\x00" * (DIM * 4 + 1), DIM)
+
+
+def test_check_vector_type():
+    assert check_vector_type("float16") == "FLOAT16"
+    with pytest.raises(ValueError):
+        check_vector_type("BFLOAT16")
+    with pytest.raises(ValueError):
+        check_vector_type(None)
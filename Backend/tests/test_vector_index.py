@@ -0,0 +1,159 @@
+# 向量索引版本管理测试：开始重建、切换别名、放弃构建与回收旧版本（进程内的Redis替身，不需要Redis）
+#
+# 用法（在 Backend 目录下）:
+#     python -m pytest tests/test_vector_index.py
+import fnmatch
+import pytest
+from config.database import VECTOR_INDEX_META_KEY
+from config.settings import db_config
+from services import vector_index
+from services.vector_index import VectorIndexManager
+
+
+class _MemoryRedis:
+    """VectorIndexManager 用到的 Redis 命令的进程内实现，RediSearch 命令和建索引记录在 ft_calls/created"""
+
+    def __init__(self):
+        self.hashes = {}
+        self.keys = set()
+        self.ft_calls = []
+        self.created = []
+
+    def pipeline(self, transaction: bool = True):
+        return _MemoryPipeline(self)
+
+    def hgetall(self, key):
+        return {k.encode("utf-8"): str(v).encode("utf-8") for k, v in self.hashes.get(key, {}).items()}
+
+    def hset(self, key, field=None, value=None, mapping=None):
+        fields = self.hashes.setdefault(key, {})
+        if field is not None:
+            fields[field] = value
+        fields.update(mapping or {})
+
+    def hdel(self, key, *fields):
+        for field in fields:
+            self.hashes.get(key, {}).pop(field, None)
+
+    def scan_iter(self, match=None, count=None):
+        return [key for key in sorted(self.keys) if fnmatch.fnmatchcase(key, match)]
+
+    def unlink(self, *keys):
+        deleted = self.keys.intersection(keys)
+        self.keys.difference_update(keys)
+        return len(deleted)
+
+    def ft(self, index_name):
+        return _MemoryIndex(self, index_name)
+
+
+class _MemoryIndex:
+    def __init__(self, redis_client: _MemoryRedis, index_name: str):
+        self.redis_client = redis_client
+        self.index_name = index_name
+
+    def aliasupdate(self, alias):
+        self.redis_client.ft_calls.append(("aliasupdate", self.index_name, alias))
+
+    def dropindex(self, delete_documents=False):
+        self.redis_client.ft_calls.append(("dropindex", self.index_name, delete_documents))
+
+
+class _MemoryPipeline:
+    def __init__(self, redis_client: _MemoryRedis):
+        self.redis_client = redis_client
+        self.calls = []
+
+    def __getattr__(self, name):
+        def queue(*args, **kwargs):
+            self.calls.append((getattr(self.redis_client, name), args, kwargs))
+        return queue
+
+    def execute(self):
+        results = [call(*args, **kwargs) for call, args, kwargs in self.calls]
+        self.calls = []
+        return results
+
+
+@pytest.fixture
+def redis_client(monkeypatch):
+    client = _MemoryRedis()
+    monkeypatch.setattr(vector_index, "create_vector_index",
+                        lambda redis_client, vector_type, version: redis_client.created.append((version, vector_type)))
+    return client
+
+
+def _meta(redis_client: _MemoryRedis) -> dict:
+    return redis_client.hashes.get(VECTOR_INDEX_META_KEY, {})
+
+
+def test_begin_rebuild_creates_next_version_and_starts_dual_write(redis_client):
+    manager = VectorIndexManager(redis_client)
+    # 上次放弃后残留的新版本键先被回收
+    redis_client.keys.update({"vector_v1:doc1:0", "vector:doc1:0"})
+
+    assert manager.begin_rebuild("float16") == 1
+    assert redis_client.created == [(1, "FLOAT16")]
+    assert redis_client.keys == {"vector:doc1:0"}
+    state = manager.state()
+    assert state["active"] == 0
+    assert state["building"] == 1
+    assert manager.vector_type(1) == "FLOAT16"
+    assert manager.vector_type(0) == db_config.vector_type
+
+    # 同时只能有一个正在构建的版本
+    with pytest.raises(ValueError):
+        manager.begin_rebuild()
+
+
+def test_swap_moves_alias_and_retires_previous_version(redis_client):
+    manager = VectorIndexManager(redis_client)
+    version = manager.begin_rebuild()
+    with pytest.raises(ValueError):
+        manager.swap(version + 1)
+
+    manager.swap(version)
+    assert ("aliasupdate", "vector_v1", db_config.vector_index_alias) in redis_client.ft_calls
+    state = manager.state()
+    assert state["active"] == 1
+    assert state["building"] is None
+    assert state["previous"] == 0
+    assert state["retired_at"] is not None
+
+    # 旧版本回收前不能开始下一次重建
+    with pytest.raises(ValueError):
+        manager.begin_rebuild()
+
+
+def test_abort_drops_building_version(redis_client):
+    manager = VectorIndexManager(redis_client)
+    version = manager.begin_rebuild()
+    redis_client.keys.update({"vector_v1:doc1:0", "vector_v1_doc:doc1", "vector:doc1:0"})
+
+    manager.abort()
+    assert redis_client.keys == {"vector:doc1:0"}
+    assert ("dropindex", "vector_v1", False) in redis_client.ft_calls
+    assert manager.state()["building"] is None
+    assert f"type:{version}" not in _meta(redis_client)
+    # 没有正在构建的版本时什么也不做
+    manager.abort()
+
+
+def test_gc_waits_for_grace_period_unless_forced(redis_client, monkeypatch):
+    manager = VectorIndexManager(redis_client)
+    manager.swap(manager.begin_rebuild())
+    redis_client.keys.update({"vector:doc1:0", "vector_doc:doc1", "vector_v1:doc1:0"})
+
+    monkeypatch.setattr(db_config, "vector_index_gc_grace", 3600)
+    assert manager.gc() is None
+    assert "vector:doc1:0" in redis_client.keys
+
+    assert manager.gc(force=True) == 0
+    assert redis_client.keys == {"vector_v1:doc1:0"}
+    assert manager.state()["previous"] is None
+    assert "retired_at" not in _meta(redis_client)
+    # 没有待回收的版本
+    assert manager.gc(force=True) is None
+
+    # 回收后可以开始下一次重建
+    assert manager.begin_rebuild() == 2
@@ -0,0 +1,202 @@
+# VectorService 测试：长文本分块、检索结果RRF融合、缓存结果的有效性检查、近重复内容折叠（编码模型和存储用替身，不需要Redis）
+#
+# 用法（在 Backend 目录下）:
+#     python -m pytest tests/test_vector_service.py
+from unittest import mock
+import pytest
+from config.settings import ai_config
+from services.vector_service import VectorService
+from services.vector_store import VectorStore
+
+
+class _Tokenizer:
+    """快速分词器替身：按空白切分，返回每个词的字符偏移"""
+
+    def __call__(self, text, add_special_tokens=False, return_offsets_mapping=False, verbose=False):
+        offsets = []
+        start = None
+        for i, char in enumerate(text + " "):
+            if char.isspace():
+                if start is not None:
+                    offsets.append((start, i))
+                    start = None
+            elif start is None:
+                start = i
+        return {"offset_mapping": offsets}
+
+
+class _Links:
+    """近重复索引替身，只提供 linked"""
+
+    def __init__(self, links: dict = None, error: Exception = None):
+        self.links = links or {}
+        self.error = error
+        self.calls = []
+
+    def linked(self, user_id: str, doc_ids: list) -> dict:
+        self.calls.append((user_id, list(doc_ids)))
+        if self.error is not None:
+            raise self.error
+        return {doc_id: self.links[doc_id] for doc_id in doc_ids if doc_id in self.links}
+
+
+@pytest.fixture
+def service(monkeypatch):
+    """真实的服务实例：编码模型和向量存储用替身，近重复索引由各测试设置"""
+    with mock.patch("services.vector_service.load_encoder"):
+        instance = VectorService()
+    monkeypatch.setattr(instance, "store", mock.Mock(spec=VectorStore))
+    return instance
+
+
+@pytest.fixture
+def chunk(service, monkeypatch):
+    """按 4 个token一块、重叠 1 个token分块"""
+    monkeypatch.setattr(service, "_model", mock.Mock(tokenizer=_Tokenizer()))
+    monkeypatch.setattr(ai_config, "chunk_tokens", 4)
+    monkeypatch.setattr(ai_config, "chunk_overlap", 1)
+    return service.chunk_text
+
+
+@pytest.fixture
+def collapse(service, monkeypatch):
+    def run(groups: list, links: _Links = None) -> list:
+        monkeypatch.setattr(service, "near_duplicates", links or _Links())
+        return service._collapse_duplicates(groups, "u1")
+    return run
+
+
+def _group(doc_id: str, score: float, duplicate_of: str = None) -> dict:
+    raw = {"images": [], "files": [f"{doc_id}.pdf"]}
+    if duplicate_of:
+        raw["duplicate_of"] = duplicate_of
+    return {"doc_id": doc_id, "score": score, "raw": raw}
+
+
+def _hit(doc_id: str, score: float, chunks: list) -> dict:
+    return {
+        "doc_id": doc_id,
+        "score": score,
+        "raw": {"images": [], "files": []},
+        "chunks": [{"chunk_index": index, "score": chunk_score} for index, chunk_score in chunks],
+    }
+
+
+def test_short_text_is_a_single_chunk(chunk):
+    assert chunk("") == []
+    assert chunk(" a b c d ") == [{"text": " a b c d ", "start": 0, "end": 9}]
+
+
+def test_long_text_is_split_into_overlapping_windows(chunk):
+    text = "w0 w1 w2 w3 w4 w5 w6 w7 w8"
+    chunks = chunk(text)
+    # 步长为 chunk_tokens - overlap = 3，相邻块共享一个词
+    assert [c["text"] for c in chunks] == ["w0 w1 w2 w3", "w3 w4 w5 w6", "w6 w7 w8"]
+    for c in chunks:
+        assert text[c["start"]:c["end"]] == c["text"]
+
+
+def test_chunks_cover_leading_and_trailing_text(chunk):
+    text = "  w0 w1 w2 w3 w4 w5\n"
+    chunks = chunk(text)
+    # 首块从0开始、末块到文本结尾，首尾空白不会丢失
+    assert chunks[0]["start"] == 0
+    assert chunks[-1]["end"] == len(text)
+    assert chunks[-1]["text"] == "w3 w4 w5\n"
+
+
+def test_overlap_is_capped_below_chunk_size(chunk, monkeypatch):
+    monkeypatch.setattr(ai_config, "chunk_overlap", 10)
+    # 重叠不小于块大小时按 chunk_tokens - 1 处理，仍逐词前进而不会死循环
+    assert [c["text"] for c in chunk("a b c d e f")] == ["a b c d", "b c d e", "c d e f"]
+
+
+def test_rrf_merge_sums_reciprocal_ranks(service):
+    dense = [_hit("a", 0.9, [(0, 0.9)]), _hit("b", 0.8, [(0, 0.8)])]
+    lexical = [_hit("b", 12.0, [(1, 12.0)]), _hit("c", 7.0, [(0, 7.0)])]
+    merged = service._rrf_merge({"dense": dense, "lexical": lexical}, top_k=3, k=60)
+
+    # b 在两路中都出现，融合后排第一
+    assert [entry["doc_id"] for entry in merged] == ["b", "a", "c"]
+    assert merged[0]["score"] == pytest.approx(1 / 62 + 1 / 61)
+    assert merged[1]["score"] == pytest.approx(1 / 61)
+    assert merged[0]["dense_score"] == 0.8
+    assert merged[0]["lexical_score"] == 12.0
+    assert "lexical_score" not in merged[1]
+
+
+def test_rrf_merge_unions_chunks_and_truncates(service):
+    dense = [_hit("a", 0.9, [(2, 0.9), (0, 0.5)])]
+    lexical = [_hit("a", 5.0, [(0, 5.0), (1, 3.0)]), _hit("b", 4.0, [(0, 4.0)])]
+    merged = service._rrf_merge({"dense": dense, "lexical": lexical}, top_k=1)
+
+    assert [entry["doc_id"] for entry in merged] == ["a"]
+    # 各路命中分块取并集，同一分块保留分数较高的一条，按分块顺序排列
+    assert [(c["chunk_index"], c["score"]) for c in merged[0]["chunks"]] == [(0, 5.0), (1, 3.0), (2, 0.9)]
+
+
+def test_cached_results_with_live_vectors_are_served(service):
+    service.store.for_user.return_value.get_metas.return_value = [{"user_id": "u1"}, {"user_id": "u1"}]
+    assert service._cached_results_alive("u1", [{"doc_id": "c1"}, {"doc_id": "c2"}])
+    service.store.for_user.assert_called_with("u1")
+    service.store.for_user.return_value.get_metas.assert_called_with(["c1", "c2"])
+
+
+def test_cached_results_with_expired_vectors_are_searched_again(service):
+    # 过期的内容没有元数据（user_id 为 None），TTL过期不更新纪元，缓存结果按未命中处理
+    service.store.for_user.return_value.get_metas.return_value = [{"user_id": "u1"}, {"user_id": None}]
+    assert not service._cached_results_alive("u1", [{"doc_id": "c1"}, {"doc_id": "c2"}])
+
+
+def test_empty_or_unreadable_cached_results_are_searched_again(service):
+    assert not service._cached_results_alive("u1", [])
+    service.store.for_user.return_value.get_metas.side_effect = ConnectionError("redis down")
+    assert not service._cached_results_alive("u1", [{"doc_id": "c1"}])
+
+
+def test_flag_mode_keeps_highest_scoring_of_each_canonical(collapse):
+    groups = [
+        _group("dup1", 0.9, duplicate_of="c1"),
+        _group("c1", 0.8),
+        _group("other", 0.7),
+        _group("dup2", 0.6, duplicate_of="c1"),
+    ]
+    collapsed = collapse(groups)
+    assert [group["doc_id"] for group in collapsed] == ["dup1", "other"]
+    assert collapsed[0]["duplicates"] == ["c1", "dup2"]
+    assert "duplicates" not in collapsed[1]
+
+
+def test_flag_mode_duplicate_without_canonical_in_results_is_kept(collapse):
+    collapsed = collapse([_group("dup1", 0.9, duplicate_of="c1"), _group("c2", 0.5)])
+    assert [group["doc_id"] for group in collapsed] == ["dup1", "c2"]
+    assert all("duplicates" not in group for group in collapsed)
+
+
+def test_link_mode_lists_linked_duplicates(collapse):
+    links = _Links({"c1": ["dup1", "dup2"]})
+    collapsed = collapse([_group("c1", 0.9), _group("c2", 0.5)], links)
+    assert [group["doc_id"] for group in collapsed] == ["c1", "c2"]
+    assert collapsed[0]["duplicates"] == ["dup1", "dup2"]
+    assert "duplicates" not in collapsed[1]
+    # 只为折叠后保留的内容读取一次链接
+    assert links.calls == [("u1", ["c1", "c2"])]
+
+
+def test_flag_and_link_duplicates_are_merged(collapse):
+    links = _Links({"dup1": ["linked1"]})
+    collapsed = collapse([_group("dup1", 0.9, duplicate_of="c1"), _group("c1", 0.8)], links)
+    assert len(collapsed) == 1
+    assert collapsed[0]["duplicates"] == ["c1", "linked1"]
+
+
+def test_link_lookup_failure_returns_flag_collapsed_results(collapse):
+    links = _Links(error=ConnectionError("redis down"))
+    collapsed = collapse([_group("c1", 0.9), _group("dup1", 0.8, duplicate_of="c1")], links)
+    assert [group["doc_id"] for group in collapsed] == ["c1"]
+    assert collapsed[0]["duplicates"] == ["dup1"]
+
+
+def test_empty_results(collapse):
+    links = _Links()
+    assert collapse([], links) == []
@@ -0,0 +1,93 @@
+# RedisVectorStore 测试：TAG查询值转义、WRITE_DOC 脚本参数的组装（不需要Redis）
+#
+# 用法（在 Backend 目录下）:
+#     python -m pytest tests/test_vector_store.py
+import numpy as np
+import pytest
+from config.settings import db_config
+from services.vector_store import RedisVectorStore
+
+
+class _ScriptRedis:
+    """只提供注册脚本的Redis替身，用于组装脚本参数"""
+
+    def register_script(self, script):
+        return None
+
+
+@pytest.mark.parametrize("value, escaped", [
+    ("user1", "user1"),
+    ("65f1c2a9e4b0", "65f1c2a9e4b0"),
+    ("3f2b-41aa-9c1e", r"3f2b\-41aa\-9c1e"),
+    ("a.b@c d", r"a\.b\@c\ d"),
+    ("x{y}|z", r"x\{y\}\|z"),
+    ("用户_1", "用户_1"),
+])
+def test_escape_tag(value, escaped):
+    assert RedisVectorStore._escape_tag(value) == escaped
+
+
+def _write_args(evicted: bool = False, budgeted: bool = True) -> tuple:
+    store = RedisVectorStore(_ScriptRedis(), vector_type="FLOAT32")
+    store.budgeted = budgeted
+    chunks = [{"text": f"分块{i}", "start": i * 10, "end": i * 10 + 10} for i in range(2)]
+    return store, store._write_doc_args(
+        doc_id="d1",
+        user_id="u1",
+        chunks=chunks,
+        fingerprints=["fp0", "fp1"],
+        vectors=None if evicted else [np.ones(db_config.vector_dim, dtype=np.float32) for _ in chunks],
+        raw_json="{}",
+        content_fingerprint="c1",
+        extras=[{"lex": "t1", "colbert": b"\x01"}, {"lex": "t2"}],
+        evicted=evicted
+    )
+
+
+def _hashes(args: list, n_hashes: int) -> list:
+    """按脚本的解析方式从ARGV中取出各个哈希的字段，返回 (哈希列表, 剩余参数)"""
+    pos = 11
+    hashes = []
+    for _ in range(n_hashes):
+        n_items = args[pos]
+        items = args[pos + 1:pos + 1 + n_items]
+        hashes.append(dict(zip(items[::2], items[1::2])))
+        pos += n_items + 1
+    return hashes, args[pos:]
+
+
+def test_write_args_register_vectors_and_pointers():
+    store, (keys, args) = _write_args()
+    assert args[2:5] == [3, 1, 2]
+    assert args[10] == 0
+    (meta, *chunks), pointers = _hashes(args, 3)
+    assert "evicted" not in meta
+    assert meta["bytes"] == args[8] == 2 * db_config.vector_dim * 4 + 1
+    assert args[9] > 0
+    assert all("vector" in chunk for chunk in chunks)
+    assert chunks[0]["colbert"] == b"\x01"
+    assert pointers == [store._chunk_key("d1", 0), store._chunk_key("d1", 1)]
+    assert f"{store.prefixes['fp']}fp0" in keys
+
+
+def test_write_args_without_budget_are_not_metered():
+    _, (_, args) = _write_args(budgeted=False)
+    # LRU时间戳为0时脚本不更新计量和LRU，元数据不记录计入的字节数
+    assert args[9] == 0
+    (meta, *_), _ = _hashes(args, 3)
+    assert "bytes" not in meta
+
+
+def test_write_args_for_evicted_document_keep_text_and_lex_only():
+    store, (keys, args) = _write_args(evicted=True)
+    assert args[2:5] == [3, 1, 0]
+    assert args[8] == 0
+    assert args[10] == 1
+    (meta, *chunks), pointers = _hashes(args, 3)
+    assert meta["evicted"] == 1
+    assert meta["bytes"] == 0
+    assert [chunk["lex"] for chunk in chunks] == ["t1", "t2"]
+    assert [chunk["text"] for chunk in chunks] == ["分块0", "分块1"]
+    assert all(not {"vector", "vector_scale", "colbert"} & chunk.keys() for chunk in chunks)
+    assert pointers == []
+    assert not any(key.startswith(store.prefixes["fp"]) for key in keys)
@@ -1,4 +1,5 @@
 # 装饰器模块，提供认证和其他通用装饰器
+import threading
 import jwt
 from functools import wraps
 from flask import request, jsonify
@@ -112,11 +113,14 @@ def handle_exceptions(f):
     return decorated
 
 
-#单例模式
+#单例模式，多线程同时首次使用时只构造一次（加锁后再检查）
 def singleton(cls):
     instances={}
+    lock=threading.RLock()
     def get_instance(*args,**kwargs):
         if cls not in instances:
-            instances[cls]=cls(*args,**kwargs)
+            with lock:
+                if cls not in instances:
+                    instances[cls]=cls(*args,**kwargs)
         return instances[cls]
     return get_instance
\ No newline at end of file
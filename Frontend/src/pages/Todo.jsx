@@ -200,6 +200,35 @@ export default function Todo() {
         }
     }
 
+    //入库进度：索引中的内容通过SSE更新状态
+    const indexingIds = contents
+        .filter(c => c.index_status === "pending" || c.index_status === "processing")
+        .map(c => c._id)
+        .sort()
+        .join(",");
+    useEffect(() => {
+        if (!indexingIds) return;
+        const token = localStorage.getItem("token");
+        const es = new EventSource(`http://localhost:5000/api/todos/ingest/events?content_ids=${indexingIds}&token=${token}`);
+        //提取、向量化中显示为processing，重试显示为pending
+        const statusMap = { extracting: "processing", embedding: "processing", retrying: "pending" };
+        const update = (e) => {
+            try {
+                const event = JSON.parse(e.data);
+                const status = statusMap[event.status] || event.status;
+                setContents(prev => prev.map(item =>
+                    item._id === event.content_id ? { ...item, index_status: status } : item
+                ));
+            } catch (err) {
+                console.error("解析入库进度失败:", err);
+            }
+        };
+        es.addEventListener("status", update);
+        es.addEventListener("index", update);
+        es.addEventListener("end", () => es.close());
+        return () => es.close();
+    }, [indexingIds]);
+
     //提交事件
     async function handleSubmit() {
         //必须输入文字
@@ -504,6 +533,12 @@ export default function Todo() {
                                             {c.content}
                                         </ReactMarkdown>
                                     )}
+                                    {(c.index_status === "pending" || c.index_status === "processing") && (
+                                        <span className="todo-content-indexing">索引中…</span>
+                                    )}
+                                    {c.index_status === "failed" && (
+                                        <span className="todo-content-indexing failed">索引失败</span>
+                                    )}
 
 
                                 </div>